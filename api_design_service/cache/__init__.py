@@ -14,21 +14,25 @@ class RedisClient:
     
     def __init__(self):
         self.redis_client = None
+        # 缓存引擎读写二进制编码的值，使用不做UTF-8解码的独立连接
+        self.binary_client = None
     
     def init_app(self, app):
         """初始化Redis连接"""
         redis_url = app.config.get('REDIS_URL')
         if redis_url:
             self.redis_client = redis.from_url(redis_url, decode_responses=True)
+            self.binary_client = redis.from_url(redis_url, decode_responses=False)
         else:
             # 兼容旧配置方式
-            self.redis_client = redis.Redis(
+            connection_kwargs = dict(
                 host=app.config.get('REDIS_HOST', 'localhost'),
                 port=app.config.get('REDIS_PORT', 6379),
                 db=app.config.get('REDIS_DB', 0),
                 password=app.config.get('REDIS_PASSWORD'),
-                decode_responses=True
             )
+            self.redis_client = redis.Redis(decode_responses=True, **connection_kwargs)
+            self.binary_client = redis.Redis(decode_responses=False, **connection_kwargs)
     
     def get(self, key):
         """获取缓存值"""
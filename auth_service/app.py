@@ -16,10 +16,14 @@ from flask_jwt_extended import JWTManager
 
 from cache import redis_client
 from common.common_method import fail_response_result
+from common.periodic_task import PeriodicTask
+from configs.cache_config import CacheConfig
+from configs.constant import Config
 from configs.app_config import REDIS_DATABASE_URI, SQLALCHEMY_DATABASE_URI, SERVER_HOST, SERVER_PORT, SECRET_KEY
 from dbs.mysql_db import db
 from loggers import logger
 from views.auth_api import blp as auth_blp
+from controllers.auth_controller import AuthController
 
 # from waitress import serve
 
@@ -98,6 +102,46 @@ def create_app(app):
 
     api = Api(app)
     api.register_blueprint(auth_blp)
+
+    # 定时缓存预热：启动时立即执行一次，避免冷启动时令牌验证集中回源数据库
+    if CacheConfig.ENABLE_SCHEDULED_WARM_UP:
+        PeriodicTask(
+            "auth_cache_warm_up",
+            AuthController().warm_up_active_sessions,
+            CacheConfig.CACHE_WARM_UP_INTERVAL_SECONDS,
+            run_on_start=True
+        ).start(app)
+
+    # 用户搜索索引全量重建：修复注册/资料更新时漏写的索引
+    PeriodicTask(
+        "auth_user_search_index_rebuild",
+        AuthController().rebuild_user_search_index,
+        CacheConfig.USER_SEARCH_INDEX_REBUILD_SECONDS,
+        run_on_start=True
+    ).start(app)
+
+    # 过期会话清理：数据库批量标记失效，Redis会话元数据随TTL自动过期
+    PeriodicTask(
+        "auth_session_cleanup",
+        AuthController().cleanup_expired_sessions,
+        Config.SESSION_CLEANUP_HOURS * 3600
+    ).start(app)
+
+    # 会话索引对账：修复索引与数据库活跃会话的偏差，会话列表读取只走Redis
+    PeriodicTask(
+        "auth_session_index_reconcile",
+        AuthController().reconcile_session_index,
+        CacheConfig.SESSION_INDEX_RECONCILE_SECONDS
+    ).start(app)
+
+    # 登录尝试记录批量落库：缓冲区在进程内，每个worker各自刷新
+    PeriodicTask(
+        "auth_login_attempt_flush",
+        AuthController().flush_login_attempts,
+        Config.LOGIN_ATTEMPT_FLUSH_SECONDS,
+        jitter_seconds=1,
+        exclusive=False
+    ).start(app)
     return app
 
 
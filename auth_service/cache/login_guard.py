@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""
+@文件: login_guard.py
+@說明: 登录失败计数与锁定 - 基于Lua脚本的原子滑动窗口
+@時間: 2025-01-09
+@作者: LiDong
+"""
+
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from cache import redis_client
+from configs.constant import Config
+from loggers import logger
+
+
+# 每个维度(账户/IP)占用3个键：滑动窗口、锁定标记、锁定级别
+
+# 密码校验前调用，一次完成锁定检查与失败计数：
+# 1. 任一维度处于锁定中即拒绝，不计数也不延长锁定
+# 2. 窗口内已有的失败达到阈值则按级别指数延长锁定时间并拒绝本次尝试
+# 3. 否则将本次尝试预先计为失败写入所有维度的窗口，登录成功或不计数的拒绝再撤回
+# 返回 {是否拒绝, 剩余锁定秒数, 触发锁定的维度序号(从1开始), 账户窗口内失败次数(含本次)}
+_ATTEMPT_SCRIPT = """
+local now_ms = tonumber(ARGV[1])
+local member = ARGV[2]
+local scopes = tonumber(ARGV[3])
+
+for i = 0, scopes - 1 do
+    local ttl = redis.call('TTL', KEYS[i * 3 + 2])
+    if ttl > 0 then
+        return {1, ttl, i + 1, 0}
+    end
+end
+
+local result = {0, 0, 0, 0}
+for i = 0, scopes - 1 do
+    local window_key = KEYS[i * 3 + 1]
+    local lock_key = KEYS[i * 3 + 2]
+    local level_key = KEYS[i * 3 + 3]
+    local arg = 4 + i * 5
+    local window_ms = tonumber(ARGV[arg])
+    local max_attempts = tonumber(ARGV[arg + 1])
+    local base_lock = tonumber(ARGV[arg + 2])
+    local max_lock = tonumber(ARGV[arg + 3])
+    local level_ttl = tonumber(ARGV[arg + 4])
+
+    redis.call('ZREMRANGEBYSCORE', window_key, '-inf', now_ms - window_ms)
+    local count = redis.call('ZCARD', window_key)
+    if i == 0 then
+        result[4] = count + 1
+    end
+
+    if count >= max_attempts then
+        local level = redis.call('INCR', level_key)
+        redis.call('EXPIRE', level_key, level_ttl)
+        local lock_seconds = math.min(base_lock * math.pow(2, level - 1), max_lock)
+        lock_seconds = math.floor(lock_seconds)
+        redis.call('SET', lock_key, level, 'EX', lock_seconds)
+        redis.call('DEL', window_key)
+        if lock_seconds > result[2] then
+            result[1] = 1
+            result[2] = lock_seconds
+            result[3] = i + 1
+        end
+    end
+end
+if result[1] == 1 then
+    result[4] = 0
+    return result
+end
+
+for i = 0, scopes - 1 do
+    local window_key = KEYS[i * 3 + 1]
+    redis.call('ZADD', window_key, now_ms, member)
+    redis.call('PEXPIRE', window_key, tonumber(ARGV[4 + i * 5]))
+end
+return result
+"""
+
+
+class LoginAttemptGuard:
+    """
+    登录尝试防护
+
+    密码校验前以一次Lua调用原子地检查账户/IP两个维度的锁定，锁定期间直接拒绝，不再消耗PBKDF2计算；
+    未锁定时同一次调用将本次尝试预先计为失败，失败的登录因此只有这一次Redis往返。
+    窗口内已有 max_attempts 次失败后的下一次尝试触发锁定，允许的猜测次数与校验后计数一致。
+    登录成功时撤回预计的这一次，正确密码不会因此前的失败次数被拒绝，NAT后的正常登录也不会占满IP窗口；
+    同时清除账户维度的计数。
+    """
+
+    KEY_PREFIX = "auth:login:"
+    SCOPE_ACCOUNT = "account"
+    SCOPE_IP = "ip"
+
+    def __init__(self):
+        self.redis = redis_client
+        self._scripts = {}
+
+    def attempt(self, user_id: Optional[str], ip_address: str) -> Optional[Dict[str, Any]]:
+        """
+        检查锁定并预先登记一次失败 (密码校验前调用)
+        :param user_id: 用户ID，用户不存在时为None(仅检查IP)
+        :return: {'blocked', 'retry_after', 'scope', 'account_attempts', 'attempt_id'}；Redis不可用时返回None
+        """
+        scopes = self._scopes(user_id, ip_address)
+        if not self.redis.redis_client or not scopes:
+            return None
+
+        attempt_id = uuid.uuid4().hex
+        keys: List[str] = []
+        args: List[Any] = [int(time.time() * 1000), attempt_id, len(scopes)]
+        for scope, identifier, limits in scopes:
+            keys.extend(self._scope_keys(scope, identifier))
+            args.extend([
+                limits['window'] * 1000,
+                limits['max_attempts'],
+                limits['base_lock'],
+                Config.LOGIN_LOCKOUT_MAX_SECONDS,
+                Config.LOGIN_LOCKOUT_LEVEL_TTL_SECONDS,
+            ])
+
+        try:
+            blocked, retry_after, scope_index, account_attempts = self._run(_ATTEMPT_SCRIPT, keys, args)
+            return {
+                'blocked': bool(blocked),
+                'retry_after': int(retry_after),
+                'scope': scopes[scope_index - 1][0] if scope_index else None,
+                'account_attempts': int(account_attempts),
+                'attempt_id': attempt_id,
+            }
+        except Exception as e:
+            logger.error(f"檢查登錄鎖定失敗: {str(e)}")
+            return None
+
+    def release(self, user_id: Optional[str], ip_address: str, attempt_id: str) -> bool:
+        """撤回 attempt 预先登记的失败 (不计数的拒绝)"""
+        if not self.redis.redis_client:
+            return False
+        try:
+            pipe = self.redis.redis_client.pipeline(transaction=False)
+            for scope, identifier, _ in self._scopes(user_id, ip_address):
+                pipe.zrem(self._scope_keys(scope, identifier)[0], attempt_id)
+            pipe.execute()
+            return True
+        except Exception as e:
+            logger.error(f"撤回登錄失敗計數失敗: {str(e)}")
+            return False
+
+    def clear_account(self, user_id: str, ip_address: str = None, attempt_id: str = None) -> bool:
+        """
+        登录成功或管理员解锁后清除账户维度的计数、锁定和级别
+        登录成功时传入 attempt_id，同一次往返中撤回IP窗口中预计的这一次
+        """
+        if not self.redis.redis_client:
+            return False
+        try:
+            pipe = self.redis.redis_client.pipeline(transaction=False)
+            pipe.delete(*self._scope_keys(self.SCOPE_ACCOUNT, str(user_id)))
+            if ip_address and attempt_id:
+                pipe.zrem(self._scope_keys(self.SCOPE_IP, ip_address)[0], attempt_id)
+            pipe.execute()
+            return True
+        except Exception as e:
+            logger.error(f"清除登錄失敗計數失敗: {str(e)}")
+            return False
+
+    def _scopes(self, user_id: Optional[str], ip_address: str) -> List[tuple]:
+        scopes = []
+        if user_id:
+            scopes.append((self.SCOPE_ACCOUNT, str(user_id), {
+                'window': Config.LOGIN_FAILURE_WINDOW_SECONDS,
+                'max_attempts': Config.MAX_LOGIN_ATTEMPTS,
+                'base_lock': Config.LOGIN_LOCKOUT_BASE_SECONDS,
+            }))
+        if ip_address:
+            scopes.append((self.SCOPE_IP, ip_address, {
+                'window': Config.IP_LOGIN_WINDOW_SECONDS,
+                'max_attempts': Config.IP_MAX_LOGIN_ATTEMPTS,
+                'base_lock': Config.IP_LOCKOUT_BASE_SECONDS,
+            }))
+        return scopes
+
+    def _run(self, script: str, keys: List[str], args: List[Any]):
+        if script not in self._scripts:
+            self._scripts[script] = self.redis.redis_client.register_script(script)
+        return self._scripts[script](keys=keys, args=args)
+
+    def _scope_keys(self, scope: str, identifier: str) -> List[str]:
+        base = f"{self.KEY_PREFIX}{scope}:{identifier}"
+        return [f"{base}:window", f"{base}:lock", f"{base}:level"]
+
+
+# 创建全局登录防护实例
+login_guard = LoginAttemptGuard()
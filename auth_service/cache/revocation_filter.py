@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+@文件: revocation_filter.py
+@說明: 刷新令牌撤销过滤器 - 基于Redis位图的布隆过滤器
+@時間: 2025-01-09
+@作者: LiDong
+"""
+
+import hashlib
+import time
+from typing import List, Optional
+
+from cache import redis_client
+from configs.cache_config import CacheConfig
+from configs.constant import Config
+from loggers import logger
+
+
+class RefreshRevocationFilter:
+    """
+    刷新令牌撤销过滤器
+
+    刷新令牌中携带 session_id 与 gen(会话代数)，撤销记录以 "session_id:gen"
+    (单个代数) 或 "session_id:*" (整个会话) 的形式写入布隆过滤器。
+    过滤器按纪元轮换，纪元长度等于刷新令牌有效期，校验时同时检查当前纪元
+    与上一纪元，保证所有仍未过期的刷新令牌都被覆盖。
+
+    布隆过滤器只会误报不会漏报：返回 False 表示一定未被撤销，可以直接放行；
+    返回 True 时由调用方回源MySQL确认。
+    """
+
+    FILTER_KEY_PREFIX = "auth:refresh:revoked:"
+    SESSION_WILDCARD = "*"
+
+    def __init__(self):
+        self.redis = redis_client
+        self.bits = CacheConfig.REFRESH_REVOCATION_BLOOM_BITS
+        self.hashes = CacheConfig.REFRESH_REVOCATION_BLOOM_HASHES
+        self.epoch_seconds = Config.REFRESH_TOKEN_EXPIRE_DAYS * 86400
+
+    # ==================== 撤销写入 ====================
+
+    def revoke_generation(self, session_id: str, generation: int) -> bool:
+        """
+        撤销会话的某一代刷新令牌(令牌轮换后旧令牌作废)
+        :param session_id: 会话ID
+        :param generation: 被撤销的代数
+        """
+        return self._add(f"{session_id}:{generation}")
+
+    def revoke_session(self, session_id: str) -> bool:
+        """
+        撤销整个会话的所有刷新令牌(登出、会话撤销)
+        :param session_id: 会话ID
+        """
+        return self._add(f"{session_id}:{self.SESSION_WILDCARD}")
+
+    def revoke_sessions(self, session_ids: List[str]) -> bool:
+        """
+        批量撤销会话
+        :param session_ids: 会话ID列表
+        """
+        if not session_ids:
+            return True
+        return self._add(*[f"{sid}:{self.SESSION_WILDCARD}" for sid in session_ids])
+
+    # ==================== 撤销校验 ====================
+
+    def might_be_revoked(self, session_id: str, generation: int) -> Optional[bool]:
+        """
+        检查刷新令牌是否可能已被撤销
+        :param session_id: 会话ID
+        :param generation: 令牌携带的代数
+        :return: False表示一定未撤销，True表示可能已撤销，None表示Redis不可用
+        """
+        if not self.redis.redis_client:
+            return None
+
+        try:
+            items = [
+                f"{session_id}:{self.SESSION_WILDCARD}",
+                f"{session_id}:{generation}",
+            ]
+            offsets = [self._offsets(item) for item in items]
+            epoch = self._current_epoch()
+
+            # 每个纪元一条BITFIELD命令，两个纪元在同一个pipeline中完成，一次往返
+            pipeline = self.redis.redis_client.pipeline(transaction=False)
+            for key in (self._filter_key(epoch), self._filter_key(epoch - 1)):
+                args = []
+                for item_offsets in offsets:
+                    for offset in item_offsets:
+                        args.extend(["GET", "u1", offset])
+                pipeline.execute_command("BITFIELD", key, *args)
+            results = pipeline.execute()
+
+            for bits in results:
+                for i in range(len(items)):
+                    chunk = bits[i * self.hashes:(i + 1) * self.hashes]
+                    if chunk and all(chunk):
+                        return True
+            return False
+
+        except Exception as e:
+            logger.error(f"检查刷新令牌撤销状态失败: {str(e)}")
+            return None
+
+    # ==================== 辅助方法 ====================
+
+    def _add(self, *items: str) -> bool:
+        """将条目写入当前纪元的过滤器"""
+        if not self.redis.redis_client:
+            return False
+
+        try:
+            key = self._filter_key(self._current_epoch())
+            args = []
+            for item in items:
+                for offset in self._offsets(item):
+                    args.extend(["SET", "u1", offset, 1])
+
+            pipeline = self.redis.redis_client.pipeline(transaction=False)
+            pipeline.execute_command("BITFIELD", key, *args)
+            # 过滤器需保留到下一纪元结束，覆盖其中所有令牌的剩余有效期
+            pipeline.expire(key, self.epoch_seconds * 2)
+            pipeline.execute()
+            return True
+
+        except Exception as e:
+            logger.error(f"写入刷新令牌撤销记录失败: {str(e)}")
+            return False
+
+    def _offsets(self, item: str) -> List[int]:
+        """双重哈希计算布隆过滤器位偏移"""
+        digest = hashlib.sha256(item.encode()).digest()
+        h1 = int.from_bytes(digest[:8], "big")
+        h2 = int.from_bytes(digest[8:16], "big") | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def _current_epoch(self) -> int:
+        return int(time.time()) // self.epoch_seconds
+
+    def _filter_key(self, epoch: int) -> str:
+        return f"{self.FILTER_KEY_PREFIX}{epoch}"
+
+
+# 创建全局刷新令牌撤销过滤器实例
+refresh_revocation = RefreshRevocationFilter()
@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+"""
+@文件: session_index.py
+@說明: 用户会话索引 - 每用户有序集合，支持会话列表、批量撤销和过期清理
+@時間: 2025-01-09
+@作者: LiDong
+"""
+
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from cache import redis_client
+from loggers import logger
+
+
+# 脚本只操作 KEYS 中声明的两个集合；会话元数据键随会话过期时间自动过期，由调用方在脚本外读取或删除
+# 清理已过期会话：按过期时间集合找出过期成员，从两个集合中移除
+# KEYS[1]=活动时间集合 KEYS[2]=过期时间集合  ARGV[1]=当前时间
+_PRUNE_SNIPPET = """
+local expired = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[1])
+for _, token in ipairs(expired) do
+    redis.call('ZREM', KEYS[1], token)
+end
+if #expired > 0 then
+    redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', ARGV[1])
+end
+"""
+
+# 列出会话：先清理过期成员，再按最后活动时间倒序分页读取
+# ARGV[2]=起始位置 ARGV[3]=结束位置
+# 返回 {总数, 令牌1, 活动时间1, 令牌2, 活动时间2, ...}
+_LIST_SCRIPT = _PRUNE_SNIPPET + """
+local result = {redis.call('ZCARD', KEYS[1])}
+local members = redis.call('ZREVRANGE', KEYS[1], ARGV[2], ARGV[3], 'WITHSCORES')
+for i = 1, #members do
+    table.insert(result, members[i])
+end
+return result
+"""
+
+# 撤销除指定会话外的全部会话，返回被撤销的会话令牌
+# ARGV[2]=保留的会话令牌(为空则全部撤销)
+_REVOKE_OTHERS_SCRIPT = """
+local members = redis.call('ZRANGE', KEYS[1], 0, -1)
+local revoked = {}
+for _, token in ipairs(members) do
+    if token ~= ARGV[2] then
+        redis.call('ZREM', KEYS[1], token)
+        redis.call('ZREM', KEYS[2], token)
+        table.insert(revoked, token)
+    end
+end
+return revoked
+"""
+
+
+class UserSessionIndex:
+    """
+    用户会话索引
+
+    每个用户两个有序集合：按最后活动时间排序(用于列表)、按过期时间排序(用于清理)；
+    每个会话一个哈希保存展示所需的元数据，并以会话过期时间作为键的过期时间。
+    MySQL会话表仍是权威数据源，索引缺失时由调用方从数据库回填，与数据库的偏差由周期对账修复。
+    """
+
+    ACTIVITY_KEY_PREFIX = "auth:user:sessions:"
+    EXPIRY_KEY_PREFIX = "auth:user:sessions:exp:"
+    META_KEY_PREFIX = "auth:session:meta:"
+
+    def __init__(self):
+        self.redis = redis_client
+        self._scripts = {}
+
+    # ==================== 写入 ====================
+
+    def add_sessions(self, user_id: str, sessions: List[Dict[str, Any]], replace: bool = False) -> bool:
+        """
+        写入会话索引
+        :param user_id: 用户ID
+        :param sessions: 会话列表，每项包含 session_id(会话令牌)、expires_at(datetime)、
+                         last_activity(datetime，可选) 及其余需要展示的字段
+        :param replace: 以数据库回填时整体替换用户的索引，丢弃已不在数据库中的会话
+        """
+        if not self.redis.redis_client or not (sessions or replace):
+            return False
+
+        try:
+            activity_key, expiry_key = self._user_keys(user_id)
+            max_expires_at = 0
+            pipeline = self.redis.redis_client.pipeline(transaction=replace)
+            if replace:
+                pipeline.delete(activity_key, expiry_key)
+            for session in sessions:
+                session_token = session['session_id']
+                expires_at = int(session['expires_at'].timestamp())
+                last_activity = session.get('last_activity')
+                activity_score = last_activity.timestamp() if last_activity else time.time()
+                max_expires_at = max(max_expires_at, expires_at)
+
+                meta_key = f"{self.META_KEY_PREFIX}{session_token}"
+                meta = {k: self._to_field(v) for k, v in session.items() if k not in ('session_id', 'last_activity')}
+                pipeline.zadd(activity_key, {session_token: activity_score})
+                pipeline.zadd(expiry_key, {session_token: expires_at})
+                pipeline.hset(meta_key, mapping=meta)
+                pipeline.expireat(meta_key, expires_at)
+
+            # 集合随最晚过期的会话一起过期
+            if max_expires_at:
+                pipeline.expireat(activity_key, max_expires_at)
+                pipeline.expireat(expiry_key, max_expires_at)
+            pipeline.execute()
+            return True
+
+        except Exception as e:
+            logger.error(f"寫入會話索引失敗: {str(e)}")
+            return False
+
+    def touch(self, user_id: str, session_token: str, activity_time: float = None) -> bool:
+        """更新会话最后活动时间 (仅更新已存在的成员)"""
+        if not self.redis.redis_client:
+            return False
+        try:
+            activity_key, _ = self._user_keys(user_id)
+            self.redis.redis_client.zadd(activity_key, {session_token: activity_time or time.time()}, xx=True)
+            return True
+        except Exception as e:
+            logger.error(f"更新會話活動時間失敗: {str(e)}")
+            return False
+
+    def remove_session(self, user_id: str, session_token: str) -> bool:
+        """移除单个会话"""
+        if not self.redis.redis_client:
+            return False
+        try:
+            activity_key, expiry_key = self._user_keys(user_id)
+            pipeline = self.redis.redis_client.pipeline(transaction=False)
+            pipeline.zrem(activity_key, session_token)
+            pipeline.zrem(expiry_key, session_token)
+            pipeline.delete(f"{self.META_KEY_PREFIX}{session_token}")
+            pipeline.execute()
+            return True
+        except Exception as e:
+            logger.error(f"移除會話索引失敗: {str(e)}")
+            return False
+
+    def revoke_others(self, user_id: str, keep_session_token: str = None) -> Optional[List[str]]:
+        """
+        原子地从索引移除用户除指定会话外的全部会话 (数据库撤销提交后调用)
+        :return: 被移除的会话令牌列表；Redis不可用时返回None
+        """
+        if not self.redis.redis_client:
+            return None
+        try:
+            revoked = self._run_script(_REVOKE_OTHERS_SCRIPT, user_id, [keep_session_token or ""])
+            if revoked:
+                pipeline = self.redis.redis_client.pipeline(transaction=False)
+                for token in revoked:
+                    pipeline.delete(f"{self.META_KEY_PREFIX}{token}")
+                pipeline.execute()
+            return revoked
+        except Exception as e:
+            logger.error(f"批量撤銷會話索引失敗: {str(e)}")
+            return None
+
+    # ==================== 查询 ====================
+
+    def list_sessions(self, user_id: str, offset: int = 0, limit: int = 50) -> Optional[Dict[str, Any]]:
+        """
+        按最后活动时间倒序列出有效会话
+        :return: {'total', 'sessions'}；Redis不可用或索引为空时返回None，由调用方回源数据库
+        """
+        if not self.redis.redis_client:
+            return None
+        try:
+            raw = self._run_script(_LIST_SCRIPT, user_id, [offset, offset + limit - 1])
+            total = int(raw[0])
+            if total == 0:
+                return None
+
+            members = list(zip(raw[1::2], raw[2::2]))
+            pipeline = self.redis.redis_client.pipeline(transaction=False)
+            for session_token, _ in members:
+                pipeline.hgetall(f"{self.META_KEY_PREFIX}{session_token}")
+            sessions = []
+            for (session_token, activity_score), meta in zip(members, pipeline.execute()):
+                session = dict(meta)
+                session['session_id'] = session_token
+                session['last_activity'] = datetime.fromtimestamp(float(activity_score)).isoformat()
+                sessions.append(session)
+            return {'total': total, 'sessions': sessions}
+
+        except Exception as e:
+            logger.error(f"讀取會話索引失敗: {str(e)}")
+            return None
+
+    def count_active(self, user_id: str) -> Optional[int]:
+        """统计未过期会话数量，索引为空时返回None"""
+        if not self.redis.redis_client:
+            return None
+        try:
+            _, expiry_key = self._user_keys(user_id)
+            count = self.redis.redis_client.zcount(expiry_key, f"({int(time.time())}", "+inf")
+            return count or None
+        except Exception as e:
+            logger.error(f"統計會話數量失敗: {str(e)}")
+            return None
+
+    def count_active_many(self, user_ids: List[str]) -> Optional[Dict[str, int]]:
+        """批量统计未过期会话数量 (单次pipeline)，Redis不可用时返回None"""
+        if not self.redis.redis_client:
+            return None
+        try:
+            now = f"({int(time.time())}"
+            pipeline = self.redis.redis_client.pipeline(transaction=False)
+            for user_id in user_ids:
+                pipeline.zcount(self._user_keys(user_id)[1], now, "+inf")
+            return dict(zip(user_ids, pipeline.execute()))
+        except Exception as e:
+            logger.error(f"批量統計會話數量失敗: {str(e)}")
+            return None
+
+    # ==================== 辅助方法 ====================
+
+    def _run_script(self, script: str, user_id: str, extra_args: List[Any]):
+        if script not in self._scripts:
+            self._scripts[script] = self.redis.redis_client.register_script(script)
+        args = [int(time.time())] + list(extra_args)
+        return self._scripts[script](keys=list(self._user_keys(user_id)), args=args)
+
+    def _user_keys(self, user_id: str):
+        return f"{self.ACTIVITY_KEY_PREFIX}{user_id}", f"{self.EXPIRY_KEY_PREFIX}{user_id}"
+
+    @staticmethod
+    def _to_field(value) -> str:
+        if isinstance(value, datetime):
+            return value.isoformat()
+        return "" if value is None else str(value)
+
+
+# 创建全局会话索引实例
+session_index = UserSessionIndex()
@@ -1,38 +1,52 @@
 # -*- coding: utf-8 -*-
 """
 @文件: token_cache.py
-@說明: 高性能令牌缓存服务 - 专为内部令牌验证优化
+@說明: 高性能令牌缓存服务 - 专为内部令牌验证优化 (基于两级缓存引擎)
 @時間: 2025-01-09
 @作者: LiDong
 """
 
-import json
 import time
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Callable
 from flask_jwt_extended import decode_token
 from cache import redis_client
+from cache.cache_engine import CacheEngine
+from configs.cache_config import CacheConfig
 from loggers import logger
 
 
 class TokenCacheService:
     """令牌缓存服务 - 超低延迟设计"""
-    
+
     # 缓存键前缀
     TOKEN_CACHE_PREFIX = "auth:token:"
     USER_CACHE_PREFIX = "auth:user:"
     SESSION_CACHE_PREFIX = "auth:session:"
     BLACKLIST_SET = "auth:blacklist"
-    
+    BLACKLIST_KEY_PREFIX = "blacklisted_token:"
+
     # 缓存时间配置 (秒)
     TOKEN_CACHE_TTL = 300       # 5分钟 - 令牌信息缓存
     USER_CACHE_TTL = 600        # 10分钟 - 用户信息缓存
     SESSION_CACHE_TTL = 1800    # 30分钟 - 会话信息缓存
-    
+
     def __init__(self):
         self.redis = redis_client
-    
+        self.engine = CacheEngine("auth")
+        # 令牌和会话的有效性关乎安全，L1只做极短时间的热点缓冲，过期后也不供应旧值
+        self.tokens = self.engine.namespace("token", self.TOKEN_CACHE_PREFIX, self.TOKEN_CACHE_TTL,
+                                            l1_size=20000, l1_ttl=5, stale_ttl=0)
+        self.users = self.engine.namespace("user", self.USER_CACHE_PREFIX, self.USER_CACHE_TTL)
+        self.sessions = self.engine.namespace("session", self.SESSION_CACHE_PREFIX, self.SESSION_CACHE_TTL,
+                                              l1_ttl=5, stale_ttl=0)
+        # 与命名空间前缀重叠的其他键单独统计，避免计入用户/会话缓存数量
+        self.engine.track_prefix("blacklist", self.BLACKLIST_KEY_PREFIX)
+        self.engine.track_prefix("session_index", "auth:user:sessions:")
+        self.engine.track_prefix("session_meta", "auth:session:meta:")
+        self.engine.track_prefix("user_search", "auth:user:search")
+
     # ==================== 令牌验证缓存 ====================
-    
+
     def cache_token_validation(self, token: str, validation_result: Dict[str, Any], ttl: int = None) -> bool:
         """
         缓存令牌验证结果
@@ -41,23 +55,18 @@ class TokenCacheService:
         :param ttl: 缓存过期时间(秒)
         """
         try:
-            token_hash = self._hash_token(token)
-            cache_key = f"{self.TOKEN_CACHE_PREFIX}{token_hash}"
-            
-            # 序列化验证结果
             cache_data = {
                 'result': validation_result,
-                'cached_at': int(time.time()),
                 'token_exp': self._get_token_exp(token)
             }
-            
-            cache_ttl = ttl or self.TOKEN_CACHE_TTL
-            return self.redis.setex(cache_key, cache_ttl, json.dumps(cache_data))
-            
+            # 按用户打标签，用户信息变更时只清除该用户的令牌缓存
+            user_id = validation_result.get('user_id') if isinstance(validation_result, dict) else None
+            return self.tokens.set(self._hash_token(token), cache_data, ttl, tags=[user_id] if user_id else None)
+
         except Exception as e:
             logger.error(f"缓存令牌验证结果失败: {str(e)}")
             return False
-    
+
     def get_cached_token_validation(self, token: str) -> Optional[Dict[str, Any]]:
         """
         获取缓存的令牌验证结果
@@ -66,37 +75,37 @@ class TokenCacheService:
         """
         try:
             token_hash = self._hash_token(token)
-            cache_key = f"{self.TOKEN_CACHE_PREFIX}{token_hash}"
-            
-            cached_data = self.redis.get(cache_key)
-            if not cached_data:
+            cache_info = self.tokens.get(token_hash)
+            if not cache_info:
                 return None
-            
-            cache_info = json.loads(cached_data)
-            
+
             # 检查令牌是否已过期
-            current_time = int(time.time())
-            token_exp = cache_info.get('token_exp', 0)
-            
-            if current_time >= token_exp:
-                # 令牌已过期，删除缓存
-                self.redis.delete(cache_key)
+            if int(time.time()) >= cache_info.get('token_exp', 0):
+                self.tokens.delete(token_hash)
                 return None
-            
+
             # 检查是否在黑名单中
             if self.is_token_blacklisted(token):
                 # 令牌已被撤销，删除缓存
-                self.redis.delete(cache_key)
+                self.tokens.delete(token_hash)
                 return None
-            
+
             return cache_info['result']
-            
+
         except Exception as e:
             logger.error(f"获取缓存令牌验证结果失败: {str(e)}")
             return None
-    
+
+    def invalidate_user_token_validations(self, user_id: str) -> int:
+        """
+        清除指定用户的令牌验证缓存 (按用户标签删除，不扫描键空间)
+        :param user_id: 用户ID
+        :return: 清除的缓存数量
+        """
+        return self.tokens.delete_tag(user_id)
+
     # ==================== 用户信息缓存 ====================
-    
+
     def cache_user_info(self, user_id: str, user_info: Dict[str, Any], ttl: int = None) -> bool:
         """
         缓存用户信息
@@ -104,55 +113,29 @@ class TokenCacheService:
         :param user_info: 用户信息
         :param ttl: 缓存过期时间(秒)
         """
-        try:
-            cache_key = f"{self.USER_CACHE_PREFIX}{user_id}"
-            cache_data = {
-                'user_info': user_info,
-                'cached_at': int(time.time())
-            }
-            
-            cache_ttl = ttl or self.USER_CACHE_TTL
-            return self.redis.setex(cache_key, cache_ttl, json.dumps(cache_data))
-            
-        except Exception as e:
-            logger.error(f"缓存用户信息失败: {str(e)}")
-            return False
-    
-    def get_cached_user_info(self, user_id: str) -> Optional[Dict[str, Any]]:
+        return self.users.set(user_id, user_info, ttl)
+
+    def get_cached_user_info(self, user_id: str,
+                             loader: Callable[[], Optional[Dict[str, Any]]] = None) -> Optional[Dict[str, Any]]:
         """
         获取缓存的用户信息
         :param user_id: 用户ID
+        :param loader: 未命中时的回源函数，提供时启用防击穿(租约/旧值供应/提前刷新)并自动回写
         :return: 用户信息或None
         """
-        try:
-            cache_key = f"{self.USER_CACHE_PREFIX}{user_id}"
-            cached_data = self.redis.get(cache_key)
-            
-            if not cached_data:
-                return None
-            
-            cache_info = json.loads(cached_data)
-            return cache_info['user_info']
-            
-        except Exception as e:
-            logger.error(f"获取缓存用户信息失败: {str(e)}")
-            return None
-    
+        if loader:
+            return self.users.get_or_load(user_id, loader)
+        return self.users.get(user_id)
+
     def invalidate_user_cache(self, user_id: str) -> bool:
         """
         使用户缓存失效
         :param user_id: 用户ID
         """
-        try:
-            cache_key = f"{self.USER_CACHE_PREFIX}{user_id}"
-            return self.redis.delete(cache_key) > 0
-            
-        except Exception as e:
-            logger.error(f"使用户缓存失效失败: {str(e)}")
-            return False
-    
+        return self.users.delete(user_id)
+
     # ==================== 会话信息缓存 ====================
-    
+
     def cache_session_info(self, session_id: str, session_info: Dict[str, Any], ttl: int = None) -> bool:
         """
         缓存会话信息
@@ -160,55 +143,29 @@ class TokenCacheService:
         :param session_info: 会话信息
         :param ttl: 缓存过期时间(秒)
         """
-        try:
-            cache_key = f"{self.SESSION_CACHE_PREFIX}{session_id}"
-            cache_data = {
-                'session_info': session_info,
-                'cached_at': int(time.time())
-            }
-            
-            cache_ttl = ttl or self.SESSION_CACHE_TTL
-            return self.redis.setex(cache_key, cache_ttl, json.dumps(cache_data))
-            
-        except Exception as e:
-            logger.error(f"缓存会话信息失败: {str(e)}")
-            return False
-    
-    def get_cached_session_info(self, session_id: str) -> Optional[Dict[str, Any]]:
+        return self.sessions.set(session_id, session_info, ttl)
+
+    def get_cached_session_info(self, session_id: str,
+                                loader: Callable[[], Optional[Dict[str, Any]]] = None) -> Optional[Dict[str, Any]]:
         """
         获取缓存的会话信息
         :param session_id: 会话ID
+        :param loader: 未命中时的回源函数，提供时启用防击穿并自动回写
         :return: 会话信息或None
         """
-        try:
-            cache_key = f"{self.SESSION_CACHE_PREFIX}{session_id}"
-            cached_data = self.redis.get(cache_key)
-            
-            if not cached_data:
-                return None
-            
-            cache_info = json.loads(cached_data)
-            return cache_info['session_info']
-            
-        except Exception as e:
-            logger.error(f"获取缓存会话信息失败: {str(e)}")
-            return None
-    
+        if loader:
+            return self.sessions.get_or_load(session_id, loader)
+        return self.sessions.get(session_id)
+
     def invalidate_session_cache(self, session_id: str) -> bool:
         """
         使会话缓存失效
         :param session_id: 会话ID
         """
-        try:
-            cache_key = f"{self.SESSION_CACHE_PREFIX}{session_id}"
-            return self.redis.delete(cache_key) > 0
-            
-        except Exception as e:
-            logger.error(f"使会话缓存失效失败: {str(e)}")
-            return False
-    
+        return self.sessions.delete(session_id)
+
     # ==================== 令牌黑名单管理 ====================
-    
+
     def add_token_to_blacklist(self, token: str, ttl: int = None) -> bool:
         """
         将令牌添加到黑名单
@@ -218,27 +175,27 @@ class TokenCacheService:
         try:
             token_data = decode_token(token)
             jti = token_data.get('jti')
-            
+
             if not jti:
                 return False
-            
+
             # 计算令牌剩余有效期
             exp = token_data.get('exp', 0)
             current_time = int(time.time())
             remaining_ttl = exp - current_time
-            
+
             if remaining_ttl <= 0:
                 return True  # 令牌已过期，无需加入黑名单
-            
+
             blacklist_ttl = ttl or remaining_ttl
-            blacklist_key = f"blacklisted_token:{jti}"
-            
+            blacklist_key = f"{self.BLACKLIST_KEY_PREFIX}{jti}"
+
             return self.redis.setex(blacklist_key, blacklist_ttl, "revoked")
-            
+
         except Exception as e:
             logger.error(f"添加令牌到黑名单失败: {str(e)}")
             return False
-    
+
     def is_token_blacklisted(self, token: str) -> bool:
         """
         检查令牌是否在黑名单中
@@ -248,17 +205,17 @@ class TokenCacheService:
         try:
             token_data = decode_token(token)
             jti = token_data.get('jti')
-            
+
             if not jti:
                 return False
-            
-            blacklist_key = f"blacklisted_token:{jti}"
+
+            blacklist_key = f"{self.BLACKLIST_KEY_PREFIX}{jti}"
             return self.redis.exists(blacklist_key)
-            
+
         except Exception as e:
             logger.error(f"检查令牌黑名单状态失败: {str(e)}")
             return False
-    
+
     def remove_token_from_blacklist(self, token: str) -> bool:
         """
         从黑名单移除令牌
@@ -267,133 +224,125 @@ class TokenCacheService:
         try:
             token_data = decode_token(token)
             jti = token_data.get('jti')
-            
+
             if not jti:
                 return False
-            
-            blacklist_key = f"blacklisted_token:{jti}"
+
+            blacklist_key = f"{self.BLACKLIST_KEY_PREFIX}{jti}"
             return self.redis.delete(blacklist_key) > 0
-            
+
         except Exception as e:
             logger.error(f"从黑名单移除令牌失败: {str(e)}")
             return False
-    
+
     # ==================== 批量操作优化 ====================
-    
+
     def batch_cache_users(self, users_data: Dict[str, Dict[str, Any]], ttl: int = None) -> bool:
         """
         批量缓存用户信息
         :param users_data: {user_id: user_info} 格式的用户数据
         :param ttl: 缓存过期时间(秒)
         """
-        try:
-            cache_ttl = ttl or self.USER_CACHE_TTL
-            pipeline = self.redis.redis_client.pipeline()
-            
-            for user_id, user_info in users_data.items():
-                cache_key = f"{self.USER_CACHE_PREFIX}{user_id}"
-                cache_data = {
-                    'user_info': user_info,
-                    'cached_at': int(time.time())
-                }
-                pipeline.setex(cache_key, cache_ttl, json.dumps(cache_data))
-            
-            pipeline.execute()
-            return True
-            
-        except Exception as e:
-            logger.error(f"批量缓存用户信息失败: {str(e)}")
-            return False
-    
+        return self.users.set_many(users_data, ttl)
+
+    def batch_cache_sessions(self, sessions_data: Dict[str, Dict[str, Any]], ttls: Dict[str, int] = None) -> bool:
+        """
+        批量缓存会话信息
+        :param sessions_data: {session_id: session_info} 格式的会话数据
+        :param ttls: {session_id: ttl} 单个会话的过期时间(秒)，缺省使用SESSION_CACHE_TTL
+        """
+        return self.sessions.set_many(sessions_data, ttls=ttls)
+
+    def batch_invalidate_sessions(self, session_ids: list) -> int:
+        """
+        批量使会话缓存失效
+        :param session_ids: 会话ID列表
+        :return: 删除的缓存数量
+        """
+        return self.sessions.delete_many(list(session_ids or []))
+
     def batch_get_users(self, user_ids: list) -> Dict[str, Dict[str, Any]]:
         """
         批量获取用户缓存信息
         :param user_ids: 用户ID列表
         :return: {user_id: user_info} 格式的用户数据
         """
-        try:
-            pipeline = self.redis.redis_client.pipeline()
-            cache_keys = [f"{self.USER_CACHE_PREFIX}{user_id}" for user_id in user_ids]
-            
-            for cache_key in cache_keys:
-                pipeline.get(cache_key)
-            
-            cached_results = pipeline.execute()
-            
-            users_data = {}
-            for i, cached_data in enumerate(cached_results):
-                if cached_data:
-                    try:
-                        cache_info = json.loads(cached_data)
-                        users_data[user_ids[i]] = cache_info['user_info']
-                    except (json.JSONDecodeError, KeyError):
-                        continue
-            
-            return users_data
-            
-        except Exception as e:
-            logger.error(f"批量获取用户缓存信息失败: {str(e)}")
-            return {}
-    
+        return self.users.get_many(user_ids)
+
     # ==================== 缓存统计和监控 ====================
-    
+
     def get_cache_stats(self) -> Dict[str, Any]:
         """
         获取缓存统计信息
+        键数量来自后台SCAN的定期统计(近似值，统计尚未完成时为0)，读取本身不遍历键空间
         """
         try:
-            # 获取不同类型缓存的数量
-            token_keys = len(self.redis.redis_client.keys(f"{self.TOKEN_CACHE_PREFIX}*"))
-            user_keys = len(self.redis.redis_client.keys(f"{self.USER_CACHE_PREFIX}*"))
-            session_keys = len(self.redis.redis_client.keys(f"{self.SESSION_CACHE_PREFIX}*"))
-            blacklist_keys = len(self.redis.redis_client.keys("blacklisted_token:*"))
-            
+            engine_stats = self.engine.get_stats()
+            namespaces = engine_stats.get('namespaces', {})
+
+            def key_count(name: str) -> int:
+                return namespaces.get(name, {}).get('keys') or 0
+
+            token_keys = key_count('token')
+            user_keys = key_count('user')
+            session_keys = key_count('session')
+            blacklist_keys = key_count('blacklist')
+
             return {
                 'token_cache_count': token_keys,
                 'user_cache_count': user_keys,
                 'session_cache_count': session_keys,
                 'blacklist_count': blacklist_keys,
                 'total_cache_keys': token_keys + user_keys + session_keys + blacklist_keys,
+                'key_counts_updated_at': engine_stats.get('key_counts_updated_at'),
+                'engine_stats': engine_stats,
                 'redis_info': self.redis.redis_client.info('memory') if self.redis.redis_client else {}
             }
-            
+
         except Exception as e:
             logger.error(f"获取缓存统计信息失败: {str(e)}")
             return {}
-    
-    def clear_expired_cache(self) -> int:
+
+    def clear_expired_cache(self) -> bool:
         """
         清理过期缓存（Redis会自动清理，这里主要用于手动清理）
-        :return: 清理的缓存数量
+        清理在后台线程中SCAN执行，不阻塞调用方
+        :return: 是否已提交清理任务
         """
-        try:
-            cleared_count = 0
-            current_time = int(time.time())
-            
-            # 清理过期的令牌缓存
-            token_keys = self.redis.redis_client.keys(f"{self.TOKEN_CACHE_PREFIX}*")
-            for key in token_keys:
-                try:
-                    cached_data = self.redis.get(key)
-                    if cached_data:
-                        cache_info = json.loads(cached_data)
-                        token_exp = cache_info.get('token_exp', 0)
-                        if current_time >= token_exp:
-                            self.redis.delete(key)
-                            cleared_count += 1
-                except (json.JSONDecodeError, KeyError):
-                    # 数据格式错误，删除
-                    self.redis.delete(key)
-                    cleared_count += 1
-            
-            return cleared_count
-            
-        except Exception as e:
-            logger.error(f"清理过期缓存失败: {str(e)}")
+        return self.engine.submit("clear_expired_tokens", self._sweep_expired_tokens)
+
+    def _sweep_expired_tokens(self) -> int:
+        """SCAN遍历令牌缓存，按批MGET并删除已过期令牌的缓存"""
+        redis = self.engine.redis_conn()
+        if not redis:
             return 0
-    
+
+        cleared_count = 0
+        batch = []
+        batch_size = CacheConfig.CACHE_SCAN_BATCH_SIZE
+        for key in redis.scan_iter(match=f"{self.TOKEN_CACHE_PREFIX}*", count=batch_size):
+            batch.append(key)
+            if len(batch) >= batch_size:
+                cleared_count += self._delete_expired_tokens(batch)
+                batch = []
+        if batch:
+            cleared_count += self._delete_expired_tokens(batch)
+        if cleared_count:
+            logger.info(f"清理過期令牌緩存: {cleared_count} 條")
+        return cleared_count
+
+    def _delete_expired_tokens(self, keys: list) -> int:
+        current_time = int(time.time())
+        token_hashes = [key[len(self.TOKEN_CACHE_PREFIX):] for key in keys]
+        cached = self.tokens.peek_many(token_hashes)
+        expired = []
+        for token_hash, cache_info in cached.items():
+            if not isinstance(cache_info, dict) or current_time >= cache_info.get('token_exp', 0):
+                expired.append(token_hash)
+        return self.tokens.delete_many(expired)
+
     # ==================== 辅助方法 ====================
-    
+
     def _hash_token(self, token: str) -> str:
         """
         生成令牌哈希值用作缓存键
@@ -402,7 +351,7 @@ class TokenCacheService:
         """
         import hashlib
         return hashlib.sha256(token.encode()).hexdigest()
-    
+
     def _get_token_exp(self, token: str) -> int:
         """
         获取令牌过期时间
@@ -417,4 +366,4 @@ class TokenCacheService:
 
 
 # 创建全局令牌缓存服务实例
-token_cache = TokenCacheService()
\ No newline at end of file
+token_cache = TokenCacheService()
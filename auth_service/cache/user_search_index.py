@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""
+@文件: user_search_index.py
+@說明: 用户前缀搜索索引 - 基于Redis有序集合的字典序索引
+@時間: 2025-01-09
+@作者: LiDong
+"""
+
+import json
+import re
+from typing import Any, Iterable, List, Optional, Tuple
+
+from cache import redis_client
+from configs.cache_config import CacheConfig
+from loggers import logger
+
+
+class UserSearchIndex:
+    """
+    用户前缀搜索索引
+
+    所有成员分值均为0，有序集合按字典序排列，成员格式为 "词项\\x00用户ID"。
+    前缀查询使用 ZRANGEBYLEX，复杂度 O(log N + M)，与用户总量基本无关。
+    词项来自用户名、邮箱(完整邮箱与@前部分)、显示名称及其按空白切分的单词，统一小写。
+    """
+
+    INDEX_KEY = "auth:user:search"
+    TERMS_KEY = "auth:user:search:terms"
+    SEPARATOR = "\x00"
+    # 字典序上界：U+10FFFF的UTF-8编码大于任何合法字符
+    LEX_MAX_CHAR = chr(0x10FFFF)
+
+    def __init__(self):
+        self.redis = redis_client
+        self.max_matches = CacheConfig.USER_SEARCH_MAX_MATCHES
+        self.scan_batch = CacheConfig.USER_SEARCH_SCAN_BATCH
+
+    # ==================== 索引维护 ====================
+
+    def index_user(self, user) -> bool:
+        """
+        写入或更新单个用户的索引词项 (用户名/邮箱/显示名称变更后调用)
+        :param user: UserModel实例
+        """
+        return self.index_users([user])
+
+    def index_users(self, users: Iterable[Any]) -> bool:
+        """
+        批量写入或更新用户索引，旧词项先移除再写入新词项
+        :param users: UserModel实例列表
+        """
+        if not self.redis.redis_client:
+            return False
+
+        try:
+            users = list(users)
+            if not users:
+                return True
+
+            old_terms_list = self.redis.redis_client.hmget(self.TERMS_KEY, [str(u.id) for u in users])
+
+            pipeline = self.redis.redis_client.pipeline(transaction=False)
+            for user, old_terms_json in zip(users, old_terms_list):
+                user_id = str(user.id)
+                new_terms = self._build_terms(user)
+                old_terms = set(json.loads(old_terms_json)) if old_terms_json else set()
+
+                stale = old_terms - new_terms
+                if stale:
+                    pipeline.zrem(self.INDEX_KEY, *[self._member(t, user_id) for t in stale])
+                if new_terms:
+                    pipeline.zadd(self.INDEX_KEY, {self._member(t, user_id): 0 for t in new_terms})
+                pipeline.hset(self.TERMS_KEY, user_id, json.dumps(sorted(new_terms)))
+            pipeline.execute()
+            return True
+
+        except Exception as e:
+            logger.error(f"更新用户搜索索引失败: {str(e)}")
+            return False
+
+    def remove_user(self, user_id: str) -> bool:
+        """从索引中移除用户"""
+        if not self.redis.redis_client:
+            return False
+
+        try:
+            user_id = str(user_id)
+            old_terms_json = self.redis.redis_client.hget(self.TERMS_KEY, user_id)
+            pipeline = self.redis.redis_client.pipeline(transaction=False)
+            if old_terms_json:
+                members = [self._member(t, user_id) for t in json.loads(old_terms_json)]
+                if members:
+                    pipeline.zrem(self.INDEX_KEY, *members)
+            pipeline.hdel(self.TERMS_KEY, user_id)
+            pipeline.execute()
+            return True
+
+        except Exception as e:
+            logger.error(f"移除用户搜索索引失败: {str(e)}")
+            return False
+
+    def is_ready(self) -> bool:
+        """索引是否已建立"""
+        try:
+            return bool(self.redis.redis_client and self.redis.redis_client.exists(self.TERMS_KEY))
+        except Exception:
+            return False
+
+    # ==================== 查询 ====================
+
+    def search_user_ids(self, keyword: str, limit: int = None) -> Optional[Tuple[List[str], bool]]:
+        """
+        按前缀查询用户ID
+        以上一批最后一个成员作为字典序游标分批 ZRANGEBYLEX，直到收集到 limit 个不同用户或区间读完；
+        同一用户可能有多个词项命中同一前缀，因此按去重后的用户数而不是条目数计数。
+        :param keyword: 搜索关键词(前缀)
+        :param limit: 最多返回的用户数
+        :return: (去重后的用户ID列表, 是否因达到上限而截断)；索引不可用时返回None，由调用方回退数据库查询
+        """
+        if not self.is_ready():
+            return None
+
+        prefix = self._normalize(keyword)
+        if not prefix:
+            return [], False
+
+        try:
+            limit = limit or self.max_matches
+            lower, upper = f"[{prefix}", f"[{prefix}{self.LEX_MAX_CHAR}"
+            user_ids = []
+            seen = set()
+            while True:
+                members = self.redis.redis_client.zrangebylex(
+                    self.INDEX_KEY, lower, upper, start=0, num=self.scan_batch
+                )
+                for member in members:
+                    user_id = member.rsplit(self.SEPARATOR, 1)[-1]
+                    if user_id in seen:
+                        continue
+                    if len(user_ids) >= limit:
+                        return user_ids, True
+                    seen.add(user_id)
+                    user_ids.append(user_id)
+                if len(members) < self.scan_batch:
+                    return user_ids, False
+                # 排他下界：从上一批最后一个成员之后继续
+                lower = f"({members[-1]}"
+
+        except Exception as e:
+            logger.error(f"查询用户搜索索引失败: {str(e)}")
+            return None
+
+    # ==================== 辅助方法 ====================
+
+    def _build_terms(self, user) -> set:
+        """构建用户的索引词项集合"""
+        terms = set()
+        for value in (user.username, user.email, user.display_name):
+            normalized = self._normalize(value)
+            if not normalized:
+                continue
+            terms.add(normalized)
+            # 单词级前缀：显示名称 "John Doe" 可通过 "doe" 命中
+            for word in re.split(r"[\s._\-]+", normalized):
+                if word:
+                    terms.add(word)
+
+        email = self._normalize(user.email)
+        if email and "@" in email:
+            terms.add(email.split("@", 1)[0])
+        return terms
+
+    def _member(self, term: str, user_id: str) -> str:
+        return f"{term}{self.SEPARATOR}{user_id}"
+
+    def _normalize(self, value: Optional[str]) -> str:
+        if not value:
+            return ""
+        return value.strip().lower().replace(self.SEPARATOR, "")
+
+
+# 创建全局用户搜索索引实例
+user_search_index = UserSearchIndex()
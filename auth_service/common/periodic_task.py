@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+@文件: periodic_task.py
+@說明: 后台周期任务 (守护线程 + Redis互斥锁)
+@時間: 2025-01-09
+@作者: LiDong
+"""
+
+import random
+import threading
+import time
+import traceback
+import uuid
+
+from cache import redis_client
+from loggers import logger
+
+
+class PeriodicTask:
+    """
+    后台周期任务
+
+    每个进程启动一个守护线程按固定间隔执行任务；多worker/多实例部署时，
+    通过Redis SET NX 互斥锁保证同一周期内只有一个进程真正执行。
+    处理进程内状态(如本地缓冲区)的任务应设置 exclusive=False，每个进程各自执行。
+    """
+
+    LOCK_KEY_PREFIX = "task:lock:"
+
+    def __init__(self, name, func, interval_seconds, run_on_start=False, jitter_seconds=5, exclusive=True):
+        """
+        :param name: 任务名称(同时作为互斥锁键)
+        :param func: 任务函数，在应用上下文中调用
+        :param interval_seconds: 执行间隔(秒)
+        :param run_on_start: 启动后是否立即执行一次
+        :param jitter_seconds: 启动延迟随机抖动，避免多进程同时抢锁
+        :param exclusive: 是否跨进程互斥执行
+        """
+        self.name = name
+        self.func = func
+        self.interval_seconds = interval_seconds
+        self.run_on_start = run_on_start
+        self.jitter_seconds = jitter_seconds
+        self.exclusive = exclusive
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._app = None
+
+    def start(self, app):
+        """启动任务线程"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._app = app
+        self._thread = threading.Thread(target=self._run, name=f"periodic-{self.name}", daemon=True)
+        self._thread.start()
+        logger.info(f"周期任務已啟動: {self.name}, 間隔 {self.interval_seconds} 秒")
+
+    def stop(self):
+        """停止任务线程"""
+        self._stop_event.set()
+
+    def run_once(self):
+        """立即执行一次(不加锁)，返回任务结果"""
+        with self._app.app_context():
+            return self.func()
+
+    def _run(self):
+        delay = random.uniform(0, self.jitter_seconds)
+        if not self.run_on_start:
+            delay += self.interval_seconds
+
+        while not self._stop_event.wait(delay):
+            started = time.time()
+            if not self.exclusive or self._acquire_lock():
+                try:
+                    with self._app.app_context():
+                        result = self.func()
+                    # 高频任务无事可做时不刷日志
+                    if self.exclusive or result:
+                        logger.info(
+                            f"周期任務完成: {self.name}, 耗時 {round(time.time() - started, 3)} 秒, 結果: {result}"
+                        )
+                except Exception as e:
+                    logger.error(f"周期任務執行失敗: {self.name}, {str(e)}")
+                    logger.error(traceback.format_exc())
+            delay = self.interval_seconds
+
+    def _acquire_lock(self):
+        """获取本周期执行权，锁在间隔结束前自然过期，不主动释放"""
+        if not redis_client.redis_client:
+            return True
+        try:
+            lock_ttl = max(int(self.interval_seconds) - 1, 1)
+            return bool(redis_client.redis_client.set(
+                f"{self.LOCK_KEY_PREFIX}{self.name}", uuid.uuid4().hex, nx=True, ex=lock_ttl
+            ))
+        except Exception as e:
+            logger.warning(f"獲取周期任務鎖失敗: {self.name}, {str(e)}")
+            return False
@@ -41,22 +41,89 @@ class CacheConfig:
     
     # 失败验证结果缓存 - 短期缓存，避免恶意重试
     FAILED_VALIDATION_TTL = int(os.getenv('FAILED_VALIDATION_TTL', 60))     # 1分钟
-    
+
+    # ==================== 刷新令牌撤销过滤器配置 ====================
+
+    # 布隆过滤器位数 (2^24位 = 2MB/纪元，百万级撤销记录误判率约0.05%)
+    REFRESH_REVOCATION_BLOOM_BITS = int(os.getenv('REFRESH_REVOCATION_BLOOM_BITS', 1 << 24))
+    # 哈希函数个数
+    REFRESH_REVOCATION_BLOOM_HASHES = int(os.getenv('REFRESH_REVOCATION_BLOOM_HASHES', 7))
+
     # ==================== 缓存策略配置 ====================
     
     # 是否启用缓存
     ENABLE_TOKEN_CACHE = os.getenv('ENABLE_TOKEN_CACHE', 'true').lower() == 'true'
     ENABLE_USER_CACHE = os.getenv('ENABLE_USER_CACHE', 'true').lower() == 'true'
     ENABLE_SESSION_CACHE = os.getenv('ENABLE_SESSION_CACHE', 'true').lower() == 'true'
+
+    # 会话索引对账 - 周期比较数据库活跃会话数与索引，不一致的用户整体回填
+    SESSION_INDEX_RECONCILE_SECONDS = int(os.getenv('SESSION_INDEX_RECONCILE_SECONDS', 900))   # 对账间隔(秒)
+    SESSION_INDEX_RECONCILE_CHUNK = int(os.getenv('SESSION_INDEX_RECONCILE_CHUNK', 500))       # 每块用户数
     
     # 批量操作配置
     BATCH_CACHE_SIZE = int(os.getenv('BATCH_CACHE_SIZE', 100))              # 批量缓存大小限制
     CACHE_WARM_UP_LIMIT = int(os.getenv('CACHE_WARM_UP_LIMIT', 200))        # 缓存预热用户数量限制
-    
+
+    # 定时预热配置 - 从会话表分块流式加载活跃会话
+    ENABLE_SCHEDULED_WARM_UP = os.getenv('ENABLE_SCHEDULED_WARM_UP', 'true').lower() == 'true'
+    CACHE_WARM_UP_INTERVAL_SECONDS = int(os.getenv('CACHE_WARM_UP_INTERVAL_SECONDS', 300))   # 预热间隔
+    CACHE_WARM_UP_CHUNK_SIZE = int(os.getenv('CACHE_WARM_UP_CHUNK_SIZE', 200))               # 每块会话数
+    CACHE_WARM_UP_RATE_LIMIT = int(os.getenv('CACHE_WARM_UP_RATE_LIMIT', 1000))              # 每秒最多预热会话数
+    CACHE_WARM_UP_MAX_SESSIONS = int(os.getenv('CACHE_WARM_UP_MAX_SESSIONS', 50000))         # 单次预热会话上限
+
+    # 管理员用户列表 - 前缀搜索索引与近似总数
+    USER_SEARCH_MAX_MATCHES = int(os.getenv('USER_SEARCH_MAX_MATCHES', 1000))               # 单次搜索最多匹配用户数
+    USER_SEARCH_SCAN_BATCH = int(os.getenv('USER_SEARCH_SCAN_BATCH', 500))                  # 索引分批读取条目数
+    USER_SEARCH_INDEX_REBUILD_SECONDS = int(os.getenv('USER_SEARCH_INDEX_REBUILD_SECONDS', 86400))  # 索引全量修复间隔
+    ADMIN_USER_COUNT_TTL = int(os.getenv('ADMIN_USER_COUNT_TTL', 300))                      # 近似总数缓存时间
+
+    # 登录预取 - 登录后异步预加载团队/权限上下文
+    ENABLE_LOGIN_PREFETCH = os.getenv('ENABLE_LOGIN_PREFETCH', 'true').lower() == 'true'
+    LOGIN_PREFETCH_WORKERS = int(os.getenv('LOGIN_PREFETCH_WORKERS', 4))
+    LOGIN_PREFETCH_TIMEOUT = float(os.getenv('LOGIN_PREFETCH_TIMEOUT', 2))                   # 单次调用超时(秒)
+
     # 缓存性能监控
     ENABLE_CACHE_METRICS = os.getenv('ENABLE_CACHE_METRICS', 'true').lower() == 'true'
     CACHE_HIT_RATE_THRESHOLD = float(os.getenv('CACHE_HIT_RATE_THRESHOLD', 0.8))  # 缓存命中率阈值
     
+    # ==================== 两级缓存引擎配置 ====================
+    
+    # 进程内L1缓存
+    L1_CACHE_ENABLED = os.getenv('L1_CACHE_ENABLED', 'true').lower() == 'true'
+    L1_CACHE_DEFAULT_SIZE = int(os.getenv('L1_CACHE_DEFAULT_SIZE', 5000))     # 每个命名空间的条目上限
+    L1_CACHE_MAX_TTL = int(os.getenv('L1_CACHE_MAX_TTL', 30))                # L1最长保留时间(秒)，兜底失效消息丢失
+    
+    # 负缓存与TTL抖动
+    NEGATIVE_CACHE_TTL = int(os.getenv('NEGATIVE_CACHE_TTL', 30))             # 不存在的数据缓存时间(秒)
+    CACHE_TTL_JITTER = float(os.getenv('CACHE_TTL_JITTER', 0.1))              # TTL随机抖动比例
+    
+    # 请求合并与失效广播
+    CACHE_LOAD_TIMEOUT = float(os.getenv('CACHE_LOAD_TIMEOUT', 5))            # 等待同键回源的超时时间(秒)
+    CACHE_INVALIDATION_CHANNEL_PREFIX = os.getenv('CACHE_INVALIDATION_CHANNEL_PREFIX', 'cache:invalidate:')
+    
+    # 标签失效与后台任务 (请求路径上不使用KEYS)
+    CACHE_TAG_KEY_PREFIX = os.getenv('CACHE_TAG_KEY_PREFIX', 'cache:tag:')
+    CACHE_SCAN_BATCH_SIZE = int(os.getenv('CACHE_SCAN_BATCH_SIZE', 500))           # SCAN/DEL单批键数量
+    CACHE_BACKGROUND_QUEUE_SIZE = int(os.getenv('CACHE_BACKGROUND_QUEUE_SIZE', 1000))  # 后台任务队列上限
+    
+    # 缓存统计 - 计数哈希与键数量刷新间隔
+    CACHE_STATS_KEY_PREFIX = os.getenv('CACHE_STATS_KEY_PREFIX', 'cache:stats:')
+    CACHE_KEY_COUNT_REFRESH_SECONDS = int(os.getenv('CACHE_KEY_COUNT_REFRESH_SECONDS', 300))
+    
+    # 缓存值编码 - auto 优先msgpack，其次orjson，均未安装时使用json
+    CACHE_CODEC = os.getenv('CACHE_CODEC', 'auto')
+    CACHE_COMPRESS_THRESHOLD = int(os.getenv('CACHE_COMPRESS_THRESHOLD', 1024))    # 超过该字节数时压缩(zstd/zlib)，0为不压缩
+    CACHE_COMPRESS_LEVEL = int(os.getenv('CACHE_COMPRESS_LEVEL', 3))
+    CACHE_CODEC_SAMPLE_EVERY = int(os.getenv('CACHE_CODEC_SAMPLE_EVERY', 100))    # 每N次编码抽样对比JSON体积，0为关闭
+    
+    # 防击穿 - 回源租约、过期旧值供应与XFetch提前刷新
+    CACHE_LEASE_KEY_PREFIX = os.getenv('CACHE_LEASE_KEY_PREFIX', 'cache:lease:')
+    CACHE_LEASE_TTL_MS = int(os.getenv('CACHE_LEASE_TTL_MS', 3000))                # 租约时长(毫秒)，应大于一次回源耗时
+    CACHE_LEASE_WAIT_SECONDS = float(os.getenv('CACHE_LEASE_WAIT_SECONDS', 1.5))   # 未获租约时等待结果的最长时间
+    CACHE_LEASE_POLL_MS = int(os.getenv('CACHE_LEASE_POLL_MS', 50))                # 等待期间轮询间隔(毫秒)
+    CACHE_STALE_TTL = int(os.getenv('CACHE_STALE_TTL', 60))                        # 逻辑过期后继续保留旧值的时间(秒)，0为关闭
+    CACHE_XFETCH_BETA = float(os.getenv('CACHE_XFETCH_BETA', 1.0))                 # 提前刷新力度，0为关闭
+    
     # ==================== 缓存清理配置 ====================
     
     # 自动清理过期缓存
@@ -18,12 +18,26 @@ class Config:
     # 账户锁定配置
     MAX_LOGIN_ATTEMPTS = int(os.getenv("MAX_LOGIN_ATTEMPTS", 5))
     ACCOUNT_LOCKOUT_DURATION = int(os.getenv("ACCOUNT_LOCKOUT_DURATION", 24))  # 小时
+    # 登录失败滑动窗口与指数锁定: 锁定时长 = 基础时长 * 2^(级别-1)，上限为 ACCOUNT_LOCKOUT_DURATION
+    LOGIN_FAILURE_WINDOW_SECONDS = int(os.getenv("LOGIN_FAILURE_WINDOW_SECONDS", 900))
+    LOGIN_LOCKOUT_BASE_SECONDS = int(os.getenv("LOGIN_LOCKOUT_BASE_SECONDS", 300))
+    LOGIN_LOCKOUT_MAX_SECONDS = ACCOUNT_LOCKOUT_DURATION * 3600
+    LOGIN_LOCKOUT_LEVEL_TTL_SECONDS = int(os.getenv("LOGIN_LOCKOUT_LEVEL_TTL_SECONDS", 86400))  # 锁定级别保留时间
+    IP_MAX_LOGIN_ATTEMPTS = int(os.getenv("IP_MAX_LOGIN_ATTEMPTS", 50))
+    IP_LOGIN_WINDOW_SECONDS = int(os.getenv("IP_LOGIN_WINDOW_SECONDS", 600))
+    IP_LOCKOUT_BASE_SECONDS = int(os.getenv("IP_LOCKOUT_BASE_SECONDS", 600))
+    # 登录尝试记录批量落库
+    LOGIN_ATTEMPT_FLUSH_SECONDS = int(os.getenv("LOGIN_ATTEMPT_FLUSH_SECONDS", 5))
+    LOGIN_ATTEMPT_FLUSH_BATCH = int(os.getenv("LOGIN_ATTEMPT_FLUSH_BATCH", 500))
+    LOGIN_ATTEMPT_BUFFER_MAX = int(os.getenv("LOGIN_ATTEMPT_BUFFER_MAX", 20000))
     
     # JWT 配置
     JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY", "APIGateway2025!")
     JWT_ACCESS_TOKEN_EXPIRE_HOURS = int(os.getenv("JWT_ACCESS_TOKEN_EXPIRE_HOURS", 2))
     REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", 30))
-    
+    # 刷新令牌重用检测宽限期(秒)，客户端并发刷新时不视为令牌重放
+    REFRESH_REUSE_GRACE_SECONDS = int(os.getenv("REFRESH_REUSE_GRACE_SECONDS", 10))
+
     # 用户名配置
     USERNAME_MIN_LENGTH = int(os.getenv("USERNAME_MIN_LENGTH", 3))
     USERNAME_MAX_LENGTH = int(os.getenv("USERNAME_MAX_LENGTH", 50))
@@ -65,6 +79,10 @@ class Config:
     CACHE_DEFAULT_TIMEOUT = int(os.getenv("CACHE_DEFAULT_TIMEOUT", 300))  # 5分钟
     CACHE_KEY_PREFIX = os.getenv("CACHE_KEY_PREFIX", "api_gateway:")
 
+    # 下游服务地址
+    TEAM_SERVICE_URL = os.getenv("TEAM_SERVICE_URL", "http://localhost:25698")
+    PERMISSION_SERVICE_URL = os.getenv("PERMISSION_SERVICE_URL", "http://localhost:25700")
+
 
 # 角色权限配置
 ROLE_PERMISSIONS = {
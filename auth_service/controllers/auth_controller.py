@@ -6,30 +6,51 @@
 @作者: LiDong
 """
 
+import base64
 import hashlib
+import json
 import secrets
+import time
 import uuid
 import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Tuple, Dict, Any, Optional, List
 from flask import request, g
 from flask_jwt_extended import create_access_token, create_refresh_token, decode_token
-from sqlalchemy import and_, or_, func
+from sqlalchemy import and_, func
+import requests
 
 from common.common_tools import CommonTools
 from dbs.mysql_db import DBFunction
 from dbs.mysql_db.model_tables import (
     UserModel, UserSessionModel,
-    LoginAttemptModel, OAuthProviderModel, UserOAuthAccountModel
+    OAuthProviderModel, UserOAuthAccountModel
 )
 from models.auth_model import (
     OperUserModel, OperUserSessionModel,
     OperLoginAttemptModel, OperOAuthProviderModel
 )
 from configs.constant import Config
+from configs.cache_config import CacheConfig
 from loggers import logger
 from cache import redis_client
 from cache.token_cache import token_cache
+from cache.revocation_filter import refresh_revocation
+from cache.user_search_index import user_search_index
+from cache.login_guard import login_guard
+from cache.session_index import session_index
+
+
+# 登录预取线程池和HTTP连接池 (进程级共享)
+_prefetch_executor = ThreadPoolExecutor(
+    max_workers=CacheConfig.LOGIN_PREFETCH_WORKERS, thread_name_prefix="login-prefetch"
+)
+_prefetch_http = requests.Session()
+
+# 登录尝试记录缓冲区 (进程级)，由周期任务批量落库；超出上限时丢弃最旧记录
+_login_attempt_buffer = deque(maxlen=Config.LOGIN_ATTEMPT_BUFFER_MAX)
 
 
 class AuthController:
@@ -104,53 +125,80 @@ class AuthController:
         return None
     
     def _is_account_locked(self, user):
-        """检查账户是否被锁定"""
-        # 检查数据库中的锁定状态
-        if self.oper_user.is_account_locked(user):
-            return True
-            
-        # 检查缓存中的失败尝试次数
-        cache_key = f"failed_attempts:{user.id}"
-        attempts = redis_client.get(cache_key)
-        
-        if attempts and int(attempts) >= self.max_login_attempts:
-            return True
+        """检查数据库中的锁定状态 (管理员锁定或Redis不可用时的回退锁定)"""
+        return self.oper_user.is_account_locked(user)
+    
+    def _lockout_message(self, guard_result):
+        """构建锁定提示"""
+        retry_minutes = max((guard_result['retry_after'] + 59) // 60, 1)
+        if guard_result['scope'] == login_guard.SCOPE_IP:
+            return f"登錄嘗試過於頻繁，請在{retry_minutes}分鐘後重試"
+        return f"賬戶被鎖定，請在{retry_minutes}分鐘後重試"
+    
+    def _record_failed_attempt(self, user, credential, reason, guard_result=None, count=True):
+        """
+        记录失败尝试
+        缓冲审计记录；失败已由 login_guard.attempt 预先计入账户/IP失败窗口，
+        不计数的拒绝 (count=False) 撤回预计的这一次，Redis不可用(guard_result为None)时回退为数据库计数锁定。
+        """
+        self._buffer_login_attempt(credential, False, reason)
+        if guard_result is not None:
+            if not count and not guard_result['blocked']:
+                login_guard.release(user.id if user else None, self._get_client_info()['ip_address'],
+                                    guard_result['attempt_id'])
+            return
+        if not count:
+            return
         
-        # 检查最近的失败登录尝试
-        failed_count = self.oper_login_attempt.get_recent_failed_attempts(
-            user.email, 'email', self.lockout_duration
-        )
-        return failed_count >= self.max_login_attempts
+        if user:
+            failed_attempts = (user.failed_login_attempts or 0) + 1
+            if failed_attempts >= self.max_login_attempts:
+                result, flag = self.oper_user.lock_user(user, self.lockout_duration * 60)
+            else:
+                result, flag = self.oper_user.update_user(user, {'failed_login_attempts': failed_attempts})
+            DBFunction.do_commit(result, flag)
     
-    def _record_failed_attempt(self, user, credential, reason):
-        """记录失败尝试"""
-        cache_key = f"failed_attempts:{user.id if user else 'unknown'}"
-        current_attempts = redis_client.get(cache_key) or 0
-        redis_client.setex(cache_key, self.lockout_duration * 3600, int(current_attempts) + 1)
+    def _clear_failed_attempts(self, user, guard_result=None):
+        """清除失败尝试记录，并撤回 login_guard 预计的本次失败"""
+        login_guard.clear_account(user.id, self._get_client_info()['ip_address'],
+                                  guard_result['attempt_id'] if guard_result else None)
         
-        # 记录到数据库
+        # 仅在存在数据库锁定状态时才写库
+        if user.failed_login_attempts or user.locked_until:
+            self.oper_user.update_user(user, {'failed_login_attempts': 0, 'locked_until': None})
+    
+    def _buffer_login_attempt(self, credential, success, reason=None, user=None):
+        """缓冲登录尝试记录，由 flush_login_attempts 批量写库"""
         client_info = self._get_client_info()
-        attempt_data = LoginAttemptModel(
-            email=credential if '@' in credential else None,
-            username=credential if '@' not in credential else None,
-            ip_address=client_info['ip_address'],
-            user_agent=client_info['user_agent'],
-            success=False,
-            failure_reason=reason
-        )
-        self.oper_login_attempt.create_attempt(attempt_data)
-        
-        # 如果用户存在且失败次数过多，锁定账户
-        if user and int(current_attempts) + 1 >= self.max_login_attempts:
-            self.oper_user.lock_user(user, self.lockout_duration * 60)
+        is_email = '@' in credential
+        _login_attempt_buffer.append({
+            'id': str(uuid.uuid4()),
+            'email': credential if is_email else (user.email if user else None),
+            'username': credential if not is_email else (user.username if user else None),
+            'ip_address': client_info['ip_address'],
+            'user_agent': client_info['user_agent'],
+            'success': success,
+            'failure_reason': reason,
+            'attempted_at': datetime.now()
+        })
     
-    def _clear_failed_attempts(self, user):
-        """清除失败尝试记录"""
-        cache_key = f"failed_attempts:{user.id}"
-        redis_client.delete(cache_key)
-        
-        # 重置数据库中的失败次数
-        self.oper_user.update_user(user, {'failed_login_attempts': 0, 'locked_until': None})
+    def flush_login_attempts(self) -> int:
+        """批量写入缓冲的登录尝试记录 (周期任务，每个进程各自执行)"""
+        flushed = 0
+        while _login_attempt_buffer:
+            batch = []
+            while _login_attempt_buffer and len(batch) < Config.LOGIN_ATTEMPT_FLUSH_BATCH:
+                batch.append(_login_attempt_buffer.popleft())
+            
+            result, flag = self.oper_login_attempt.bulk_create_attempts(batch)
+            result, flag = DBFunction.do_commit(result, flag)
+            if not flag:
+                # 放回缓冲区头部，下一周期重试；缓冲区有上限，持续失败时丢弃最新的记录
+                _login_attempt_buffer.extendleft(reversed(batch))
+                logger.error(f"批量寫入登錄嘗試記錄失敗，{len(batch)} 條待下一週期重試: {result}")
+                break
+            flushed += len(batch)
+        return flushed
     
     def _create_user_session(self, user_id, session_token, refresh_token):
         """创建用户会话"""
@@ -174,17 +222,41 @@ class AuthController:
         
         return self.oper_session.create_session(session_data)
     
+    def _build_user_cache_info(self, user):
+        """构建用户缓存信息"""
+        return {
+            'user_id': user.id,
+            'username': user.username,
+            'email': user.email,
+            'display_name': user.display_name,
+            'status': user.status,
+            'platform_role': user.platform_role or 'platform_user',
+            'email_verified': user.email_verified,
+            'two_factor_enabled': user.two_factor_enabled,
+            'avatar_url': user.avatar_url
+        }
+    
+    def _load_user_cache_info(self, user_id) -> Optional[Dict[str, Any]]:
+        """缓存回源：从数据库加载用户缓存信息，用户不存在时返回None(写入负缓存)"""
+        user = self.oper_user.get_by_id(user_id)
+        return self._build_user_cache_info(user) if user else None
+    
+    def _build_session_cache_info(self, session):
+        """构建会话缓存信息 (与令牌验证读取的结构一致)"""
+        return {
+            'session_id': session.session_token,
+            'user_id': session.user_id,
+            'device_info': session.device_info.get('type', '未知設備') if session.device_info else '未知設備',
+            'ip_address': session.ip_address,
+            'is_active': True,
+            'is_valid': True,
+            'expires_at': session.expires_at.isoformat() if session.expires_at else None
+        }
+    
     def _record_successful_login(self, user, credential):
         """记录成功登录"""
-        client_info = self._get_client_info()
-        attempt_data = LoginAttemptModel(
-            email=credential if '@' in credential else user.email,
-            username=credential if '@' not in credential else user.username,
-            ip_address=client_info['ip_address'],
-            user_agent=client_info['user_agent'],
-            success=True
-        )
-        return self.oper_login_attempt.create_attempt(attempt_data)
+        self._buffer_login_attempt(credential, True, user=user)
+        return True, True
 
     # ==================== 事务处理装饰器 ====================
     
@@ -260,7 +332,10 @@ class AuthController:
                 'created_at': created_user.created_at
             }
         
-        return self._execute_with_transaction(_register_operation, "用戶註冊")
+        result, flag = self._execute_with_transaction(_register_operation, "用戶註冊")
+        if flag:
+            self.refresh_user_search_index(result['user_id'])
+        return result, flag
     
     def login(self, data: Dict) -> Tuple[Any, bool]:
         """用户登录"""
@@ -270,26 +345,36 @@ class AuthController:
             
             # 获取用户
             user = self.oper_user.get_by_login_credential(credential)
+            
+            # 一次Lua调用原子地检查账户/IP锁定并预先计入本次失败，锁定期间直接拒绝，不再进行密码哈希计算；
+            # 登录成功或不计数的拒绝再撤回，失败的登录只有这一次Redis往返
+            guard_result = login_guard.attempt(user.id if user else None, self._get_client_info()['ip_address'])
+            if guard_result and guard_result['blocked']:
+                reason = "IP嘗試過於頻繁" if guard_result['scope'] == login_guard.SCOPE_IP else "賬戶被鎖定"
+                self._record_failed_attempt(user, credential, reason, guard_result, count=False)
+                return self._lockout_message(guard_result), False
+            
             if not user:
+                self._record_failed_attempt(None, credential, "用戶不存在", guard_result)
                 return "用戶名或密碼錯誤", False
             
             # 检查账户是否被锁定
             if self._is_account_locked(user):
-                self._record_failed_attempt(user, credential, "賬戶被鎖定")
+                self._record_failed_attempt(user, credential, "賬戶被鎖定", guard_result, count=False)
                 return f"賬戶被鎖定，請在{self.lockout_duration}小時後重試", False
             
             # 检查账户状态
             if user.status not in ['active', 'pending_verification']:
-                self._record_failed_attempt(user, credential, f"賬戶狀態：{user.status}")
+                self._record_failed_attempt(user, credential, f"賬戶狀態：{user.status}", guard_result)
                 return f"賬戶狀態異常：{user.status}", False
             
             # 验证密码
             if not self.oper_user.verify_password(user, password):
-                self._record_failed_attempt(user, credential, "密碼錯誤")
+                self._record_failed_attempt(user, credential, "密碼錯誤", guard_result)
                 return "用戶名或密碼錯誤", False
             
             # 清除失败尝试记录
-            self._clear_failed_attempts(user)
+            self._clear_failed_attempts(user, guard_result)
             
             # 创建JWT令牌
             session_id = str(uuid.uuid4())
@@ -306,6 +391,7 @@ class AuthController:
                 additional_claims={
                     'username': user.username,
                     'session_id': session_id,
+                    'gen': 0,
                     'jti': str(uuid.uuid4())
                 }
             )
@@ -329,26 +415,18 @@ class AuthController:
                     logger.warning(f"記錄成功登錄失敗: {attempt_result}")
                 
                 # 缓存用户信息以提高后续访问性能
-                user_info = {
-                    'user_id': user.id,
-                    'username': user.username,
-                    'email': user.email,
-                    'display_name': user.display_name,
-                    'status': user.status,
-                    'platform_role': user.platform_role or 'platform_user',
-                    'email_verified': user.email_verified,
-                    'two_factor_enabled': user.two_factor_enabled,
-                    'avatar_url': user.avatar_url
-                }
+                user_info = self._build_user_cache_info(user)
                 token_cache.cache_user_info(str(user.id), user_info)
                 
                 # 缓存会话信息
+                client_info = self._get_client_info()
                 session_info = {
                     'session_id': session_id,
                     'user_id': user.id,
                     'device_info': client_info['device_info'],
                     'ip_address': client_info['ip_address'],
-                    'is_active': True
+                    'is_active': True,
+                    'is_valid': True
                 }
                 token_cache.cache_session_info(session_id, session_info)
                 
@@ -370,75 +448,161 @@ class AuthController:
                     }
                 }
             
-            return self._execute_with_transaction(_login_transaction, "用戶登錄")
+            result, flag = self._execute_with_transaction(_login_transaction, "用戶登錄")
+            if flag:
+                client_info = self._get_client_info()
+                now = datetime.now()
+                session_index.add_sessions(str(user.id), [{
+                    'session_id': session_id,
+                    'device_info': client_info['device_info'],
+                    'ip_address': client_info['ip_address'],
+                    'created_at': now,
+                    'expires_at': now + timedelta(days=Config.REFRESH_TOKEN_EXPIRE_DAYS),
+                    'last_activity': now
+                }])
+            if flag and CacheConfig.ENABLE_LOGIN_PREFETCH:
+                # 异步预加载下游服务的团队/权限上下文，不影响登录响应时间
+                self.prefetch_user_contexts(str(user.id))
+            return result, flag
             
         except Exception as e:
             logger.error(f"登錄異常: {str(e)}")
             return "登錄失敗，系統內部錯誤", False
     
     def refresh_token(self, refresh_token: str) -> Tuple[Any, bool]:
-        """刷新访问令牌"""
+        """
+        刷新访问令牌 - 无状态校验 + 令牌轮换
+        刷新令牌携带 session_id 与 gen(代数)，有效性由Redis撤销过滤器判定，
+        只有轮换写入(条件UPDATE)才访问MySQL
+        """
         try:
-            # 验证刷新令牌
+            # 验证刷新令牌签名和有效期
             try:
                 token_data = decode_token(refresh_token)
-                user_id = int(token_data['sub'])  # sub is now a string containing user_id
+                user_id = token_data['sub']
+                session_id = token_data['session_id']
+                # 轮换机制上线前签发的令牌没有gen声明，其会话代数均为0
+                generation = int(token_data.get('gen', 0))
             except Exception:
                 traceback.print_exc()
                 return "刷新令牌無效", False
-            
-            # 检查会话记录
-            token_hash = hashlib.sha256(refresh_token.encode()).hexdigest()
-            session_record = self.oper_session.get_session_by_refresh_token_hash(token_hash)
-            
-            if not session_record:
-                return "刷新令牌已過期或無效", False
-            
-            is_valid = self.oper_session.is_session_valid(session_record)
-            if not is_valid:
-                return "刷新令牌已過期或無效", False
-            
-            # 获取用户信息
-            user = self.oper_user.get_by_id(user_id)
-            if not user:
-                return "用戶不存在", False
-            
-            # 创建新的访问令牌
-            import uuid
+
+            if token_data.get('type') != 'refresh':
+                return "刷新令牌無效", False
+
+            # 撤销过滤器校验：未命中即一定未撤销，无需查询数据库
+            might_be_revoked = refresh_revocation.might_be_revoked(session_id, generation)
+            if might_be_revoked is not False:
+                # 可能已撤销(布隆误判)或Redis不可用，回源数据库确认
+                session_record = self.oper_session.get_by_session_token(session_id)
+                if (not self.oper_session.is_session_valid(session_record)
+                        or session_record.refresh_generation != generation):
+                    return "刷新令牌已過期或無效", False
+
+            # 获取用户信息 (优先缓存)
+            user_info, error = self._get_refresh_user_info(user_id)
+            if error:
+                return error, False
+
+            # 签发新的访问令牌和下一代刷新令牌
             access_token = create_access_token(
-                identity=str(user.id),
+                identity=str(user_id),
                 additional_claims={
-                    'username': user.username,
+                    'username': user_info['username'],
+                    'session_id': session_id,
                     'jti': str(uuid.uuid4())  # 添加唯一标识符用于撤销
                 }
             )
-            
-            def _refresh_transaction():
-                # 记录刷新日志
-                log_result, log_flag = self._create_login_log(
-                    user.id, "refresh", "success"
-                )
-                if not log_flag:
-                    logger.warning(f"創建刷新日誌失敗: {log_result}")
-                
-                return {
-                    'access_token': access_token,
-                    'token_type': 'Bearer',
-                    'user_info': {
-                        'user_id': user.id,
-                        'username': user.username,
-                        'email': user.email,
-                        'full_name': user.full_name,
-                        'role': user.role
-                    }
+            new_refresh_token = create_refresh_token(
+                identity=str(user_id),
+                additional_claims={
+                    'username': user_info['username'],
+                    'session_id': session_id,
+                    'gen': generation + 1,
+                    'jti': str(uuid.uuid4())
                 }
-            
-            return _refresh_transaction(), True
-            
+            )
+            new_token_hash = hashlib.sha256(new_refresh_token.encode()).hexdigest()
+
+            # 轮换写入：条件UPDATE保证同一代令牌只能成功刷新一次
+            rotated, rotate_flag = self.oper_session.rotate_refresh_token(
+                session_id, generation, new_token_hash
+            )
+            if not rotate_flag:
+                DBFunction.db_rollback()
+                return "刷新令牌失敗", False
+
+            if not rotated:
+                DBFunction.db_rollback()
+                self._handle_refresh_token_reuse(session_id, generation)
+                return "刷新令牌已過期或無效", False
+
+            commit_result, commit_flag = DBFunction.do_commit("刷新令牌成功", True)
+            if not commit_flag:
+                logger.error(f"刷新令牌提交失敗: {commit_result}")
+                return "刷新令牌失敗", False
+
+            # 旧代令牌作废
+            refresh_revocation.revoke_generation(session_id, generation)
+            session_index.touch(user_id, session_id)
+
+            return {
+                'access_token': access_token,
+                'refresh_token': new_refresh_token,
+                'token_type': 'Bearer',
+                'session_id': session_id,
+                'user_info': {
+                    'user_id': user_info['user_id'],
+                    'username': user_info['username'],
+                    'email': user_info['email'],
+                    'display_name': user_info.get('display_name'),
+                    'platform_role': user_info.get('platform_role', 'platform_user')
+                }
+            }, True
+
         except Exception as e:
             logger.error(f"刷新令牌異常: {str(e)}")
             return "刷新令牌失敗", False
-    
+
+    def _get_refresh_user_info(self, user_id: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        """获取刷新令牌对应的用户信息，返回 (用户信息, 错误信息)"""
+        user_info = token_cache.get_cached_user_info(str(user_id), loader=lambda: self._load_user_cache_info(user_id))
+        if not user_info:
+            return None, "用戶不存在"
+
+        if user_info.get('status') not in ['active', 'pending_verification']:
+            return None, f"賬戶狀態異常：{user_info.get('status')}"
+
+        return user_info, None
+
+    def _handle_refresh_token_reuse(self, session_id: str, generation: int) -> None:
+        """
+        轮换失败处理：旧代令牌在宽限期之后被再次使用视为令牌泄露，撤销整个会话
+        宽限期内的失败视为客户端并发刷新，仅拒绝本次请求
+        """
+        try:
+            session_record = self.oper_session.get_by_session_token(session_id)
+            if not session_record or session_record.refresh_generation <= generation:
+                return
+
+            grace_deadline = datetime.now() - timedelta(seconds=Config.REFRESH_REUSE_GRACE_SECONDS)
+            if session_record.last_activity and session_record.last_activity > grace_deadline:
+                return
+
+            revoke_result, revoke_flag = self.oper_session.revoke_session(session_record)
+            commit_result, commit_flag = DBFunction.do_commit(revoke_result, revoke_flag)
+            if not commit_flag:
+                logger.error(f"撤銷重放令牌會話失敗: {commit_result}")
+                return
+
+            refresh_revocation.revoke_session(session_id)
+            session_index.remove_session(session_record.user_id, session_id)
+            self.invalidate_session_cache(session_id)
+            logger.warning(f"檢測到刷新令牌重放，已撤銷會話: {session_id}")
+
+        except Exception as e:
+            logger.error(f"處理刷新令牌重放異常: {str(e)}")
+
     def get_profile(self, user_id: int) -> Tuple[Any, bool]:
         """获取用户档案"""
         try:
@@ -446,8 +610,10 @@ class AuthController:
             if not user:
                 return "用戶不存在", False
             
-            # 获取活跃的用户会话数量
-            active_sessions = self.oper_session.get_active_sessions_by_user(user_id)
+            # 获取活跃的用户会话数量 (优先读取会话索引)
+            active_session_count = session_index.count_active(user_id)
+            if active_session_count is None:
+                active_session_count = len(self.oper_session.get_active_sessions_by_user(user_id))
             
             profile_data = {
                 'user_info': {
@@ -465,7 +631,7 @@ class AuthController:
                     'created_at': user.created_at.isoformat() if user.created_at else None
                 },
                 'security_info': {
-                    'active_sessions': len(active_sessions),
+                    'active_sessions': active_session_count,
                     'last_login_ip': user.last_login_ip
                 }
             }
@@ -479,19 +645,27 @@ class AuthController:
     def logout(self, refresh_token: str, access_token: str = None) -> Tuple[Any, bool]:
         """用户登出"""
         try:
-            # 撤销用户会话
-            token_hash = hashlib.sha256(refresh_token.encode()).hexdigest()
-            session_record = self.oper_session.get_session_by_refresh_token_hash(token_hash)
-            
+            # 从刷新令牌声明中获取会话，无需按哈希查询会话表
+            try:
+                token_data = decode_token(refresh_token)
+                session_id = token_data.get('session_id')
+                user_id = token_data.get('sub')
+            except Exception:
+                session_id = None
+                user_id = None
+
             def _logout_transaction():
                 # 撤销会话
-                if session_record:
-                    revoke_result, revoke_flag = self.oper_session.revoke_session(session_record)
+                if session_id:
+                    revoke_result, revoke_flag = self.oper_session.revoke_by_session_token(session_id, user_id)
                     if not revoke_flag:
                         raise Exception(f"撤銷會話失敗: {revoke_result}")
-                    
-                    # 清除会话缓存
-                    self.invalidate_session_cache(session_record.id)
+
+                    # 写入撤销过滤器并清除会话缓存
+                    refresh_revocation.revoke_session(session_id)
+                    if user_id:
+                        session_index.remove_session(user_id, session_id)
+                    self.invalidate_session_cache(session_id)
                 
                 # 使用令牌缓存服务将tokens加入黑名单
                 try:
@@ -518,37 +692,34 @@ class AuthController:
             logger.error(f"登出異常: {str(e)}")
             return "登出失敗", False
     
-    def get_user_sessions(self, user_id: int, current_token_hash: str = None) -> Tuple[Any, bool]:
-        """获取用户会话列表 (MVC架构优化版本)"""
+    def get_user_sessions(self, user_id: str, current_session_id: str = None) -> Tuple[Any, bool]:
+        """
+        获取用户会话列表 - 只读取Redis会话索引
+        索引为空或Redis不可用时回源数据库并整体回填；与数据库的其他偏差由周期对账修复
+        """
         try:
-            # 获取活跃的用户会话
-            active_sessions = self.oper_session.get_active_sessions_by_user(user_id)
-            
-            sessions_data = []
-            for session in active_sessions:
-                # 检测是否为当前会话
-                is_current = False
-                if current_token_hash and session.refresh_token_hash == current_token_hash:
-                    is_current = True
-                
-                session_info = {
-                    'session_id': session.id,
-                    'device_info': session.device_info.get('type', '未知設備') if session.device_info else '未知設備',
-                    'ip_address': session.ip_address or "未知IP",
-                    'created_at': session.created_at,
-                    'expires_at': session.expires_at,
-                    'is_current': is_current,
-                    'status': '活躍' if self.oper_session.is_session_valid(session) else '已過期'
-                }
-                sessions_data.append(session_info)
-            
-            # 按创建时间倒序排序
-            sessions_data.sort(key=lambda x: x['created_at'], reverse=True)
+            indexed = session_index.list_sessions(user_id)
+            if indexed is not None:
+                sessions_data = indexed['sessions']
+            else:
+                entries = self._rebuild_session_index(user_id)
+                sessions_data = [
+                    {**entry,
+                     'created_at': entry['created_at'].isoformat() if entry['created_at'] else None,
+                     'expires_at': entry['expires_at'].isoformat() if entry['expires_at'] else None,
+                     'last_activity': entry['last_activity'].isoformat() if entry['last_activity'] else None}
+                    for entry in entries
+                ]
+                sessions_data.sort(key=lambda x: x['last_activity'] or '', reverse=True)
+            
+            for session_info in sessions_data:
+                session_info['is_current'] = bool(current_session_id) and session_info['session_id'] == current_session_id
+                session_info['status'] = '活躍'
             
             result = {
                 'user_id': user_id,
                 'total_sessions': len(sessions_data),
-                'active_sessions': len([s for s in sessions_data if s['status'] == '活躍']),
+                'active_sessions': len(sessions_data),
                 'sessions': sessions_data
             }
             
@@ -558,31 +729,122 @@ class AuthController:
             logger.error(f"獲取用戶會話列表異常: {str(e)}")
             return "獲取會話列表失敗", False
     
-    def revoke_user_session(self, user_id: int, session_id: str) -> Tuple[Any, bool]:
-        """撤销指定用户会话"""
+    def revoke_user_session(self, user_id: str, session_id: str) -> Tuple[Any, bool]:
+        """撤销指定用户会话 (session_id 为会话令牌，即JWT中的session_id)"""
         try:
-            # 获取会话记录
-            session_record = self.oper_session.get_session_by_id(session_id)
-            
-            if not session_record or session_record.user_id != user_id:
-                return "會話不存在或已失效", False
-            
             def _revoke_session_transaction():
-                revoke_result, revoke_flag = self.oper_session.revoke_session(session_record)
+                revoke_result, revoke_flag = self.oper_session.revoke_by_session_token(session_id, user_id)
                 if not revoke_flag:
                     raise Exception(f"撤銷會話失敗: {revoke_result}")
-                
-                # 清除相关缓存
-                self.invalidate_session_cache(session_id)
+                if not revoke_result:
+                    raise ValueError("會話不存在或已失效")
                 
                 return f"會話已成功撤銷"
             
-            return self._execute_with_transaction(_revoke_session_transaction, "撤銷用戶會話")
+            result, flag = self._execute_with_transaction(_revoke_session_transaction, "撤銷用戶會話")
+            if flag:
+                # 提交后写入撤销过滤器并清除相关缓存
+                refresh_revocation.revoke_session(session_id)
+                session_index.remove_session(user_id, session_id)
+                self.invalidate_session_cache(session_id)
+            return result, flag
             
         except Exception as e:
             logger.error(f"撤銷用戶會話異常: {str(e)}")
             return "撤銷會話失敗", False
     
+    def revoke_other_sessions(self, user_id: str, current_session_id: str = None) -> Tuple[Any, bool]:
+        """撤销当前会话以外的全部会话 - 单条UPDATE提交后再移除索引并下发撤销"""
+        try:
+            db_tokens = []
+            
+            def _revoke_others_transaction():
+                # 撤销名单以数据库为准，索引中可能缺少部署前创建的会话
+                db_tokens.extend(self.oper_session.get_active_session_tokens(user_id, current_session_id))
+                revoke_result, revoke_flag = self.oper_session.revoke_user_sessions(user_id, current_session_id)
+                if not revoke_flag:
+                    raise Exception(f"撤銷會話失敗: {revoke_result}")
+                return revoke_result
+            
+            revoked_count, flag = self._execute_with_transaction(_revoke_others_transaction, "撤銷其他會話")
+            if not flag:
+                return revoked_count, flag
+            
+            self._fan_out_session_revocation(user_id, db_tokens, current_session_id)
+            
+            return {
+                'revoked_sessions': revoked_count,
+                'message': f'已撤銷{revoked_count}個其他會話'
+            }, True
+            
+        except Exception as e:
+            logger.error(f"撤銷其他會話異常: {str(e)}")
+            return "撤銷其他會話失敗", False
+    
+    def _fan_out_session_revocation(self, user_id: str, db_tokens: List[str], keep_session_token: str = None):
+        """数据库撤销提交后：移除会话索引，并对数据库与索引中的会话并集写入撤销过滤器、清除令牌缓存"""
+        indexed_tokens = session_index.revoke_others(user_id, keep_session_token) or []
+        revoked_tokens = list(dict.fromkeys(list(db_tokens) + indexed_tokens))
+        if revoked_tokens:
+            refresh_revocation.revoke_sessions(revoked_tokens)
+            token_cache.batch_invalidate_sessions(revoked_tokens)
+    
+    def cleanup_expired_sessions(self) -> Dict[str, Any]:
+        """将已过期会话标记为失效 (周期任务)；Redis中的会话元数据随过期时间自动清除"""
+        result, flag = self.oper_session.cleanup_expired_sessions()
+        result, flag = DBFunction.do_commit(result, flag)
+        if not flag:
+            logger.error(f"清理過期會話失敗: {result}")
+            return {'expired_sessions': 0}
+        return {'expired_sessions': result}
+    
+    def _rebuild_session_index(self, user_id: str) -> List[Dict[str, Any]]:
+        """从数据库读取用户活跃会话并整体替换索引，返回索引条目"""
+        active_sessions = self.oper_session.get_active_sessions_by_user(
+            user_id, limit=Config.MAX_ACTIVE_SESSIONS_PER_USER
+        )
+        entries = [self._build_session_index_entry(session) for session in active_sessions]
+        session_index.add_sessions(user_id, entries, replace=True)
+        return entries
+    
+    def reconcile_session_index(self, chunk_size: int = None) -> Dict[str, Any]:
+        """
+        会话索引对账 (周期任务) - 按用户ID分块比较数据库活跃会话数与索引中的数量，不一致的用户整体回填
+        修复部署前创建的会话、索引写入失败等造成的偏差，会话列表读取因此只走Redis
+        """
+        chunk_size = chunk_size or CacheConfig.SESSION_INDEX_RECONCILE_CHUNK
+        started = time.time()
+        result = {'checked': 0, 'rebuilt': 0}
+        after_user_id = None
+        while True:
+            rows = self.oper_session.count_active_sessions_by_user(after_user_id, chunk_size)
+            if not rows:
+                break
+            indexed = session_index.count_active_many([user_id for user_id, _ in rows])
+            if indexed is None:
+                break
+            for user_id, count in rows:
+                if indexed.get(user_id, 0) != min(count, Config.MAX_ACTIVE_SESSIONS_PER_USER):
+                    self._rebuild_session_index(user_id)
+                    result['rebuilt'] += 1
+            result['checked'] += len(rows)
+            after_user_id = rows[-1][0]
+            if len(rows) < chunk_size:
+                break
+        result['duration_ms'] = int((time.time() - started) * 1000)
+        return result
+    
+    def _build_session_index_entry(self, session) -> Dict[str, Any]:
+        """构建会话索引条目"""
+        return {
+            'session_id': session.session_token,
+            'device_info': session.device_info.get('type', '未知設備') if session.device_info else '未知設備',
+            'ip_address': session.ip_address or "未知IP",
+            'created_at': session.created_at,
+            'expires_at': session.expires_at,
+            'last_activity': session.last_activity or session.created_at
+        }
+    
     # ==================== 数据一致性保障方法 ====================
     
     def ensure_cache_consistency_on_user_update(self, user_id: str) -> bool:
@@ -591,27 +853,11 @@ class AuthController:
             # 清除用户相关的所有缓存
             self.invalidate_user_cache(user_id)
             
-            # 清除该用户所有会话的缓存
-            sessions = self.oper_session.get_active_sessions_by_user(user_id)
-            for session in sessions:
-                self.invalidate_session_cache(session.id)
+            # 清除该用户所有会话的缓存 (会话缓存以会话令牌为键)
+            token_cache.batch_invalidate_sessions(self.oper_session.get_active_session_tokens(user_id))
             
-            # 清除该用户的令牌验证缓存 - 通过键模式匹配
-            try:
-                # 这里需要Redis支持清除模式匹配的键
-                redis_keys = redis_client.redis_client.keys(f"auth:token:*")
-                for key in redis_keys:
-                    cached_data = redis_client.get(key)
-                    if cached_data:
-                        import json
-                        try:
-                            cache_info = json.loads(cached_data)
-                            if cache_info.get('result', {}).get('user_id') == user_id:
-                                redis_client.delete(key)
-                        except (json.JSONDecodeError, KeyError):
-                            continue
-            except Exception as e:
-                logger.warning(f"清除令牌验证缓存失败: {str(e)}")
+            # 清除该用户的令牌验证缓存
+            token_cache.invalidate_user_token_validations(user_id)
             
             return True
         except Exception as e:
@@ -629,8 +875,7 @@ class AuthController:
             if session:
                 # 清除与该会话相关的令牌验证缓存
                 token_hash = session.refresh_token_hash
-                token_cache_key = f"auth:token:{hashlib.sha256(token_hash.encode()).hexdigest()}"
-                redis_client.delete(token_cache_key)
+                token_cache.tokens.delete(hashlib.sha256(token_hash.encode()).hexdigest())
             
             return True
         except Exception as e:
@@ -923,43 +1168,18 @@ class AuthController:
                 return error_result, False
             
             # 第4层：检查缓存的用户信息 (< 1ms)
-            cached_user = token_cache.get_cached_user_info(user_id)
-            if cached_user:
-                user_info = cached_user
-                # 检查用户状态
-                if user_info.get('status') not in ['active', 'pending_verification']:
-                    error_result = f"用戶狀態異常: {user_info.get('status')}"
-                    token_cache.cache_token_validation(token, error_result, ttl=60)
-                    return error_result, False
-            else:
-                # 第5层：数据库查询用户 (仅在缓存未命中时)
-                user = self.oper_user.get_by_id(user_id)
-                if not user:
-                    error_result = "用戶不存在"
-                    token_cache.cache_token_validation(token, error_result, ttl=60)
-                    return error_result, False
-                
-                # 检查用户状态
-                if user.status not in ['active', 'pending_verification']:
-                    error_result = f"用戶狀態異常: {user.status}"
-                    token_cache.cache_token_validation(token, error_result, ttl=60)
-                    return error_result, False
-                
-                # 构建用户信息并缓存
-                user_info = {
-                    'user_id': user.id,
-                    'username': user.username,
-                    'email': user.email,
-                    'status': user.status,
-                    'display_name': user.display_name,
-                    'avatar_url': user.avatar_url
-                }
-                
-                # 异步缓存用户信息，不影响响应时间
-                try:
-                    token_cache.cache_user_info(user_id, user_info)
-                except Exception as cache_error:
-                    logger.warning(f"缓存用户信息失败: {str(cache_error)}")
+            # 第5层：缓存未命中时查询数据库，热点用户缓存过期时只有一个请求回源
+            user_info = token_cache.get_cached_user_info(user_id, loader=lambda: self._load_user_cache_info(user_id))
+            if not user_info:
+                error_result = "用戶不存在"
+                token_cache.cache_token_validation(token, error_result, ttl=60)
+                return error_result, False
+            
+            # 检查用户状态
+            if user_info.get('status') not in ['active', 'pending_verification']:
+                error_result = f"用戶狀態異常: {user_info.get('status')}"
+                token_cache.cache_token_validation(token, error_result, ttl=60)
+                return error_result, False
             
             # 第6层：检查会话有效性（如果有session_id）
             if session_id:
@@ -1116,61 +1336,159 @@ class AuthController:
     
     # ==================== 平台管理員方法 ====================
     
-    def get_users_list(self, page: int = 1, size: int = 20, filters: Dict = None) -> Tuple[Any, bool]:
-        """獲取用戶列表（平台管理員）"""
+    def get_users_list(self, page: int = 1, size: int = 20, filters: Dict = None,
+                       cursor: str = None, include_total: str = 'approx') -> Tuple[Any, bool]:
+        """
+        獲取用戶列表（平台管理員）
+        使用 (created_at, id) 游標分頁，深分頁不再退化為大OFFSET掃描；
+        搜索走Redis前綴索引，索引不可用時回退為前綴LIKE。
+        """
         try:
-            query = self.oper_user.model.query
-            
-            # 應用過濾條件
-            if filters:
-                if filters.get('status'):
-                    query = query.filter(self.oper_user.model.status == filters['status'])
-                if filters.get('platform_role'):
-                    query = query.filter(self.oper_user.model.platform_role == filters['platform_role'])
-                if filters.get('email_verified') is not None:
-                    query = query.filter(self.oper_user.model.email_verified == filters['email_verified'])
-                if filters.get('search'):
-                    search_term = f"%{filters['search']}%"
-                    query = query.filter(
-                        or_(
-                            self.oper_user.model.username.like(search_term),
-                            self.oper_user.model.email.like(search_term),
-                            self.oper_user.model.display_name.like(search_term)
-                        )
-                    )
-            
-            # 分頁查詢
-            paginated = query.order_by(self.oper_user.model.created_at.desc()).paginate(
-                page=page, per_page=size, error_out=False
+            filters = filters or {}
+
+            after = None
+            if cursor:
+                after = self._decode_users_cursor(cursor)
+                if not after:
+                    return "無效的分頁游標", False
+
+            # 搜索索引命中的用戶ID，None表示索引不可用；命中用戶超過上限時結果集被截斷
+            user_ids, search_truncated = None, False
+            if filters.get('search'):
+                search_result = user_search_index.search_user_ids(filters['search'])
+                if search_result is not None:
+                    user_ids, search_truncated = search_result
+                    if not user_ids:
+                        return self._build_users_list_result([], size, page, cursor, 0, False), True
+
+            # 多取一條用於判斷是否還有下一頁
+            offset = 0 if after else (page - 1) * size
+            users = self.oper_user.list_users_keyset(
+                size + 1, filters, after=after, user_ids=user_ids, offset=offset
             )
-            
-            users_data = []
-            for user in paginated.items:
-                users_data.append({
-                    'user_id': user.id,
-                    'username': user.username,
-                    'email': user.email,
-                    'display_name': user.display_name,
-                    'status': user.status,
-                    'platform_role': user.platform_role,
-                    'email_verified': user.email_verified,
-                    'two_factor_enabled': user.two_factor_enabled,
-                    'last_login_at': user.last_login_at.isoformat() if user.last_login_at else None,
-                    'created_at': user.created_at.isoformat() if user.created_at else None
-                })
-            
-            return {
-                'users': users_data,
-                'total': paginated.total,
-                'page': page,
-                'size': size,
-                'pages': paginated.pages
-            }, True
-            
+            has_more = len(users) > size
+            users = users[:size]
+
+            total, total_is_approximate = None, False
+            if include_total == 'exact':
+                total = self.oper_user.count_users(filters, user_ids)
+            elif include_total == 'approx':
+                total, total_is_approximate = self._get_cached_users_count(filters, user_ids)
+            # 截斷時總數只是命中範圍內的下限
+            if total is not None and search_truncated:
+                total_is_approximate = True
+
+            next_cursor = None
+            if has_more and users:
+                next_cursor = self._encode_users_cursor(users[-1])
+
+            result = self._build_users_list_result(
+                users, size, page, cursor, total, total_is_approximate
+            )
+            result['next_cursor'] = next_cursor
+            result['has_more'] = has_more
+            result['search_truncated'] = search_truncated
+            return result, True
+
         except Exception as e:
             logger.error(f"獲取用戶列表異常: {str(e)}")
             return "獲取用戶列表失敗", False
-    
+
+    def _build_users_list_result(self, users: List, size: int, page: int, cursor: Optional[str],
+                                 total: Optional[int], total_is_approximate: bool) -> Dict[str, Any]:
+        """構建用戶列表響應"""
+        users_data = []
+        for user in users:
+            users_data.append({
+                'user_id': user.id,
+                'username': user.username,
+                'email': user.email,
+                'display_name': user.display_name,
+                'status': user.status,
+                'platform_role': user.platform_role,
+                'email_verified': user.email_verified,
+                'two_factor_enabled': user.two_factor_enabled,
+                'last_login_at': user.last_login_at.isoformat() if user.last_login_at else None,
+                'created_at': user.created_at.isoformat() if user.created_at else None
+            })
+
+        return {
+            'users': users_data,
+            'total': total,
+            'total_is_approximate': total_is_approximate,
+            # 使用游標時頁碼無意義
+            'page': None if cursor else page,
+            'size': size,
+            'pages': (total + size - 1) // size if total is not None else None,
+            'next_cursor': None,
+            'has_more': False,
+            'search_truncated': False
+        }
+
+    def _get_cached_users_count(self, filters: Dict, user_ids: Optional[List[str]]) -> Tuple[int, bool]:
+        """
+        獲取近似用戶總數：按過濾條件緩存COUNT結果，避免每次翻頁都全表計數
+        搜索命中時按主鍵IN列表加上狀態/角色/驗證過濾計數，緩存鍵包含搜索詞
+        :return: (總數, 是否為緩存的近似值)
+        """
+        count_key = "auth:admin:users:count:" + hashlib.md5(
+            json.dumps(filters, sort_keys=True, default=str).encode()
+        ).hexdigest()
+
+        try:
+            if redis_client.redis_client:
+                cached = redis_client.redis_client.get(count_key)
+                if cached is not None:
+                    return int(cached), True
+        except Exception as e:
+            logger.warning(f"讀取用戶總數緩存失敗: {str(e)}")
+
+        total = self.oper_user.count_users(filters, user_ids)
+        try:
+            if redis_client.redis_client:
+                redis_client.redis_client.setex(count_key, CacheConfig.ADMIN_USER_COUNT_TTL, total)
+        except Exception as e:
+            logger.warning(f"寫入用戶總數緩存失敗: {str(e)}")
+        return total, False
+
+    def refresh_user_search_index(self, user_id: str) -> bool:
+        """用戶名/郵箱/顯示名稱變更後刷新搜索索引，失敗不影響主流程 (定時重建兜底)"""
+        try:
+            user = self.oper_user.get_by_id(user_id)
+            if not user:
+                return user_search_index.remove_user(user_id)
+            return user_search_index.index_user(user)
+        except Exception as e:
+            logger.warning(f"刷新用戶搜索索引失敗: {str(e)}")
+            return False
+
+    def rebuild_user_search_index(self) -> Dict[str, Any]:
+        """全量重建用戶搜索索引 (定時任務)"""
+        start_time = time.time()
+        indexed = 0
+        for chunk in self.oper_user.iter_user_chunks():
+            if user_search_index.index_users(chunk):
+                indexed += len(chunk)
+        duration_ms = int((time.time() - start_time) * 1000)
+        logger.info(f"用戶搜索索引重建完成: {indexed} 個用戶, 耗時 {duration_ms}ms")
+        return {'indexed_users': indexed, 'duration_ms': duration_ms}
+
+    @staticmethod
+    def _encode_users_cursor(user) -> str:
+        """編碼分頁游標 (created_at, id)"""
+        payload = json.dumps([user.created_at.isoformat(), str(user.id)])
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    @staticmethod
+    def _decode_users_cursor(cursor: str) -> Optional[Tuple[datetime, str]]:
+        """解碼分頁游標，格式錯誤返回None"""
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            created_at, user_id = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+            return datetime.fromisoformat(created_at), str(user_id)
+        except Exception:
+            return None
+
     def update_user_platform_role(self, admin_user_id: str, target_user_id: str, new_role: str) -> Tuple[Any, bool]:
         """更新用戶平台角色（平台管理員）"""
         try:
@@ -1226,6 +1544,8 @@ class AuthController:
             if target_user.status == 'suspended':
                 return "用戶已經被暫停", False
             
+            db_tokens = []
+            
             def _suspend_user_transaction():
                 # 更新用戶狀態
                 update_result, update_flag = self.oper_user.update_user(
@@ -1234,10 +1554,11 @@ class AuthController:
                 if not update_flag:
                     raise Exception(f"暫停用戶失敗: {update_result}")
                 
-                # 撤銷該用戶的所有活躍會話
-                active_sessions = self.oper_session.get_active_sessions_by_user(target_user_id)
-                for session in active_sessions:
-                    self.oper_session.terminate_session(session)
+                # 撤銷該用戶的所有活躍會話，索引與撤銷下發在提交後進行
+                db_tokens.extend(self.oper_session.get_active_session_tokens(target_user_id))
+                revoke_result, revoke_flag = self.oper_session.revoke_user_sessions(target_user_id)
+                if not revoke_flag:
+                    raise Exception(f"撤銷用戶會話失敗: {revoke_result}")
                 
                 # 使用戶緩存失效
                 self.ensure_cache_consistency_on_user_update(target_user_id)
@@ -1252,7 +1573,10 @@ class AuthController:
                     'message': '用戶已被暫停'
                 }
             
-            return self._execute_with_transaction(_suspend_user_transaction, "暫停用戶")
+            result, flag = self._execute_with_transaction(_suspend_user_transaction, "暫停用戶")
+            if flag:
+                self._fan_out_session_revocation(target_user_id, db_tokens)
+            return result, flag
             
         except Exception as e:
             logger.error(f"暫停用戶異常: {str(e)}")
@@ -1289,6 +1613,8 @@ class AuthController:
                 
                 # 使用戶緩存失效
                 self.ensure_cache_consistency_on_user_update(target_user_id)
+                # 同時解除Redis中的登錄失敗鎖定
+                login_guard.clear_account(target_user_id)
                 
                 # 記錄操作日誌
                 logger.info(f"用戶 {target_user.username} 被管理員 {admin_user_id} 激活")
@@ -1309,21 +1635,9 @@ class AuthController:
     def check_platform_permission(self, user_id: str, required_role: str = 'platform_admin') -> Tuple[Any, bool]:
         """檢查平台權限（內部服務）"""
         try:
-            # 先檢查緩存
-            cached_user = token_cache.get_cached_user_info(user_id)
-            if cached_user:
-                platform_role = cached_user.get('platform_role', 'platform_user')
-                has_permission = (platform_role == required_role) or (platform_role == 'platform_admin')
-                return {
-                    'user_id': user_id,
-                    'platform_role': platform_role,
-                    'has_permission': has_permission,
-                    'required_role': required_role
-                }, True
-            
-            # 從數據庫查詢
-            user = self.oper_user.get_by_id(user_id)
-            if not user:
+            # 先檢查緩存，未命中時從數據庫加載並回寫 (並發未命中只回源一次)
+            user_info = token_cache.get_cached_user_info(user_id, loader=lambda: self._load_user_cache_info(user_id))
+            if not user_info:
                 return {
                     'user_id': user_id,
                     'platform_role': None,
@@ -1332,21 +1646,8 @@ class AuthController:
                     'error': '用戶不存在'
                 }, False
             
-            platform_role = user.platform_role or 'platform_user'
+            platform_role = user_info.get('platform_role') or 'platform_user'
             has_permission = (platform_role == required_role) or (platform_role == 'platform_admin')
-            
-            # 緩存用戶信息
-            user_info = {
-                'user_id': user.id,
-                'username': user.username,
-                'email': user.email,
-                'display_name': user.display_name,
-                'status': user.status,
-                'platform_role': platform_role,
-                'avatar_url': user.avatar_url
-            }
-            token_cache.cache_user_info(user_id, user_info)
-            
             return {
                 'user_id': user_id,
                 'platform_role': platform_role,
@@ -1358,9 +1659,14 @@ class AuthController:
             logger.error(f"檢查平台權限異常: {str(e)}")
             return "檢查平台權限失敗", False
     
-    def warm_up_cache(self, user_ids: List[str] = None, limit: int = 100) -> Tuple[Any, bool]:
+    def warm_up_cache(self, user_ids: List[str] = None, limit: int = 100,
+                      active_sessions: bool = False) -> Tuple[Any, bool]:
         """缓存预热 - 预先加载热点用户数据"""
         try:
+            if active_sessions:
+                # 按活跃会话流式预热用户和会话缓存
+                return self.warm_up_active_sessions(max_sessions=limit), True
+            
             warmed_users = 0
             
             if user_ids:
@@ -1391,4 +1697,85 @@ class AuthController:
             
         except Exception as e:
             logger.error(f"缓存预热异常: {str(e)}")
-            return "缓存预热失败", False
\ No newline at end of file
+            return "缓存预热失败", False
+    
+    def warm_up_active_sessions(self, chunk_size: int = None, rate_limit: int = None,
+                                max_sessions: int = None) -> Dict[str, Any]:
+        """
+        活跃会话预热 - 从会话表分块流式读取活跃会话，通过pipeline批量写入用户和会话缓存
+        冷启动后令牌验证直接命中缓存，避免大量请求同时回源数据库
+        :param chunk_size: 每块会话数
+        :param rate_limit: 每秒最多预热的会话数
+        :param max_sessions: 单次预热会话上限
+        """
+        chunk_size = chunk_size or CacheConfig.CACHE_WARM_UP_CHUNK_SIZE
+        rate_limit = rate_limit or CacheConfig.CACHE_WARM_UP_RATE_LIMIT
+        max_sessions = max_sessions or CacheConfig.CACHE_WARM_UP_MAX_SESSIONS
+        
+        started = time.time()
+        warmed_sessions = 0
+        warmed_users = 0
+        db_user_queries = 0
+        
+        for chunk in self.oper_session.iter_active_session_chunks(chunk_size, max_sessions):
+            now = datetime.now()
+            sessions_data = {}
+            session_ttls = {}
+            for session in chunk:
+                sessions_data[session.session_token] = self._build_session_cache_info(session)
+                remaining = int((session.expires_at - now).total_seconds())
+                session_ttls[session.session_token] = max(1, min(remaining, token_cache.SESSION_CACHE_TTL))
+            
+            # 已缓存的用户不再回源，只查询缺失部分
+            user_ids = list({session.user_id for session in chunk})
+            cached_users = token_cache.batch_get_users(user_ids)
+            missing_user_ids = [uid for uid in user_ids if uid not in cached_users]
+            
+            users_data = {}
+            if missing_user_ids:
+                db_user_queries += 1
+                for user in self.oper_user.get_users_by_ids(missing_user_ids):
+                    users_data[user.id] = self._build_user_cache_info(user)
+            
+            token_cache.batch_cache_sessions(sessions_data, session_ttls)
+            if users_data:
+                token_cache.batch_cache_users(users_data)
+            
+            warmed_sessions += len(sessions_data)
+            warmed_users += len(users_data)
+            
+            # 限速：按已处理会话数计算应耗时间，超前则休眠
+            expected_elapsed = warmed_sessions / rate_limit
+            elapsed = time.time() - started
+            if expected_elapsed > elapsed:
+                time.sleep(expected_elapsed - elapsed)
+        
+        return {
+            'warmed_sessions': warmed_sessions,
+            'warmed_users': warmed_users,
+            'db_user_queries': db_user_queries,
+            'duration_ms': int((time.time() - started) * 1000),
+            'message': f'成功预热{warmed_sessions}个会话、{warmed_users}个用户的缓存'
+        }
+    
+    def prefetch_user_contexts(self, user_id: str) -> None:
+        """
+        登录预取 - 异步调用团队服务和权限服务，预先构建该用户的团队/权限上下文缓存
+        失败只记录日志，不影响登录
+        """
+        calls = [
+            (f"{Config.TEAM_SERVICE_URL}/internal/user/teams", {'user_ids': [user_id]}),
+            (f"{Config.PERMISSION_SERVICE_URL}/internal/permissions/build-context", {'user_id': user_id}),
+        ]
+        for url, payload in calls:
+            try:
+                _prefetch_executor.submit(self._post_prefetch, url, payload)
+            except Exception as e:
+                logger.warning(f"提交登錄預取任務失敗: {str(e)}")
+    
+    @staticmethod
+    def _post_prefetch(url: str, payload: Dict) -> None:
+        try:
+            _prefetch_http.post(url, json=payload, timeout=CacheConfig.LOGIN_PREFETCH_TIMEOUT)
+        except Exception as e:
+            logger.warning(f"登錄預取失敗 {url}: {str(e)}")
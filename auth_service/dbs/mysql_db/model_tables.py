@@ -72,6 +72,9 @@ class UserModel(BaseModel):
         db.Index('idx_platform_role', 'platform_role'),
         db.Index('idx_verification_token', 'email_verification_token'),
         db.Index('idx_reset_token', 'password_reset_token'),
+        # 管理员用户列表游标分页 (created_at, id)
+        db.Index('idx_created_id', 'created_at', 'id'),
+        db.Index('idx_status_created_id', 'status', 'created_at', 'id'),
     )
 
 
@@ -83,6 +86,7 @@ class UserSessionModel(BaseModel):
     user_id = db.Column(db.String(36), db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False, comment="用戶ID")
     session_token = db.Column(db.String(255), nullable=False, unique=True, comment="會話令牌")
     refresh_token_hash = db.Column(db.String(255), nullable=False, comment="刷新令牌哈希")
+    refresh_generation = db.Column(db.Integer, nullable=False, default=0, comment="刷新令牌代數")
     device_info = db.Column(db.JSON, comment="設備信息")
     ip_address = db.Column(db.String(45), comment="IP地址")
     user_agent = db.Column(db.Text, comment="用戶代理")
@@ -100,6 +104,8 @@ class UserSessionModel(BaseModel):
         db.Index('idx_refresh_token', 'refresh_token_hash'),
         db.Index('idx_expires', 'expires_at'),
         db.Index('idx_active', 'is_active'),
+        # 会话索引对账按用户分组统计活跃会话，覆盖索引避免回表
+        db.Index('idx_user_active_expires', 'user_id', 'is_active', 'expires_at'),
     )
 
 
@@ -82,7 +82,81 @@ class OperUserModel:
     def get_users_by_ids(self, user_ids: List[str]) -> List[UserModel]:
         """批量获取用户信息"""
         return self.model.query.filter(self.model.id.in_(user_ids)).all()
-    
+
+    def _build_list_conditions(self, filters: Dict = None, user_ids: List[str] = None) -> list:
+        """构建用户列表过滤条件"""
+        conditions = []
+        filters = filters or {}
+        if filters.get('status'):
+            conditions.append(self.model.status == filters['status'])
+        if filters.get('platform_role'):
+            conditions.append(self.model.platform_role == filters['platform_role'])
+        if filters.get('email_verified') is not None:
+            conditions.append(self.model.email_verified == filters['email_verified'])
+        if user_ids is not None:
+            conditions.append(self.model.id.in_(user_ids))
+        elif filters.get('search'):
+            # 搜索索引不可用时的回退：前缀匹配可以利用用户名/邮箱上的B-tree索引
+            # autoescape 转义输入中的 % 和 _，避免被当作通配符
+            prefix = filters['search']
+            conditions.append(
+                or_(
+                    self.model.username.startswith(prefix, autoescape=True),
+                    self.model.email.startswith(prefix, autoescape=True),
+                    self.model.display_name.startswith(prefix, autoescape=True)
+                )
+            )
+        return conditions
+
+    def list_users_keyset(self, size: int, filters: Dict = None, after: Tuple = None,
+                          user_ids: List[str] = None, offset: int = 0) -> List[UserModel]:
+        """
+        游标分页获取用户列表 - 按 (created_at, id) 倒序
+        :param size: 获取数量
+        :param filters: 过滤条件
+        :param after: 上一页最后一条的 (created_at, id)
+        :param user_ids: 限定用户ID范围 (搜索索引命中结果)
+        :param offset: 兼容旧版页码分页的偏移量，仅在未提供after时使用
+        """
+        conditions = self._build_list_conditions(filters, user_ids)
+        if after:
+            after_created_at, after_id = after
+            conditions.append(
+                or_(
+                    self.model.created_at < after_created_at,
+                    and_(self.model.created_at == after_created_at, self.model.id < after_id)
+                )
+            )
+
+        query = self.model.query.filter(and_(*conditions)).order_by(
+            self.model.created_at.desc(), self.model.id.desc()
+        )
+        if offset and not after:
+            query = query.offset(offset)
+        return query.limit(size).all()
+
+    def count_users(self, filters: Dict = None, user_ids: List[str] = None) -> int:
+        """统计用户数量"""
+        conditions = self._build_list_conditions(filters, user_ids)
+        return db.session.query(func.count(self.model.id)).filter(and_(*conditions)).scalar() or 0
+
+    def iter_user_chunks(self, chunk_size: int = 500):
+        """按主键游标分块遍历全部用户 (仅加载搜索索引所需字段)"""
+        last_id = None
+        while True:
+            query = self.model.query.options(
+                load_only(self.model.id, self.model.username, self.model.email, self.model.display_name)
+            )
+            if last_id is not None:
+                query = query.filter(self.model.id > last_id)
+            chunk = query.order_by(self.model.id.asc()).limit(chunk_size).all()
+            if not chunk:
+                return
+            yield chunk
+            last_id = chunk[-1].id
+            if len(chunk) < chunk_size:
+                return
+
     @TryExcept("更新用戶失敗")
     def update_user(self, user, update_data):
         """更新用户信息"""
@@ -226,6 +300,10 @@ class OperUserSessionModel:
             )
         ).first()
     
+    def get_session_by_id(self, session_id):
+        """根据会话ID获取会话"""
+        return self.model.query.filter(self.model.id == session_id).first()
+
     def get_active_sessions_by_user(self, user_id, limit=10):
         """获取用户的活跃会话"""
         current_time = datetime.now()
@@ -237,11 +315,53 @@ class OperUserSessionModel:
             )
         ).order_by(self.model.created_at.desc()).limit(limit).all()
     
+    def iter_active_session_chunks(self, chunk_size=200, max_sessions=None):
+        """
+        分块流式遍历活跃会话 - 按主键游标(keyset)分页，避免OFFSET深翻页和一次性加载
+        :return: 生成器，每次产出一块会话列表
+        """
+        last_id = None
+        yielded = 0
+        while True:
+            if max_sessions is not None:
+                if yielded >= max_sessions:
+                    return
+                chunk_size = min(chunk_size, max_sessions - yielded)
+
+            conditions = [
+                self.model.is_active == True,
+                self.model.expires_at > datetime.now()
+            ]
+            if last_id is not None:
+                conditions.append(self.model.id > last_id)
+
+            chunk = self.model.query.options(
+                load_only(
+                    self.model.id, self.model.user_id, self.model.session_token,
+                    self.model.device_info, self.model.ip_address, self.model.expires_at
+                )
+            ).filter(and_(*conditions)).order_by(self.model.id.asc()).limit(chunk_size).all()
+
+            if not chunk:
+                return
+
+            yield chunk
+            yielded += len(chunk)
+            last_id = chunk[-1].id
+            if len(chunk) < chunk_size:
+                return
+
     @TryExcept("終止會話失敗")
     def terminate_session(self, session):
         """终止会话"""
         session.is_active = False
         return True
+
+    @TryExcept("撤銷會話失敗")
+    def revoke_session(self, session):
+        """撤销会话"""
+        session.is_active = False
+        return True
     
     @TryExcept("更新會話活動時間失敗")
     def update_last_activity(self, session):
@@ -253,25 +373,81 @@ class OperUserSessionModel:
         """检查会话是否有效"""
         if not session or not session.is_active:
             return False
-        
+
         current_time = datetime.now()
         return session.expires_at > current_time
-    
+
+    @TryExcept("輪換刷新令牌失敗")
+    def rotate_refresh_token(self, session_token, generation, new_refresh_token_hash):
+        """
+        轮换刷新令牌 - 条件更新(CAS)，仅当会话有效且代数匹配时推进代数
+        :return: 更新的行数，0表示令牌已被轮换或会话已失效
+        """
+        return self.model.query.filter(
+            and_(
+                self.model.session_token == session_token,
+                self.model.refresh_generation == generation,
+                self.model.is_active == True,
+                self.model.expires_at > datetime.now()
+            )
+        ).update({
+            self.model.refresh_generation: generation + 1,
+            self.model.refresh_token_hash: new_refresh_token_hash,
+            self.model.last_activity: datetime.now()
+        }, synchronize_session=False)
+
+    @TryExcept("撤銷會話失敗")
+    def revoke_by_session_token(self, session_token, user_id=None):
+        """根据会话令牌撤销会话 - 单条UPDATE，无需先查询"""
+        conditions = [self.model.session_token == session_token, self.model.is_active == True]
+        if user_id is not None:
+            conditions.append(self.model.user_id == user_id)
+        return self.model.query.filter(and_(*conditions)).update(
+            {self.model.is_active: False}, synchronize_session=False
+        )
+
+    @TryExcept("撤銷會話失敗")
+    def revoke_user_sessions(self, user_id, exclude_session_token=None):
+        """撤销用户的全部活跃会话(可保留指定会话) - 单条UPDATE"""
+        conditions = [self.model.user_id == user_id, self.model.is_active == True]
+        if exclude_session_token:
+            conditions.append(self.model.session_token != exclude_session_token)
+        return self.model.query.filter(and_(*conditions)).update(
+            {self.model.is_active: False}, synchronize_session=False
+        )
+
+    def count_active_sessions_by_user(self, after_user_id=None, limit=500):
+        """
+        按用户ID游标分块统计活跃会话数 (会话索引对账用)
+        :return: [(用户ID, 活跃会话数)]，按用户ID升序
+        """
+        conditions = [self.model.is_active == True, self.model.expires_at > datetime.now()]
+        if after_user_id is not None:
+            conditions.append(self.model.user_id > after_user_id)
+        return db.session.query(self.model.user_id, func.count(self.model.id)).filter(
+            and_(*conditions)
+        ).group_by(self.model.user_id).order_by(self.model.user_id).limit(limit).all()
+
+    def get_active_session_tokens(self, user_id, exclude_session_token=None):
+        """获取用户活跃会话的令牌列表"""
+        conditions = [
+            self.model.user_id == user_id,
+            self.model.is_active == True,
+            self.model.expires_at > datetime.now()
+        ]
+        if exclude_session_token:
+            conditions.append(self.model.session_token != exclude_session_token)
+        return [row.session_token for row in db.session.query(self.model.session_token).filter(and_(*conditions))]
+
     @TryExcept("清理過期會話失敗")
     def cleanup_expired_sessions(self):
-        """清理过期会话"""
-        current_time = datetime.now()
-        expired_sessions = self.model.query.filter(
+        """清理过期会话 - 单条UPDATE，不加载会话对象"""
+        return self.model.query.filter(
             and_(
-                self.model.expires_at <= current_time,
+                self.model.expires_at <= datetime.now(),
                 self.model.is_active == True
             )
-        ).all()
-        
-        for session in expired_sessions:
-            session.is_active = False
-        
-        return len(expired_sessions)
+        ).update({self.model.is_active: False}, synchronize_session=False)
 
 
 
@@ -287,6 +463,14 @@ class OperLoginAttemptModel:
         """创建登录尝试记录"""
         db.session.add(attempt_data)
         return True
+
+    @TryExcept("批量記錄登錄嘗試失敗")
+    def bulk_create_attempts(self, attempts: List[Dict]):
+        """批量写入登录尝试记录 (单条多值INSERT)"""
+        if not attempts:
+            return 0
+        db.session.bulk_insert_mappings(self.model, attempts)
+        return len(attempts)
     
     def get_recent_failed_attempts(self, identifier, identifier_type='email', hours=1):
         """获取最近的失败登录尝试"""
@@ -143,9 +143,10 @@ class UserSessionsResponseSchema(Schema):
 
 class SessionRevokeSchema(Schema):
     """撤销会话请求参数"""
-    token_id = fields.Int(
+    token_id = fields.String(
         required=True,
-        metadata={"description": "令牌ID"}
+        validate=validate.Length(min=1, max=255),
+        metadata={"description": "会话ID (登录返回的session_id)"}
     )
 
 
@@ -581,7 +582,16 @@ class AdminUsersQuerySchema(Schema):
     )
     search = fields.String(
         validate=validate.Length(max=100),
-        metadata={"description": "搜索关键词"}
+        metadata={"description": "搜索关键词(前缀匹配)"}
+    )
+    cursor = fields.String(
+        validate=validate.Length(max=200),
+        metadata={"description": "分页游标，取上一页返回的next_cursor；提供时忽略page"}
+    )
+    include_total = fields.String(
+        load_default='approx',
+        validate=validate.OneOf(['none', 'approx', 'exact']),
+        metadata={"description": "总数统计方式: none-不统计, approx-缓存计数, exact-实时计数"}
     )
 
 
@@ -625,6 +635,10 @@ class CacheWarmUpSchema(Schema):
     )
     limit = fields.Int(
         load_default=100,
-        validate=validate.Range(min=1, max=1000),
+        validate=validate.Range(min=1, max=100000),
         metadata={"description": "预热数量限制"}
+    )
+    active_sessions = fields.Boolean(
+        load_default=False,
+        metadata={"description": "是否按活跃会话流式预热用户和会话缓存"}
     )
\ No newline at end of file
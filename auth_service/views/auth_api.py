@@ -9,7 +9,7 @@
 from flask import request, g
 from flask.views import MethodView
 from flask_smorest import Blueprint
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required, get_jwt, get_jwt_identity
 
 from common.common_method import fail_response_result, response_result
 from controllers.auth_controller import AuthController
@@ -155,6 +155,8 @@ class UserProfileApi(BaseAuthView):
             
             # 清除緩存
             self.ac.ensure_cache_consistency_on_user_update(current_user_id)
+            if 'display_name' in update_data:
+                self.ac.refresh_user_search_index(current_user_id)
             
             # 返回更新後的用戶信息
             result, flag = self.ac.get_profile(current_user_id)
@@ -204,11 +206,11 @@ class UserSessionsApi(BaseAuthView):
     def get(self):
         """获取用户的活跃会话列表"""
         try:
-            current_user_id = get_jwt_identity()
-            user_id = int(current_user_id)
+            user_id = get_jwt_identity()
+            current_session_id = get_jwt().get('session_id')
             
             # 通过控制器获取会话列表，符合MVC架构
-            result, flag = self.ac.get_user_sessions(user_id)
+            result, flag = self.ac.get_user_sessions(user_id, current_session_id)
             return self._build_response(result, flag, "獲取會話列表成功")
         except Exception as e:
             logger.error(f"獲取會話列表異常: {str(e)}")
@@ -220,8 +222,7 @@ class UserSessionsApi(BaseAuthView):
     def delete(self, payload):
         """撤销指定会话"""
         try:
-            current_user_id = get_jwt_identity()
-            user_id = int(current_user_id)
+            user_id = get_jwt_identity()
             token_id = payload['token_id']
             
             # 通过控制器撤销会话，符合MVC架构
@@ -232,6 +233,25 @@ class UserSessionsApi(BaseAuthView):
             return fail_response_result(msg="系統內部錯誤，請稍後重試")
 
 
+@blp.route("/auth/sessions/revoke-others")
+class UserRevokeOtherSessionsApi(BaseAuthView):
+    """撤销其他会话API"""
+
+    @jwt_required()
+    @blp.response(200, RspMsgDictSchema)
+    def post(self):
+        """撤销当前会话以外的全部会话"""
+        try:
+            user_id = get_jwt_identity()
+            current_session_id = get_jwt().get('session_id')
+            
+            result, flag = self.ac.revoke_other_sessions(user_id, current_session_id)
+            return self._build_response(result, flag, "其他會話已撤銷")
+        except Exception as e:
+            logger.error(f"撤銷其他會話異常: {str(e)}")
+            return fail_response_result(msg="系統內部錯誤，請稍後重試")
+
+
 @blp.route("/auth/health")
 class AuthHealthApi(MethodView):
     """认证服务健康检查API"""
@@ -498,7 +518,11 @@ class AdminUsersListApi(BaseAuthView):
             if query_params.get('search'):
                 filters['search'] = query_params.get('search')
             
-            result, flag = self.ac.get_users_list(page, size, filters)
+            result, flag = self.ac.get_users_list(
+                page, size, filters,
+                cursor=query_params.get('cursor'),
+                include_total=query_params.get('include_total', 'approx')
+            )
             return self._build_response(result, flag, "獲取用戶列表成功")
         except Exception as e:
             logger.error(f"獲取用戶列表異常: {str(e)}")
@@ -742,8 +766,9 @@ class CacheWarmUpApi(BaseAuthView):
             # 可以从请求参数获取用户ID列表和限制数量
             user_ids = payload.get('user_ids')
             limit = payload.get('limit', 100)
+            active_sessions = payload.get('active_sessions', False)
             
-            result, flag = self.ac.warm_up_cache(user_ids, limit)
+            result, flag = self.ac.warm_up_cache(user_ids, limit, active_sessions)
             return self._build_response(result, flag, "緩存預熱成功")
         except Exception as e:
             logger.error(f"緩存預熱異常: {str(e)}")
@@ -0,0 +1,791 @@
+# -*- coding: utf-8 -*-
+"""
+@文件: cache_engine.py
+@說明: 两级缓存引擎 - 进程内LRU(L1) + Redis(L2)，支持负缓存、请求合并、TTL抖动、发布订阅失效、标签批量失效和二进制编码
+@時間: 2025-01-09
+@作者: LiDong
+"""
+
+import json
+import math
+import queue
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from cache import redis_client
+from cache.codec import CacheCodec
+from configs.cache_config import CacheConfig
+from loggers import logger
+
+
+# 缓存未命中标记 (区别于缓存的None/负缓存)，LocalLRUCache.get 未命中时返回
+MISSING = object()
+# 负缓存标记：数据源确认不存在的键，L2中存储为 {"n": 1}
+_NEGATIVE = object()
+
+
+class LocalLRUCache:
+    """进程内LRU缓存 - 每个条目带独立过期时间"""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return MISSING
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return MISSING
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        if self.max_size <= 0 or ttl <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def delete_prefix(self, prefix: str) -> None:
+        with self._lock:
+            for key in [k for k in self._data if k.startswith(prefix)]:
+                del self._data[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class _InflightCall:
+    """进行中的回源调用，同键的并发请求等待同一结果"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _BackgroundWorker:
+    """
+    后台任务线程 - 承接按前缀扫描、键数量统计等慢操作，避免占用请求线程
+    同一任务键在执行前只排队一次
+    """
+
+    def __init__(self, name: str, max_pending: int):
+        self.name = name
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def submit(self, job_key: str, func: Callable[[], Any]) -> bool:
+        """提交任务，返回是否已在队列中"""
+        with self._lock:
+            if job_key in self._pending:
+                return True
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=f"cache-worker-{self.name}", daemon=True)
+                self._thread.start()
+            try:
+                self._queue.put_nowait((job_key, func))
+            except queue.Full:
+                logger.warning(f"緩存後台任務隊列已滿，丟棄任務: {job_key}")
+                return False
+            self._pending.add(job_key)
+            return True
+
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    def _run(self) -> None:
+        while True:
+            job_key, func = self._queue.get()
+            # 先出队再执行，执行期间的新提交会重新排队，不会漏掉之后的变更
+            with self._lock:
+                self._pending.discard(job_key)
+            try:
+                func()
+            except Exception as e:
+                logger.error(f"緩存後台任務執行失敗: {job_key}, {str(e)}")
+
+
+# 释放回源租约：仅当租约仍属于自己时删除
+_RELEASE_LEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class CacheNamespace:
+    """
+    缓存命名空间 - 一类数据(如团队信息、成员角色)共享键前缀、TTL和L1容量
+
+    读取顺序：L1 -> L2(Redis) -> 回源(get_or_load)。
+    L1的TTL远短于L2，发布订阅消息丢失时最多产生 l1_ttl 秒的陈旧数据。
+    需要按组失效的键(如团队下的全部成员)在写入时附带标签，标签是一个以过期时间为分值的
+    有序集合，失效时只处理该组的键，不扫描整个键空间。
+
+    防击穿(get_or_load)：
+    - 未命中时进程内请求合并，跨进程通过Redis租约只让一个请求回源，其余请求短暂等待结果；
+    - stale_ttl > 0 时键在逻辑TTL之后继续保留 stale_ttl 秒，过期后由抢到租约的请求回源刷新，
+      其余请求直接返回旧值；
+    - XFetch：按上次回源耗时和 xfetch_beta 概率性地在到期前提前刷新，避免热点键同时到期。
+    普通 get 不返回逻辑过期的值，语义与未开启时一致。
+    """
+
+    def __init__(self, engine: "CacheEngine", name: str, prefix: str, ttl: int,
+                 l1_size: int = None, l1_ttl: int = None, negative_ttl: int = None,
+                 codec: str = None, compress_threshold: int = None,
+                 stale_ttl: int = None, xfetch_beta: float = None):
+        self.engine = engine
+        self.name = name
+        self.prefix = prefix
+        self.ttl = ttl
+        self.l1_ttl = min(l1_ttl or CacheConfig.L1_CACHE_MAX_TTL, ttl)
+        self.negative_ttl = negative_ttl or CacheConfig.NEGATIVE_CACHE_TTL
+        if not CacheConfig.L1_CACHE_ENABLED:
+            l1_size = 0
+        elif l1_size is None:
+            l1_size = CacheConfig.L1_CACHE_DEFAULT_SIZE
+        self.l1 = LocalLRUCache(l1_size)
+        self.codec = CacheCodec(codec, compress_threshold)
+        self.stale_ttl = CacheConfig.CACHE_STALE_TTL if stale_ttl is None else stale_ttl
+        self.xfetch_beta = CacheConfig.CACHE_XFETCH_BETA if xfetch_beta is None else xfetch_beta
+
+    def key(self, key: str) -> str:
+        return f"{self.prefix}{key}"
+
+    def tag_key(self, tag: str) -> str:
+        return f"{CacheConfig.CACHE_TAG_KEY_PREFIX}{self.engine.service_name}:{self.name}:{tag}"
+
+    # ==================== 读取 ====================
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """读取缓存，未命中或负缓存时返回default"""
+        value = self._get(key)
+        return default if value is MISSING or value is _NEGATIVE else value
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """批量读取，L1未命中的键通过一次MGET从Redis获取；只返回命中的键"""
+        result = {}
+        l2_keys = []
+        for key in keys:
+            value = self.l1.get(self.key(key))
+            if value is MISSING:
+                l2_keys.append(key)
+            else:
+                self.engine.record('l1_hit')
+                if value is not _NEGATIVE:
+                    result[key] = value
+
+        redis = self.engine.value_conn()
+        if l2_keys and redis:
+            try:
+                raws = redis.mget([self.key(k) for k in l2_keys])
+                now = time.time()
+                for key, raw in zip(l2_keys, raws):
+                    value, meta = self._decode_entry(raw)
+                    if value is MISSING or self._is_expired(meta, now):
+                        self.engine.record('miss')
+                        continue
+                    self.engine.record('l2_hit')
+                    self.l1.set(self.key(key), value, self._l1_ttl_for(value))
+                    if value is not _NEGATIVE:
+                        result[key] = value
+            except Exception as e:
+                logger.error(f"批量讀取緩存失敗[{self.name}]: {str(e)}")
+        return result
+
+    def peek_many(self, keys: List[str]) -> Dict[str, Any]:
+        """直接读取Redis中的值，不经过L1也不计入命中统计 (供后台清理等批量扫描使用)；负缓存返回None"""
+        redis = self.engine.value_conn()
+        if not keys or not redis:
+            return {}
+        try:
+            raws = redis.mget([self.key(k) for k in keys])
+        except Exception as e:
+            logger.error(f"批量讀取緩存失敗[{self.name}]: {str(e)}")
+            return {}
+        result = {}
+        for key, raw in zip(keys, raws):
+            value = self.decode(raw)
+            if value is not MISSING:
+                result[key] = None if value is _NEGATIVE else value
+        return result
+
+    def get_or_load(self, key: str, loader: Callable[[], Any], ttl: int = None, tags: List[str] = None) -> Any:
+        """
+        读取缓存，未命中时回源 (防击穿)
+        loader返回None时写入负缓存
+        :param tags: 回源写入时附带的失效标签
+        """
+        full_key = self.key(key)
+        value = self.l1.get(full_key)
+        if value is not MISSING:
+            self.engine.record('l1_hit')
+            return None if value is _NEGATIVE else value
+
+        value, meta = self._read_l2(full_key)
+        if value is _NEGATIVE:
+            self.engine.record('l2_hit')
+            self.l1.set(full_key, value, self._l1_ttl_for(value))
+            return None
+        if value is not MISSING:
+            self.engine.record('l2_hit')
+            now = time.time()
+            if not self._is_expired(meta, now) and not self._should_refresh_early(meta, now):
+                self.l1.set(full_key, value, self.l1_ttl)
+                return value
+            # 已过期(仍在stale窗口内)或XFetch命中：抢到租约的请求刷新，其余请求返回旧值
+            lease = self.engine.acquire_lease(full_key)
+            if lease is None:
+                self.engine.record('stale_served')
+                return value
+            self.engine.record('early_refresh' if not self._is_expired(meta, now) else 'stale_refresh')
+            try:
+                return self._load_and_store(key, loader, ttl, tags)
+            except Exception as e:
+                # 刷新失败时旧值仍可用，不把数据源故障放大给调用方
+                logger.warning(f"刷新緩存失敗，返回舊值[{self.name}]: {str(e)}")
+                return value
+            finally:
+                self.engine.release_lease(full_key, lease)
+
+        return self.engine.single_flight(full_key, lambda: self._load_with_lease(key, loader, ttl, tags))
+
+    def _load_with_lease(self, key: str, loader: Callable[[], Any], ttl: int = None, tags: List[str] = None) -> Any:
+        """未命中回源：跨进程只允许租约持有者回源，其余请求轮询等待其写入结果"""
+        full_key = self.key(key)
+        lease = self.engine.acquire_lease(full_key)
+        if lease is None:
+            self.engine.record('lease_wait')
+            deadline = time.monotonic() + CacheConfig.CACHE_LEASE_WAIT_SECONDS
+            while time.monotonic() < deadline:
+                time.sleep(CacheConfig.CACHE_LEASE_POLL_MS / 1000.0)
+                value, _ = self._read_l2(full_key)
+                if value is not MISSING:
+                    self.l1.set(full_key, value, self._l1_ttl_for(value))
+                    return None if value is _NEGATIVE else value
+            # 租约持有者迟迟未写入(回源慢或进程退出)，自行回源
+            self.engine.record('lease_timeout')
+            return self._load_and_store(key, loader, ttl, tags)
+
+        try:
+            # 拿到租约前其他进程可能已写入
+            value, meta = self._read_l2(full_key)
+            if value is not MISSING and not self._is_expired(meta, time.time()):
+                return None if value is _NEGATIVE else value
+            return self._load_and_store(key, loader, ttl, tags)
+        finally:
+            self.engine.release_lease(full_key, lease)
+
+    def _load_and_store(self, key: str, loader: Callable[[], Any], ttl: int = None, tags: List[str] = None) -> Any:
+        started = time.perf_counter()
+        loaded = loader()
+        delta_ms = (time.perf_counter() - started) * 1000
+        self.engine.record('loads')
+        if loaded is None:
+            self.set_negative(key)
+        else:
+            self.set_many({key: loaded}, ttl, tags={key: tags} if tags else None, deltas={key: delta_ms})
+        return loaded
+
+    # ==================== 写入 ====================
+
+    def set(self, key: str, value: Any, ttl: int = None, tags: List[str] = None) -> bool:
+        """写入缓存并通知其他进程丢弃L1中的旧值"""
+        return self.set_many({key: value}, ttl, tags={key: tags} if tags else None)
+
+    def set_many(self, mapping: Dict[str, Any], ttl: int = None, ttls: Dict[str, int] = None,
+                 tags: Dict[str, List[str]] = None, deltas: Dict[str, float] = None) -> bool:
+        """
+        批量写入 (单次pipeline)
+        :param tags: {key: [tag, ...]} 键所属的失效标签，供 delete_tag 按组删除
+        :param deltas: {key: 回源耗时毫秒}，供XFetch计算提前刷新概率
+        """
+        if not mapping:
+            return True
+        ttls = ttls or {}
+        tags = tags or {}
+        deltas = deltas or {}
+        for key, value in mapping.items():
+            self.l1.set(self.key(key), value, self.l1_ttl)
+
+        redis = self.engine.value_conn()
+        if not redis:
+            return False
+        try:
+            now = int(time.time())
+            tag_ttls = {}
+            pipeline = redis.pipeline(transaction=False)
+            for key, value in mapping.items():
+                key_ttl = self.engine.jitter_ttl(ttls.get(key) or ttl or self.ttl)
+                encoded = self.codec.encode(value, ttl=key_ttl, delta_ms=deltas.get(key, 0))
+                # 物理过期时间多保留stale窗口，逻辑TTL记录在值头部
+                key_ttl += self.stale_ttl
+                pipeline.setex(self.key(key), key_ttl, encoded)
+                for tag in tags.get(key) or []:
+                    pipeline.zadd(self.tag_key(tag), {self.key(key): now + key_ttl})
+                    tag_ttls[tag] = max(tag_ttls.get(tag, 0), key_ttl)
+            for tag, key_ttl in tag_ttls.items():
+                # 顺带清理已过期的成员；标签至少存活一个完整的命名空间TTL
+                tag_key = self.tag_key(tag)
+                pipeline.zremrangebyscore(tag_key, '-inf', now)
+                pipeline.expire(tag_key, max(key_ttl, self.engine.max_jitter_ttl(self.ttl)))
+            self.engine.count(self.name, 'writes', len(mapping), pipeline=pipeline)
+            self.engine.publish_invalidation(self.name, keys=list(mapping.keys()), pipeline=pipeline)
+            pipeline.execute()
+            return True
+        except Exception as e:
+            logger.error(f"寫入緩存失敗[{self.name}]: {str(e)}")
+            return False
+
+    def set_negative(self, key: str, ttl: int = None) -> bool:
+        """写入负缓存：记录数据源中不存在该键，避免反复回源"""
+        negative_ttl = ttl or self.negative_ttl
+        self.l1.set(self.key(key), _NEGATIVE, min(self.l1_ttl, negative_ttl))
+        redis = self.engine.value_conn()
+        if not redis:
+            return False
+        try:
+            pipeline = redis.pipeline(transaction=False)
+            pipeline.setex(self.key(key), self.engine.jitter_ttl(negative_ttl), self.codec.encode_negative())
+            self.engine.count(self.name, 'negative_writes', pipeline=pipeline)
+            return bool(pipeline.execute()[0])
+        except Exception as e:
+            logger.error(f"寫入負緩存失敗[{self.name}]: {str(e)}")
+            return False
+
+    # ==================== 失效 ====================
+
+    def delete(self, key: str) -> bool:
+        """删除单个键"""
+        return self.delete_many([key]) > 0
+
+    def delete_many(self, keys: List[str]) -> int:
+        """批量删除，返回Redis中实际删除的数量"""
+        if not keys:
+            return 0
+        for key in keys:
+            self.l1.delete(self.key(key))
+
+        redis = self.engine.redis_conn()
+        if not redis:
+            return 0
+        try:
+            pipeline = redis.pipeline(transaction=False)
+            pipeline.delete(*[self.key(k) for k in keys])
+            self.engine.count(self.name, 'deletes', len(keys), pipeline=pipeline)
+            self.engine.publish_invalidation(self.name, keys=list(keys), pipeline=pipeline)
+            return pipeline.execute()[0]
+        except Exception as e:
+            logger.error(f"刪除緩存失敗[{self.name}]: {str(e)}")
+            return 0
+
+    def delete_tag(self, tag: str, sub_prefix: str = None) -> int:
+        """
+        删除标签下的全部键，返回Redis中实际删除的数量
+        只读取该标签的有序集合，代价与组大小成正比，可以在请求路径上同步执行
+        :param sub_prefix: 组内键的公共前缀，提供时L1按前缀清除并以前缀广播，避免失效消息过大
+        """
+        if sub_prefix is not None:
+            self.l1.delete_prefix(self.key(sub_prefix))
+
+        redis = self.engine.redis_conn()
+        if not redis:
+            return 0
+        try:
+            # 事务中取出并删除标签集合，只涉及标签键本身；之后写入的键进入新的标签集合，不会漏删
+            tag_key = self.tag_key(tag)
+            pipeline = redis.pipeline(transaction=True)
+            pipeline.zrange(tag_key, 0, -1)
+            pipeline.delete(tag_key)
+            members = pipeline.execute()[0]
+
+            # 成员键分布在不同槽位，逐键DEL并按批pipeline发送，不依赖脚本访问未声明的键
+            deleted = 0
+            batch_size = CacheConfig.CACHE_SCAN_BATCH_SIZE
+            for start in range(0, len(members), batch_size):
+                pipeline = redis.pipeline(transaction=False)
+                for member in members[start:start + batch_size]:
+                    pipeline.delete(member)
+                deleted += sum(pipeline.execute())
+
+            keys = [member[len(self.prefix):] for member in members if member.startswith(self.prefix)]
+            for key in keys:
+                self.l1.delete(self.key(key))
+
+            pipeline = redis.pipeline(transaction=False)
+            self.engine.count(self.name, 'tag_invalidations', pipeline=pipeline)
+            if deleted:
+                self.engine.count(self.name, 'deletes', deleted, pipeline=pipeline)
+            if sub_prefix is not None:
+                self.engine.publish_invalidation(self.name, prefix=sub_prefix, pipeline=pipeline)
+            elif keys:
+                self.engine.publish_invalidation(self.name, keys=keys, pipeline=pipeline)
+            pipeline.execute()
+            return deleted
+        except Exception as e:
+            logger.error(f"按標籤刪除緩存失敗[{self.name}]: {str(e)}")
+            return 0
+
+    def delete_prefix(self, sub_prefix: str = "") -> bool:
+        """
+        按前缀删除
+        L1立即清除并广播；Redis中的键由后台线程SCAN遍历删除，不阻塞请求，也不阻塞Redis。
+        请求路径上需要立即生效的组失效应使用 delete_tag。
+        :return: 是否已提交后台删除
+        """
+        self.l1.delete_prefix(self.key(sub_prefix))
+        if not self.engine.redis_conn():
+            return False
+        try:
+            self.engine.publish_invalidation(self.name, prefix=sub_prefix)
+        except Exception as e:
+            logger.warning(f"發布前綴失效消息失敗[{self.name}]: {str(e)}")
+        return self.engine.submit(f"delete_prefix:{self.name}:{sub_prefix}", lambda: self._scan_delete(sub_prefix))
+
+    def _scan_delete(self, sub_prefix: str) -> int:
+        redis = self.engine.redis_conn()
+        if not redis:
+            return 0
+        deleted = 0
+        batch = []
+        batch_size = CacheConfig.CACHE_SCAN_BATCH_SIZE
+        for cache_key in redis.scan_iter(match=f"{self.key(sub_prefix)}*", count=batch_size):
+            batch.append(cache_key)
+            if len(batch) >= batch_size:
+                deleted += redis.delete(*batch)
+                batch = []
+        if batch:
+            deleted += redis.delete(*batch)
+        if deleted:
+            self.engine.count(self.name, 'deletes', deleted)
+        return deleted
+
+    # ==================== 内部方法 ====================
+
+    def _get(self, key: str) -> Any:
+        full_key = self.key(key)
+        value = self.l1.get(full_key)
+        if value is not MISSING:
+            self.engine.record('l1_hit')
+            return value
+
+        value, meta = self._read_l2(full_key)
+        if value is MISSING or self._is_expired(meta, time.time()):
+            self.engine.record('miss')
+            return MISSING
+        self.engine.record('l2_hit')
+        self.l1.set(full_key, value, self._l1_ttl_for(value))
+        return value
+
+    def _read_l2(self, full_key: str):
+        """读取Redis中的值及其元数据，连接不可用或出错时视为未命中"""
+        redis = self.engine.value_conn()
+        if not redis:
+            return MISSING, None
+        try:
+            return self._decode_entry(redis.get(full_key))
+        except Exception as e:
+            logger.error(f"讀取緩存失敗[{self.name}]: {str(e)}")
+            return MISSING, None
+
+    def decode(self, raw: Optional[bytes]) -> Any:
+        """解码Redis中的值，返回值本身或 MISSING/_NEGATIVE 标记"""
+        return self._decode_entry(raw)[0]
+
+    def _decode_entry(self, raw: Optional[bytes]):
+        hit, negative, value, meta = self.codec.decode(raw)
+        if not hit:
+            return MISSING, None
+        return (_NEGATIVE if negative else value), meta
+
+    @staticmethod
+    def _is_expired(meta, now: float) -> bool:
+        """逻辑TTL已过 (值仍在stale窗口内)；未记录逻辑TTL的旧数据以Redis物理过期为准"""
+        return bool(meta and meta.ttl) and now >= meta.written_at + meta.ttl
+
+    def _should_refresh_early(self, meta, now: float) -> bool:
+        """XFetch：now - delta * beta * ln(rand) >= expiry 时提前刷新，回源越慢、越接近到期，概率越高"""
+        if self.xfetch_beta <= 0 or not meta or not meta.ttl or not meta.delta_ms:
+            return False
+        gap = -(meta.delta_ms / 1000.0) * self.xfetch_beta * math.log(1.0 - random.random())
+        return now + gap >= meta.written_at + meta.ttl
+
+    def _l1_ttl_for(self, value: Any) -> int:
+        return min(self.l1_ttl, self.negative_ttl) if value is _NEGATIVE else self.l1_ttl
+
+
+class CacheEngine:
+    """
+    两级缓存引擎
+
+    每个服务创建一个引擎实例，按数据类型注册命名空间。写入和删除会在同一pipeline中
+    发布失效消息，各进程的订阅线程据此清除本地L1，保证多worker之间的一致性。
+    统计不使用KEYS：写入/删除次数随写操作在Redis哈希中累加，键数量由后台线程
+    定期SCAN一遍键空间得出，读取统计只做一次HGETALL。
+    缓存值由各命名空间的编解码器序列化为二进制，经独立的二进制连接读写。
+    """
+
+    def __init__(self, service_name: str):
+        self.service_name = service_name
+        self.redis = redis_client
+        self.channel = f"{CacheConfig.CACHE_INVALIDATION_CHANNEL_PREFIX}{service_name}"
+        self.counters_key = f"{CacheConfig.CACHE_STATS_KEY_PREFIX}{service_name}"
+        self.key_counts_key = f"{CacheConfig.CACHE_STATS_KEY_PREFIX}{service_name}:keys"
+        self.instance_id = uuid.uuid4().hex
+        self.namespaces: Dict[str, CacheNamespace] = {}
+        self._tracked_prefixes: Dict[str, str] = {}
+        self._scripts = {}
+        self._worker = _BackgroundWorker(service_name, CacheConfig.CACHE_BACKGROUND_QUEUE_SIZE)
+        self._inflight: Dict[str, _InflightCall] = {}
+        self._inflight_lock = threading.Lock()
+        self._listener = None
+        self._listener_lock = threading.Lock()
+        self._stats = {'l1_hit': 0, 'l2_hit': 0, 'miss': 0, 'coalesced': 0, 'invalidations_received': 0,
+                       'loads': 0, 'lease_wait': 0, 'lease_timeout': 0, 'stale_served': 0, 'stale_refresh': 0,
+                       'early_refresh': 0}
+
+    def namespace(self, name: str, prefix: str, ttl: int, **kwargs) -> CacheNamespace:
+        """注册命名空间"""
+        namespace = CacheNamespace(self, name, prefix, ttl, **kwargs)
+        self.namespaces[name] = namespace
+        return namespace
+
+    def track_prefix(self, name: str, prefix: str) -> None:
+        """登记不经过命名空间读写的键前缀(如令牌黑名单)，纳入键数量统计"""
+        self._tracked_prefixes[name] = prefix
+
+    # ==================== TTL ====================
+
+    @staticmethod
+    def jitter_ttl(ttl: int) -> int:
+        """TTL随机抖动，避免同时写入的键集中过期"""
+        jitter = CacheConfig.CACHE_TTL_JITTER
+        if jitter <= 0:
+            return int(ttl)
+        return max(1, int(ttl * (1 + random.uniform(-jitter, jitter))))
+
+    @staticmethod
+    def max_jitter_ttl(ttl: int) -> int:
+        """抖动后TTL的上界"""
+        return int(ttl * (1 + max(CacheConfig.CACHE_TTL_JITTER, 0))) + 1
+
+    # ==================== 请求合并 ====================
+
+    def single_flight(self, key: str, func: Callable[[], Any]) -> Any:
+        """同一进程内同键并发调用只执行一次，其余调用等待并共享结果"""
+        with self._inflight_lock:
+            call = self._inflight.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = _InflightCall()
+                self._inflight[key] = call
+
+        if not is_leader:
+            self.record('coalesced')
+            if call.event.wait(CacheConfig.CACHE_LOAD_TIMEOUT):
+                if call.error:
+                    raise call.error
+                return call.result
+            # 等待超时，自行回源
+            return func()
+
+        try:
+            call.result = func()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            call.event.set()
+            with self._inflight_lock:
+                self._inflight.pop(key, None)
+
+    # ==================== 失效广播 ====================
+
+    def redis_conn(self):
+        """获取Redis连接，首次可用时启动失效订阅线程"""
+        conn = self.redis.redis_client
+        if conn is not None and self._listener is None:
+            self._start_listener(conn)
+        return conn
+
+    def value_conn(self):
+        """获取读写缓存值的二进制连接 (不做UTF-8解码)"""
+        if self.redis_conn() is None:
+            return None
+        return self.redis.binary_client
+
+    def publish_invalidation(self, namespace: str, keys: List[str] = None, prefix: str = None, pipeline=None) -> None:
+        """发布失效消息，可随写入操作放入同一pipeline"""
+        message = json.dumps({"o": self.instance_id, "ns": namespace, "k": keys, "p": prefix})
+        target = pipeline if pipeline is not None else self.redis.redis_client
+        if target is not None:
+            target.publish(self.channel, message)
+
+    # ==================== 回源租约 ====================
+
+    def acquire_lease(self, full_key: str) -> Optional[str]:
+        """
+        获取回源租约，成功返回租约令牌，已被其他请求持有时返回None
+        Redis不可用时无法协调，直接放行(返回空字符串)
+        """
+        conn = self.redis.redis_client
+        if conn is None:
+            return ""
+        token = uuid.uuid4().hex
+        try:
+            acquired = conn.set(f"{CacheConfig.CACHE_LEASE_KEY_PREFIX}{full_key}", token,
+                                nx=True, px=CacheConfig.CACHE_LEASE_TTL_MS)
+            return token if acquired else None
+        except Exception as e:
+            logger.warning(f"獲取緩存回源租約失敗: {str(e)}")
+            return ""
+
+    def release_lease(self, full_key: str, token: str) -> None:
+        """释放租约 (只删除自己持有的租约，过期后被他人获取的不受影响)"""
+        if not token or self.redis.redis_client is None:
+            return
+        try:
+            self.run_script(_RELEASE_LEASE_SCRIPT, keys=[f"{CacheConfig.CACHE_LEASE_KEY_PREFIX}{full_key}"], args=[token])
+        except Exception as e:
+            logger.warning(f"釋放緩存回源租約失敗: {str(e)}")
+
+    def run_script(self, script: str, keys: List[str], args: List[Any]):
+        """执行Lua脚本 (按脚本内容缓存注册结果)"""
+        if script not in self._scripts:
+            self._scripts[script] = self.redis.redis_client.register_script(script)
+        return self._scripts[script](keys=keys, args=args)
+
+    def submit(self, job_key: str, func: Callable[[], Any]) -> bool:
+        """提交后台任务"""
+        return self._worker.submit(job_key, func)
+
+    def _start_listener(self, conn) -> None:
+        with self._listener_lock:
+            if self._listener is not None:
+                return
+            try:
+                pubsub = conn.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(**{self.channel: self._handle_invalidation})
+                self._listener = pubsub.run_in_thread(sleep_time=1, daemon=True)
+            except Exception as e:
+                # 订阅失败时依赖L1短TTL兜底，下次访问重试
+                self._listener = None
+                logger.warning(f"啟動緩存失效訂閱失敗: {str(e)}")
+
+    def _handle_invalidation(self, message) -> None:
+        try:
+            payload = json.loads(message['data'])
+            if payload.get('o') == self.instance_id:
+                return
+            namespace = self.namespaces.get(payload.get('ns'))
+            if not namespace:
+                return
+            self.record('invalidations_received')
+            if payload.get('p') is not None:
+                namespace.l1.delete_prefix(namespace.key(payload['p']))
+            for key in payload.get('k') or []:
+                namespace.l1.delete(namespace.key(key))
+        except Exception as e:
+            logger.warning(f"處理緩存失效消息失敗: {str(e)}")
+
+    # ==================== 统计 ====================
+
+    def record(self, metric: str) -> None:
+        # 计数允许在并发下轻微丢失，避免在热路径上加锁
+        self._stats[metric] = self._stats.get(metric, 0) + 1
+
+    def count(self, namespace: str, metric: str, amount: int = 1, pipeline=None) -> None:
+        """累加跨进程共享的命名空间计数，可随写操作放入同一pipeline"""
+        target = pipeline if pipeline is not None else self.redis.redis_client
+        if target is not None:
+            target.hincrby(self.counters_key, f"{namespace}:{metric}", amount)
+
+    def refresh_key_counts(self) -> Dict[str, int]:
+        """
+        SCAN一遍键空间，按最长前缀归类统计各命名空间的键数量
+        只在后台线程中执行；SCAN为增量遍历，期间Redis可以正常服务其他请求
+        """
+        redis = self.redis_conn()
+        if not redis:
+            return {}
+        prefixes = {name: namespace.prefix for name, namespace in self.namespaces.items()}
+        prefixes.update(self._tracked_prefixes)
+        # 前缀可能互相包含(如 auth:user: 与 auth:user:sessions:)，长前缀优先匹配
+        ordered = sorted(prefixes.items(), key=lambda item: len(item[1]), reverse=True)
+        counts = {name: 0 for name in prefixes}
+        for key in redis.scan_iter(count=CacheConfig.CACHE_SCAN_BATCH_SIZE):
+            for name, prefix in ordered:
+                if key.startswith(prefix):
+                    counts[name] += 1
+                    break
+
+        mapping = dict(counts)
+        mapping['_updated_at'] = int(time.time())
+        redis.hset(self.key_counts_key, mapping=mapping)
+        return counts
+
+    def _schedule_key_count_refresh(self, redis, updated_at: int) -> None:
+        interval = CacheConfig.CACHE_KEY_COUNT_REFRESH_SECONDS
+        if updated_at and time.time() - updated_at < interval:
+            return
+        # 多进程只需一个执行，锁在刷新间隔内自然过期
+        if redis.set(f"{self.key_counts_key}:lock", self.instance_id, nx=True, ex=interval):
+            self.submit("refresh_key_counts", self.refresh_key_counts)
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = dict(self._stats)
+        lookups = stats['l1_hit'] + stats['l2_hit'] + stats['miss']
+        stats['hit_rate'] = round((stats['l1_hit'] + stats['l2_hit']) / lookups, 4) if lookups else 0
+        stats['l1_sizes'] = {name: len(ns.l1) for name, ns in self.namespaces.items()}
+        stats['invalidation_listener'] = self._listener is not None
+        stats['background_pending'] = self._worker.pending_count()
+        stats['codecs'] = {name: ns.codec.describe() for name, ns in self.namespaces.items()}
+
+        redis = self.redis_conn()
+        if not redis:
+            return stats
+        try:
+            pipeline = redis.pipeline(transaction=False)
+            pipeline.hgetall(self.counters_key)
+            pipeline.hgetall(self.key_counts_key)
+            counters, key_counts = pipeline.execute()
+
+            namespaces = {name: {'keys': None} for name in list(self.namespaces) + list(self._tracked_prefixes)}
+            for field, value in counters.items():
+                name, _, metric = field.rpartition(':')
+                namespaces.setdefault(name, {'keys': None})[metric] = int(value)
+            for name, value in key_counts.items():
+                if name in namespaces:
+                    namespaces[name]['keys'] = int(value)
+
+            updated_at = int(key_counts.get('_updated_at', 0))
+            stats['namespaces'] = namespaces
+            stats['key_counts_updated_at'] = updated_at or None
+            self._schedule_key_count_refresh(redis, updated_at)
+        except Exception as e:
+            logger.warning(f"讀取緩存統計計數失敗: {str(e)}")
+        return stats
@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+"""
+@文件: permission_client.py
+@說明: 权限服务客户端 - 本地决策缓存(代数失效)、短窗口合并批量查询、熔断
+@時間: 2025-01-09
+@作者: LiDong
+"""
+
+import json
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from cache import redis_client
+from cache.cache_engine import LocalLRUCache, MISSING
+from configs.cache_config import CacheConfig
+from configs.constant import Config
+from loggers import logger
+
+
+class _CircuitBreaker:
+    """连续失败达到阈值后打开，冷却时间后放行一次试探请求，成功则关闭"""
+
+    def __init__(self, failure_threshold: int, recovery_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        return 'half_open' if time.monotonic() - self.opened_at >= self.recovery_timeout else 'open'
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half_open' and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class _PendingBatch:
+    """一个合并窗口内同一用户的查询 {字段: (资源类型, 资源ID, 操作)}"""
+
+    def __init__(self, generation: Optional[str]):
+        self.checks: Dict[str, Tuple[str, str, str]] = {}
+        self.results: Dict[str, bool] = {}
+        self.generation = generation
+        self.done = threading.Event()
+
+
+class PermissionClient:
+    """
+    权限服务客户端
+
+    判定结果按 用户:代数:资源类型:资源ID:操作 缓存在进程内。代数与权限服务共用
+    Redis中的 perm:gen:* 键，权限变更时权限服务递增代数并在 perm:gen:changed 频道广播，
+    客户端收到后丢弃本地代数，旧代数下的决策不再被读取。因此须与权限服务使用同一Redis库。
+
+    本地未命中的查询先进入该用户的合并窗口，窗口内同一用户的查询合并为一次批量验证请求；
+    合并窗口按用户区分，不同用户的请求由各自的发起线程并行发送，互不等待。
+    权限服务连续失败时熔断，熔断期间不发起请求，未命中的查询按拒绝处理。
+    """
+
+    GENERATION_KEY_PREFIX = "perm:gen:"
+    GLOBAL_GENERATION_KEY = "perm:gen:__all__"
+    GENERATION_CHANNEL = "perm:gen:changed"
+
+    def __init__(self):
+        self.redis = redis_client
+        self.base_url = Config.PERMISSION_SERVICE_URL
+        self.decisions = LocalLRUCache(CacheConfig.PERMISSION_CLIENT_CACHE_SIZE)
+        self.generations = LocalLRUCache(max(CacheConfig.PERMISSION_CLIENT_CACHE_SIZE // 10, 1000))
+        self.breaker = _CircuitBreaker(CacheConfig.PERMISSION_CLIENT_FAILURE_THRESHOLD,
+                                       CacheConfig.PERMISSION_CLIENT_RECOVERY_TIMEOUT)
+        self._http = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=CacheConfig.PERMISSION_CLIENT_POOL_SIZE)
+        self._http.mount('http://', adapter)
+        self._http.mount('https://', adapter)
+        self._pending: Dict[str, _PendingBatch] = {}
+        self._pending_lock = threading.Lock()
+        self._listener = None
+        self._listener_lock = threading.Lock()
+        self._stats = {'hit': 0, 'miss': 0, 'remote_calls': 0, 'coalesced': 0,
+                       'rejected_open': 0, 'errors': 0, 'follower_timeouts': 0,
+                       'invalidations_received': 0}
+
+    @staticmethod
+    def field(resource_type: str, resource_id: str, action: str) -> str:
+        return f"{resource_type}:{resource_id or ''}:{action}"
+
+    # ==================== 判定 ====================
+
+    def check(self, user_id: str, resource_type: str, resource_id: str, action: str) -> bool:
+        """判定单个权限"""
+        return self.check_many(user_id, [(resource_type, resource_id, action)])[0]
+
+    def check_many(self, user_id: str, checks: Iterable[Tuple[str, str, str]]) -> List[bool]:
+        """批量判定 (资源类型, 资源ID, 操作)，本地全部命中时不访问网络"""
+        checks = list(checks)
+        fields = [self.field(*item) for item in checks]
+        generation = self._generation(user_id)
+
+        decisions: Dict[str, bool] = {}
+        misses: Dict[str, Tuple[str, str, str]] = {}
+        for field, item in zip(fields, checks):
+            value = self.decisions.get(f"{user_id}:{generation}:{field}") if generation is not None else MISSING
+            if value is MISSING:
+                misses[field] = item
+            else:
+                decisions[field] = value
+        self._stats['hit'] += len(decisions)
+        self._stats['miss'] += len(misses)
+
+        if misses:
+            decisions.update(self._load(user_id, generation, misses))
+        return [decisions.get(field, False) for field in fields]
+
+    def filter(self, user_id: str, resource_type: str, action: str, resource_ids: List[str]) -> List[str]:
+        """过滤有权限的资源ID (权限服务批量过滤接口，结果不做本地缓存)"""
+        if not resource_ids:
+            return []
+        if not self.breaker.allow():
+            self._stats['rejected_open'] += 1
+            return []
+        try:
+            content = self._post('/internal/permissions/filter', {
+                'user_id': user_id, 'resource_type': resource_type,
+                'action': action, 'resource_ids': resource_ids
+            })
+            self.breaker.record_success()
+            return content.get('allowed') or []
+        except Exception as e:
+            self.breaker.record_failure()
+            self._stats['errors'] += 1
+            logger.warning(f"權限過濾請求失敗: {str(e)}")
+            return []
+
+    # ==================== 合并批量查询 ====================
+
+    def _load(self, user_id: str, generation: Optional[str],
+              misses: Dict[str, Tuple[str, str, str]]) -> Dict[str, bool]:
+        """加入该用户当前的合并窗口；第一个加入的线程等待窗口结束后发送，其余线程只等待这一次请求"""
+        with self._pending_lock:
+            batch = self._pending.get(user_id)
+            is_leader = batch is None
+            if is_leader:
+                batch = self._pending[user_id] = _PendingBatch(generation)
+            else:
+                self._stats['coalesced'] += 1
+            batch.checks.update(misses)
+
+        if is_leader:
+            time.sleep(CacheConfig.PERMISSION_CLIENT_BATCH_WINDOW_MS / 1000)
+            with self._pending_lock:
+                self._pending.pop(user_id, None)
+            try:
+                batch.results = self._dispatch(user_id, batch.generation, batch.checks)
+            finally:
+                batch.done.set()
+        elif not batch.done.wait(CacheConfig.PERMISSION_CLIENT_CONNECT_TIMEOUT
+                                 + CacheConfig.PERMISSION_CLIENT_TIMEOUT
+                                 + CacheConfig.PERMISSION_CLIENT_BATCH_WINDOW_MS / 1000):
+            # 发起线程的请求本身受超时约束，仍未完成时自行发送，不把等待超时当作拒绝
+            self._stats['follower_timeouts'] += 1
+            logger.warning(f"等待合併權限請求超時，單獨發送: {user_id}")
+            return self._dispatch(user_id, generation, misses)
+
+        return {field: batch.results[field] for field in misses if field in batch.results}
+
+    def _dispatch(self, user_id: str, generation: Optional[str],
+                  checks: Dict[str, Tuple[str, str, str]]) -> Dict[str, bool]:
+        """发送一次批量验证请求；熔断或失败时返回空结果，调用方按拒绝处理"""
+        if not self.breaker.allow():
+            self._stats['rejected_open'] += 1
+            return {}
+        try:
+            content = self._post('/internal/permissions/verify-batch', {
+                'user_id': user_id,
+                'permissions': [
+                    {'resource_type': resource_type, 'resource_id': resource_id, 'action': action}
+                    for resource_type, resource_id, action in checks.values()
+                ]
+            })
+            self.breaker.record_success()
+        except Exception as e:
+            self.breaker.record_failure()
+            self._stats['errors'] += 1
+            logger.warning(f"權限驗證請求失敗: {user_id}, {str(e)}")
+            return {}
+
+        results = {
+            self.field(item.get('resource_type'), item.get('resource_id'), item.get('action')):
+                bool(item.get('has_permission'))
+            for item in content.get('permissions', [])
+        }
+        # 部分上下文得出的决策不缓存；沿用请求前读取的代数，期间发生的失效使其不再被读取
+        if generation is not None and not content.get('partial'):
+            for field, decision in results.items():
+                self.decisions.set(f"{user_id}:{generation}:{field}", decision,
+                                   CacheConfig.PERMISSION_CLIENT_DECISION_TTL)
+        return results
+
+    def _post(self, path: str, payload: Dict) -> Dict:
+        self._stats['remote_calls'] += 1
+        response = self._http.post(f"{self.base_url}{path}", json=payload,
+                                   timeout=(CacheConfig.PERMISSION_CLIENT_CONNECT_TIMEOUT,
+                                            CacheConfig.PERMISSION_CLIENT_TIMEOUT))
+        response.raise_for_status()
+        result = response.json()
+        if result.get("code") != "S10000":
+            raise ValueError(result.get("msg") or "權限服務返回失敗")
+        return result.get("content") or {}
+
+    # ==================== 代数 ====================
+
+    def _generation(self, user_id: str) -> Optional[str]:
+        """用户当前代数；Redis不可用时返回None，此时不使用本地决策缓存"""
+        cached = self.generations.get(user_id)
+        if cached is not MISSING:
+            return cached
+
+        conn = self.redis.redis_client
+        if conn is None:
+            return None
+        if self._listener is None:
+            self._start_listener(conn)
+        try:
+            global_gen, user_gen = conn.mget(self.GLOBAL_GENERATION_KEY, f"{self.GENERATION_KEY_PREFIX}{user_id}")
+        except Exception as e:
+            logger.warning(f"讀取權限代數失敗: {str(e)}")
+            return None
+        generation = f"{global_gen or 0}.{user_gen or 0}"
+        self.generations.set(user_id, generation, CacheConfig.PERMISSION_CLIENT_GENERATION_TTL)
+        return generation
+
+    def _start_listener(self, conn) -> None:
+        with self._listener_lock:
+            if self._listener is not None:
+                return
+            try:
+                pubsub = conn.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(**{self.GENERATION_CHANNEL: self._handle_generation_change})
+                self._listener = pubsub.run_in_thread(sleep_time=1, daemon=True)
+            except Exception as e:
+                # 订阅失败时依赖代数的本地短TTL兜底，下次访问重试
+                self._listener = None
+                logger.warning(f"啟動權限代數訂閱失敗: {str(e)}")
+
+    def _handle_generation_change(self, message) -> None:
+        try:
+            payload = json.loads(message['data'])
+            self._stats['invalidations_received'] += 1
+            if payload == "*":
+                self.generations.clear()
+                return
+            for user_id in payload:
+                self.generations.delete(user_id)
+        except Exception as e:
+            logger.warning(f"處理權限代數變更消息失敗: {str(e)}")
+
+    def get_stats(self) -> Dict:
+        lookups = self._stats['hit'] + self._stats['miss']
+        return dict(self._stats, breaker=self.breaker.state, l1_entries=len(self.decisions),
+                    hit_rate=round(self._stats['hit'] / lookups, 4) if lookups else 0)
+
+
+# 创建全局权限客户端实例
+permission_client = PermissionClient()
@@ -57,6 +57,59 @@ class CacheConfig:
     ENABLE_CACHE_METRICS = os.getenv('ENABLE_CACHE_METRICS', 'true').lower() == 'true'
     CACHE_HIT_RATE_THRESHOLD = float(os.getenv('CACHE_HIT_RATE_THRESHOLD', 0.8))  # 缓存命中率阈值
     
+    # ==================== 两级缓存引擎配置 ====================
+    
+    # 进程内L1缓存
+    L1_CACHE_ENABLED = os.getenv('L1_CACHE_ENABLED', 'true').lower() == 'true'
+    L1_CACHE_DEFAULT_SIZE = int(os.getenv('L1_CACHE_DEFAULT_SIZE', 5000))     # 每个命名空间的条目上限
+    L1_CACHE_MAX_TTL = int(os.getenv('L1_CACHE_MAX_TTL', 30))                # L1最长保留时间(秒)，兜底失效消息丢失
+    
+    # 负缓存与TTL抖动
+    NEGATIVE_CACHE_TTL = int(os.getenv('NEGATIVE_CACHE_TTL', 30))             # 不存在的数据缓存时间(秒)
+    CACHE_TTL_JITTER = float(os.getenv('CACHE_TTL_JITTER', 0.1))              # TTL随机抖动比例
+    
+    # 请求合并与失效广播
+    CACHE_LOAD_TIMEOUT = float(os.getenv('CACHE_LOAD_TIMEOUT', 5))            # 等待同键回源的超时时间(秒)
+    CACHE_INVALIDATION_CHANNEL_PREFIX = os.getenv('CACHE_INVALIDATION_CHANNEL_PREFIX', 'cache:invalidate:')
+    
+    # 标签失效与后台任务 (请求路径上不使用KEYS)
+    CACHE_TAG_KEY_PREFIX = os.getenv('CACHE_TAG_KEY_PREFIX', 'cache:tag:')
+    CACHE_SCAN_BATCH_SIZE = int(os.getenv('CACHE_SCAN_BATCH_SIZE', 500))           # SCAN/DEL单批键数量
+    CACHE_BACKGROUND_QUEUE_SIZE = int(os.getenv('CACHE_BACKGROUND_QUEUE_SIZE', 1000))  # 后台任务队列上限
+    
+    # 缓存统计 - 计数哈希与键数量刷新间隔
+    CACHE_STATS_KEY_PREFIX = os.getenv('CACHE_STATS_KEY_PREFIX', 'cache:stats:')
+    CACHE_KEY_COUNT_REFRESH_SECONDS = int(os.getenv('CACHE_KEY_COUNT_REFRESH_SECONDS', 300))
+    
+    # 缓存值编码 - auto 优先msgpack，其次orjson，均未安装时使用json
+    CACHE_CODEC = os.getenv('CACHE_CODEC', 'auto')
+    CACHE_COMPRESS_THRESHOLD = int(os.getenv('CACHE_COMPRESS_THRESHOLD', 1024))    # 超过该字节数时压缩(zstd/zlib)，0为不压缩
+    CACHE_COMPRESS_LEVEL = int(os.getenv('CACHE_COMPRESS_LEVEL', 3))
+    CACHE_CODEC_SAMPLE_EVERY = int(os.getenv('CACHE_CODEC_SAMPLE_EVERY', 100))    # 每N次编码抽样对比JSON体积，0为关闭
+    
+    # 防击穿 - 回源租约、过期旧值供应与XFetch提前刷新
+    CACHE_LEASE_KEY_PREFIX = os.getenv('CACHE_LEASE_KEY_PREFIX', 'cache:lease:')
+    CACHE_LEASE_TTL_MS = int(os.getenv('CACHE_LEASE_TTL_MS', 3000))                # 租约时长(毫秒)，应大于一次回源耗时
+    CACHE_LEASE_WAIT_SECONDS = float(os.getenv('CACHE_LEASE_WAIT_SECONDS', 1.5))   # 未获租约时等待结果的最长时间
+    CACHE_LEASE_POLL_MS = int(os.getenv('CACHE_LEASE_POLL_MS', 50))                # 等待期间轮询间隔(毫秒)
+    CACHE_STALE_TTL = int(os.getenv('CACHE_STALE_TTL', 60))                        # 逻辑过期后继续保留旧值的时间(秒)，0为关闭
+    CACHE_XFETCH_BETA = float(os.getenv('CACHE_XFETCH_BETA', 1.0))                 # 提前刷新力度，0为关闭
+    
+    # ==================== 权限服务客户端配置 ====================
+    
+    # 本地决策缓存 (按权限代数失效)
+    PERMISSION_CLIENT_CACHE_SIZE = int(os.getenv('PERMISSION_CLIENT_CACHE_SIZE', 50000))          # 本地决策条目上限
+    PERMISSION_CLIENT_DECISION_TTL = int(os.getenv('PERMISSION_CLIENT_DECISION_TTL', 600))        # 本地决策保留时间(秒)
+    PERMISSION_CLIENT_GENERATION_TTL = float(os.getenv('PERMISSION_CLIENT_GENERATION_TTL', 2))    # 本地代数有效期(秒)，订阅消息丢失时的兜底
+    # 合并批量查询
+    PERMISSION_CLIENT_BATCH_WINDOW_MS = float(os.getenv('PERMISSION_CLIENT_BATCH_WINDOW_MS', 2))  # 合并窗口(毫秒)
+    PERMISSION_CLIENT_POOL_SIZE = int(os.getenv('PERMISSION_CLIENT_POOL_SIZE', 10))               # HTTP连接池大小
+    PERMISSION_CLIENT_CONNECT_TIMEOUT = float(os.getenv('PERMISSION_CLIENT_CONNECT_TIMEOUT', 0.3))
+    PERMISSION_CLIENT_TIMEOUT = float(os.getenv('PERMISSION_CLIENT_TIMEOUT', 1.0))                # 读取超时(秒)
+    # 熔断
+    PERMISSION_CLIENT_FAILURE_THRESHOLD = int(os.getenv('PERMISSION_CLIENT_FAILURE_THRESHOLD', 5))  # 连续失败次数阈值
+    PERMISSION_CLIENT_RECOVERY_TIMEOUT = float(os.getenv('PERMISSION_CLIENT_RECOVERY_TIMEOUT', 10))  # 熔断冷却时间(秒)
+    
     # ==================== 缓存清理配置 ====================
     
     # 自动清理过期缓存
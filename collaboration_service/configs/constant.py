@@ -65,6 +65,9 @@ class Config:
     CACHE_DEFAULT_TIMEOUT = int(os.getenv("CACHE_DEFAULT_TIMEOUT", 300))  # 5分钟
     CACHE_KEY_PREFIX = os.getenv("CACHE_KEY_PREFIX", "api_gateway:")
 
+    # 下游服务地址
+    PERMISSION_SERVICE_URL = os.getenv("PERMISSION_SERVICE_URL", "http://localhost:25700")
+
 
 # 角色权限配置
 ROLE_PERMISSIONS = {
@@ -14,6 +14,7 @@ from flask_jwt_extended import get_jwt_identity
 
 from models.collaboration_model import CollaborationModel
 from common.common_tools import CommonTools
+from common.permission_client import permission_client
 from cache import redis_client
 from loggers import logger
 
@@ -503,15 +504,18 @@ class CollaborationController:
             
             if cached_permissions:
                 permissions = json.loads(cached_permissions)
-                return self._validate_permission(permissions, required_permission)
-            
-            # 如果緩存中沒有，從數據庫或其他服務獲取
-            permissions = self._fetch_user_permissions(user_id, document_id)
-            
-            # 緩存權限信息
-            self.redis.setex(permission_key, 300, json.dumps(permissions))  # 5分鐘緩存
+            else:
+                # 如果緩存中沒有，從數據庫或其他服務獲取
+                permissions = self._fetch_user_permissions(user_id, document_id)
+                
+                # 緩存權限信息
+                self.redis.setex(permission_key, 300, json.dumps(permissions))  # 5分鐘緩存
             
-            return self._validate_permission(permissions, required_permission)
+            if self._validate_permission(permissions, required_permission):
+                return True
+            # 文檔權限不足時才詢問平台管理員覆蓋 (權限服務判定，本地決策緩存命中時不訪問網絡；
+            # 權限服務不可用時返回False)，常見的放行路徑不經過遠程調用和合併窗口
+            return permission_client.check(user_id, 'platform', 'platform', 'admin')
             
         except Exception as e:
             logger.error(f"檢查文檔權限失敗: {str(e)}")
@@ -6,8 +6,9 @@
 @作者: LiDong
 """
 import json
+import time
 from datetime import timedelta
-from flask import Flask, request
+from flask import Flask, g, request
 from flask_cors import CORS
 from flask_marshmallow import Marshmallow
 from flask_migrate import Migrate
@@ -15,9 +16,14 @@ from flask_smorest import Api
 from flask_jwt_extended import JWTManager
 
 from cache import redis_client
+from common.cache_compactor import cache_compactor
 from common.common_method import fail_response_result
+from common.metrics import permission_metrics
+from common.periodic_task import PeriodicTask
+from configs.cache_config import CacheConfig
 from configs.app_config import REDIS_DATABASE_URI, SQLALCHEMY_DATABASE_URI, SERVER_HOST, SERVER_PORT, SECRET_KEY
 from dbs.mysql_db import db
+from controllers.permission_controller import PermissionController
 from loggers import logger
 from views.permission_api import blp as permission_blp
 from views.internal_api import blp as internal_blp
@@ -100,14 +106,42 @@ def create_app(app):
     api = Api(app)
     api.register_blueprint(permission_blp)
     api.register_blueprint(internal_blp)
+
+    # 权限变更流消费：消费组内每个worker各自拉取，读取本身阻塞等待新事件
+    PeriodicTask(
+        "permission_change_consumer",
+        PermissionController.consume_permission_changes,
+        CacheConfig.PERMISSION_CHANGE_POLL_SECONDS,
+        run_on_start=True,
+        jitter_seconds=1,
+        exclusive=False
+    ).start(app)
+
+    # 权限缓存表过期压缩：分批删除过期行，多实例互斥执行
+    if CacheConfig.AUTO_CLEANUP_EXPIRED:
+        PeriodicTask(
+            "permission_cache_compact",
+            cache_compactor.run,
+            CacheConfig.CLEANUP_INTERVAL_MINUTES * 60
+        ).start(app)
     return app
 
 
+@app.before_request
+def before_request():
+    g.request_started = time.perf_counter()
+
+
 @app.after_request
 def after_request(resp):
     """统一错误响应处理 (优化版本)"""
+    # 按路由模板记录请求延迟 (流式响应只计到开始输出)
+    if request.url_rule is not None and 'request_started' in g:
+        permission_metrics.observe('request_latency', f"{request.method} {request.url_rule.rule}",
+                                   time.perf_counter() - g.request_started)
     try:
-        if request.method == "OPTIONS":
+        # 流式响应不读取响应体，避免提前消费生成器
+        if request.method == "OPTIONS" or resp.is_streamed:
             return resp
             
         # 只处理JSON响应
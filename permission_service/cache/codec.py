@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+"""
+@文件: codec.py
+@說明: 缓存值编解码 - 二进制头 + 可插拔序列化(msgpack/orjson/json) + 可选压缩(zstd/zlib)
+@時間: 2025-01-09
+@作者: LiDong
+"""
+
+import json
+import struct
+import threading
+import time
+import zlib
+from collections import namedtuple
+from typing import Any, Dict, Optional, Tuple
+
+from configs.cache_config import CacheConfig
+from loggers import logger
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - 可选依赖
+    msgpack = None
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - 可选依赖
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - 可选依赖
+    zstandard = None
+
+
+# 格式版本：首字节。旧格式JSON文本以 '{' 开头，不会与版本号冲突；
+# 升级格式时递增版本号并保留旧版本的解码分支，滚动发布期间新旧实例可以互读
+FORMAT_VERSION = 2
+
+# v1头部：版本(1) + 序列化器(1) + 压缩算法(1) + 写入时间(4, 秒级时间戳)
+_HEADER_V1 = struct.Struct(">BBBI")
+# v2头部：在v1基础上增加 逻辑TTL(4, 秒) + 回源耗时(4, 毫秒)，用于过期后短暂供应旧值和提前刷新
+_HEADER = struct.Struct(">BBBIII")
+_HEADERS = {1: _HEADER_V1, 2: _HEADER}
+
+# 缓存条目元数据：写入时间、逻辑TTL(0表示未知，以Redis物理过期为准)、回源耗时
+EntryMeta = namedtuple('EntryMeta', ['written_at', 'ttl', 'delta_ms'])
+_EMPTY_META = EntryMeta(0, 0, 0)
+
+SERIALIZER_NEGATIVE = 0
+SERIALIZER_JSON = 1
+SERIALIZER_MSGPACK = 2
+SERIALIZER_ORJSON = 3
+
+COMPRESSION_NONE = 0
+COMPRESSION_ZLIB = 1
+COMPRESSION_ZSTD = 2
+
+
+def _json_dumps(value: Any) -> bytes:
+    return json.dumps(value, default=str, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def _json_loads(data: bytes) -> Any:
+    return json.loads(data)
+
+
+def _msgpack_dumps(value: Any) -> bytes:
+    return msgpack.packb(value, default=str, use_bin_type=True)
+
+
+def _msgpack_loads(data: bytes) -> Any:
+    return msgpack.unpackb(data, raw=False, strict_map_key=False)
+
+
+def _orjson_dumps(value: Any) -> bytes:
+    return orjson.dumps(value, default=str, option=orjson.OPT_NON_STR_KEYS)
+
+
+_SERIALIZERS = {SERIALIZER_JSON: (_json_dumps, _json_loads)}
+if msgpack is not None:
+    _SERIALIZERS[SERIALIZER_MSGPACK] = (_msgpack_dumps, _msgpack_loads)
+if orjson is not None:
+    _SERIALIZERS[SERIALIZER_ORJSON] = (_orjson_dumps, orjson.loads)
+
+_SERIALIZER_NAMES = {'json': SERIALIZER_JSON, 'msgpack': SERIALIZER_MSGPACK, 'orjson': SERIALIZER_ORJSON}
+
+
+def _zlib_compress(data: bytes) -> bytes:
+    return zlib.compress(data, CacheConfig.CACHE_COMPRESS_LEVEL)
+
+
+_COMPRESSORS = {COMPRESSION_ZLIB: (_zlib_compress, zlib.decompress)}
+if zstandard is not None:
+    # ZstdCompressor/ZstdDecompressor 实例不是线程安全的，每个线程各持有一组
+    _zstd_local = threading.local()
+
+    def _zstd_compress(data: bytes) -> bytes:
+        compressor = getattr(_zstd_local, 'compressor', None)
+        if compressor is None:
+            compressor = _zstd_local.compressor = zstandard.ZstdCompressor(level=CacheConfig.CACHE_COMPRESS_LEVEL)
+        return compressor.compress(data)
+
+    def _zstd_decompress(data: bytes) -> bytes:
+        decompressor = getattr(_zstd_local, 'decompressor', None)
+        if decompressor is None:
+            decompressor = _zstd_local.decompressor = zstandard.ZstdDecompressor()
+        return decompressor.decompress(data)
+
+    _COMPRESSORS[COMPRESSION_ZSTD] = (_zstd_compress, _zstd_decompress)
+
+
+def resolve_serializer(name: str) -> int:
+    """按名称选择序列化器，auto 依次优先 msgpack、orjson，依赖未安装时回退json"""
+    if name == 'auto':
+        for candidate in (SERIALIZER_MSGPACK, SERIALIZER_ORJSON):
+            if candidate in _SERIALIZERS:
+                return candidate
+        return SERIALIZER_JSON
+    serializer = _SERIALIZER_NAMES.get(name)
+    if serializer not in _SERIALIZERS:
+        logger.warning(f"緩存序列化器不可用: {name}，回退為json")
+        return SERIALIZER_JSON
+    return serializer
+
+
+def resolve_compression() -> int:
+    return COMPRESSION_ZSTD if COMPRESSION_ZSTD in _COMPRESSORS else COMPRESSION_ZLIB
+
+
+class CodecStats:
+    """单个命名空间的编解码统计 (进程内，允许并发下轻微丢失)"""
+
+    def __init__(self):
+        self.encodes = 0
+        self.decodes = 0
+        self.encode_seconds = 0.0
+        self.decode_seconds = 0.0
+        self.raw_bytes = 0          # 序列化后、压缩前的字节数
+        self.stored_bytes = 0       # 实际写入Redis的字节数
+        self.compressed = 0
+        self.json_sampled_bytes = 0  # 抽样：同一批值按旧JSON格式编码的字节数
+        self.sampled_stored_bytes = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        saved_ratio = 0
+        if self.json_sampled_bytes:
+            saved_ratio = round(1 - self.sampled_stored_bytes / self.json_sampled_bytes, 4)
+        return {
+            'encodes': self.encodes,
+            'decodes': self.decodes,
+            'avg_encode_us': round(self.encode_seconds / self.encodes * 1e6, 2) if self.encodes else 0,
+            'avg_decode_us': round(self.decode_seconds / self.decodes * 1e6, 2) if self.decodes else 0,
+            'stored_bytes': self.stored_bytes,
+            'compression_saved_bytes': self.raw_bytes - self.stored_bytes,
+            'compressed_values': self.compressed,
+            'saved_ratio_vs_json': saved_ratio,
+            'estimated_saved_bytes_vs_json': int(self.stored_bytes * saved_ratio / (1 - saved_ratio))
+            if 0 < saved_ratio < 1 else 0,
+        }
+
+
+class CacheCodec:
+    """
+    缓存值编解码器
+
+    每个命名空间持有一个实例：序列化器和压缩阈值可按命名空间配置，
+    解码按头部字节识别格式，因此配置变更或滚动发布期间新旧格式可以共存。
+    """
+
+    def __init__(self, serializer: str = None, compress_threshold: int = None):
+        self.serializer = resolve_serializer(serializer or CacheConfig.CACHE_CODEC)
+        self.compression = resolve_compression()
+        self.compress_threshold = (CacheConfig.CACHE_COMPRESS_THRESHOLD
+                                   if compress_threshold is None else compress_threshold)
+        self.stats = CodecStats()
+        self._sample_every = max(int(CacheConfig.CACHE_CODEC_SAMPLE_EVERY), 0)
+
+    def encode(self, value: Any, ttl: int = 0, delta_ms: float = 0) -> bytes:
+        """
+        :param ttl: 逻辑TTL(秒)，超过后视为陈旧
+        :param delta_ms: 本次回源耗时(毫秒)，供提前刷新概率计算
+        """
+        started = time.perf_counter()
+        data = _SERIALIZERS[self.serializer][0](value)
+        raw_size = len(data)
+        compression = COMPRESSION_NONE
+        if 0 < self.compress_threshold <= raw_size:
+            compressed = _COMPRESSORS[self.compression][0](data)
+            # 压缩收益不足时保留原文，省去读取时的解压开销
+            if len(compressed) < raw_size * 0.9:
+                data, compression = compressed, self.compression
+        payload = _HEADER.pack(FORMAT_VERSION, self.serializer, compression, int(time.time()),
+                               int(ttl or 0), int(delta_ms or 0)) + data
+
+        stats = self.stats
+        stats.encode_seconds += time.perf_counter() - started
+        stats.encodes += 1
+        stats.raw_bytes += raw_size
+        stats.stored_bytes += len(payload)
+        if compression:
+            stats.compressed += 1
+        if self._sample_every and stats.encodes % self._sample_every == 0:
+            stats.json_sampled_bytes += len(_json_dumps({"v": value, "t": int(time.time())}))
+            stats.sampled_stored_bytes += len(payload)
+        return payload
+
+    @staticmethod
+    def encode_negative() -> bytes:
+        return _HEADER.pack(FORMAT_VERSION, SERIALIZER_NEGATIVE, COMPRESSION_NONE, int(time.time()), 0, 0)
+
+    def decode(self, raw: Optional[bytes]) -> Tuple[bool, bool, Any, EntryMeta]:
+        """
+        解码缓存值
+        :return: (命中, 是否负缓存, 值, 元数据)；无法识别的数据视为未命中
+        """
+        if not raw:
+            return False, False, None, _EMPTY_META
+        started = time.perf_counter()
+        try:
+            if raw[:1] == b'{':
+                return self._decode_legacy(raw)
+            header = _HEADERS.get(raw[0])
+            if header is None or len(raw) < header.size:
+                return False, False, None, _EMPTY_META
+            fields = header.unpack_from(raw)
+            serializer, compression = fields[1], fields[2]
+            meta = EntryMeta(*fields[3:]) if len(fields) == 6 else EntryMeta(fields[3], 0, 0)
+            if serializer == SERIALIZER_NEGATIVE:
+                return True, True, None, meta
+            if serializer not in _SERIALIZERS or (compression and compression not in _COMPRESSORS):
+                # 其他实例使用了本进程未安装的序列化器/压缩算法
+                return False, False, None, _EMPTY_META
+            data = raw[header.size:]
+            if compression:
+                data = _COMPRESSORS[compression][1](data)
+            return True, False, _SERIALIZERS[serializer][1](data), meta
+        except Exception as e:
+            logger.warning(f"解碼緩存值失敗: {str(e)}")
+            return False, False, None, _EMPTY_META
+        finally:
+            self.stats.decode_seconds += time.perf_counter() - started
+            self.stats.decodes += 1
+
+    @staticmethod
+    def _decode_legacy(raw: bytes) -> Tuple[bool, bool, Any, EntryMeta]:
+        """兼容升级前写入的JSON文本 {"v": 值, "t": 时间} / {"n": 1}"""
+        payload = json.loads(raw)
+        if not isinstance(payload, dict):
+            return False, False, None, _EMPTY_META
+        if payload.get("n"):
+            return True, True, None, _EMPTY_META
+        if "v" not in payload:
+            return False, False, None, _EMPTY_META
+        return True, False, payload["v"], EntryMeta(int(payload.get("t") or 0), 0, 0)
+
+    def describe(self) -> Dict[str, Any]:
+        names = {v: k for k, v in _SERIALIZER_NAMES.items()}
+        return {
+            'serializer': names.get(self.serializer),
+            'compression': 'zstd' if self.compression == COMPRESSION_ZSTD else 'zlib',
+            'compress_threshold': self.compress_threshold,
+            **self.stats.to_dict(),
+        }
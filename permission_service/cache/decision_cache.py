@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+"""
+@文件: decision_cache.py
+@說明: 权限决策缓存 - 进程内LRU + Redis每用户哈希，按用户代数整体失效
+@時間: 2025-01-09
+@作者: LiDong
+"""
+
+import json
+import threading
+from typing import Any, Dict, Iterable, List, Tuple
+
+from cache import redis_client
+from cache.cache_engine import LocalLRUCache, MISSING
+from configs.cache_config import CacheConfig
+from loggers import logger
+
+
+# 变更位点：同一用户同一资源只接受流中更新的事件ID，乱序到达的旧事件被跳过
+# KEYS[1]=位点哈希  ARGV[1]=过期时间 ARGV[2..]=字段、事件ID交替
+# 返回每个事件是否应当应用 (1/0)
+_CLAIM_CHANGES_SCRIPT = """
+local result = {}
+for i = 2, #ARGV, 2 do
+    local current = redis.call('HGET', KEYS[1], ARGV[i])
+    local newer = true
+    if current then
+        local cm, cs = string.match(current, '(%d+)-(%d+)')
+        local nm, ns = string.match(ARGV[i + 1], '(%d+)-(%d+)')
+        cm, cs, nm, ns = tonumber(cm), tonumber(cs), tonumber(nm), tonumber(ns)
+        newer = nm > cm or (nm == cm and ns >= cs)
+    end
+    if newer then
+        redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1])
+        table.insert(result, 1)
+    else
+        table.insert(result, 0)
+    end
+end
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+return result
+"""
+
+
+class PermissionDecisionCache:
+    """
+    权限决策缓存
+
+    每个用户一个代数计数器(generation)，决策结果写入以当前代数命名的哈希
+    perm:decision:{user_id}:{generation}，字段为 资源类型:资源ID:操作，值为 1/0。
+    失效只需对代数执行一次INCR：旧代数的哈希不再被读取，随TTL自然过期，
+    不产生逐条删除。全局代数用于清空全部用户的决策。
+
+    代数在进程内短暂缓存，INCR后通过发布订阅通知其他进程丢弃本地代数；
+    消息丢失时由代数的本地TTL兜底。Redis不可用时退化为仅进程内缓存。
+    """
+
+    GENERATION_KEY_PREFIX = "perm:gen:"
+    GLOBAL_GENERATION_KEY = "perm:gen:__all__"
+    DECISION_KEY_PREFIX = "perm:decision:"
+    APPLIED_KEY_PREFIX = "perm:applied:"
+    GENERATION_CHANNEL = "perm:gen:changed"
+
+    def __init__(self):
+        self.redis = redis_client
+        self.decisions = LocalLRUCache(CacheConfig.PERMISSION_DECISION_L1_SIZE)
+        self.generations = LocalLRUCache(max(CacheConfig.PERMISSION_DECISION_L1_SIZE // 10, 1000))
+        # Redis不可用时使用的进程内代数
+        self._local_generations: Dict[str, int] = {}
+        self._local_global_generation = 0
+        self._scripts = {}
+        self._listener = None
+        self._listener_lock = threading.Lock()
+        self._stats = {'l1_hit': 0, 'l2_hit': 0, 'miss': 0, 'writes': 0,
+                       'invalidations_sent': 0, 'invalidations_received': 0}
+
+    @staticmethod
+    def field(resource_type: str, resource_id: str, action: str) -> str:
+        return f"{resource_type}:{resource_id or ''}:{action}"
+
+    # ==================== 代数 ====================
+
+    def generation(self, user_id: str) -> str:
+        """获取用户当前代数 (全局代数.用户代数)"""
+        cached = self.generations.get(user_id)
+        if cached is not MISSING:
+            return cached
+
+        conn = self._redis_conn()
+        if conn is None:
+            return f"{self._local_global_generation}.{self._local_generations.get(user_id, 0)}"
+
+        try:
+            global_gen, user_gen = conn.mget(self.GLOBAL_GENERATION_KEY, f"{self.GENERATION_KEY_PREFIX}{user_id}")
+            generation = f"{global_gen or 0}.{user_gen or 0}"
+        except Exception as e:
+            logger.warning(f"讀取權限代數失敗: {str(e)}")
+            return f"{self._local_global_generation}.{self._local_generations.get(user_id, 0)}"
+
+        self.generations.set(user_id, generation, CacheConfig.PERMISSION_GENERATION_L1_TTL)
+        return generation
+
+    def invalidate_users(self, user_ids: Iterable[str]) -> int:
+        """递增用户代数，使其全部决策失效"""
+        user_ids = [str(user_id) for user_id in user_ids if user_id]
+        if not user_ids:
+            return 0
+
+        for user_id in user_ids:
+            self._local_generations[user_id] = self._local_generations.get(user_id, 0) + 1
+            self.generations.delete(user_id)
+
+        conn = self._redis_conn()
+        if conn is not None:
+            try:
+                pipeline = conn.pipeline(transaction=False)
+                for user_id in user_ids:
+                    pipeline.incr(f"{self.GENERATION_KEY_PREFIX}{user_id}")
+                pipeline.publish(self.GENERATION_CHANNEL, json.dumps(user_ids))
+                pipeline.execute()
+            except Exception as e:
+                logger.error(f"遞增權限代數失敗: {str(e)}")
+        self._stats['invalidations_sent'] += len(user_ids)
+        return len(user_ids)
+
+    def invalidate_all(self) -> bool:
+        """递增全局代数，使全部用户的决策失效"""
+        self._local_global_generation += 1
+        self.generations.clear()
+
+        conn = self._redis_conn()
+        if conn is not None:
+            try:
+                pipeline = conn.pipeline(transaction=False)
+                pipeline.incr(self.GLOBAL_GENERATION_KEY)
+                pipeline.publish(self.GENERATION_CHANNEL, json.dumps("*"))
+                pipeline.execute()
+            except Exception as e:
+                logger.error(f"遞增全局權限代數失敗: {str(e)}")
+                return False
+        self._stats['invalidations_sent'] += 1
+        return True
+
+    def claim_changes(self, user_id: str, changes: List[Tuple[str, str]]) -> List[bool]:
+        """
+        登记变更流位点，判断事件是否比已应用的同资源事件更新
+        须在持有该用户上下文行锁时调用，保证位点判断与上下文修补的顺序一致
+        :param changes: [(资源类型:资源ID, 流事件ID)]
+        :return: 与 changes 对应的是否应用；Redis不可用时全部应用
+        """
+        conn = self._redis_conn()
+        if conn is None or not changes:
+            return [True] * len(changes)
+        args = [CacheConfig.PERMISSION_CHANGE_APPLIED_TTL]
+        for field, entry_id in changes:
+            args.extend([field, entry_id])
+        result = self._run_script(conn, _CLAIM_CHANGES_SCRIPT, keys=[f"{self.APPLIED_KEY_PREFIX}{user_id}"], args=args)
+        return [bool(int(flag)) for flag in result]
+
+    # ==================== 决策读写 ====================
+
+    def get_many(self, user_id: str, fields: List[str]) -> Tuple[str, Dict[str, bool]]:
+        """
+        批量读取决策，本地代数命中时最多一次Redis往返
+        :return: (读取时的代数, {字段: 是否有权限})；写回计算结果时须使用同一代数，
+                 计算期间发生的失效会使写回落入旧代数，不会被读到
+        """
+        fields = list(dict.fromkeys(fields))
+        conn = self._redis_conn()
+        # 决策哈希键由代数决定，本地没有代数时先读代数再HMGET (不用脚本拼接未声明的键)
+        generation = self.generation(user_id)
+
+        local_prefix = f"{user_id}:{generation}:"
+        found: Dict[str, bool] = {}
+        missing: List[str] = []
+        for field in fields:
+            value = self.decisions.get(local_prefix + field)
+            if value is MISSING:
+                missing.append(field)
+            else:
+                found[field] = value
+        self._stats['l1_hit'] += len(found)
+
+        if missing and conn is not None:
+            try:
+                values = conn.hmget(self._decision_key(user_id, generation), missing)
+            except Exception as e:
+                logger.warning(f"讀取權限決策緩存失敗: {str(e)}")
+                values = [None] * len(missing)
+            self._collect(local_prefix, missing, values, found)
+
+        self._stats['miss'] += len(fields) - len(found)
+        return generation, found
+
+    def _collect(self, local_prefix: str, fields: List[str], values: List[Any], found: Dict[str, bool]) -> None:
+        for field, value in zip(fields, values):
+            if value is None:
+                continue
+            decision = value == "1"
+            found[field] = decision
+            self.decisions.set(local_prefix + field, decision, CacheConfig.PERMISSION_DECISION_L1_TTL)
+            self._stats['l2_hit'] += 1
+
+    def get(self, user_id: str, field: str) -> Tuple[str, Any]:
+        """读取单个决策，未命中时值为None"""
+        generation, found = self.get_many(user_id, [field])
+        return generation, found.get(field)
+
+    def set_many(self, user_id: str, generation: str, decisions: Dict[str, bool]) -> bool:
+        """写入指定代数下的决策"""
+        if not decisions:
+            return True
+        local_prefix = f"{user_id}:{generation}:"
+        for field, decision in decisions.items():
+            self.decisions.set(local_prefix + field, bool(decision), CacheConfig.PERMISSION_DECISION_L1_TTL)
+        self._stats['writes'] += len(decisions)
+
+        conn = self._redis_conn()
+        if conn is None:
+            return True
+        try:
+            key = self._decision_key(user_id, generation)
+            pipeline = conn.pipeline(transaction=False)
+            pipeline.hset(key, mapping={field: "1" if decision else "0" for field, decision in decisions.items()})
+            pipeline.expire(key, CacheConfig.PERMISSION_DECISION_TTL)
+            pipeline.execute()
+            return True
+        except Exception as e:
+            logger.warning(f"寫入權限決策緩存失敗: {str(e)}")
+            return False
+
+    # ==================== 统计 ====================
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = dict(self._stats)
+        lookups = stats['l1_hit'] + stats['l2_hit'] + stats['miss']
+        stats['hit_rate'] = round((stats['l1_hit'] + stats['l2_hit']) / lookups, 4) if lookups else 0
+        stats['l1_entries'] = len(self.decisions)
+        stats['l1_generations'] = len(self.generations)
+        stats['redis_available'] = self.redis.redis_client is not None
+        return stats
+
+    # ==================== 辅助方法 ====================
+
+    def _decision_key(self, user_id: str, generation: str) -> str:
+        return f"{self.DECISION_KEY_PREFIX}{user_id}:{generation}"
+
+    def _run_script(self, conn, script: str, keys: List[str], args: List[Any]):
+        if script not in self._scripts:
+            self._scripts[script] = conn.register_script(script)
+        return self._scripts[script](keys=keys, args=args)
+
+    def _redis_conn(self):
+        """获取Redis连接，首次可用时启动代数变更订阅线程"""
+        conn = self.redis.redis_client
+        if conn is not None and self._listener is None:
+            self._start_listener(conn)
+        return conn
+
+    def _start_listener(self, conn) -> None:
+        with self._listener_lock:
+            if self._listener is not None:
+                return
+            try:
+                pubsub = conn.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(**{self.GENERATION_CHANNEL: self._handle_generation_change})
+                self._listener = pubsub.run_in_thread(sleep_time=1, daemon=True)
+            except Exception as e:
+                # 订阅失败时依赖代数的本地短TTL兜底，下次访问重试
+                self._listener = None
+                logger.warning(f"啟動權限代數訂閱失敗: {str(e)}")
+
+    def _handle_generation_change(self, message) -> None:
+        try:
+            payload = json.loads(message['data'])
+            self._stats['invalidations_received'] += 1
+            if payload == "*":
+                self.generations.clear()
+                return
+            for user_id in payload:
+                self.generations.delete(user_id)
+        except Exception as e:
+            logger.warning(f"處理權限代數變更消息失敗: {str(e)}")
+
+
+# 创建全局决策缓存实例
+decision_cache = PermissionDecisionCache()
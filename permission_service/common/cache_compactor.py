@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+@文件: cache_compactor.py
+@說明: 权限缓存表过期压缩 - 分批删除过期行，批间休眠限流，运行结果写入Redis供统计接口读取
+@時間: 2025-01-09
+@作者: LiDong
+"""
+
+import json
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict
+
+from cache import redis_client
+from configs.cache_config import CacheConfig
+from dbs.mysql_db import db
+from dbs.mysql_db.model_tables import UserPermissionContextModel, PermissionVerificationCacheModel
+from loggers import logger
+
+
+class ExpiredCacheCompactor:
+    """
+    过期缓存压缩器
+
+    每批先按 expires_at 索引取出一批过期行的主键，再按主键删除并提交，
+    单个事务只锁定一批行；批间休眠，单次运行超过时间预算后停止，剩余行留给下一周期。
+    删除时再次校验 expires_at，期间被刷新续期的上下文不会被误删。
+    手动触发在后台线程执行，结果同样写入 last_run，通过缓存统计接口查看。
+    """
+
+    TABLES = (
+        ('user_permission_context', UserPermissionContextModel),
+        ('permission_verification_cache', PermissionVerificationCacheModel),
+    )
+    LAST_RUN_KEY = "perm:compactor:last_run"
+
+    def __init__(self):
+        self.redis = redis_client
+        self._stats = {'runs': 0, 'rows_reclaimed': 0, 'last_run': None}
+        self._manual_lock = threading.Lock()
+
+    def start_async(self, app) -> bool:
+        """在后台线程执行一次压缩 (手动触发)；本进程已有手动压缩在运行时不重复启动，返回是否已启动"""
+        if not self._manual_lock.acquire(blocking=False):
+            return False
+
+        def _target():
+            try:
+                with app.app_context():
+                    self.run()
+            except Exception as e:
+                logger.error(f"手動壓縮過期緩存失敗: {str(e)}")
+            finally:
+                self._manual_lock.release()
+
+        try:
+            threading.Thread(target=_target, name="cache-compact-manual", daemon=True).start()
+        except Exception:
+            self._manual_lock.release()
+            raise
+        return True
+
+    def run(self) -> Dict[str, Any]:
+        """压缩一次，返回本次各表回收行数与耗时"""
+        started = time.monotonic()
+        deadline = started + CacheConfig.CACHE_COMPACT_MAX_SECONDS
+        cutoff = datetime.utcnow()
+        reclaimed = {}
+        batches = 0
+        completed = True
+
+        for table, model in self.TABLES:
+            reclaimed[table] = 0
+            while True:
+                if time.monotonic() >= deadline:
+                    completed = False
+                    break
+                deleted = self._delete_batch(model, cutoff)
+                reclaimed[table] += deleted
+                batches += 1 if deleted else 0
+                if deleted < CacheConfig.CACHE_COMPACT_BATCH_SIZE:
+                    break
+                time.sleep(CacheConfig.CACHE_COMPACT_SLEEP_MS / 1000)
+            if not completed:
+                break
+
+        result = {
+            'rows_reclaimed': sum(reclaimed.values()),
+            'by_table': reclaimed,
+            'batches': batches,
+            'duration_seconds': round(time.monotonic() - started, 3),
+            'completed': completed,
+            'finished_at': datetime.utcnow().isoformat()
+        }
+        self._stats['runs'] += 1
+        self._stats['rows_reclaimed'] += result['rows_reclaimed']
+        self._stats['last_run'] = result
+        self._save_last_run(result)
+        return result
+
+    def _delete_batch(self, model, cutoff: datetime) -> int:
+        try:
+            ids = [row_id for row_id, in db.session.query(model.id).filter(
+                model.expires_at <= cutoff
+            ).order_by(model.expires_at).limit(CacheConfig.CACHE_COMPACT_BATCH_SIZE).all()]
+            if not ids:
+                return 0
+            deleted = model.query.filter(
+                model.id.in_(ids), model.expires_at <= cutoff
+            ).delete(synchronize_session=False)
+            db.session.commit()
+            return deleted
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"壓縮過期緩存失敗: {model.__tablename__}, {str(e)}")
+            return 0
+
+    def _save_last_run(self, result: Dict[str, Any]):
+        conn = self.redis.redis_client
+        if conn is None:
+            return
+        try:
+            # 压缩任务跨进程互斥执行，统计接口可能落在其他进程，结果写入Redis共享
+            conn.set(self.LAST_RUN_KEY, json.dumps(result), ex=CacheConfig.CLEANUP_INTERVAL_MINUTES * 60 * 3)
+        except Exception as e:
+            logger.warning(f"保存緩存壓縮結果失敗: {str(e)}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = dict(self._stats)
+        conn = self.redis.redis_client
+        if conn is not None:
+            try:
+                last_run = conn.get(self.LAST_RUN_KEY)
+                if last_run:
+                    stats['last_run'] = json.loads(last_run)
+            except Exception as e:
+                logger.warning(f"讀取緩存壓縮結果失敗: {str(e)}")
+        return stats
+
+
+# 创建全局压缩器实例
+cache_compactor = ExpiredCacheCompactor()
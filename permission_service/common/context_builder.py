@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""
+@文件: context_builder.py
+@說明: 用户权限上下文构建 - 并发调用团队服务和项目服务，连接池复用，统一截止时间，同用户构建合并
+@時間: 2025-01-09
+@作者: LiDong
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from cache.cache_engine import _InflightCall
+from common.metrics import permission_metrics
+from configs.cache_config import CacheConfig
+from configs.constant import Config
+from loggers import logger
+
+
+class UserContextBuilder:
+    """
+    用户权限上下文构建器
+
+    团队角色和项目维护员角色并发获取，构建耗时取决于较慢的一方而不是两者之和；
+    整次构建共用一个截止时间，超时或失败的下游按空结果处理并把上下文标记为部分结果，
+    由调用方以较短TTL缓存。同一进程内同一用户的并发构建只发起一次下游调用。
+    """
+
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(
+            max_workers=CacheConfig.CONTEXT_BUILD_WORKERS, thread_name_prefix="context-builder"
+        )
+        self._http = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=CacheConfig.CONTEXT_HTTP_POOL_SIZE)
+        self._http.mount('http://', adapter)
+        self._http.mount('https://', adapter)
+        self._inflight: Dict[str, _InflightCall] = {}
+        self._inflight_lock = threading.Lock()
+        self._stats = {'builds': 0, 'partial': 0, 'coalesced': 0, 'team_failed': 0, 'project_failed': 0}
+
+    def build(self, user_id: str) -> Dict[str, Any]:
+        """
+        构建用户权限上下文
+        :return: 上下文字典，partial 为 True 表示有下游未在截止时间内返回有效结果
+        """
+        with self._inflight_lock:
+            call = self._inflight.get(user_id)
+            is_leader = call is None
+            if is_leader:
+                call = _InflightCall()
+                self._inflight[user_id] = call
+
+        if not is_leader:
+            self._stats['coalesced'] += 1
+            if call.event.wait(CacheConfig.CONTEXT_BUILD_TIMEOUT * 2) and call.result is not None:
+                return dict(call.result)
+            return self._build(user_id)
+
+        try:
+            call.result = self._build(user_id)
+            return dict(call.result)
+        finally:
+            call.event.set()
+            with self._inflight_lock:
+                self._inflight.pop(user_id, None)
+
+    @permission_metrics.timed('fan_out', name='context_build')
+    def _build(self, user_id: str) -> Dict[str, Any]:
+        self._stats['builds'] += 1
+        context = {
+            'user_id': user_id,
+            'platform_role': 'platform_user',  # 默认角色，实际应从用户服务获取
+            'team_roles': {},
+            'project_maintainer_roles': {},
+            'partial': False
+        }
+
+        deadline = time.monotonic() + CacheConfig.CONTEXT_BUILD_TIMEOUT
+        fetchers: Dict[str, Tuple[str, Callable[[str, float], Dict[str, str]]]] = {
+            'team': ('team_roles', self._fetch_team_roles),
+            'project': ('project_maintainer_roles', self._fetch_project_roles),
+        }
+        futures = {
+            self._executor.submit(self._timed_fetch, source, fetch, user_id, deadline): source
+            for source, (_, fetch) in fetchers.items()
+        }
+        done, not_done = wait(futures, timeout=max(deadline - time.monotonic(), 0))
+
+        for future, source in futures.items():
+            field = fetchers[source][0]
+            if future not in done:
+                future.cancel()
+                logger.warning(f"获取用户{source}角色超时: {user_id}")
+            elif future.exception() is not None:
+                logger.warning(f"获取用户{source}角色失败: {user_id}, {str(future.exception())}")
+            else:
+                context[field] = future.result()
+                continue
+            self._stats[f'{source}_failed'] += 1
+            context['partial'] = True
+
+        if context['partial']:
+            self._stats['partial'] += 1
+        return context
+
+    # ==================== 下游调用 ====================
+
+    @staticmethod
+    def _timed_fetch(source: str, fetch: Callable[[str, float], Dict[str, str]], user_id: str,
+                     deadline: float) -> Dict[str, str]:
+        with permission_metrics.timer('context_fetch', source):
+            return fetch(user_id, deadline)
+
+    def _fetch_team_roles(self, user_id: str, deadline: float) -> Dict[str, str]:
+        """团队服务批量接口，返回 {团队ID: 角色}"""
+        content = self._post(f"{Config.TEAM_SERVICE_URL}/internal/user/teams", {'user_ids': [user_id]}, deadline)
+        teams = content.get(user_id) or []
+        return {team['team_id']: team['role'] for team in teams if team.get('team_id') and team.get('role')}
+
+    def _fetch_project_roles(self, user_id: str, deadline: float) -> Dict[str, str]:
+        """项目服务维护员接口，返回 {项目ID: 'maintainer'}"""
+        content = self._get(f"{Config.PROJECT_SERVICE_URL}/internal/projects/user/{user_id}/maintainer-projects",
+                            deadline)
+        return {project['id']: 'maintainer' for project in content.get('projects', []) if project.get('id')}
+
+    def _get(self, url: str, deadline: float) -> Dict[str, Any]:
+        return self._parse(self._http.get(url, timeout=self._timeout(deadline)))
+
+    def _post(self, url: str, payload: Dict[str, Any], deadline: float) -> Dict[str, Any]:
+        return self._parse(self._http.post(url, json=payload, timeout=self._timeout(deadline)))
+
+    @staticmethod
+    def _timeout(deadline: float) -> Tuple[float, float]:
+        """(连接超时, 读取超时)，读取超时为距截止时间的剩余时间"""
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError("已超过上下文构建截止时间")
+        return min(CacheConfig.CONTEXT_CONNECT_TIMEOUT, remaining), remaining
+
+    @staticmethod
+    def _parse(response) -> Dict[str, Any]:
+        response.raise_for_status()
+        result = response.json()
+        if result.get("code") != "S10000":
+            raise ValueError(result.get("msg") or "下游服务返回失败")
+        return result.get("content") or {}
+
+    def get_stats(self) -> Dict[str, Any]:
+        return dict(self._stats, inflight=len(self._inflight))
+
+
+# 创建全局上下文构建器实例
+context_builder = UserContextBuilder()
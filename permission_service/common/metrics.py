@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+@文件: metrics.py
+@說明: 进程内延迟直方图与计数器 - 固定分桶，内部指标接口以JSON或Prometheus文本输出
+@時間: 2025-01-09
+@作者: LiDong
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+from typing import Any, Dict, List, Optional, Tuple
+
+
+# 直方图分桶上界 (秒)，覆盖本地缓存命中(亚毫秒)到下游超时(秒级)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class LatencyHistogram:
+    """固定分桶延迟直方图，记录一次观测为一次二分查找和一次计数"""
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        # 最后一个桶为 +Inf
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float) -> None:
+        index = bisect_left(self.buckets, seconds)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += seconds
+
+    def percentile(self, q: float) -> Optional[float]:
+        """按分桶上界估算分位数 (秒)，落在 +Inf 桶时返回最大上界"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for index, bucket_count in enumerate(self.counts):
+            cumulative += bucket_count
+            if cumulative >= rank:
+                return self.buckets[min(index, len(self.buckets) - 1)]
+        return self.buckets[-1]
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            count, total = self.count, self.sum
+        return {
+            'count': count,
+            'avg_ms': round(total / count * 1000, 3) if count else None,
+            'p50_ms': self._ms(self.percentile(0.5)),
+            'p95_ms': self._ms(self.percentile(0.95)),
+            'p99_ms': self._ms(self.percentile(0.99)),
+        }
+
+    @staticmethod
+    def _ms(seconds: Optional[float]) -> Optional[float]:
+        return None if seconds is None else round(seconds * 1000, 3)
+
+
+class ServiceMetrics:
+    """
+    服务指标
+
+    直方图按 (名称, 标签) 区分，如 ('operation_latency', 'verify')；计数器同理。
+    指标只统计本进程，多worker部署时由采集端按实例汇总。
+    """
+
+    def __init__(self, namespace: str):
+        self.namespace = namespace
+        self.histograms: Dict[Tuple[str, str], LatencyHistogram] = {}
+        self.counters: Dict[Tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+
+    def observe(self, name: str, label: str, seconds: float) -> None:
+        key = (name, label)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(key, LatencyHistogram())
+        histogram.observe(seconds)
+
+    def incr(self, name: str, label: str, amount: int = 1) -> None:
+        key = (name, label)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    @contextmanager
+    def timer(self, name: str, label: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, label, time.perf_counter() - started)
+
+    def timed(self, label: str, name: str = 'operation_latency'):
+        """装饰器：记录函数耗时"""
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.timer(name, label):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def snapshot(self) -> Dict[str, Any]:
+        """{指标名: {标签: 统计}}"""
+        result: Dict[str, Any] = {'uptime_seconds': round(time.time() - self.started_at, 1)}
+        for (name, label), histogram in sorted(self.histograms.items()):
+            result.setdefault(name, {})[label] = histogram.snapshot()
+        with self._lock:
+            counters = dict(self.counters)
+        for (name, label), value in sorted(counters.items()):
+            result.setdefault(name, {})[label] = value
+        return result
+
+    def to_prometheus(self, gauges: Dict[str, Dict[str, float]] = None) -> str:
+        """Prometheus文本格式；gauges 为调用方附加的 {指标名: {标签: 数值}}"""
+        lines: List[str] = []
+        histograms: Dict[str, List[Tuple[str, LatencyHistogram]]] = {}
+        for (name, label), histogram in sorted(self.histograms.items()):
+            histograms.setdefault(name, []).append((label, histogram))
+        for name, series in histograms.items():
+            metric = f"{self.namespace}_{name}_seconds"
+            lines.append(f"# TYPE {metric} histogram")
+            for label, histogram in series:
+                with histogram._lock:
+                    counts, count, total = list(histogram.counts), histogram.count, histogram.sum
+                cumulative = 0
+                for bound, bucket_count in zip(histogram.buckets + (float('inf'),), counts):
+                    cumulative += bucket_count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f'{metric}_bucket{{label="{label}",le="{le}"}} {cumulative}')
+                lines.append(f'{metric}_sum{{label="{label}"}} {total}')
+                lines.append(f'{metric}_count{{label="{label}"}} {count}')
+
+        with self._lock:
+            counters = sorted(self.counters.items())
+        counter_names = []
+        for (name, label), value in counters:
+            metric = f"{self.namespace}_{name}_total"
+            if metric not in counter_names:
+                counter_names.append(metric)
+                lines.append(f"# TYPE {metric} counter")
+            lines.append(f'{metric}{{label="{label}"}} {value}')
+
+        for name, series in (gauges or {}).items():
+            metric = f"{self.namespace}_{name}"
+            lines.append(f"# TYPE {metric} gauge")
+            for label, value in series.items():
+                lines.append(f'{metric}{{label="{label}"}} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+# 创建全局指标实例
+permission_metrics = ServiceMetrics('permission')
@@ -65,6 +65,10 @@ class Config:
     CACHE_DEFAULT_TIMEOUT = int(os.getenv("CACHE_DEFAULT_TIMEOUT", 300))  # 5分钟
     CACHE_KEY_PREFIX = os.getenv("CACHE_KEY_PREFIX", "api_gateway:")
 
+    # 下游服务地址
+    TEAM_SERVICE_URL = os.getenv("TEAM_SERVICE_URL", "http://localhost:25698")
+    PROJECT_SERVICE_URL = os.getenv("PROJECT_SERVICE_URL", "http://localhost:25699")
+
 
 # 角色权限配置
 ROLE_PERMISSIONS = {
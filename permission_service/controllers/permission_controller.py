@@ -14,76 +14,76 @@ from sqlalchemy import func, and_, or_
 from sqlalchemy.exc import IntegrityError
 
 from common.common_tools import CommonTools
+from common.cache_compactor import cache_compactor
+from common.context_builder import context_builder
+from common.metrics import permission_metrics
+from common.permission_evaluator import PERMISSION_RULES, CompiledContext, permission_evaluator
 from dbs.mysql_db import db
 from dbs.mysql_db.model_tables import (
     PermissionModel, UserPermissionContextModel,
-    PermissionVerificationCacheModel, PermissionChangeEventModel
+    PermissionChangeEventModel
 )
 from cache import redis_client
+from cache.cache_engine import LocalLRUCache, MISSING
+from cache.decision_cache import decision_cache
+from cache.permission_feed import permission_feed
+from configs.cache_config import CacheConfig
 from loggers import logger
 
 
+# 已编译的用户上下文 {用户ID:代数:上下文缓存时间: CompiledContext}
+_compiled_contexts = LocalLRUCache(CacheConfig.COMPILED_CONTEXT_L1_SIZE)
+
+
 class PermissionController:
     """权限控制器"""
 
-    # 缓存过期时间
-    CONTEXT_CACHE_EXPIRE = 3600  # 1小时
-    VERIFICATION_CACHE_EXPIRE = 1800  # 30分钟
+    # 缓存过期时间 (部分结果使用较短的 CONTEXT_PARTIAL_TTL)
+    CONTEXT_CACHE_EXPIRE = CacheConfig.CONTEXT_CACHE_TTL
     
-    # 权限规则定义
-    PERMISSION_RULES = {
-        # 平台级权限
-        'platform': {
-            'platform_admin': ['platform:admin', 'platform:read', 'platform:write'],
-            'platform_user': ['platform:read']
-        },
-        # 团队级权限
-        'team': {
-            'owner': ['team:admin', 'team:read', 'team:write', 'team:delete', 'team:invite', 'team:manage_members'],
-            'admin': ['team:read', 'team:write', 'team:invite', 'team:manage_members'],
-            'member': ['team:read']
-        },
-        # 项目级权限
-        'project': {
-            'maintainer': ['project:admin', 'project:read', 'project:write', 'project:delete', 'project:manage'],
-            'member': ['project:read', 'project:write']  # 如果项目允许成员编辑
-        }
-    }
+    # 权限规则定义 (判定使用启动时编译的位掩码，见 common.permission_evaluator)
+    PERMISSION_RULES = PERMISSION_RULES
 
     @staticmethod
-    def verify_permission(user_id: str, resource_type: str, resource_id: str, action: str, use_cache: bool = True) -> Tuple[bool, Any]:
+    @permission_metrics.timed('verify')
+    def verify_permission(user_id: str, resource_type: str, resource_id: str, action: str, use_cache: bool = True) -> Tuple[Any, bool]:
         """验证单个权限"""
         try:
-            # 检查缓存
+            # 检查决策缓存 (记下读取时的代数，写回时沿用，避免计算期间的失效被覆盖)
+            generation = None
             if use_cache:
-                cached_result = PermissionController._get_verification_cache(user_id, resource_type, resource_id, action)
+                generation, cached_result = PermissionController._get_verification_cache(
+                    user_id, resource_type, resource_id, action
+                )
                 if cached_result is not None:
-                    return True, {
+                    permission_metrics.incr('checks', 'cache')
+                    return {
                         'has_permission': cached_result,
                         'source': 'cache',
                         'user_id': user_id,
                         'resource_type': resource_type,
                         'resource_id': resource_id,
                         'action': action
-                    }
+                    }, True
             
             # 获取用户权限上下文
             context_result, context_flag = PermissionController.get_user_context(user_id)
             if not context_flag:
-                return False, f"获取用户权限上下文失败: {context_result}"
+                return f"获取用户权限上下文失败: {context_result}", False
             
             # 执行权限验证
             has_permission = PermissionController._verify_permission_logic(
-                context_result, resource_type, resource_id, action
+                context_result, resource_type, resource_id, action, generation
             )
+            permission_metrics.incr('checks', 'computed')
             
-            # 缓存结果
-            if use_cache:
+            # 缓存结果 (部分上下文得出的决策不缓存，避免在上下文补全后继续生效)
+            if use_cache and not context_result.get('partial'):
                 PermissionController._cache_verification_result(
-                    user_id, resource_type, resource_id, action, has_permission, context_result
+                    user_id, generation, {decision_cache.field(resource_type, resource_id, action): has_permission}
                 )
             
-            return True, {
+            return {
                 'has_permission': has_permission,
                 'source': 'computed',
                 'user_id': user_id,
@@ -91,67 +91,101 @@ class PermissionController:
                 'resource_id': resource_id,
                 'action': action,
                 'context': context_result
-            }
+            }, True
             
         except Exception as e:
             logger.error(f"权限验证失败: {str(e)}")
-            return False, f"权限验证失败: {str(e)}"
+            return f"权限验证失败: {str(e)}", False
 
     @staticmethod
-    def verify_permissions_batch(user_id: str, permissions: List[Dict]) -> Tuple[bool, Any]:
+    @permission_metrics.timed('verify_batch')
+    def verify_permissions_batch(user_id: str, permissions: List[Dict]) -> Tuple[Any, bool]:
         """批量验证权限"""
         try:
-            results = []
-            
-            # 获取用户权限上下文
-            context_result, context_flag = PermissionController.get_user_context(user_id)
-            if not context_flag:
-                return False, f"获取用户权限上下文失败: {context_result}"
+            # 一次读取全部决策，仅在存在未命中时才获取用户权限上下文
+            fields = [
+                decision_cache.field(perm.get('resource_type'), perm.get('resource_id'), perm.get('action'))
+                for perm in permissions
+            ]
+            generation, cached = decision_cache.get_many(user_id, fields)
+            
+            # 未命中的去重后一次性判定：上下文只展开一次，每项为一次字典查找加一次按位与
+            context_result = None
+            computed = {}
+            misses = {
+                field: (perm.get('resource_type'), perm.get('resource_id'), perm.get('action'))
+                for perm, field in zip(permissions, fields) if field not in cached
+            }
+            if misses:
+                context_result, context_flag = PermissionController.get_user_context(user_id)
+                if not context_flag:
+                    return f"获取用户权限上下文失败: {context_result}", False
+                compiled_context = PermissionController._compile_context(context_result, generation)
+                computed = dict(zip(misses, permission_evaluator.check_many(compiled_context, misses.values())))
+            permission_metrics.incr('checks', 'cache', len(permissions) - len(misses))
+            permission_metrics.incr('checks', 'computed', len(misses))
             
-            for perm in permissions:
-                resource_type = perm.get('resource_type')
-                resource_id = perm.get('resource_id')
-                action = perm.get('action')
-                
-                # 检查缓存
-                cached_result = PermissionController._get_verification_cache(user_id, resource_type, resource_id, action)
-                
-                if cached_result is not None:
-                    has_permission = cached_result
-                    source = 'cache'
-                else:
-                    # 执行权限验证
-                    has_permission = PermissionController._verify_permission_logic(
-                        context_result, resource_type, resource_id, action
-                    )
-                    source = 'computed'
-                    
-                    # 缓存结果
-                    PermissionController._cache_verification_result(
-                        user_id, resource_type, resource_id, action, has_permission, context_result
-                    )
-                
+            results = []
+            for perm, field in zip(permissions, fields):
+                from_cache = field in cached
                 results.append({
-                    'resource_type': resource_type,
-                    'resource_id': resource_id,
-                    'action': action,
-                    'has_permission': has_permission,
-                    'source': source
+                    'resource_type': perm.get('resource_type'),
+                    'resource_id': perm.get('resource_id'),
+                    'action': perm.get('action'),
+                    'has_permission': cached[field] if from_cache else computed[field],
+                    'source': 'cache' if from_cache else 'computed'
                 })
             
-            return True, {
+            # 缓存结果 (部分上下文得出的决策不缓存)
+            if not (context_result or {}).get('partial'):
+                PermissionController._cache_verification_result(user_id, generation, computed)
+            
+            return {
                 'user_id': user_id,
                 'results': results,
                 'total': len(results),
                 'context': context_result
-            }
+            }, True
             
         except Exception as e:
             logger.error(f"批量权限验证失败: {str(e)}")
-            return False, f"批量权限验证失败: {str(e)}"
+            return f"批量权限验证失败: {str(e)}", False
 
     @staticmethod
-    def get_user_context(user_id: str, force_refresh: bool = False) -> Tuple[bool, Any]:
+    @permission_metrics.timed('filter')
+    def filter_permitted_resources(user_id: str, resource_type: str, action: str,
+                                   resource_ids: List[str]) -> Tuple[Any, bool]:
+        """
+        过滤用户对同一 资源类型:操作 有权限的资源ID
+        不逐项读写决策缓存，直接用展开后的上下文一次遍历判定；allowed 为惰性迭代器，供调用方流式输出
+        """
+        try:
+            context_result, context_flag = PermissionController.get_user_context(user_id)
+            if not context_flag:
+                return f"获取用户权限上下文失败: {context_result}", False
+            
+            compiled_context = PermissionController._compile_context(
+                context_result, decision_cache.generation(user_id)
+            )
+            # 去重并保持请求顺序
+            unique_ids = list(dict.fromkeys(resource_ids))
+            permission_metrics.incr('checks', 'filter', len(unique_ids))
+            return {
+                'user_id': user_id,
+                'resource_type': resource_type,
+                'action': action,
+                'total': len(unique_ids),
+                'partial': bool(context_result.get('partial')),
+                'allowed': permission_evaluator.filter_allowed(compiled_context, resource_type, action, unique_ids)
+            }, True
+            
+        except Exception as e:
+            logger.error(f"批量过滤资源权限失败: {str(e)}")
+            return f"批量过滤资源权限失败: {str(e)}", False
+
+    @staticmethod
+    @permission_metrics.timed('context')
+    def get_user_context(user_id: str, force_refresh: bool = False) -> Tuple[Any, bool]:
         """获取用户权限上下文"""
         try:
             # 检查缓存
@@ -162,13 +196,19 @@ class PermissionController:
                 ).first()
                 
                 if context:
-                    return True, {
+                    # 部分上下文在写入时标记，读取时不据此缓存决策
+                    partial = bool(context.is_partial)
+                    permission_metrics.incr('context_cache', 'stale' if partial else 'hit')
+                    return {
                         'user_id': context.user_id,
                         'platform_role': context.platform_role,
                         'team_roles': context.team_roles or {},
                         'project_maintainer_roles': context.project_maintainer_roles or {},
-                        'cached_at': context.cached_at.isoformat() if context.cached_at else None
-                    }
+                        'cached_at': context.cached_at.isoformat() if context.cached_at else None,
+                        'partial': partial
+                    }, True
+            
+            permission_metrics.incr('context_cache', 'refresh' if force_refresh else 'miss')
             
             # 构建用户上下文
             context_result = PermissionController._build_user_context(user_id)
@@ -176,14 +216,14 @@ class PermissionController:
             # 保存到缓存
             PermissionController._save_user_context(user_id, context_result)
             
-            return True, context_result
+            return context_result, True
             
         except Exception as e:
             logger.error(f"获取用户权限上下文失败: {str(e)}")
-            return False, f"获取用户权限上下文失败: {str(e)}"
+            return f"获取用户权限上下文失败: {str(e)}", False
 
     @staticmethod
-    def refresh_user_context(user_ids: List[str]) -> Tuple[bool, Any]:
+    def refresh_user_context(user_ids: List[str]) -> Tuple[Any, bool]:
         """刷新用户权限上下文"""
         try:
             refreshed_users = []
@@ -194,8 +234,9 @@ class PermissionController:
                     # 清除旧缓存
                     UserPermissionContextModel.query.filter_by(user_id=user_id).delete()
                     
-                    # 重新构建上下文
+                    # 重新构建上下文 (新上下文已提交后再递增代数，之后的决策均基于新上下文)
                     result, flag = PermissionController.get_user_context(user_id, force_refresh=True)
+                    decision_cache.invalidate_users([user_id])
                     if flag:
                         refreshed_users.append(user_id)
                     else:
@@ -206,96 +247,97 @@ class PermissionController:
             
             db.session.commit()
             
-            return True, {
+            return {
                 'refreshed_users': refreshed_users,
                 'failed_users': failed_users,
                 'total_requested': len(user_ids),
                 'total_refreshed': len(refreshed_users),
                 'total_failed': len(failed_users)
-            }
+            }, True
             
         except Exception as e:
             db.session.rollback()
             logger.error(f"刷新用户权限上下文失败: {str(e)}")
-            return False, f"刷新用户权限上下文失败: {str(e)}"
+            return f"刷新用户权限上下文失败: {str(e)}", False
 
     @staticmethod
-    def clear_context_cache(user_ids: List[str] = None, clear_all: bool = False) -> Tuple[bool, Any]:
+    def clear_context_cache(user_ids: List[str] = None, clear_all: bool = False) -> Tuple[Any, bool]:
         """清除权限上下文缓存"""
         try:
             if clear_all:
                 deleted_count = UserPermissionContextModel.query.delete()
-                PermissionVerificationCacheModel.query.delete()
             elif user_ids:
                 deleted_count = UserPermissionContextModel.query.filter(
                     UserPermissionContextModel.user_id.in_(user_ids)
                 ).delete(synchronize_session=False)
-                
-                PermissionVerificationCacheModel.query.filter(
-                    PermissionVerificationCacheModel.user_id.in_(user_ids)
-                ).delete(synchronize_session=False)
             else:
-                return False, "必须指定用户ID列表或选择清除全部"
+                return "必须指定用户ID列表或选择清除全部", False
             
             db.session.commit()
             
-            return True, {
+            # 上下文删除提交后再递增代数，避免并发请求基于旧上下文写入新代数
+            if clear_all:
+                decision_cache.invalidate_all()
+            else:
+                decision_cache.invalidate_users(user_ids)
+            
+            return {
                 'cleared_contexts': deleted_count if not clear_all else 'all',
                 'user_ids': user_ids if not clear_all else 'all'
-            }
+            }, True
             
         except Exception as e:
             db.session.rollback()
             logger.error(f"清除权限上下文缓存失败: {str(e)}")
-            return False, f"清除权限上下文缓存失败: {str(e)}"
+            return f"清除权限上下文缓存失败: {str(e)}", False
 
     @staticmethod
-    def get_user_team_roles(user_id: str) -> Tuple[bool, Any]:
+    def get_user_team_roles(user_id: str) -> Tuple[Any, bool]:
         """获取用户的群组角色"""
         try:
             context_result, flag = PermissionController.get_user_context(user_id)
             if not flag:
-                return False, context_result
+                return context_result, False
             
             team_roles = context_result.get('team_roles', {})
             
-            return True, {
+            return {
                 'user_id': user_id,
                 'team_roles': team_roles,
                 'total_teams': len(team_roles)
-            }
+            }, True
             
         except Exception as e:
             logger.error(f"获取用户群组角色失败: {str(e)}")
-            return False, f"获取用户群组角色失败: {str(e)}"
+            return f"获取用户群组角色失败: {str(e)}", False
 
     @staticmethod
-    def get_user_project_roles(user_id: str) -> Tuple[bool, Any]:
+    def get_user_project_roles(user_id: str) -> Tuple[Any, bool]:
         """获取用户的项目维护权限"""
         try:
             context_result, flag = PermissionController.get_user_context(user_id)
             if not flag:
-                return False, context_result
+                return context_result, False
             
             project_roles = context_result.get('project_maintainer_roles', {})
             
-            return True, {
+            return {
                 'user_id': user_id,
                 'project_maintainer_roles': project_roles,
                 'total_projects': len(project_roles)
-            }
+            }, True
             
         except Exception as e:
             logger.error(f"获取用户项目维护权限失败: {str(e)}")
-            return False, f"获取用户项目维护权限失败: {str(e)}"
+            return f"获取用户项目维护权限失败: {str(e)}", False
 
     @staticmethod
-    def get_user_effective_permissions(user_id: str) -> Tuple[bool, Any]:
+    def get_user_effective_permissions(user_id: str) -> Tuple[Any, bool]:
         """获取用户有效权限列表"""
         try:
             context_result, flag = PermissionController.get_user_context(user_id)
             if not flag:
-                return False, context_result
+                return context_result, False
             
             effective_permissions = []
             
@@ -337,21 +379,21 @@ class PermissionController:
                             'source': 'project_role'
                         })
             
-            return True, {
+            return {
                 'user_id': user_id,
                 'effective_permissions': effective_permissions,
                 'total_permissions': len(effective_permissions),
                 'context': context_result
-            }
+            }, True
             
         except Exception as e:
             logger.error(f"获取用户有效权限列表失败: {str(e)}")
-            return False, f"获取用户有效权限列表失败: {str(e)}"
+            return f"获取用户有效权限列表失败: {str(e)}", False
 
     @staticmethod
     def handle_permission_change_event(event_type: str, user_id: str, resource_type: str, 
                                      resource_id: str, old_role: str = None, new_role: str = None, 
-                                     changed_by: str = None, metadata: dict = None) -> Tuple[bool, Any]:
+                                     changed_by: str = None, metadata: dict = None) -> Tuple[Any, bool]:
         """处理权限变更事件"""
         try:
             # 记录权限变更事件
@@ -366,29 +408,116 @@ class PermissionController:
             )
             db.session.add(event)
             
-            # 清除相关缓存
-            PermissionController._clear_user_caches(user_id)
+            # 只修补上下文中受影响的资源条目，不丢弃整个上下文
+            PermissionController._patch_user_contexts([event])
             
             db.session.commit()
             
+            # 上下文修补提交后再递增代数，避免并发请求基于旧上下文写入新代数
+            decision_cache.invalidate_users([user_id])
+            
             logger.info(f"权限变更事件处理成功 - 类型: {event_type}, 用户: {user_id}, 资源: {resource_type}:{resource_id}")
             
-            return True, {
+            return {
                 'event_id': event.id,
                 'event_type': event_type,
                 'user_id': user_id,
                 'resource_type': resource_type,
                 'resource_id': resource_id,
                 'processed_at': event.created_at.isoformat() if event.created_at else None
-            }
+            }, True
             
         except Exception as e:
             db.session.rollback()
             logger.error(f"处理权限变更事件失败: {str(e)}")
-            return False, f"处理权限变更事件失败: {str(e)}"
+            return f"处理权限变更事件失败: {str(e)}", False
 
     @staticmethod
-    def get_cache_stats() -> Tuple[bool, Any]:
+    @permission_metrics.timed('apply_changes')
+    def apply_permission_changes(events: List[Dict], positions: List[str] = None) -> Tuple[Any, bool]:
+        """
+        批量应用权限变更流事件：记录事件、修补受影响用户上下文中的对应条目，并递增这些用户的代数
+        :param positions: 事件在变更流中的ID，同一用户同一资源只应用比已应用位点更新的事件
+        """
+        try:
+            valid = [
+                (index, event) for index, event in enumerate(events)
+                if event.get('event_type') and event.get('user_id') and event.get('resource_type')
+                and event.get('resource_id')
+            ]
+            user_ids = list(dict.fromkeys(event['user_id'] for _, event in valid))
+            if not user_ids:
+                return {'applied': 0, 'skipped': len(events), 'user_ids': []}, True
+            
+            # 先锁定上下文行，再登记位点，位点判断与修补顺序在并发worker之间保持一致
+            contexts = PermissionController._lock_user_contexts(user_ids)
+            
+            accepted = []
+            if positions:
+                changes_by_user: Dict[str, List] = {}
+                for index, event in valid:
+                    changes_by_user.setdefault(event['user_id'], []).append((index, event))
+                for user_id, user_changes in changes_by_user.items():
+                    flags = decision_cache.claim_changes(user_id, [
+                        (f"{event['resource_type']}:{event['resource_id']}", positions[index])
+                        for index, event in user_changes
+                    ])
+                    accepted.extend(event for (_, event), flag in zip(user_changes, flags) if flag)
+            else:
+                accepted = [event for _, event in valid]
+            
+            models = [
+                PermissionChangeEventModel(
+                    event_type=event['event_type'],
+                    user_id=event['user_id'],
+                    resource_type=event['resource_type'],
+                    resource_id=event['resource_id'],
+                    old_role=event.get('old_role'),
+                    new_role=event.get('new_role'),
+                    changed_by=event.get('changed_by') or ''
+                )
+                for event in accepted
+            ]
+            db.session.add_all(models)
+            PermissionController._patch_user_contexts(models, contexts)
+            db.session.commit()
+            
+            # 提交后再递增代数
+            decision_cache.invalidate_users(user_ids)
+            
+            return {
+                'applied': len(accepted),
+                'skipped': len(events) - len(accepted),
+                'user_ids': user_ids
+            }, True
+            
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"应用权限变更失败: {str(e)}")
+            return f"应用权限变更失败: {str(e)}", False
+
+    @staticmethod
+    def consume_permission_changes() -> int:
+        """消费一批权限变更流事件 (后台任务)，应用成功后ACK，返回处理条数"""
+        group = CacheConfig.PERMISSION_CHANGE_GROUP
+        entries = permission_feed.read(group, CacheConfig.PERMISSION_CHANGE_BATCH_SIZE,
+                                       CacheConfig.PERMISSION_CHANGE_BLOCK_MS)
+        if not entries:
+            return 0
+        
+        entry_ids = [entry_id for entry_id, _ in entries]
+        result, flag = PermissionController.apply_permission_changes(
+            [event for _, event in entries], positions=entry_ids
+        )
+        if not flag:
+            # 不ACK，超过认领空闲时间后重试
+            logger.error(f"权限变更流事件处理失败，等待重试: {result}")
+            return 0
+        permission_feed.ack(group, entry_ids)
+        return len(entries)
+
+    @staticmethod
+    def get_cache_stats() -> Tuple[Any, bool]:
         """获取缓存统计信息"""
         try:
             # 权限上下文缓存统计
@@ -398,44 +527,36 @@ class PermissionController:
             ).count()
             context_active = context_total - context_expired
             
-            # 权限验证缓存统计
-            verification_total = PermissionVerificationCacheModel.query.count()
-            verification_expired = PermissionVerificationCacheModel.query.filter(
-                PermissionVerificationCacheModel.expires_at <= datetime.utcnow()
-            ).count()
-            verification_active = verification_total - verification_expired
+            # 权限决策缓存统计 (进程内计数)
+            decision_stats = decision_cache.get_stats()
             
-            return True, {
+            return {
                 'context_cache': {
                     'total': context_total,
                     'active': context_active,
                     'expired': context_expired
                 },
-                'verification_cache': {
-                    'total': verification_total,
-                    'active': verification_active,
-                    'expired': verification_expired
-                },
-                'total_cache_entries': context_total + verification_total,
-                'total_active_entries': context_active + verification_active
-            }
+                'verification_cache': decision_stats,
+                'context_builder': context_builder.get_stats(),
+                'compactor': cache_compactor.get_stats(),
+                'total_cache_entries': context_total + decision_stats['l1_entries'],
+                'total_active_entries': context_active + decision_stats['l1_entries']
+            }, True
             
         except Exception as e:
             logger.error(f"获取缓存统计信息失败: {str(e)}")
-            return False, f"获取缓存统计信息失败: {str(e)}"
+            return f"获取缓存统计信息失败: {str(e)}", False
 
     @staticmethod
     def invalidate_cache(user_ids: List[str] = None, resource_type: str = None, 
-                        resource_ids: List[str] = None, invalidate_all: bool = False) -> Tuple[bool, Any]:
+                        resource_ids: List[str] = None, invalidate_all: bool = False) -> Tuple[Any, bool]:
         """使缓存失效"""
         try:
             invalidated_count = 0
             
             if invalidate_all:
                 # 清除所有缓存
-                context_count = UserPermissionContextModel.query.delete()
-                verification_count = PermissionVerificationCacheModel.query.delete()
-                invalidated_count = context_count + verification_count
+                invalidated_count = UserPermissionContextModel.query.delete()
                 
             else:
                 # 按条件清除缓存
@@ -444,23 +565,19 @@ class PermissionController:
                         UserPermissionContextModel.user_id.in_(user_ids)
                     ).delete(synchronize_session=False)
                     
-                    verification_count = PermissionVerificationCacheModel.query.filter(
-                        PermissionVerificationCacheModel.user_id.in_(user_ids)
-                    ).delete(synchronize_session=False)
-                    
-                    invalidated_count += context_count + verification_count
-                
-                if resource_type and resource_ids:
-                    verification_count = PermissionVerificationCacheModel.query.filter(
-                        PermissionVerificationCacheModel.resource_type == resource_type,
-                        PermissionVerificationCacheModel.resource_id.in_(resource_ids)
-                    ).delete(synchronize_session=False)
-                    
-                    invalidated_count += verification_count
+                    invalidated_count += context_count
             
             db.session.commit()
             
-            return True, {
+            # 上下文删除提交后再递增代数，避免并发请求基于旧上下文写入新代数
+            if invalidate_all or (resource_type and resource_ids):
+                # 决策按用户分代存储，没有资源到用户的索引；按资源失效时递增全局代数，
+                # 全部决策从仍然有效的用户上下文重新计算
+                decision_cache.invalidate_all()
+            elif user_ids:
+                invalidated_count += decision_cache.invalidate_users(user_ids)
+            
+            return {
                 'invalidated_count': invalidated_count,
                 'criteria': {
                     'user_ids': user_ids,
@@ -468,86 +585,50 @@ class PermissionController:
                     'resource_ids': resource_ids,
                     'invalidate_all': invalidate_all
                 }
-            }
+            }, True
             
         except Exception as e:
             db.session.rollback()
             logger.error(f"缓存失效操作失败: {str(e)}")
-            return False, f"缓存失效操作失败: {str(e)}"
+            return f"缓存失效操作失败: {str(e)}", False
 
     # 私有方法
     @staticmethod
-    def _verify_permission_logic(context: Dict, resource_type: str, resource_id: str, action: str) -> bool:
+    def _verify_permission_logic(context: Dict, resource_type: str, resource_id: str, action: str,
+                                 generation: Optional[str] = None) -> bool:
         """权限验证逻辑核心"""
         try:
-            # 平台管理员拥有所有权限
-            if context.get('platform_role') == 'platform_admin':
-                return True
-            
-            # 根据资源类型和操作进行权限检查
-            if resource_type == 'platform':
-                # 平台级操作
-                platform_role = context.get('platform_role')
-                platform_permissions = PermissionController.PERMISSION_RULES['platform'].get(platform_role, [])
-                return f'platform:{action}' in platform_permissions
-            
-            elif resource_type == 'team':
-                # 团队级操作
-                team_roles = context.get('team_roles', {})
-                user_role = team_roles.get(resource_id)
-                if user_role:
-                    team_permissions = PermissionController.PERMISSION_RULES['team'].get(user_role, [])
-                    return f'team:{action}' in team_permissions
-                return False
-            
-            elif resource_type == 'project':
-                # 项目级操作
-                # 检查是否是项目维护员
-                project_roles = context.get('project_maintainer_roles', {})
-                if resource_id in project_roles:
-                    project_permissions = PermissionController.PERMISSION_RULES['project']['maintainer']
-                    return f'project:{action}' in project_permissions
-                
-                # 检查团队权限（如果项目属于某个团队）
-                # 这里需要调用项目服务获取项目信息，简化处理
-                return False
-            
-            return False
+            return permission_evaluator.check(
+                PermissionController._compile_context(context, generation), resource_type, resource_id, action
+            )
             
         except Exception as e:
             logger.error(f"权限验证逻辑执行失败: {str(e)}")
             return False
 
+    @staticmethod
+    def _compile_context(context: Dict, generation: Optional[str]) -> CompiledContext:
+        """
+        编译用户上下文，同一代数下同一条上下文缓存记录只编译一次
+        上下文修补后会递增代数，重建后缓存时间不同，两者均使旧的编译结果不再被读取；
+        部分上下文及刚构建尚无缓存时间的上下文不复用
+        """
+        version = context.get('cached_at')
+        if generation is None or not version or context.get('partial'):
+            return permission_evaluator.compile_context(context)
+        
+        key = f"{context.get('user_id')}:{generation}:{version}"
+        compiled = _compiled_contexts.get(key)
+        if compiled is MISSING:
+            compiled = permission_evaluator.compile_context(context)
+            _compiled_contexts.set(key, compiled, CacheConfig.PERMISSION_DECISION_L1_TTL)
+        return compiled
+
     @staticmethod
     def _build_user_context(user_id: str) -> Dict:
-        """构建用户权限上下文"""
+        """构建用户权限上下文 (并发调用团队服务和项目服务)"""
         try:
-            context = {
-                'user_id': user_id,
-                'platform_role': 'platform_user',  # 默认角色，实际应从用户服务获取
-                'team_roles': {},
-                'project_maintainer_roles': {}
-            }
-            
-            # 调用团队服务获取用户团队角色
-            try:
-                # 这里应该调用团队服务的内部接口
-                # team_roles = requests.get(f'http://team-service/internal/users/{user_id}/teams').json()
-                # context['team_roles'] = team_roles.get('data', {})
-                pass
-            except Exception as e:
-                logger.warning(f"获取用户团队角色失败: {str(e)}")
-            
-            # 调用项目服务获取用户项目维护员角色
-            try:
-                # 这里应该调用项目服务的内部接口
-                # project_roles = requests.get(f'http://project-service/internal/users/{user_id}/maintainer-projects').json()
-                # context['project_maintainer_roles'] = {p['id']: 'maintainer' for p in project_roles.get('data', {}).get('projects', [])}
-                pass
-            except Exception as e:
-                logger.warning(f"获取用户项目维护员角色失败: {str(e)}")
-            
-            return context
+            return context_builder.build(user_id)
             
         except Exception as e:
             logger.error(f"构建用户权限上下文失败: {str(e)}")
@@ -555,13 +636,16 @@ class PermissionController:
                 'user_id': user_id,
                 'platform_role': 'platform_user',
                 'team_roles': {},
-                'project_maintainer_roles': {}
+                'project_maintainer_roles': {},
+                'partial': True
             }
 
     @staticmethod
     def _save_user_context(user_id: str, context: Dict):
-        """保存用户上下文到缓存"""
+        """保存用户上下文到缓存 (部分结果使用较短TTL，尽快重新构建)"""
         try:
+            ttl = CacheConfig.CONTEXT_PARTIAL_TTL if context.get('partial') else PermissionController.CONTEXT_CACHE_EXPIRE
+            
             # 删除旧缓存
             UserPermissionContextModel.query.filter_by(user_id=user_id).delete()
             
@@ -571,7 +655,8 @@ class PermissionController:
                 platform_role=context.get('platform_role', 'platform_user'),
                 team_roles=context.get('team_roles'),
                 project_maintainer_roles=context.get('project_maintainer_roles'),
-                expires_at=datetime.utcnow() + timedelta(seconds=PermissionController.CONTEXT_CACHE_EXPIRE)
+                is_partial=bool(context.get('partial')),
+                expires_at=datetime.utcnow() + timedelta(seconds=ttl)
             )
             db.session.add(context_model)
             db.session.commit()
@@ -580,63 +665,62 @@ class PermissionController:
             logger.error(f"保存用户上下文缓存失败: {str(e)}")
 
     @staticmethod
-    def _get_verification_cache(user_id: str, resource_type: str, resource_id: str, action: str) -> Optional[bool]:
-        """获取权限验证缓存"""
+    def _get_verification_cache(user_id: str, resource_type: str, resource_id: str, action: str) -> Tuple[str, Optional[bool]]:
+        """获取权限验证缓存，返回 (用户当前代数, 缓存的决策或None)"""
         try:
-            cache = PermissionVerificationCacheModel.query.filter(
-                PermissionVerificationCacheModel.user_id == user_id,
-                PermissionVerificationCacheModel.resource_type == resource_type,
-                PermissionVerificationCacheModel.resource_id == resource_id,
-                PermissionVerificationCacheModel.action == action,
-                PermissionVerificationCacheModel.expires_at > datetime.utcnow()
-            ).first()
-            
-            if cache:
-                return cache.has_permission
-            return None
-            
+            return decision_cache.get(user_id, decision_cache.field(resource_type, resource_id, action))
         except Exception as e:
             logger.error(f"获取权限验证缓存失败: {str(e)}")
-            return None
+            return None, None
 
     @staticmethod
-    def _cache_verification_result(user_id: str, resource_type: str, resource_id: str, 
-                                 action: str, has_permission: bool, context: Dict):
-        """缓存权限验证结果"""
+    def _cache_verification_result(user_id: str, generation: Optional[str], decisions: Dict[str, bool]):
+        """缓存权限验证结果 (写入读取时的代数，期间发生失效则写入的结果不会再被读到)"""
+        if generation is None or not decisions:
+            return
         try:
-            # 删除旧缓存
-            PermissionVerificationCacheModel.query.filter(
-                PermissionVerificationCacheModel.user_id == user_id,
-                PermissionVerificationCacheModel.resource_type == resource_type,
-                PermissionVerificationCacheModel.resource_id == resource_id,
-                PermissionVerificationCacheModel.action == action
-            ).delete()
-            
-            # 保存新缓存
-            cache = PermissionVerificationCacheModel(
-                user_id=user_id,
-                resource_type=resource_type,
-                resource_id=resource_id,
-                action=action,
-                has_permission=has_permission,
-                verification_context=context,
-                expires_at=datetime.utcnow() + timedelta(seconds=PermissionController.VERIFICATION_CACHE_EXPIRE)
-            )
-            db.session.add(cache)
-            db.session.commit()
-            
+            decision_cache.set_many(user_id, generation, decisions)
         except Exception as e:
             logger.error(f"缓存权限验证结果失败: {str(e)}")
 
     @staticmethod
-    def _clear_user_caches(user_id: str):
-        """清除用户相关的所有缓存"""
-        try:
-            UserPermissionContextModel.query.filter_by(user_id=user_id).delete()
-            PermissionVerificationCacheModel.query.filter_by(user_id=user_id).delete()
-            
-        except Exception as e:
-            logger.error(f"清除用户缓存失败: {str(e)}")
+    def _lock_user_contexts(user_ids: List[str]) -> Dict[str, Any]:
+        """锁定并返回已缓存的用户上下文 {用户ID: 上下文行}"""
+        return {
+            context.user_id: context
+            for context in UserPermissionContextModel.query.filter(
+                UserPermissionContextModel.user_id.in_(user_ids)
+            ).with_for_update().all()
+        }
+
+    @staticmethod
+    def _patch_user_contexts(events: List[Any], contexts: Dict[str, Any] = None):
+        """
+        按事件修补用户上下文中的单个资源条目 (new_role为空表示移除)
+        无法增量修补的事件删除该用户上下文，下次访问时整体重建
+        """
+        if contexts is None:
+            contexts = PermissionController._lock_user_contexts(list({event.user_id for event in events}))
+        
+        for event in events:
+            context = contexts.get(event.user_id)
+            if context is None:
+                continue
+            
+            if event.resource_type in ('team', 'project'):
+                field = 'team_roles' if event.resource_type == 'team' else 'project_maintainer_roles'
+                # JSON列需整体赋值新对象才会被识别为已修改
+                roles = dict(getattr(context, field) or {})
+                if event.new_role:
+                    roles[event.resource_id] = event.new_role if event.resource_type == 'team' else 'maintainer'
+                else:
+                    roles.pop(event.resource_id, None)
+                setattr(context, field, roles)
+            elif event.resource_type == 'platform' and event.new_role in ('platform_admin', 'platform_user'):
+                context.platform_role = event.new_role
+            else:
+                db.session.delete(context)
+                contexts.pop(event.user_id)
 
 
 # 创建全局控制器实例
@@ -54,12 +54,14 @@ class UserPermissionContextModel(BaseModel):
     )
     team_roles = db.Column(db.JSON, comment="群組角色映射")
     project_maintainer_roles = db.Column(db.JSON, comment="項目維護員角色映射")
+    is_partial = db.Column(db.Boolean, nullable=False, default=False, comment="是否為部分下游失敗時構建的上下文")
     cached_at = db.Column(db.TIMESTAMP, default=db.func.current_timestamp(), comment="緩存時間")
     expires_at = db.Column(db.TIMESTAMP, nullable=False, comment="過期時間")
 
     # 索引
     __table_args__ = (
-        db.Index('idx_user', 'user_id'),
+        # 上下文读取按 user_id + expires_at 过滤
+        db.Index('idx_user_expires', 'user_id', 'expires_at'),
         db.Index('idx_expires', 'expires_at'),
     )
 
@@ -81,7 +83,8 @@ class PermissionVerificationCacheModel(BaseModel):
     # 唯一約束和索引
     __table_args__ = (
         db.UniqueConstraint('user_id', 'resource_type', 'resource_id', 'action', name='uk_permission_verification'),
-        db.Index('idx_user_resource', 'user_id', 'resource_type', 'resource_id'),
+        # 验证结果读取按完整键 + expires_at 过滤
+        db.Index('idx_lookup_expires', 'user_id', 'resource_type', 'resource_id', 'action', 'expires_at'),
         db.Index('idx_expires', 'expires_at'),
     )
 
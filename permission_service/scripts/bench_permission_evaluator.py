@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+权限判定微基准
+对比逐次拼接字符串、在规则列表中查找的原实现与位掩码判定器的每秒判定次数，
+并先校验两者在同一批随机用例上的结果一致
+
+用法: python scripts/bench_permission_evaluator.py [判定次数] [团队数] [项目数]
+"""
+
+import os
+import random
+import sys
+import time
+from functools import partial
+
+# 添加项目根目录到Python路径
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from common.permission_evaluator import PERMISSION_RULES, permission_evaluator
+
+
+class LegacyController:
+    """原 PermissionController._verify_permission_logic 的判定逻辑，原样保留作为对照"""
+
+    PERMISSION_RULES = PERMISSION_RULES
+
+    @staticmethod
+    def _verify_permission_logic(context, resource_type, resource_id, action):
+        try:
+            if context.get('platform_role') == 'platform_admin':
+                return True
+            if resource_type == 'platform':
+                platform_role = context.get('platform_role')
+                platform_permissions = LegacyController.PERMISSION_RULES['platform'].get(platform_role, [])
+                return f'platform:{action}' in platform_permissions
+            elif resource_type == 'team':
+                team_roles = context.get('team_roles', {})
+                user_role = team_roles.get(resource_id)
+                if user_role:
+                    team_permissions = LegacyController.PERMISSION_RULES['team'].get(user_role, [])
+                    return f'team:{action}' in team_permissions
+                return False
+            elif resource_type == 'project':
+                project_roles = context.get('project_maintainer_roles', {})
+                if resource_id in project_roles:
+                    project_permissions = LegacyController.PERMISSION_RULES['project']['maintainer']
+                    return f'project:{action}' in project_permissions
+                return False
+            return False
+        except Exception:
+            return False
+
+
+legacy_verify = LegacyController._verify_permission_logic
+
+
+def build_context(team_count, project_count):
+    roles = list(PERMISSION_RULES['team'])
+    return {
+        'user_id': 'bench-user',
+        'platform_role': 'platform_user',
+        'team_roles': {f'team-{i}': random.choice(roles) for i in range(team_count)},
+        'project_maintainer_roles': {f'project-{i}': 'maintainer' for i in range(project_count)},
+    }
+
+
+def build_checks(count, team_count, project_count):
+    actions = ['read', 'write', 'admin', 'delete', 'invite', 'manage', 'manage_members', 'unknown']
+    checks = []
+    for _ in range(count):
+        resource_type = random.choice(['platform', 'team', 'team', 'project', 'project', 'other'])
+        upper = team_count if resource_type == 'team' else project_count
+        # 约四分之一的用例指向用户无角色的资源
+        resource_id = f'{resource_type}-{random.randint(0, int(upper * 1.33) + 1)}'
+        checks.append((resource_type, resource_id, random.choice(actions)))
+    return checks
+
+
+def measure(label, func, checks):
+    started = time.perf_counter()
+    for resource_type, resource_id, action in checks:
+        func(resource_type, resource_id, action)
+    elapsed = time.perf_counter() - started
+    rate = len(checks) / elapsed if elapsed else float('inf')
+    print(f"{label:<28} {elapsed * 1000:>10.2f} ms  {rate:>14,.0f} 次/秒")
+    return rate
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    team_count = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    project_count = int(sys.argv[3]) if len(sys.argv) > 3 else 200
+
+    random.seed(42)
+    context = build_context(team_count, project_count)
+    checks = build_checks(count, team_count, project_count)
+    compiled = permission_evaluator.compile_context(context)
+
+    sample = checks[:20000]
+    mismatches = []
+    for sample_context in (context, dict(context, platform_role='platform_admin')):
+        sample_compiled = permission_evaluator.compile_context(sample_context)
+        batch_results = permission_evaluator.check_many(sample_compiled, sample)
+        mismatches += [c for c, batch_result in zip(sample, batch_results)
+                       if not legacy_verify(sample_context, *c)
+                       == permission_evaluator.check(sample_compiled, *c) == batch_result]
+    if mismatches:
+        print(f"❌ 判定结果不一致: {mismatches[:5]}")
+        sys.exit(1)
+    print(f"✅ 结果一致 (校验 {min(count, 20000)} 个用例)")
+    print(f"判定次数: {count}，团队数: {team_count}，项目数: {project_count}\n")
+
+    legacy_rate = measure("原实现(字符串+列表查找)", partial(legacy_verify, context), checks)
+    compiled_rate = measure("位掩码(已展开上下文)", partial(permission_evaluator.check, compiled), checks)
+
+    started = time.perf_counter()
+    permission_evaluator.check_many(compiled, checks)
+    elapsed = time.perf_counter() - started
+    batch_rate = count / elapsed if elapsed else float('inf')
+    print(f"{'位掩码(check_many批量)':<28} {elapsed * 1000:>10.2f} ms  {batch_rate:>14,.0f} 次/秒")
+
+    # 列表页过滤：同一 资源类型:操作 下的一批资源ID
+    project_ids = [f'project-{i}' for i in range(count)]
+    expected = [rid for rid in project_ids if permission_evaluator.check(compiled, 'project', rid, 'read')]
+    started = time.perf_counter()
+    allowed = list(permission_evaluator.filter_allowed(compiled, 'project', 'read', project_ids))
+    elapsed = time.perf_counter() - started
+    if allowed != expected:
+        print("❌ filter_allowed 结果与逐项判定不一致")
+        sys.exit(1)
+    filter_rate = count / elapsed if elapsed else float('inf')
+    print(f"{'位掩码(filter_allowed过滤)':<28} {elapsed * 1000:>10.2f} ms  {filter_rate:>14,.0f} 次/秒")
+
+    started = time.perf_counter()
+    for _ in range(1000):
+        permission_evaluator.compile_context(context)
+    compile_us = (time.perf_counter() - started) * 1000
+    print(f"\n上下文展开耗时: {compile_us:.2f} µs/次 (每批只需一次)")
+    print(f"加速比: 单次 {compiled_rate / legacy_rate:.2f}x，批量 {batch_rate / legacy_rate:.2f}x，"
+          f"过滤 {filter_rate / legacy_rate:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+权限服务压测
+按并发阶梯逐级加压，混合调用单次验证、批量验证和批量过滤接口，
+每级输出各接口延迟分位数与每秒判定次数，最后给出满足延迟目标的可持续判定吞吐
+
+本地环境: 用 dev_ops_central_service/docker-compose.yml 启动 MySQL 与 Redis，
+以 --stub-port 启动本脚本内置的团队/项目服务桩，并把权限服务的
+TEAM_SERVICE_URL / PROJECT_SERVICE_URL 指向该端口，使上下文构建不依赖真实下游
+
+用法:
+  python scripts/load_test_permissions.py --stub-port 25790 --serve-stub     # 只启动下游桩
+  python scripts/load_test_permissions.py [--base-url URL] [--stages 4,8,16,32] [--duration 20] [--slo-p99-ms 50]
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+# 添加项目根目录到Python路径
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from common.metrics import LatencyHistogram
+
+
+# 权限服务默认端口 (configs/app_config.py SERVER_PORT)
+DEFAULT_BASE_URL = 'http://127.0.0.1:25700'
+
+TEAM_ROLES = ('owner', 'admin', 'member')
+ACTIONS = {
+    'team': ('read', 'write', 'invite', 'manage_members', 'delete'),
+    'project': ('read', 'write', 'admin', 'delete'),
+}
+
+
+# ==================== 团队/项目服务桩 ====================
+
+def stub_team_roles(user_id, team_count):
+    """同一用户每次返回相同的团队角色"""
+    rng = random.Random(user_id)
+    return [{'team_id': f'team-{i}', 'role': rng.choice(TEAM_ROLES)}
+            for i in rng.sample(range(team_count * 4), team_count)]
+
+
+def stub_projects(user_id, project_count):
+    rng = random.Random(f'{user_id}:projects')
+    return [{'id': f'project-{i}'} for i in rng.sample(range(project_count * 4), project_count)]
+
+
+def make_stub_handler(team_count, project_count):
+    project_path = re.compile(r'^/internal/projects/user/([^/]+)/maintainer-projects$')
+
+    class StubHandler(BaseHTTPRequestHandler):
+        def _reply(self, content):
+            body = json.dumps({'code': 'S10000', 'msg': 'OK', 'content': content}).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            payload = json.loads(self.rfile.read(length) or b'{}')
+            if self.path != '/internal/user/teams':
+                self.send_error(404)
+                return
+            self._reply({uid: stub_team_roles(uid, team_count) for uid in payload.get('user_ids', [])})
+
+        def do_GET(self):
+            match = project_path.match(self.path)
+            if not match:
+                self.send_error(404)
+                return
+            self._reply({'projects': stub_projects(match.group(1), project_count)})
+
+        def log_message(self, format, *args):
+            pass
+
+    return StubHandler
+
+
+def start_stub(port, team_count, project_count):
+    server = ThreadingHTTPServer(('0.0.0.0', port), make_stub_handler(team_count, project_count))
+    threading.Thread(target=server.serve_forever, name='stub-downstream', daemon=True).start()
+    print(f"团队/项目服务桩已启动: http://127.0.0.1:{port}")
+    return server
+
+
+# ==================== 压测场景 ====================
+
+class Scenario:
+    """一个接口的调用方式，返回本次请求包含的判定次数"""
+
+    def __init__(self, name, weight, base_url, args):
+        self.name = name
+        self.weight = weight
+        self.url = f"{base_url}/internal/permissions/{name}"
+        self.args = args
+
+    def random_resource(self, rng):
+        resource_type = rng.choice(('team', 'project'))
+        upper = (self.args.teams if resource_type == 'team' else self.args.projects) * 4
+        return resource_type, f'{resource_type}-{rng.randrange(upper)}', rng.choice(ACTIONS[resource_type])
+
+    def payload(self, rng, user_id):
+        if self.name == 'verify':
+            resource_type, resource_id, action = self.random_resource(rng)
+            return {'user_id': user_id, 'resource_type': resource_type, 'resource_id': resource_id,
+                    'action': action}, 1
+        if self.name == 'verify-batch':
+            permissions = []
+            for _ in range(self.args.batch_size):
+                resource_type, resource_id, action = self.random_resource(rng)
+                permissions.append({'resource_type': resource_type, 'resource_id': resource_id, 'action': action})
+            return {'user_id': user_id, 'permissions': permissions}, len(permissions)
+        resource_ids = [f'project-{i}' for i in rng.sample(range(self.args.projects * 4),
+                                                          min(self.args.filter_size, self.args.projects * 4))]
+        return {'user_id': user_id, 'resource_type': 'project', 'action': 'read',
+                'resource_ids': resource_ids}, len(resource_ids)
+
+
+class StageResult:
+    def __init__(self, scenarios):
+        self.histograms = {scenario.name: LatencyHistogram() for scenario in scenarios}
+        self.requests = {scenario.name: 0 for scenario in scenarios}
+        self.errors = {scenario.name: 0 for scenario in scenarios}
+        self.checks = 0
+        self.lock = threading.Lock()
+
+    def record(self, name, seconds, checks, ok):
+        self.histograms[name].observe(seconds)
+        with self.lock:
+            self.requests[name] += 1
+            if ok:
+                self.checks += checks
+            else:
+                self.errors[name] += 1
+
+
+def worker(scenarios, weights, args, result, stop_at, seed):
+    rng = random.Random(seed)
+    session = requests.Session()
+    while time.monotonic() < stop_at:
+        scenario = rng.choices(scenarios, weights)[0]
+        user_id = f'load-user-{rng.randrange(args.users)}'
+        payload, checks = scenario.payload(rng, user_id)
+        started = time.perf_counter()
+        try:
+            response = session.post(scenario.url, json=payload, timeout=args.timeout)
+            ok = response.status_code == 200 and response.json().get('code') == 'S10000'
+        except Exception:
+            ok = False
+        result.record(scenario.name, time.perf_counter() - started, checks, ok)
+
+
+def run_stage(concurrency, scenarios, args):
+    weights = [scenario.weight for scenario in scenarios]
+    result = StageResult(scenarios)
+    stop_at = time.monotonic() + args.duration
+    threads = [
+        threading.Thread(target=worker, args=(scenarios, weights, args, result, stop_at, concurrency * 1000 + i),
+                         daemon=True)
+        for i in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return result
+
+
+def report_stage(concurrency, result, args):
+    total_requests = sum(result.requests.values())
+    total_errors = sum(result.errors.values())
+    error_rate = total_errors / total_requests if total_requests else 1
+    checks_per_second = result.checks / args.duration
+    worst_p99 = 0
+
+    print(f"\n并发 {concurrency}: {total_requests / args.duration:,.0f} 请求/秒, "
+          f"{checks_per_second:,.0f} 判定/秒, 错误率 {error_rate:.2%}")
+    for name, histogram in result.histograms.items():
+        snapshot = histogram.snapshot()
+        if not snapshot['count']:
+            continue
+        worst_p99 = max(worst_p99, snapshot['p99_ms'])
+        print(f"  {name:<14} {snapshot['count']:>8} 次  avg {snapshot['avg_ms']:>8.2f} ms  "
+              f"p50 ≤{snapshot['p50_ms']:>7.1f} ms  p95 ≤{snapshot['p95_ms']:>7.1f} ms  "
+              f"p99 ≤{snapshot['p99_ms']:>7.1f} ms  错误 {result.errors[name]}")
+
+    within_slo = worst_p99 <= args.slo_p99_ms and error_rate <= args.max_error_rate
+    return checks_per_second, within_slo
+
+
+def print_service_metrics(base_url):
+    try:
+        content = requests.get(f"{base_url}/internal/metrics", timeout=5).json().get('content') or {}
+    except Exception as e:
+        print(f"\n读取服务指标失败: {str(e)}")
+        return
+    decision = content.get('decision_cache', {})
+    print(f"\n服务端: 决策缓存命中率 {decision.get('hit_rate', 0):.2%} "
+          f"(L1 {decision.get('l1_hit', 0)}, L2 {decision.get('l2_hit', 0)}, 未命中 {decision.get('miss', 0)})")
+    print(f"服务端: 上下文缓存 {content.get('context_cache', {})}")
+    for label, snapshot in (content.get('context_build') or {}).items():
+        print(f"服务端: 上下文构建({label}) {snapshot}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="权限服务压测")
+    parser.add_argument('--base-url', default=DEFAULT_BASE_URL)
+    parser.add_argument('--stages', default='4,8,16,32', help="逐级并发数，逗号分隔")
+    parser.add_argument('--duration', type=int, default=20, help="每级持续秒数")
+    parser.add_argument('--users', type=int, default=2000, help="模拟用户数")
+    parser.add_argument('--teams', type=int, default=20, help="每个用户的团队数")
+    parser.add_argument('--projects', type=int, default=100, help="每个用户维护的项目数")
+    parser.add_argument('--batch-size', type=int, default=50)
+    parser.add_argument('--filter-size', type=int, default=500)
+    parser.add_argument('--mix', default='verify=70,verify-batch=25,filter=5', help="接口权重")
+    parser.add_argument('--slo-p99-ms', type=float, default=50)
+    parser.add_argument('--max-error-rate', type=float, default=0.01)
+    parser.add_argument('--timeout', type=float, default=5)
+    parser.add_argument('--stub-port', type=int, help="启动团队/项目服务桩的端口")
+    parser.add_argument('--serve-stub', action='store_true', help="只运行服务桩，不压测")
+    args = parser.parse_args()
+
+    if args.stub_port:
+        start_stub(args.stub_port, args.teams, args.projects)
+        if args.serve_stub:
+            try:
+                while True:
+                    time.sleep(3600)
+            except KeyboardInterrupt:
+                return
+
+    mix = dict(item.split('=') for item in args.mix.split(','))
+    scenarios = [Scenario(name, float(weight), args.base_url, args) for name, weight in mix.items()]
+    stages = [int(stage) for stage in args.stages.split(',')]
+    print(f"目标: {args.base_url}, 阶梯: {stages}, 每级 {args.duration} 秒, "
+          f"延迟目标 p99 ≤ {args.slo_p99_ms} ms, 错误率 ≤ {args.max_error_rate:.0%}")
+
+    sustainable = None
+    for concurrency in stages:
+        checks_per_second, within_slo = report_stage(concurrency, run_stage(concurrency, scenarios, args), args)
+        if within_slo and (sustainable is None or checks_per_second > sustainable[1]):
+            sustainable = (concurrency, checks_per_second)
+        elif not within_slo:
+            print("  超出延迟目标或错误率，停止加压")
+            break
+
+    print_service_metrics(args.base_url)
+    if sustainable:
+        print(f"\n可持续吞吐: {sustainable[1]:,.0f} 判定/秒 (并发 {sustainable[0]})")
+    else:
+        print("\n最低并发已超出延迟目标，未得到可持续吞吐")
+
+
+if __name__ == '__main__':
+    main()
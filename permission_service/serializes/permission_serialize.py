@@ -8,6 +8,8 @@
 
 from marshmallow import Schema, fields, validate, validates, ValidationError
 
+from configs.cache_config import CacheConfig
+
 
 class PermissionVerifySchema(Schema):
     """单个权限验证请求模式"""
@@ -123,4 +125,17 @@ class InternalNotifyChangeSchema(Schema):
     old_role = fields.String(missing=None)
     new_role = fields.String(missing=None)
     changed_by = fields.String(required=True)
-    metadata = fields.Dict(missing=None)
\ No newline at end of file
+    metadata = fields.Dict(missing=None)
+
+
+class InternalPermissionFilterSchema(Schema):
+    """批量过滤资源权限请求模式"""
+    user_id = fields.String(required=True)
+    resource_type = fields.String(required=True, validate=validate.Length(min=1, max=50))
+    action = fields.String(required=True, validate=validate.Length(min=1, max=50))
+    resource_ids = fields.List(
+        fields.String(),
+        required=True,
+        validate=validate.Length(min=1, max=CacheConfig.PERMISSION_FILTER_MAX_IDS),
+        error_messages={'required': '資源ID列表為必填項'}
+    )
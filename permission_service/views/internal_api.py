@@ -6,14 +6,24 @@
 @作者: LiDong
 """
 
+import json
+from itertools import islice
+
+from flask import Response, current_app, request, stream_with_context
 from flask.views import MethodView
 from flask_smorest import Blueprint
 
 from common.common_method import fail_response_result, response_result
+from cache.decision_cache import decision_cache
+from common.cache_compactor import cache_compactor
+from common.context_builder import context_builder
+from common.metrics import permission_metrics
+from configs.cache_config import CacheConfig
 from controllers.permission_controller import permission_controller
 from serializes.response_serialize import RspMsgDictSchema, RspMsgSchema
 from serializes.permission_serialize import (
-    InternalPermissionVerifySchema, InternalBuildContextSchema, InternalNotifyChangeSchema
+    InternalPermissionVerifySchema, InternalBuildContextSchema, InternalNotifyChangeSchema,
+    InternalPermissionFilterSchema
 )
 from common.common_tools import CommonTools
 from loggers import logger
@@ -114,7 +124,9 @@ class InternalPermissionVerifyBatchApi(BaseInternalView):
                 internal_result = {
                     'user_id': json_data['user_id'],
                     'permissions': result.get('results', []),
-                    'total_verified': result.get('total', 0)
+                    'total_verified': result.get('total', 0),
+                    # 基于部分上下文的结果，调用方不应缓存
+                    'partial': bool((result.get('context') or {}).get('partial'))
                 }
                 return response_result(content=internal_result, msg="內部批量權限驗證完成")
             
@@ -125,6 +137,50 @@ class InternalPermissionVerifyBatchApi(BaseInternalView):
             return fail_response_result(msg=f"內部批量權限驗證失敗: {str(e)}")
 
 
+@blp.route("/permissions/filter")
+class InternalPermissionFilterApi(BaseInternalView):
+    """內部批量資源權限過濾接口"""
+    
+    @blp.arguments(InternalPermissionFilterSchema)
+    def post(self, json_data):
+        """
+        返回用户对指定 资源类型:操作 有权限的资源ID子集 (保持请求顺序)
+        响应为标准响应结构，content.allowed 按块流式写出，列表页可一次调用完成权限过滤
+        """
+        try:
+            result, flag = self.pc.filter_permitted_resources(
+                user_id=json_data['user_id'],
+                resource_type=json_data['resource_type'],
+                action=json_data['action'],
+                resource_ids=json_data['resource_ids']
+            )
+            if not flag:
+                return self._build_response(result, flag, error_prefix="內部權限過濾失敗: ")
+            
+            return Response(stream_with_context(self._stream_filter_result(result)), mimetype='application/json')
+            
+        except Exception as e:
+            logger.error(f"內部權限過濾失敗: {str(e)}")
+            return fail_response_result(msg=f"內部權限過濾失敗: {str(e)}")
+    
+    @staticmethod
+    def _stream_filter_result(result):
+        allowed = result.pop('allowed')
+        head = json.dumps(response_result(content=result, msg="內部權限過濾完成"), ensure_ascii=False)
+        # 在content对象末尾续写 allowed 列表和计数
+        yield head[:-2] + ', "allowed": ['
+        
+        allowed_count = 0
+        while True:
+            chunk = list(islice(allowed, CacheConfig.PERMISSION_FILTER_CHUNK_SIZE))
+            if not chunk:
+                break
+            yield (', ' if allowed_count else '') + json.dumps(chunk, ensure_ascii=False)[1:-1]
+            allowed_count += len(chunk)
+        
+        yield f'], "allowed_count": {allowed_count}}}}}'
+
+
 # ==================== 權限上下文構建接口 ====================
 
 @blp.route("/permissions/build-context")
@@ -280,33 +336,22 @@ class InternalCacheCleanupApi(BaseInternalView):
     
     @blp.response(200, RspMsgDictSchema)
     def post(self):
-        """清理过期缓存"""
+        """
+        清理过期缓存 (分批删除，与定时压缩任务共用实现)
+        压缩在后台线程执行，接口立即返回；本次结果写入 last_run，可在缓存统计接口查看
+        """
         try:
-            from dbs.mysql_db.model_tables import UserPermissionContextModel, PermissionVerificationCacheModel
-            from dbs.mysql_db import db
-            from datetime import datetime
-            
-            # 清理过期的用户上下文缓存
-            expired_contexts = UserPermissionContextModel.query.filter(
-                UserPermissionContextModel.expires_at <= datetime.utcnow()
-            ).delete()
-            
-            # 清理过期的权限验证缓存
-            expired_verifications = PermissionVerificationCacheModel.query.filter(
-                PermissionVerificationCacheModel.expires_at <= datetime.utcnow()
-            ).delete()
-            
-            db.session.commit()
-            
+            started = cache_compactor.start_async(current_app._get_current_object())
             cleanup_result = {
-                'expired_contexts_cleaned': expired_contexts,
-                'expired_verifications_cleaned': expired_verifications,
-                'total_cleaned': expired_contexts + expired_verifications,
-                'cleanup_time': CommonTools.get_current_time()
+                'started': started,
+                'last_run': cache_compactor.get_stats().get('last_run'),
+                'request_time': CommonTools.get_current_time()
             }
             
-            logger.info(f"緩存清理完成 - 清理了 {cleanup_result['total_cleaned']} 個過期記錄")
-            return response_result(content=cleanup_result, msg="緩存清理完成")
+            logger.info(f"緩存清理{'已觸發' if started else '正在進行中，本次不重複觸發'}")
+            return response_result(
+                content=cleanup_result, msg="緩存清理已觸發" if started else "緩存清理正在進行中"
+            )
             
         except Exception as e:
             logger.error(f"緩存清理失敗: {str(e)}")
@@ -358,6 +403,44 @@ class InternalHealthCheckApi(BaseInternalView):
             return fail_response_result(content=health_info, msg=f"權限服務健康檢查失敗: {str(e)}")
 
 
+# ==================== 指標接口 ====================
+
+@blp.route("/metrics")
+class InternalMetricsApi(BaseInternalView):
+    """延遲直方圖與緩存計數指標接口"""
+    
+    def get(self):
+        """
+        本进程指标：接口/操作延迟直方图、判定来源与上下文缓存计数、上下文构建扇出耗时
+        format=prometheus 时返回Prometheus文本格式
+        """
+        try:
+            decision_stats = decision_cache.get_stats()
+            builder_stats = context_builder.get_stats()
+            
+            if request.args.get('format') == 'prometheus':
+                gauges = {
+                    'decision_cache_lookups': {
+                        label: decision_stats[label] for label in ('l1_hit', 'l2_hit', 'miss')
+                    },
+                    'decision_cache_hit_rate': {'all': decision_stats['hit_rate']},
+                    'context_builds': {
+                        label: builder_stats[label]
+                        for label in ('builds', 'partial', 'coalesced', 'team_failed', 'project_failed')
+                    },
+                }
+                return Response(permission_metrics.to_prometheus(gauges), mimetype='text/plain; version=0.0.4')
+            
+            metrics = permission_metrics.snapshot()
+            metrics['decision_cache'] = decision_stats
+            metrics['context_builder'] = builder_stats
+            return response_result(content=metrics, msg="獲取權限服務指標成功")
+            
+        except Exception as e:
+            logger.error(f"獲取權限服務指標失敗: {str(e)}")
+            return fail_response_result(msg=f"獲取權限服務指標失敗: {str(e)}")
+
+
 # ==================== 系統管理接口 ====================
 
 @blp.route("/permissions/system/stats")
@@ -369,7 +452,7 @@ class InternalSystemStatsApi(BaseInternalView):
         """获取权限系统统计信息"""
         try:
             from dbs.mysql_db.model_tables import (
-                UserPermissionContextModel, PermissionVerificationCacheModel, PermissionChangeEventModel
+                UserPermissionContextModel, PermissionChangeEventModel
             )
             from dbs.mysql_db import db
             from sqlalchemy import func
@@ -380,10 +463,8 @@ class InternalSystemStatsApi(BaseInternalView):
                 UserPermissionContextModel.expires_at > datetime.utcnow()
             ).count()
             
-            # 统计活跃验证缓存
-            active_verifications = PermissionVerificationCacheModel.query.filter(
-                PermissionVerificationCacheModel.expires_at > datetime.utcnow()
-            ).count()
+            # 统计活跃验证缓存 (本进程的决策缓存条目)
+            active_verifications = decision_cache.get_stats()['l1_entries']
             
             # 统计最近24小时的权限变更事件
             yesterday = datetime.utcnow() - timedelta(days=1)
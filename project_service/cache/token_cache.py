@@ -1,22 +1,23 @@
 # -*- coding: utf-8 -*-
 """
 @文件: token_cache.py
-@說明: 高性能缓存服务 - 专为team service优化
+@說明: 高性能缓存服务 - 专为team service优化 (基于两级缓存引擎)
 @時間: 2025-01-09
 @作者: LiDong
 """
 
-import json
 import time
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Callable
 from flask_jwt_extended import decode_token
 from cache import redis_client
+from cache.cache_engine import CacheEngine
+from configs.cache_config import CacheConfig
 from loggers import logger
 
 
 class TeamCacheService:
     """团队缓存服务 - 超低延迟设计"""
-    
+
     # 缓存键前缀
     TOKEN_CACHE_PREFIX = "team:token:"
     USER_CACHE_PREFIX = "team:user:"
@@ -25,7 +26,8 @@ class TeamCacheService:
     PERMISSION_CACHE_PREFIX = "team:permission:"
     ACTIVITY_CACHE_PREFIX = "team:activity:"
     BLACKLIST_SET = "team:blacklist"
-    
+    BLACKLIST_KEY_PREFIX = "blacklisted_token:"
+
     # 缓存时间配置 (秒)
     TOKEN_CACHE_TTL = 300       # 5分钟 - 令牌信息缓存
     USER_CACHE_TTL = 600        # 10分钟 - 用户信息缓存
@@ -33,12 +35,27 @@ class TeamCacheService:
     MEMBER_CACHE_TTL = 900      # 15分钟 - 成员信息缓存
     PERMISSION_CACHE_TTL = 1200 # 20分钟 - 权限信息缓存
     ACTIVITY_CACHE_TTL = 300    # 5分钟 - 活动信息缓存
-    
+
     def __init__(self):
         self.redis = redis_client
-    
+        self.engine = CacheEngine("team")
+        # 令牌验证结果过期后不供应旧值
+        self.tokens = self.engine.namespace("token", self.TOKEN_CACHE_PREFIX, self.TOKEN_CACHE_TTL, stale_ttl=0)
+        self.users = self.engine.namespace("user", self.USER_CACHE_PREFIX, self.USER_CACHE_TTL)
+        self.teams = self.engine.namespace("team", self.TEAM_CACHE_PREFIX, self.TEAM_CACHE_TTL)
+        # 成员角色和权限是鉴权热点，给予更大的L1容量
+        self.members = self.engine.namespace("member", self.MEMBER_CACHE_PREFIX, self.MEMBER_CACHE_TTL, l1_size=20000)
+        self.permissions = self.engine.namespace(
+            "permission", self.PERMISSION_CACHE_PREFIX, self.PERMISSION_CACHE_TTL, l1_size=20000,
+            compress_threshold=512
+        )
+        # 活动列表和权限列表体积较大，降低压缩阈值
+        self.activities = self.engine.namespace("activity", self.ACTIVITY_CACHE_PREFIX, self.ACTIVITY_CACHE_TTL,
+                                                l1_size=500, compress_threshold=256)
+        self.engine.track_prefix("blacklist", self.BLACKLIST_KEY_PREFIX)
+
     # ==================== 令牌验证缓存 ====================
-    
+
     def cache_token_validation(self, token: str, validation_result: Dict[str, Any], ttl: int = None) -> bool:
         """
         缓存令牌验证结果
@@ -47,23 +64,16 @@ class TeamCacheService:
         :param ttl: 缓存过期时间(秒)
         """
         try:
-            token_hash = self._hash_token(token)
-            cache_key = f"{self.TOKEN_CACHE_PREFIX}{token_hash}"
-            
-            # 序列化验证结果
             cache_data = {
                 'result': validation_result,
-                'cached_at': int(time.time()),
                 'token_exp': self._get_token_exp(token)
             }
-            
-            cache_ttl = ttl or self.TOKEN_CACHE_TTL
-            return self.redis.setex(cache_key, cache_ttl, json.dumps(cache_data))
-            
+            return self.tokens.set(self._hash_token(token), cache_data, ttl)
+
         except Exception as e:
             logger.error(f"缓存令牌验证结果失败: {str(e)}")
             return False
-    
+
     def get_cached_token_validation(self, token: str) -> Optional[Dict[str, Any]]:
         """
         获取缓存的令牌验证结果
@@ -72,37 +82,29 @@ class TeamCacheService:
         """
         try:
             token_hash = self._hash_token(token)
-            cache_key = f"{self.TOKEN_CACHE_PREFIX}{token_hash}"
-            
-            cached_data = self.redis.get(cache_key)
-            if not cached_data:
+            cache_info = self.tokens.get(token_hash)
+            if not cache_info:
                 return None
-            
-            cache_info = json.loads(cached_data)
-            
+
             # 检查令牌是否已过期
-            current_time = int(time.time())
-            token_exp = cache_info.get('token_exp', 0)
-            
-            if current_time >= token_exp:
-                # 令牌已过期，删除缓存
-                self.redis.delete(cache_key)
+            if int(time.time()) >= cache_info.get('token_exp', 0):
+                self.tokens.delete(token_hash)
                 return None
-            
+
             # 检查是否在黑名单中
             if self.is_token_blacklisted(token):
                 # 令牌已被撤销，删除缓存
-                self.redis.delete(cache_key)
+                self.tokens.delete(token_hash)
                 return None
-            
+
             return cache_info['result']
-            
+
         except Exception as e:
             logger.error(f"获取缓存令牌验证结果失败: {str(e)}")
             return None
-    
+
     # ==================== 用户信息缓存 ====================
-    
+
     def cache_user_info(self, user_id: str, user_info: Dict[str, Any], ttl: int = None) -> bool:
         """
         缓存用户信息
@@ -110,55 +112,29 @@ class TeamCacheService:
         :param user_info: 用户信息
         :param ttl: 缓存过期时间(秒)
         """
-        try:
-            cache_key = f"{self.USER_CACHE_PREFIX}{user_id}"
-            cache_data = {
-                'user_info': user_info,
-                'cached_at': int(time.time())
-            }
-            
-            cache_ttl = ttl or self.USER_CACHE_TTL
-            return self.redis.setex(cache_key, cache_ttl, json.dumps(cache_data))
-            
-        except Exception as e:
-            logger.error(f"缓存用户信息失败: {str(e)}")
-            return False
-    
-    def get_cached_user_info(self, user_id: str) -> Optional[Dict[str, Any]]:
+        return self.users.set(user_id, user_info, ttl)
+
+    def get_cached_user_info(self, user_id: str,
+                             loader: Callable[[], Optional[Dict[str, Any]]] = None) -> Optional[Dict[str, Any]]:
         """
         获取缓存的用户信息
         :param user_id: 用户ID
+        :param loader: 未命中时的回源函数，提供时启用防击穿(租约/旧值供应/提前刷新)并自动回写
         :return: 用户信息或None
         """
-        try:
-            cache_key = f"{self.USER_CACHE_PREFIX}{user_id}"
-            cached_data = self.redis.get(cache_key)
-            
-            if not cached_data:
-                return None
-            
-            cache_info = json.loads(cached_data)
-            return cache_info['user_info']
-            
-        except Exception as e:
-            logger.error(f"获取缓存用户信息失败: {str(e)}")
-            return None
-    
+        if loader:
+            return self.users.get_or_load(user_id, loader)
+        return self.users.get(user_id)
+
     def invalidate_user_cache(self, user_id: str) -> bool:
         """
         使用户缓存失效
         :param user_id: 用户ID
         """
-        try:
-            cache_key = f"{self.USER_CACHE_PREFIX}{user_id}"
-            return self.redis.delete(cache_key) > 0
-            
-        except Exception as e:
-            logger.error(f"使用户缓存失效失败: {str(e)}")
-            return False
-    
+        return self.users.delete(user_id)
+
     # ==================== 团队信息缓存 ====================
-    
+
     def cache_team_info(self, team_id: str, team_info: Dict[str, Any], ttl: int = None) -> bool:
         """
         缓存团队信息
@@ -166,55 +142,29 @@ class TeamCacheService:
         :param team_info: 团队信息
         :param ttl: 缓存过期时间(秒)
         """
-        try:
-            cache_key = f"{self.TEAM_CACHE_PREFIX}{team_id}"
-            cache_data = {
-                'team_info': team_info,
-                'cached_at': int(time.time())
-            }
-            
-            cache_ttl = ttl or self.TEAM_CACHE_TTL
-            return self.redis.setex(cache_key, cache_ttl, json.dumps(cache_data))
-            
-        except Exception as e:
-            logger.error(f"缓存团队信息失败: {str(e)}")
-            return False
-    
-    def get_cached_team_info(self, team_id: str) -> Optional[Dict[str, Any]]:
+        return self.teams.set(team_id, team_info, ttl)
+
+    def get_cached_team_info(self, team_id: str,
+                             loader: Callable[[], Optional[Dict[str, Any]]] = None) -> Optional[Dict[str, Any]]:
         """
         获取缓存的团队信息
         :param team_id: 团队ID
+        :param loader: 未命中时的回源函数，提供时启用防击穿并自动回写
         :return: 团队信息或None
         """
-        try:
-            cache_key = f"{self.TEAM_CACHE_PREFIX}{team_id}"
-            cached_data = self.redis.get(cache_key)
-            
-            if not cached_data:
-                return None
-            
-            cache_info = json.loads(cached_data)
-            return cache_info['team_info']
-            
-        except Exception as e:
-            logger.error(f"获取缓存团队信息失败: {str(e)}")
-            return None
-    
+        if loader:
+            return self.teams.get_or_load(team_id, loader)
+        return self.teams.get(team_id)
+
     def invalidate_team_cache(self, team_id: str) -> bool:
         """
         使团队缓存失效
         :param team_id: 团队ID
         """
-        try:
-            cache_key = f"{self.TEAM_CACHE_PREFIX}{team_id}"
-            return self.redis.delete(cache_key) > 0
-            
-        except Exception as e:
-            logger.error(f"使团队缓存失效失败: {str(e)}")
-            return False
-    
+        return self.teams.delete(team_id)
+
     # ==================== 成员信息缓存 ====================
-    
+
     def cache_team_member_role(self, team_id: str, user_id: str, role_info: Dict[str, Any], ttl: int = None) -> bool:
         """
         缓存团队成员角色信息
@@ -223,65 +173,35 @@ class TeamCacheService:
         :param role_info: 角色信息
         :param ttl: 缓存过期时间(秒)
         """
-        try:
-            cache_key = f"{self.MEMBER_CACHE_PREFIX}{team_id}:{user_id}"
-            cache_data = {
-                'role_info': role_info,
-                'cached_at': int(time.time())
-            }
-            
-            cache_ttl = ttl or self.MEMBER_CACHE_TTL
-            return self.redis.setex(cache_key, cache_ttl, json.dumps(cache_data))
-            
-        except Exception as e:
-            logger.error(f"缓存团队成员角色信息失败: {str(e)}")
-            return False
-    
-    def get_cached_team_member_role(self, team_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+        return self.members.set(f"{team_id}:{user_id}", role_info, ttl, tags=[team_id])
+
+    def get_cached_team_member_role(self, team_id: str, user_id: str,
+                                    loader: Callable[[], Optional[Dict[str, Any]]] = None) -> Optional[Dict[str, Any]]:
         """
         获取缓存的团队成员角色信息
         :param team_id: 团队ID
         :param user_id: 用户ID
+        :param loader: 未命中时的回源函数，提供时启用防击穿并自动回写
         :return: 角色信息或None
         """
-        try:
-            cache_key = f"{self.MEMBER_CACHE_PREFIX}{team_id}:{user_id}"
-            cached_data = self.redis.get(cache_key)
-            
-            if not cached_data:
-                return None
-            
-            cache_info = json.loads(cached_data)
-            return cache_info['role_info']
-            
-        except Exception as e:
-            logger.error(f"获取缓存团队成员角色信息失败: {str(e)}")
-            return None
-    
+        if loader:
+            return self.members.get_or_load(f"{team_id}:{user_id}", loader, tags=[team_id])
+        return self.members.get(f"{team_id}:{user_id}")
+
     def invalidate_team_member_cache(self, team_id: str, user_id: str = None) -> bool:
         """
         使团队成员缓存失效
         :param team_id: 团队ID
         :param user_id: 用户ID，如果为None则清除团队所有成员缓存
         """
-        try:
-            if user_id:
-                cache_key = f"{self.MEMBER_CACHE_PREFIX}{team_id}:{user_id}"
-                return self.redis.delete(cache_key) > 0
-            else:
-                # 清除团队所有成员缓存
-                pattern = f"{self.MEMBER_CACHE_PREFIX}{team_id}:*"
-                keys = self.redis.redis_client.keys(pattern)
-                if keys:
-                    return self.redis.redis_client.delete(*keys) > 0
-                return True
-            
-        except Exception as e:
-            logger.error(f"使团队成员缓存失效失败: {str(e)}")
-            return False
-    
+        if user_id:
+            return self.members.delete(f"{team_id}:{user_id}")
+        # 按团队标签删除，只涉及该团队的成员键
+        self.members.delete_tag(team_id, sub_prefix=f"{team_id}:")
+        return True
+
     # ==================== 权限信息缓存 ====================
-    
+
     def cache_user_team_permissions(self, team_id: str, user_id: str, permissions: List[str], ttl: int = None) -> bool:
         """
         缓存用户在团队中的权限信息
@@ -290,65 +210,34 @@ class TeamCacheService:
         :param permissions: 权限列表
         :param ttl: 缓存过期时间(秒)
         """
-        try:
-            cache_key = f"{self.PERMISSION_CACHE_PREFIX}{team_id}:{user_id}"
-            cache_data = {
-                'permissions': permissions,
-                'cached_at': int(time.time())
-            }
-            
-            cache_ttl = ttl or self.PERMISSION_CACHE_TTL
-            return self.redis.setex(cache_key, cache_ttl, json.dumps(cache_data))
-            
-        except Exception as e:
-            logger.error(f"缓存用户团队权限信息失败: {str(e)}")
-            return False
-    
-    def get_cached_user_team_permissions(self, team_id: str, user_id: str) -> Optional[List[str]]:
+        return self.permissions.set(f"{team_id}:{user_id}", permissions, ttl, tags=[team_id])
+
+    def get_cached_user_team_permissions(self, team_id: str, user_id: str,
+                                         loader: Callable[[], Optional[List[str]]] = None) -> Optional[List[str]]:
         """
         获取缓存的用户团队权限信息
         :param team_id: 团队ID
         :param user_id: 用户ID
+        :param loader: 未命中时的回源函数，提供时启用防击穿并自动回写
         :return: 权限列表或None
         """
-        try:
-            cache_key = f"{self.PERMISSION_CACHE_PREFIX}{team_id}:{user_id}"
-            cached_data = self.redis.get(cache_key)
-            
-            if not cached_data:
-                return None
-            
-            cache_info = json.loads(cached_data)
-            return cache_info['permissions']
-            
-        except Exception as e:
-            logger.error(f"获取缓存用户团队权限信息失败: {str(e)}")
-            return None
-    
+        if loader:
+            return self.permissions.get_or_load(f"{team_id}:{user_id}", loader, tags=[team_id])
+        return self.permissions.get(f"{team_id}:{user_id}")
+
     def invalidate_user_team_permissions(self, team_id: str, user_id: str = None) -> bool:
         """
         使用户团队权限缓存失效
         :param team_id: 团队ID
         :param user_id: 用户ID，如果为None则清除团队所有用户权限缓存
         """
-        try:
-            if user_id:
-                cache_key = f"{self.PERMISSION_CACHE_PREFIX}{team_id}:{user_id}"
-                return self.redis.delete(cache_key) > 0
-            else:
-                # 清除团队所有用户权限缓存
-                pattern = f"{self.PERMISSION_CACHE_PREFIX}{team_id}:*"
-                keys = self.redis.redis_client.keys(pattern)
-                if keys:
-                    return self.redis.redis_client.delete(*keys) > 0
-                return True
-            
-        except Exception as e:
-            logger.error(f"使用户团队权限缓存失效失败: {str(e)}")
-            return False
-    
+        if user_id:
+            return self.permissions.delete(f"{team_id}:{user_id}")
+        self.permissions.delete_tag(team_id, sub_prefix=f"{team_id}:")
+        return True
+
     # ==================== 活动信息缓存 ====================
-    
+
     def cache_team_activities(self, team_id: str, activities: List[Dict[str, Any]], ttl: int = None) -> bool:
         """
         缓存团队活动信息
@@ -356,55 +245,30 @@ class TeamCacheService:
         :param activities: 活动列表
         :param ttl: 缓存过期时间(秒)
         """
-        try:
-            cache_key = f"{self.ACTIVITY_CACHE_PREFIX}{team_id}"
-            cache_data = {
-                'activities': activities,
-                'cached_at': int(time.time())
-            }
-            
-            cache_ttl = ttl or self.ACTIVITY_CACHE_TTL
-            return self.redis.setex(cache_key, cache_ttl, json.dumps(cache_data))
-            
-        except Exception as e:
-            logger.error(f"缓存团队活动信息失败: {str(e)}")
-            return False
-    
-    def get_cached_team_activities(self, team_id: str) -> Optional[List[Dict[str, Any]]]:
+        return self.activities.set(team_id, activities, ttl)
+
+    def get_cached_team_activities(self, team_id: str,
+                                   loader: Callable[[], Optional[List[Dict[str, Any]]]] = None
+                                   ) -> Optional[List[Dict[str, Any]]]:
         """
         获取缓存的团队活动信息
         :param team_id: 团队ID
+        :param loader: 未命中时的回源函数，提供时启用防击穿并自动回写
         :return: 活动列表或None
         """
-        try:
-            cache_key = f"{self.ACTIVITY_CACHE_PREFIX}{team_id}"
-            cached_data = self.redis.get(cache_key)
-            
-            if not cached_data:
-                return None
-            
-            cache_info = json.loads(cached_data)
-            return cache_info['activities']
-            
-        except Exception as e:
-            logger.error(f"获取缓存团队活动信息失败: {str(e)}")
-            return None
-    
+        if loader:
+            return self.activities.get_or_load(team_id, loader)
+        return self.activities.get(team_id)
+
     def invalidate_team_activities_cache(self, team_id: str) -> bool:
         """
         使团队活动缓存失效
         :param team_id: 团队ID
         """
-        try:
-            cache_key = f"{self.ACTIVITY_CACHE_PREFIX}{team_id}"
-            return self.redis.delete(cache_key) > 0
-            
-        except Exception as e:
-            logger.error(f"使团队活动缓存失效失败: {str(e)}")
-            return False
-    
+        return self.activities.delete(team_id)
+
     # ==================== 令牌黑名单管理 ====================
-    
+
     def add_token_to_blacklist(self, token: str, ttl: int = None) -> bool:
         """
         将令牌添加到黑名单
@@ -414,27 +278,27 @@ class TeamCacheService:
         try:
             token_data = decode_token(token)
             jti = token_data.get('jti')
-            
+
             if not jti:
                 return False
-            
+
             # 计算令牌剩余有效期
             exp = token_data.get('exp', 0)
             current_time = int(time.time())
             remaining_ttl = exp - current_time
-            
+
             if remaining_ttl <= 0:
                 return True  # 令牌已过期，无需加入黑名单
-            
+
             blacklist_ttl = ttl or remaining_ttl
-            blacklist_key = f"blacklisted_token:{jti}"
-            
+            blacklist_key = f"{self.BLACKLIST_KEY_PREFIX}{jti}"
+
             return self.redis.setex(blacklist_key, blacklist_ttl, "revoked")
-            
+
         except Exception as e:
             logger.error(f"添加令牌到黑名单失败: {str(e)}")
             return False
-    
+
     def is_token_blacklisted(self, token: str) -> bool:
         """
         检查令牌是否在黑名单中
@@ -444,17 +308,17 @@ class TeamCacheService:
         try:
             token_data = decode_token(token)
             jti = token_data.get('jti')
-            
+
             if not jti:
                 return False
-            
-            blacklist_key = f"blacklisted_token:{jti}"
+
+            blacklist_key = f"{self.BLACKLIST_KEY_PREFIX}{jti}"
             return self.redis.exists(blacklist_key)
-            
+
         except Exception as e:
             logger.error(f"检查令牌黑名单状态失败: {str(e)}")
             return False
-    
+
     def remove_token_from_blacklist(self, token: str) -> bool:
         """
         从黑名单移除令牌
@@ -463,145 +327,73 @@ class TeamCacheService:
         try:
             token_data = decode_token(token)
             jti = token_data.get('jti')
-            
+
             if not jti:
                 return False
-            
-            blacklist_key = f"blacklisted_token:{jti}"
+
+            blacklist_key = f"{self.BLACKLIST_KEY_PREFIX}{jti}"
             return self.redis.delete(blacklist_key) > 0
-            
+
         except Exception as e:
             logger.error(f"从黑名单移除令牌失败: {str(e)}")
             return False
-    
+
     # ==================== 批量操作优化 ====================
-    
+
     def batch_cache_teams(self, teams_data: Dict[str, Dict[str, Any]], ttl: int = None) -> bool:
         """
         批量缓存团队信息
         :param teams_data: {team_id: team_info} 格式的团队数据
         :param ttl: 缓存过期时间(秒)
         """
-        try:
-            cache_ttl = ttl or self.TEAM_CACHE_TTL
-            pipeline = self.redis.redis_client.pipeline()
-            
-            for team_id, team_info in teams_data.items():
-                cache_key = f"{self.TEAM_CACHE_PREFIX}{team_id}"
-                cache_data = {
-                    'team_info': team_info,
-                    'cached_at': int(time.time())
-                }
-                pipeline.setex(cache_key, cache_ttl, json.dumps(cache_data))
-            
-            pipeline.execute()
-            return True
-            
-        except Exception as e:
-            logger.error(f"批量缓存团队信息失败: {str(e)}")
-            return False
-    
+        return self.teams.set_many(teams_data, ttl)
+
     def batch_cache_users(self, users_data: Dict[str, Dict[str, Any]], ttl: int = None) -> bool:
         """
         批量缓存用户信息
         :param users_data: {user_id: user_info} 格式的用户数据
         :param ttl: 缓存过期时间(秒)
         """
-        try:
-            cache_ttl = ttl or self.USER_CACHE_TTL
-            pipeline = self.redis.redis_client.pipeline()
-            
-            for user_id, user_info in users_data.items():
-                cache_key = f"{self.USER_CACHE_PREFIX}{user_id}"
-                cache_data = {
-                    'user_info': user_info,
-                    'cached_at': int(time.time())
-                }
-                pipeline.setex(cache_key, cache_ttl, json.dumps(cache_data))
-            
-            pipeline.execute()
-            return True
-            
-        except Exception as e:
-            logger.error(f"批量缓存用户信息失败: {str(e)}")
-            return False
-    
+        return self.users.set_many(users_data, ttl)
+
     def batch_get_teams(self, team_ids: list) -> Dict[str, Dict[str, Any]]:
         """
         批量获取团队缓存信息
         :param team_ids: 团队ID列表
         :return: {team_id: team_info} 格式的团队数据
         """
-        try:
-            pipeline = self.redis.redis_client.pipeline()
-            cache_keys = [f"{self.TEAM_CACHE_PREFIX}{team_id}" for team_id in team_ids]
-            
-            for cache_key in cache_keys:
-                pipeline.get(cache_key)
-            
-            cached_results = pipeline.execute()
-            
-            teams_data = {}
-            for i, cached_data in enumerate(cached_results):
-                if cached_data:
-                    try:
-                        cache_info = json.loads(cached_data)
-                        teams_data[team_ids[i]] = cache_info['team_info']
-                    except (json.JSONDecodeError, KeyError):
-                        continue
-            
-            return teams_data
-            
-        except Exception as e:
-            logger.error(f"批量获取团队缓存信息失败: {str(e)}")
-            return {}
-    
+        return self.teams.get_many(team_ids)
+
     def batch_get_users(self, user_ids: list) -> Dict[str, Dict[str, Any]]:
         """
         批量获取用户缓存信息
         :param user_ids: 用户ID列表
         :return: {user_id: user_info} 格式的用户数据
         """
-        try:
-            pipeline = self.redis.redis_client.pipeline()
-            cache_keys = [f"{self.USER_CACHE_PREFIX}{user_id}" for user_id in user_ids]
-            
-            for cache_key in cache_keys:
-                pipeline.get(cache_key)
-            
-            cached_results = pipeline.execute()
-            
-            users_data = {}
-            for i, cached_data in enumerate(cached_results):
-                if cached_data:
-                    try:
-                        cache_info = json.loads(cached_data)
-                        users_data[user_ids[i]] = cache_info['user_info']
-                    except (json.JSONDecodeError, KeyError):
-                        continue
-            
-            return users_data
-            
-        except Exception as e:
-            logger.error(f"批量获取用户缓存信息失败: {str(e)}")
-            return {}
-    
+        return self.users.get_many(user_ids)
+
     # ==================== 缓存统计和监控 ====================
-    
+
     def get_cache_stats(self) -> Dict[str, Any]:
         """
         获取缓存统计信息
+        键数量来自后台SCAN的定期统计(近似值，统计尚未完成时为0)，读取本身不遍历键空间
         """
         try:
-            # 获取不同类型缓存的数量
-            token_keys = len(self.redis.redis_client.keys(f"{self.TOKEN_CACHE_PREFIX}*"))
-            user_keys = len(self.redis.redis_client.keys(f"{self.USER_CACHE_PREFIX}*"))
-            team_keys = len(self.redis.redis_client.keys(f"{self.TEAM_CACHE_PREFIX}*"))
-            member_keys = len(self.redis.redis_client.keys(f"{self.MEMBER_CACHE_PREFIX}*"))
-            permission_keys = len(self.redis.redis_client.keys(f"{self.PERMISSION_CACHE_PREFIX}*"))
-            activity_keys = len(self.redis.redis_client.keys(f"{self.ACTIVITY_CACHE_PREFIX}*"))
-            blacklist_keys = len(self.redis.redis_client.keys("blacklisted_token:*"))
-            
+            engine_stats = self.engine.get_stats()
+            namespaces = engine_stats.get('namespaces', {})
+
+            def key_count(name: str) -> int:
+                return namespaces.get(name, {}).get('keys') or 0
+
+            token_keys = key_count('token')
+            user_keys = key_count('user')
+            team_keys = key_count('team')
+            member_keys = key_count('member')
+            permission_keys = key_count('permission')
+            activity_keys = key_count('activity')
+            blacklist_keys = key_count('blacklist')
+
             return {
                 'token_cache_count': token_keys,
                 'user_cache_count': user_keys,
@@ -611,46 +403,55 @@ class TeamCacheService:
                 'activity_cache_count': activity_keys,
                 'blacklist_count': blacklist_keys,
                 'total_cache_keys': token_keys + user_keys + team_keys + member_keys + permission_keys + activity_keys + blacklist_keys,
+                'key_counts_updated_at': engine_stats.get('key_counts_updated_at'),
+                'engine_stats': engine_stats,
                 'redis_info': self.redis.redis_client.info('memory') if self.redis.redis_client else {}
             }
-            
+
         except Exception as e:
             logger.error(f"获取缓存统计信息失败: {str(e)}")
             return {}
-    
-    def clear_expired_cache(self) -> int:
+
+    def clear_expired_cache(self) -> bool:
         """
         清理过期缓存（Redis会自动清理，这里主要用于手动清理）
-        :return: 清理的缓存数量
+        清理在后台线程中SCAN执行，不阻塞调用方
+        :return: 是否已提交清理任务
         """
-        try:
-            cleared_count = 0
-            current_time = int(time.time())
-            
-            # 清理过期的令牌缓存
-            token_keys = self.redis.redis_client.keys(f"{self.TOKEN_CACHE_PREFIX}*")
-            for key in token_keys:
-                try:
-                    cached_data = self.redis.get(key)
-                    if cached_data:
-                        cache_info = json.loads(cached_data)
-                        token_exp = cache_info.get('token_exp', 0)
-                        if current_time >= token_exp:
-                            self.redis.delete(key)
-                            cleared_count += 1
-                except (json.JSONDecodeError, KeyError):
-                    # 数据格式错误，删除
-                    self.redis.delete(key)
-                    cleared_count += 1
-            
-            return cleared_count
-            
-        except Exception as e:
-            logger.error(f"清理过期缓存失败: {str(e)}")
+        return self.engine.submit("clear_expired_tokens", self._sweep_expired_tokens)
+
+    def _sweep_expired_tokens(self) -> int:
+        """SCAN遍历令牌缓存，按批MGET并删除已过期令牌的缓存"""
+        redis = self.engine.redis_conn()
+        if not redis:
             return 0
-    
+
+        cleared_count = 0
+        batch = []
+        batch_size = CacheConfig.CACHE_SCAN_BATCH_SIZE
+        for key in redis.scan_iter(match=f"{self.TOKEN_CACHE_PREFIX}*", count=batch_size):
+            batch.append(key)
+            if len(batch) >= batch_size:
+                cleared_count += self._delete_expired_tokens(batch)
+                batch = []
+        if batch:
+            cleared_count += self._delete_expired_tokens(batch)
+        if cleared_count:
+            logger.info(f"清理過期令牌緩存: {cleared_count} 條")
+        return cleared_count
+
+    def _delete_expired_tokens(self, keys: list) -> int:
+        current_time = int(time.time())
+        token_hashes = [key[len(self.TOKEN_CACHE_PREFIX):] for key in keys]
+        cached = self.tokens.peek_many(token_hashes)
+        expired = []
+        for token_hash, cache_info in cached.items():
+            if not isinstance(cache_info, dict) or current_time >= cache_info.get('token_exp', 0):
+                expired.append(token_hash)
+        return self.tokens.delete_many(expired)
+
     # ==================== 辅助方法 ====================
-    
+
     def _hash_token(self, token: str) -> str:
         """
         生成令牌哈希值用作缓存键
@@ -659,7 +460,7 @@ class TeamCacheService:
         """
         import hashlib
         return hashlib.sha256(token.encode()).hexdigest()
-    
+
     def _get_token_exp(self, token: str) -> int:
         """
         获取令牌过期时间
@@ -674,4 +475,6 @@ class TeamCacheService:
 
 
 # 创建全局团队缓存服务实例
-team_cache = TeamCacheService()
\ No newline at end of file
+team_cache = TeamCacheService()
+# 兼容按 token_cache 名称导入的调用方
+token_cache = team_cache
@@ -20,6 +20,7 @@ from dbs.mysql_db.model_tables import (
     TagModel, ProjectTagModel, ProjectActivityModel,
     ProjectAccessRequestModel, ProjectExternalAccessModel
 )
+from cache.permission_feed import permission_feed
 from loggers import logger
 
 
@@ -276,9 +277,18 @@ class ProjectController:
             if not project or project.status == 'deleted':
                 return False, "項目不存在"
             
+            maintainer_ids = [
+                maintainer_id for maintainer_id, in ProjectMaintainerModel.query.with_entities(
+                    ProjectMaintainerModel.user_id
+                ).filter_by(project_id=project_id).all()
+            ]
+            
             project.status = 'deleted'
             db.session.commit()
             
+            # 已删除项目不再计入维护员上下文，通知权限服务逐个移除
+            ProjectController._publish_maintainer_changes(project_id, maintainer_ids, None, user_id)
+            
             # 记录活动
             ProjectController._record_activity(
                 project_id, user_id, 'project_deleted',
@@ -457,6 +467,8 @@ class ProjectController:
             db.session.add(maintainer)
             db.session.commit()
             
+            ProjectController._publish_maintainer_changes(project_id, [user_id], 'maintainer', assigned_by)
+            
             # 记录活动
             ProjectController._record_activity(
                 project_id, assigned_by, 'maintainer_added',
@@ -482,6 +494,8 @@ class ProjectController:
             db.session.delete(maintainer)
             db.session.commit()
             
+            ProjectController._publish_maintainer_changes(project_id, [user_id], None, removed_by)
+            
             # 记录活动
             ProjectController._record_activity(
                 project_id, removed_by, 'maintainer_removed',
@@ -536,6 +550,22 @@ class ProjectController:
             return False, f"創建項目訪問申請失敗: {str(e)}"
 
     # 活动记录
+    @staticmethod
+    def _publish_maintainer_changes(project_id: str, user_ids: List[str], new_role: Optional[str], changed_by: str):
+        """维护员变更提交后写入权限变更流，new_role 为空表示移除"""
+        if not user_ids:
+            return
+        old_role = None if new_role else 'maintainer'
+        permission_feed.publish([{
+            'event_type': 'project_maintainer_changed',
+            'user_id': user_id,
+            'resource_type': 'project',
+            'resource_id': project_id,
+            'old_role': old_role,
+            'new_role': new_role,
+            'changed_by': changed_by
+        } for user_id in user_ids])
+
     @staticmethod
     def _record_activity(project_id: str, user_id: str, activity_type: str, description: str, metadata: dict = None):
         """记录项目活动"""
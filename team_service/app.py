@@ -16,11 +16,15 @@ from flask_jwt_extended import JWTManager
 
 from cache import redis_client
 from common.common_method import fail_response_result
+from common.periodic_task import PeriodicTask
+from configs.cache_config import CacheConfig
+from configs.constant import Config
 from configs.app_config import REDIS_DATABASE_URI, SQLALCHEMY_DATABASE_URI, SERVER_HOST, SERVER_PORT, SECRET_KEY
 from dbs.mysql_db import db
 from loggers import logger
 from views.team_api import blp as team_blp
 from views.internal_api import blp as internal_blp
+from controllers.team_controller import team_controller
 
 # from waitress import serve
 
@@ -100,6 +104,36 @@ def create_app(app):
     api = Api(app)
     api.register_blueprint(team_blp)
     api.register_blueprint(internal_blp)
+
+    # 群组物化统计对账：重新聚合已物化的群组并修正偏差，多实例互斥执行
+    PeriodicTask(
+        "team_stats_reconcile",
+        team_controller.reconcile_team_statistics,
+        CacheConfig.TEAM_STATS_RECONCILE_MINUTES * 60
+    ).start(app)
+
+    # 成员活跃时间落库：缓冲在Redis中共享，多实例互斥执行
+    PeriodicTask(
+        "team_member_activity_flush",
+        team_controller.flush_member_activity,
+        CacheConfig.MEMBER_ACTIVITY_FLUSH_SECONDS,
+        jitter_seconds=1
+    ).start(app)
+
+    # 群组活动归档：活动流中的活动批量写入MySQL，多实例互斥执行
+    PeriodicTask(
+        "team_activity_archive",
+        team_controller.archive_team_activities,
+        CacheConfig.TEAM_ACTIVITY_ARCHIVE_SECONDS,
+        jitter_seconds=1
+    ).start(app)
+
+    # 过期申请/邀请清理：分批UPDATE并逐批提交，不加载整表
+    PeriodicTask(
+        "team_expired_cleanup",
+        team_controller.cleanup_expired_records,
+        Config.EXPIRED_CLEANUP_INTERVAL_SECONDS
+    ).start(app)
     return app
 
 
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+@文件: activity_feed.py
+@說明: 群组活动流 - 每个群组一个定长Redis Stream保存近期活动，归档流批量落库
+@時間: 2025-01-09
+@作者: LiDong
+"""
+
+import json
+import re
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from cache import redis_client
+from configs.cache_config import CacheConfig
+from loggers import logger
+
+
+# 流消息ID格式 <毫秒时间戳>-<序号>，近期活动的分页游标直接使用消息ID
+_STREAM_ID = re.compile(r'^\d+-\d+$')
+
+# 落库函数 writer([活动]) -> (结果, 是否成功)
+ArchiveWriter = Callable[[List[Dict[str, Any]]], Tuple[Any, bool]]
+
+
+class TeamActivityFeed:
+    """
+    群组活动流
+
+    每个群组的近期活动保存在按近似长度裁剪的Stream中，追加为一次XADD，
+    读取最新一页用XREVRANGE只取一页条目，不再整体读写活动列表。
+    同一条活动同时写入全局归档流，归档任务按批取出，以INSERT IGNORE写入MySQL后删除；
+    活动ID为主键，任务在写库后、删除前中断时重复归档不会产生重复记录。
+    """
+
+    KEY_PREFIX = "team:activity_stream:"
+    ARCHIVE_KEY = "team:activity_stream:archive"
+    FIELDS = ('id', 'team_id', 'user_id', 'activity_type', 'description', 'metadata', 'created_at')
+
+    def __init__(self):
+        self.redis = redis_client
+        self._stats = {'appended': 0, 'append_failed': 0, 'reads': 0, 'archived': 0}
+
+    def key(self, team_id: str) -> str:
+        return f"{self.KEY_PREFIX}{team_id}"
+
+    @staticmethod
+    def is_cursor(cursor: Optional[str]) -> bool:
+        """是否为活动流游标 (消息ID)"""
+        return bool(cursor and _STREAM_ID.match(cursor))
+
+    # ==================== 写入 ====================
+
+    def append(self, activities: List[Dict[str, Any]]) -> bool:
+        """追加活动到群组流和归档流 (单次pipeline)；Redis不可用时返回False，由调用方直接落库"""
+        conn = self.redis.redis_client
+        if conn is None:
+            return False
+        if not activities:
+            return True
+        try:
+            pipeline = conn.pipeline(transaction=False)
+            for activity in activities:
+                fields = self._encode(activity)
+                key = self.key(activity['team_id'])
+                pipeline.xadd(key, fields, maxlen=CacheConfig.TEAM_ACTIVITY_STREAM_MAXLEN, approximate=True)
+                pipeline.expire(key, CacheConfig.TEAM_ACTIVITY_STREAM_TTL)
+                # 归档流不裁剪，未落库的活动不能丢失
+                pipeline.xadd(self.ARCHIVE_KEY, fields)
+            pipeline.execute()
+            self._stats['appended'] += len(activities)
+            return True
+        except Exception as e:
+            self._stats['append_failed'] += len(activities)
+            logger.error(f"寫入群組活動流失敗: {str(e)}")
+            return False
+
+    def delete(self, team_id: str) -> bool:
+        """删除群组活动流 (群组删除后调用)"""
+        conn = self.redis.redis_client
+        if conn is None:
+            return False
+        try:
+            conn.delete(self.key(team_id))
+            return True
+        except Exception as e:
+            logger.warning(f"刪除群組活動流失敗: {team_id}, {str(e)}")
+            return False
+
+    # ==================== 读取 ====================
+
+    def read(self, team_id: str, size: int, before: str = None
+             ) -> Optional[Tuple[List[Dict[str, Any]], bool]]:
+        """
+        从新到旧读取一页近期活动
+        :param before: 上一页最后一条的消息ID
+        :return: (活动列表, 流中是否还有更早的活动)，Redis不可用时返回None
+        """
+        conn = self.redis.redis_client
+        if conn is None:
+            return None
+        try:
+            entries = conn.xrevrange(self.key(team_id), max=f"({before}" if before else '+', min='-',
+                                     count=size + 1)
+        except Exception as e:
+            logger.warning(f"讀取群組活動流失敗: {team_id}, {str(e)}")
+            return None
+        self._stats['reads'] += 1
+        activities = [dict(self._decode(fields), stream_id=entry_id) for entry_id, fields in entries[:size]]
+        return activities, len(entries) > size
+
+    # ==================== 归档 ====================
+
+    def archive(self, writer: ArchiveWriter) -> Dict[str, int]:
+        """按批取出归档流写入数据库，写库成功后删除；失败的批次留在流中等待下一轮"""
+        result = {'archived': 0, 'batches': 0}
+        conn = self.redis.redis_client
+        if conn is None:
+            return result
+
+        for _ in range(CacheConfig.TEAM_ACTIVITY_ARCHIVE_MAX_BATCHES):
+            entries = conn.xrange(self.ARCHIVE_KEY, min='-', max='+', count=CacheConfig.TEAM_ACTIVITY_ARCHIVE_BATCH)
+            if not entries:
+                break
+            write_result, flag = writer([self._decode(fields) for _, fields in entries])
+            if not flag:
+                logger.error(f"歸檔群組活動失敗，保留 {len(entries)} 條待下一輪: {write_result}")
+                break
+            conn.xdel(self.ARCHIVE_KEY, *[entry_id for entry_id, _ in entries])
+            result['archived'] += len(entries)
+            result['batches'] += 1
+            if len(entries) < CacheConfig.TEAM_ACTIVITY_ARCHIVE_BATCH:
+                break
+
+        self._stats['archived'] += result['archived']
+        return result
+
+    # ==================== 编解码 ====================
+
+    def _encode(self, activity: Dict[str, Any]) -> Dict[str, str]:
+        fields = {field: "" if activity.get(field) is None else str(activity[field]) for field in self.FIELDS}
+        fields['metadata'] = json.dumps(activity.get('metadata'), ensure_ascii=False, default=str)
+        fields['created_at'] = activity['created_at'].isoformat()
+        return fields
+
+    @staticmethod
+    def _decode(fields: Dict[str, str]) -> Dict[str, Any]:
+        activity = dict(fields)
+        activity['metadata'] = json.loads(fields.get('metadata') or 'null')
+        activity['created_at'] = datetime.fromisoformat(fields['created_at'])
+        return activity
+
+    def get_stats(self) -> Dict[str, int]:
+        return dict(self._stats)
+
+
+# 创建全局群组活动流实例
+activity_feed = TeamActivityFeed()
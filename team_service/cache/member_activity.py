@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+@文件: member_activity.py
+@說明: 成员活跃时间缓冲 - 活跃时间先写入Redis Hash，周期任务批量落库
+@時間: 2025-01-09
+@作者: LiDong
+"""
+
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from cache import redis_client
+from cache.cache_engine import LocalLRUCache, MISSING
+from configs.cache_config import CacheConfig
+from loggers import logger
+
+
+# 落库函数 writer([(群组ID, 用户ID, 活跃时间)]) -> (结果, 是否成功)
+ActivityWriter = Callable[[List[Tuple[str, str, datetime]]], Tuple[object, bool]]
+
+
+class MemberActivityBuffer:
+    """
+    成员活跃时间缓冲
+
+    活跃时间以 {群组ID}:{用户ID} -> 时间戳 写入一个Redis Hash，同一成员的多次活跃只保留最新值；
+    进程内对同一成员在 MEMBER_ACTIVITY_TOUCH_RESOLUTION 秒内只写一次Redis。
+    周期任务在一个事务中取出并清空Hash，按批UPDATE落库，因此每个成员每个周期最多写库一次；
+    落库失败的条目以HSETNX写回，不覆盖期间产生的更新值。
+    读取 last_active_at 时与缓冲中尚未落库的值合并，取较新者。
+    """
+
+    PENDING_KEY = "team:member_active:pending"
+
+    def __init__(self):
+        self.redis = redis_client
+        self._recent = LocalLRUCache(CacheConfig.MEMBER_ACTIVITY_LOCAL_SIZE)
+        self._stats = {'touched': 0, 'throttled': 0, 'flushed': 0, 'flush_failed': 0}
+
+    @staticmethod
+    def field(team_id: str, user_id: str) -> str:
+        return f"{team_id}:{user_id}"
+
+    # ==================== 写入 ====================
+
+    def touch(self, team_id: str, user_id: str) -> bool:
+        """记录成员活跃；Redis不可用时丢弃本次记录 (活跃时间允许少量丢失)"""
+        field = self.field(team_id, user_id)
+        if self._recent.get(field) is not MISSING:
+            self._stats['throttled'] += 1
+            return True
+
+        conn = self.redis.redis_client
+        if conn is None:
+            return False
+        try:
+            conn.hset(self.PENDING_KEY, field, int(time.time()))
+            self._recent.set(field, True, CacheConfig.MEMBER_ACTIVITY_TOUCH_RESOLUTION)
+            self._stats['touched'] += 1
+            return True
+        except Exception as e:
+            logger.warning(f"記錄成員活躍時間失敗: {field}, {str(e)}")
+            return False
+
+    # ==================== 读取 ====================
+
+    def get_many(self, team_id: str, user_ids: List[str]) -> Dict[str, datetime]:
+        """读取缓冲中尚未落库的活跃时间 (单次HMGET)"""
+        conn = self.redis.redis_client
+        if conn is None or not user_ids:
+            return {}
+        try:
+            values = conn.hmget(self.PENDING_KEY, [self.field(team_id, user_id) for user_id in user_ids])
+        except Exception as e:
+            logger.warning(f"讀取成員活躍時間緩衝失敗: {str(e)}")
+            return {}
+        return {
+            user_id: datetime.fromtimestamp(int(value))
+            for user_id, value in zip(user_ids, values) if value
+        }
+
+    @staticmethod
+    def merge(stored: Optional[datetime], buffered: Optional[datetime]) -> Optional[datetime]:
+        """数据库值与缓冲值取较新者"""
+        if stored is None or buffered is None:
+            return stored or buffered
+        return max(stored, buffered)
+
+    # ==================== 落库 ====================
+
+    def flush(self, writer: ActivityWriter) -> Dict[str, int]:
+        """取出并清空缓冲，按批调用writer落库；失败的批次写回缓冲等待下一周期"""
+        result = {'members': 0, 'batches': 0, 'requeued': 0}
+        conn = self.redis.redis_client
+        if conn is None:
+            return result
+
+        pipeline = conn.pipeline(transaction=True)
+        pipeline.hgetall(self.PENDING_KEY)
+        pipeline.delete(self.PENDING_KEY)
+        pending = pipeline.execute()[0]
+        if not pending:
+            return result
+
+        entries = []
+        for field, value in pending.items():
+            team_id, _, user_id = field.partition(':')
+            entries.append((team_id, user_id, datetime.fromtimestamp(int(value))))
+
+        batch_size = CacheConfig.MEMBER_ACTIVITY_FLUSH_BATCH
+        for start in range(0, len(entries), batch_size):
+            batch = entries[start:start + batch_size]
+            write_result, flag = writer(batch)
+            if flag:
+                result['batches'] += 1
+                result['members'] += len(batch)
+                continue
+            logger.error(f"成員活躍時間落庫失敗，寫回緩衝 {len(entries) - start} 條: {write_result}")
+            self._requeue(conn, entries[start:], pending)
+            result['requeued'] = len(entries) - start
+            break
+
+        self._stats['flushed'] += result['members']
+        self._stats['flush_failed'] += result['requeued']
+        return result
+
+    def _requeue(self, conn, entries: List[Tuple[str, str, datetime]], pending: Dict[str, str]) -> None:
+        try:
+            pipeline = conn.pipeline(transaction=False)
+            for team_id, user_id, _ in entries:
+                field = self.field(team_id, user_id)
+                pipeline.hsetnx(self.PENDING_KEY, field, pending[field])
+            pipeline.execute()
+        except Exception as e:
+            logger.warning(f"寫回成員活躍時間緩衝失敗: {str(e)}")
+
+    def get_stats(self) -> Dict[str, int]:
+        return dict(self._stats)
+
+
+# 创建全局成员活跃时间缓冲实例
+member_activity = MemberActivityBuffer()
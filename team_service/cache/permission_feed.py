@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+@文件: permission_feed.py
+@說明: 权限变更流 - 团队/项目成员变更写入Redis Stream，权限服务以消费组增量消费
+@時間: 2025-01-09
+@作者: LiDong
+"""
+
+import os
+import socket
+from typing import Any, Dict, List, Optional, Tuple
+
+from cache import redis_client
+from configs.cache_config import CacheConfig
+from loggers import logger
+
+
+class PermissionChangeFeed:
+    """
+    权限变更流
+
+    事件字段与权限服务 /internal/permissions/notify-change 接口一致：
+    event_type、user_id、resource_type、resource_id、old_role、new_role(为空表示移除)、changed_by。
+    生产方在业务事务提交后调用 publish；流按近似长度裁剪。
+    消费方使用消费组，每条事件只由一个worker处理，处理成功后ACK；
+    worker异常退出时未ACK的事件超过空闲时间后由其他worker认领重试。
+    """
+
+    STREAM_KEY = CacheConfig.PERMISSION_CHANGE_STREAM
+    FIELDS = ('event_type', 'user_id', 'resource_type', 'resource_id', 'old_role', 'new_role', 'changed_by')
+
+    def __init__(self):
+        self.redis = redis_client
+        self.consumer_name = f"{socket.gethostname()}:{os.getpid()}"
+        self._group_ready = False
+
+    # ==================== 生产 ====================
+
+    def publish(self, events: List[Dict[str, Any]]) -> int:
+        """写入变更事件，返回写入条数；Redis不可用时返回0，由权限上下文TTL兜底"""
+        conn = self.redis.redis_client
+        if conn is None or not events:
+            return 0
+        try:
+            pipeline = conn.pipeline(transaction=False)
+            for event in events:
+                pipeline.xadd(
+                    self.STREAM_KEY,
+                    {field: "" if event.get(field) is None else str(event[field]) for field in self.FIELDS},
+                    maxlen=CacheConfig.PERMISSION_CHANGE_STREAM_MAXLEN,
+                    approximate=True
+                )
+            pipeline.execute()
+            return len(events)
+        except Exception as e:
+            logger.error(f"寫入權限變更流失敗: {str(e)}")
+            return 0
+
+    # ==================== 消费 ====================
+
+    def read(self, group: str, count: int, block_ms: int) -> List[Tuple[str, Dict[str, Optional[str]]]]:
+        """
+        读取本消费者的新事件，先认领其他消费者长时间未ACK的事件
+        :return: [(事件ID, 事件)]
+        """
+        conn = self.redis.redis_client
+        if conn is None or not self._ensure_group(conn, group):
+            return []
+
+        entries = self._claim_stale(conn, group, count)
+        if not entries:
+            response = conn.xreadgroup(group, self.consumer_name, {self.STREAM_KEY: '>'},
+                                       count=count, block=block_ms)
+            entries = response[0][1] if response else []
+        return [(entry_id, self._decode(fields)) for entry_id, fields in entries if fields]
+
+    def ack(self, group: str, entry_ids: List[str]) -> int:
+        conn = self.redis.redis_client
+        if conn is None or not entry_ids:
+            return 0
+        return conn.xack(self.STREAM_KEY, group, *entry_ids)
+
+    def _ensure_group(self, conn, group: str) -> bool:
+        if self._group_ready:
+            return True
+        try:
+            # 从流的当前末尾开始消费；组已存在时返回BUSYGROUP
+            conn.xgroup_create(self.STREAM_KEY, group, id='$', mkstream=True)
+        except Exception as e:
+            if 'BUSYGROUP' not in str(e):
+                logger.error(f"創建權限變更消費組失敗: {str(e)}")
+                return False
+        self._group_ready = True
+        return True
+
+    def _claim_stale(self, conn, group: str, count: int) -> List:
+        try:
+            response = conn.xautoclaim(self.STREAM_KEY, group, self.consumer_name,
+                                       CacheConfig.PERMISSION_CHANGE_CLAIM_IDLE_MS, start_id='0-0', count=count)
+            return response[1] if response else []
+        except Exception as e:
+            # Redis 6.2 以下不支持 XAUTOCLAIM，未ACK的事件只能等待原消费者恢复
+            logger.debug(f"認領權限變更事件失敗: {str(e)}")
+            return []
+
+    def _decode(self, fields: Dict[str, str]) -> Dict[str, Optional[str]]:
+        return {field: fields.get(field) or None for field in self.FIELDS}
+
+
+# 创建全局权限变更流实例
+permission_feed = PermissionChangeFeed()
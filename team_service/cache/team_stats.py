@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+"""
+@文件: team_stats.py
+@說明: 群组物化统计 - 每个群组一个Redis Hash，成员变更后增量更新，周期对账修正漂移
+@時間: 2025-01-09
+@作者: LiDong
+"""
+
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from cache import redis_client
+from configs.cache_config import CacheConfig
+from loggers import logger
+
+
+# Hash存在时才增量更新；不存在时由下次读取回源重建，避免只含增量的残缺统计。
+# ARGV[1] 为变更的提交时间(毫秒)，不晚于Hash重建时的聚合时间时，聚合结果已包含该变更，不再重复累加
+_APPLY_DELTAS_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+local built_at = redis.call('HGET', KEYS[1], 'built_at')
+if built_at and tonumber(built_at) >= tonumber(ARGV[1]) then
+    return 0
+end
+for i = 2, #ARGV, 2 do
+    redis.call('HINCRBY', KEYS[1], ARGV[i], ARGV[i + 1])
+end
+return 1
+"""
+
+# loader(team_ids) -> {team_id: {'role_distribution': {角色: 数量}, 'recent_activities': 数量}}
+StatsLoader = Callable[[List[str]], Dict[str, Dict[str, Any]]]
+
+
+class TeamStatsStore:
+    """
+    群组物化统计
+
+    Hash字段: role:<角色> 为各角色成员数，recent_activities 为近期活动数；成员总数由角色数相加得出。
+    成员加入、移除、升降级在事务提交后按权限变更事件计算增量，以脚本原子地 HINCRBY。
+    回源或对账重建时以 built_at 记录聚合开始时间，提交时间不晚于它的增量已含在聚合结果中，脚本跳过。
+    近期活动数是滑动窗口，不做增量维护，由回源和周期对账按窗口重新统计。
+    已物化的群组ID记录在索引集合中，对账任务按批重新聚合并覆盖与数据库不一致的Hash。
+    """
+
+    KEY_PREFIX = "team:stats:"
+    INDEX_KEY = "team:stats:index"
+    ROLE_FIELD_PREFIX = "role:"
+    BUILT_AT_FIELD = "built_at"
+
+    def __init__(self):
+        self.redis = redis_client
+        self._script = None
+        self._stats = {'hit': 0, 'miss': 0, 'deltas_applied': 0, 'reconcile_runs': 0, 'last_reconcile': None}
+
+    def key(self, team_id: str) -> str:
+        return f"{self.KEY_PREFIX}{team_id}"
+
+    # ==================== 读取 ====================
+
+    def get(self, team_id: str, loader: StatsLoader) -> Optional[Dict[str, Any]]:
+        """
+        读取群组统计，未物化时回源聚合并写入
+        :return: {'members_count', 'role_distribution', 'recent_activities'}，群组不存在时返回None
+        """
+        return self.get_many([team_id], loader).get(team_id)
+
+    def get_many(self, team_ids: List[str], loader: StatsLoader) -> Dict[str, Dict[str, Any]]:
+        """批量读取 (单次pipeline)，未物化的群组一次回源聚合后写入；不存在的群组不返回"""
+        result: Dict[str, Dict[str, Any]] = {}
+        misses = list(team_ids)
+        conn = self.redis.redis_client
+        if conn is not None and misses:
+            try:
+                pipeline = conn.pipeline(transaction=False)
+                for team_id in team_ids:
+                    pipeline.hgetall(self.key(team_id))
+                misses = []
+                for team_id, raw in zip(team_ids, pipeline.execute()):
+                    if raw:
+                        result[team_id] = self._decode(raw)
+                    else:
+                        misses.append(team_id)
+            except Exception as e:
+                logger.warning(f"讀取群組統計失敗: {str(e)}")
+                conn = None
+                misses = list(team_ids)
+
+        self._stats['hit'] += len(result)
+        self._stats['miss'] += len(misses)
+        if not misses:
+            return result
+
+        built_at = self._now_ms()
+        loaded = {team_id: self._encode(stats) for team_id, stats in loader(misses).items()}
+        if conn is not None and loaded:
+            try:
+                pipeline = conn.pipeline(transaction=False)
+                for team_id, encoded in loaded.items():
+                    self._store(pipeline, team_id, encoded, CacheConfig.TEAM_STATS_TTL, built_at)
+                pipeline.execute()
+            except Exception as e:
+                logger.warning(f"寫入群組統計失敗: {str(e)}")
+        for team_id, encoded in loaded.items():
+            result[team_id] = self._decode(encoded)
+        return result
+
+    # ==================== 增量更新 ====================
+
+    def apply_member_changes(self, events: Iterable[Dict[str, Any]], committed_at: int = None) -> int:
+        """
+        按成员角色变更事件增量更新 (事务提交后调用)，返回更新的群组数
+        old_role 为空表示加入，new_role 为空表示移除
+        :param committed_at: 变更提交前取得的时间(毫秒)，用于跳过已含在重建结果中的增量
+        """
+        deltas: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        for event in events:
+            if event.get('resource_type') != 'team':
+                continue
+            team_deltas = deltas[event['resource_id']]
+            if event.get('old_role'):
+                team_deltas[f"{self.ROLE_FIELD_PREFIX}{event['old_role']}"] -= 1
+            if event.get('new_role'):
+                team_deltas[f"{self.ROLE_FIELD_PREFIX}{event['new_role']}"] += 1
+
+        conn = self.redis.redis_client
+        if conn is None or not deltas:
+            return 0
+        try:
+            committed_at = committed_at or self._now_ms()
+            script = self._get_script(conn)
+            pipeline = conn.pipeline(transaction=False)
+            for team_id, team_deltas in deltas.items():
+                args = [committed_at]
+                for field, delta in team_deltas.items():
+                    if delta:
+                        args.extend([field, delta])
+                if len(args) > 1:
+                    script(keys=[self.key(team_id)], args=args, client=pipeline)
+            applied = sum(1 for result in pipeline.execute() if result)
+            self._stats['deltas_applied'] += applied
+            return applied
+        except Exception as e:
+            # 增量丢失时统计与数据库产生偏差，由周期对账修正
+            logger.warning(f"增量更新群組統計失敗: {str(e)}")
+            return 0
+
+    def delete(self, team_id: str) -> bool:
+        """删除群组统计 (群组删除后调用)"""
+        conn = self.redis.redis_client
+        if conn is None:
+            return False
+        try:
+            pipeline = conn.pipeline(transaction=False)
+            pipeline.delete(self.key(team_id))
+            pipeline.srem(self.INDEX_KEY, team_id)
+            pipeline.execute()
+            return True
+        except Exception as e:
+            logger.warning(f"刪除群組統計失敗: {team_id}, {str(e)}")
+            return False
+
+    # ==================== 对账 ====================
+
+    def reconcile(self, loader: StatsLoader) -> Dict[str, Any]:
+        """
+        遍历已物化的群组，按批重新聚合并覆盖与数据库不一致的统计
+        已过期的Hash只从索引移除，不重建；对账沿用Hash剩余的TTL，不延长不活跃群组的缓存时间
+        """
+        started = time.monotonic()
+        result = {'checked': 0, 'repaired': 0, 'removed': 0}
+        conn = self.redis.redis_client
+        if conn is None:
+            return result
+
+        batch: List[str] = []
+        for team_id in conn.sscan_iter(self.INDEX_KEY, count=CacheConfig.TEAM_STATS_RECONCILE_BATCH):
+            batch.append(team_id)
+            if len(batch) >= CacheConfig.TEAM_STATS_RECONCILE_BATCH:
+                self._reconcile_batch(conn, batch, loader, result)
+                batch = []
+        if batch:
+            self._reconcile_batch(conn, batch, loader, result)
+
+        result['duration_seconds'] = round(time.monotonic() - started, 3)
+        self._stats['reconcile_runs'] += 1
+        self._stats['last_reconcile'] = result
+        return result
+
+    def _reconcile_batch(self, conn, team_ids: List[str], loader: StatsLoader, result: Dict[str, Any]):
+        pipeline = conn.pipeline(transaction=False)
+        for team_id in team_ids:
+            pipeline.hgetall(self.key(team_id))
+            pipeline.ttl(self.key(team_id))
+        replies = pipeline.execute()
+        current = {
+            team_id: (raw, ttl)
+            for team_id, raw, ttl in zip(team_ids, replies[0::2], replies[1::2])
+        }
+
+        expired = {team_id for team_id, (raw, _) in current.items() if not raw}
+        live = [team_id for team_id in team_ids if team_id not in expired]
+        built_at = self._now_ms()
+        fresh = loader(live) if live else {}
+
+        pipeline = conn.pipeline(transaction=False)
+        for team_id in expired:
+            pipeline.srem(self.INDEX_KEY, team_id)
+        for team_id in live:
+            if team_id not in fresh:
+                # 群组已删除
+                pipeline.delete(self.key(team_id))
+                pipeline.srem(self.INDEX_KEY, team_id)
+                result['removed'] += 1
+                continue
+            raw, ttl = current[team_id]
+            encoded = self._encode(fresh[team_id])
+            if self._nonzero(raw) != self._nonzero(encoded):
+                # 聚合与覆盖之间的增量会被覆盖掉，下一轮对账修正
+                self._store(pipeline, team_id, encoded, ttl if ttl and ttl > 0 else CacheConfig.TEAM_STATS_TTL,
+                            built_at)
+                result['repaired'] += 1
+        pipeline.execute()
+        result['checked'] += len(team_ids)
+        result['removed'] += len(expired)
+
+    # ==================== 编解码 ====================
+
+    def _store(self, pipeline, team_id: str, encoded: Dict[str, int], ttl: int, built_at: int):
+        key = self.key(team_id)
+        pipeline.delete(key)
+        pipeline.hset(key, mapping=dict(encoded, **{self.BUILT_AT_FIELD: built_at}))
+        pipeline.expire(key, ttl)
+        pipeline.sadd(self.INDEX_KEY, team_id)
+
+    def _encode(self, stats: Dict[str, Any]) -> Dict[str, int]:
+        encoded = {'recent_activities': int(stats.get('recent_activities') or 0)}
+        for role, count in (stats.get('role_distribution') or {}).items():
+            encoded[f"{self.ROLE_FIELD_PREFIX}{role}"] = int(count)
+        return encoded
+
+    def _nonzero(self, fields: Dict[str, Any]) -> Dict[str, int]:
+        """比较用：减到0的角色字段与不存在等价，重建时间不参与比较"""
+        return {field: int(value) for field, value in fields.items()
+                if field != self.BUILT_AT_FIELD and int(value)}
+
+    @staticmethod
+    def _now_ms() -> int:
+        return int(time.time() * 1000)
+
+    def _decode(self, raw: Dict[str, Any]) -> Dict[str, Any]:
+        role_distribution = {}
+        for field, value in raw.items():
+            if field.startswith(self.ROLE_FIELD_PREFIX) and int(value) > 0:
+                role_distribution[field[len(self.ROLE_FIELD_PREFIX):]] = int(value)
+        return {
+            'members_count': sum(role_distribution.values()),
+            'role_distribution': role_distribution,
+            'recent_activities': max(int(raw.get('recent_activities') or 0), 0)
+        }
+
+    def _get_script(self, conn):
+        if self._script is None:
+            self._script = conn.register_script(_APPLY_DELTAS_SCRIPT)
+        return self._script
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self._stats['hit'] + self._stats['miss']
+        return dict(self._stats, hit_rate=round(self._stats['hit'] / lookups, 4) if lookups else 0)
+
+
+# 创建全局群组统计实例
+team_stats = TeamStatsStore()
@@ -5,6 +5,8 @@
 @時間: 2025-01-09
 @作者: LiDong
 """
+import base64
+import json
 import re
 import time
 import traceback
@@ -260,6 +262,22 @@ class CommonTools:
         except (ValueError, TypeError):
             return default
 
+    @staticmethod
+    def encode_cursor(sort_value, row_id):
+        """编码游标分页位置 (排序时间, 主键)"""
+        payload = json.dumps([sort_value.isoformat() if sort_value else None, str(row_id)])
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    @staticmethod
+    def decode_cursor(cursor):
+        """解码游标分页位置，格式错误返回None"""
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+            return datetime.fromisoformat(sort_value), str(row_id)
+        except Exception:
+            return None
+
     @staticmethod
     def safe_float(value, default=0.0):
         """安全的浮点数转换"""
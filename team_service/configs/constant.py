@@ -64,6 +64,15 @@ class Config:
     # 缓存配置
     CACHE_DEFAULT_TIMEOUT = int(os.getenv("CACHE_DEFAULT_TIMEOUT", 300))  # 5分钟
     CACHE_KEY_PREFIX = os.getenv("CACHE_KEY_PREFIX", "api_gateway:")
+    
+    # 批量成员操作配置
+    BULK_MEMBER_MAX_USERS = int(os.getenv("BULK_MEMBER_MAX_USERS", 500))  # 单次批量操作的用户数上限
+
+    # 过期申请/邀请清理配置
+    EXPIRED_CLEANUP_INTERVAL_SECONDS = int(os.getenv("EXPIRED_CLEANUP_INTERVAL_SECONDS", 300))  # 清理间隔(秒)
+    EXPIRED_CLEANUP_BATCH_SIZE = int(os.getenv("EXPIRED_CLEANUP_BATCH_SIZE", 1000))             # 每条UPDATE的行数上限
+    EXPIRED_CLEANUP_MAX_BATCHES = int(os.getenv("EXPIRED_CLEANUP_MAX_BATCHES", 100))            # 每轮每张表的批次上限
+    EXPIRED_CLEANUP_PAUSE_MS = int(os.getenv("EXPIRED_CLEANUP_PAUSE_MS", 50))                   # 批次之间的停顿(毫秒)
 
 
 # 角色权限配置
@@ -7,6 +7,7 @@
 """
 
 import secrets
+import time
 import uuid
 import traceback
 from datetime import datetime, timedelta
@@ -23,10 +24,25 @@ from team_service.models.team_model import (
     OperTeamModel, OperTeamMemberModel, OperTeamJoinRequestModel,
     OperTeamInvitationModel, OperTeamActivityModel
 )
+from configs.cache_config import CacheConfig
 from configs.constant import Config
 from loggers import logger
 from cache import redis_client
 from cache.token_cache import token_cache
+from cache.permission_feed import permission_feed
+from cache.team_stats import team_stats
+from cache.member_activity import member_activity
+from cache.activity_feed import activity_feed
+
+
+def _page_args(page: int, size: int) -> Tuple[int, int]:
+    """页码不小于1，每页条数限制在 1..MAX_PAGE_SIZE，避免负OFFSET与空页取末项"""
+    return max(page, 1), min(max(size, 1), Config.MAX_PAGE_SIZE)
+
+
+def _through_second(created_at):
+    """活动游标：包含 created_at 这一秒内的全部活动 (活动时间为秒精度)"""
+    return created_at.replace(microsecond=0) + timedelta(seconds=1), ''
 
 
 class TeamController:
@@ -61,24 +77,61 @@ class TeamController:
     
     # ==================== 事务管理 ====================
     
-    def _execute_with_transaction(self, operation, operation_name):
-        """在事务中执行操作"""
+    def _execute_with_transaction(self, operation, operation_name, permission_changes=None):
+        """
+        在事务中执行操作
+        :param permission_changes: 操作过程中追加的成员角色变更，提交成功后写入权限变更流
+        """
         try:
             result = operation()
-            commit_result, commit_flag = DBFunction.do_commit(operation_name)
+            # 提交前取时间：统计Hash在此之后重建时已包含本次变更，增量不再重复累加
+            committed_at = int(time.time() * 1000)
+            commit_result, commit_flag = DBFunction.do_commit(result, True)
             if not commit_flag:
-                return commit_result, False
+                self.oper_activity.take_pending_activities()
+                logger.error(f"{operation_name}提交失败: {commit_result}")
+                return f"{operation_name}失败", False
+            self._publish_activities(self.oper_activity.take_pending_activities())
+            if permission_changes:
+                token_cache.invalidate_user_teams([change['user_id'] for change in permission_changes])
+                team_stats.apply_member_changes(permission_changes, committed_at)
+                permission_feed.publish(permission_changes)
             return result, True
         except Exception as e:
-            rollback_result, rollback_flag = DBFunction.do_rollback(f"{operation_name}回滚")
+            self.oper_activity.take_pending_activities()
+            DBFunction.db_rollback()
             logger.error(f"{operation_name}异常: {str(e)}")
             return f"{operation_name}失败", False
     
+    def _publish_activities(self, activities):
+        """提交后写入活动流；Redis不可用时直接落库"""
+        if not activities or activity_feed.append(activities):
+            return
+        result, flag = self.oper_activity.bulk_insert_activities(activities)
+        result, flag = DBFunction.do_commit(result, flag)
+        if not flag:
+            logger.error(f"群组活动落库失败，丢弃 {len(activities)} 条: {result}")
+    
+    @staticmethod
+    def _member_change(team_id, user_id, old_role, new_role, changed_by):
+        """构造成员角色变更事件，new_role 为空表示移出群组"""
+        return {
+            'event_type': 'team_member_changed',
+            'user_id': user_id,
+            'resource_type': 'team',
+            'resource_id': team_id,
+            'old_role': old_role,
+            'new_role': new_role,
+            'changed_by': changed_by
+        }
+    
     # ==================== 群組管理 ====================
     
     def create_team(self, user_id: str, team_data: Dict[str, Any]) -> Tuple[Any, bool]:
         """创建群组"""
         try:
+            permission_changes = []
+            
             def _create_team_transaction():
                 # 创建群组
                 team = TeamModel(
@@ -110,6 +163,7 @@ class TeamController:
                 member_result, member_flag = self.oper_member.add_member(member)
                 if not member_flag:
                     raise Exception(f"添加群组所有者失败: {member_result}")
+                permission_changes.append(self._member_change(team.id, user_id, None, 'owner', user_id))
                 
                 # 记录活动
                 activity_result, activity_flag = self.oper_activity.record_team_creation(
@@ -128,7 +182,7 @@ class TeamController:
                     'your_role': 'owner'
                 }
             
-            return self._execute_with_transaction(_create_team_transaction, "创建群组")
+            return self._execute_with_transaction(_create_team_transaction, "创建群组", permission_changes)
             
         except Exception as e:
             logger.error(f"创建群组异常: {str(e)}")
@@ -142,12 +196,15 @@ class TeamController:
                 return "群组不存在", False
             
             # 检查用户是否有权限查看群组
-            member = self.oper_member.get_by_team_and_user(team_id, user_id)
+            member = self._get_membership(team_id, user_id)
             if not member and team.visibility == 'private':
                 return "没有权限查看该群组", False
+            if member:
+                member_activity.touch(team_id, user_id)
             
-            # 获取成员统计
-            stats = self.oper_team.get_team_statistics(team_id)
+            # 获取成员统计 (物化统计，未物化时回源聚合一次)
+            stats = team_stats.get(team_id, self._aggregate_team_statistics) or {}
+            stats.update({'max_members': team.max_members, 'created_at': team.created_at})
             
             team_detail = {
                 'team_id': team.id,
@@ -164,7 +221,7 @@ class TeamController:
                 'created_by': team.created_by,
                 'created_at': team.created_at.isoformat() if team.created_at else None,
                 'statistics': stats,
-                'your_role': member.role if member else None,
+                'your_role': member['role'] if member else None,
                 'is_member': member is not None
             }
             
@@ -174,6 +231,14 @@ class TeamController:
             logger.error(f"获取群组详情异常: {str(e)}")
             return "获取群组详情失败", False
     
+    def _get_membership(self, team_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+        """
+        访问私有群组的授权检查：直接按 (team_id, user_id) 唯一索引查询成员行
+        用户群组列表缓存的回填没有版本保护，移除成员后可能短暂写回旧列表，不用于授权
+        """
+        member = self.oper_member.get_by_team_and_user(team_id, user_id)
+        return {'team_id': team_id, 'role': member.role} if member else None
+    
     def update_team(self, team_id: str, user_id: str, update_data: Dict[str, Any]) -> Tuple[Any, bool]:
         """更新群组信息"""
         try:
@@ -214,7 +279,11 @@ class TeamController:
                     'message': '群组信息更新成功'
                 }
             
-            return self._execute_with_transaction(_update_team_transaction, "更新群组信息")
+            result, flag = self._execute_with_transaction(_update_team_transaction, "更新群组信息")
+            if flag and result.get('updated_fields'):
+                # 成员的群组列表中带有群组名称和可见性
+                token_cache.invalidate_user_teams(team_id=team_id)
+            return result, flag
             
         except Exception as e:
             logger.error(f"更新群组信息异常: {str(e)}")
@@ -231,6 +300,12 @@ class TeamController:
             if not team:
                 return "群组不存在", False
             
+            # 级联删除前记录成员，提交后通知权限服务移除对应团队角色
+            permission_changes = [
+                self._member_change(team_id, member_user_id, role, None, user_id)
+                for member_user_id, role in self.oper_member.get_member_roles(team_id)
+            ]
+            
             def _delete_team_transaction():
                 # 删除群组（级联删除会自动删除相关记录）
                 delete_result, delete_flag = self.oper_team.delete_team(team)
@@ -243,7 +318,11 @@ class TeamController:
                     'message': '群组删除成功'
                 }
             
-            return self._execute_with_transaction(_delete_team_transaction, "删除群组")
+            result, flag = self._execute_with_transaction(_delete_team_transaction, "删除群组", permission_changes)
+            if flag:
+                team_stats.delete(team_id)
+                activity_feed.delete(team_id)
+            return result, flag
             
         except Exception as e:
             logger.error(f"删除群组异常: {str(e)}")
@@ -262,6 +341,10 @@ class TeamController:
                 return "新所有者必须是群组成员", False
             
             current_owner_member = self.oper_member.get_by_team_and_user(team_id, current_owner_id)
+            permission_changes = [
+                self._member_change(team_id, new_owner_id, new_owner_member.role, 'owner', current_owner_id),
+                self._member_change(team_id, current_owner_id, 'owner', 'admin', current_owner_id)
+            ]
             
             def _transfer_ownership_transaction():
                 # 将新所有者设为owner
@@ -288,46 +371,184 @@ class TeamController:
                     'message': '群组所有权转让成功'
                 }
             
-            return self._execute_with_transaction(_transfer_ownership_transaction, "转让群组所有权")
+            return self._execute_with_transaction(_transfer_ownership_transaction, "转让群组所有权",
+                                                  permission_changes)
             
         except Exception as e:
             logger.error(f"转让群组所有权异常: {str(e)}")
             return "转让群组所有权失败", False
     
+    def list_public_teams(self, page: int = 1, size: int = 20, search: str = None,
+                          cursor: str = None, include_total: str = 'approx') -> Tuple[Any, bool]:
+        """获取公开群组列表，按 (created_at, id) 游标分页，成员数取自物化统计"""
+        try:
+            page, size = _page_args(page, size)
+            after = None
+            if cursor:
+                after = CommonTools.decode_cursor(cursor)
+                if not after:
+                    return "无效的分页游标", False
+            
+            teams, has_more = self.oper_team.get_public_teams(size, after=after, offset=(page - 1) * size, search=search)
+            stats = team_stats.get_many([team.id for team in teams], self._aggregate_team_statistics)
+            teams_data = [
+                dict(self._team_summary(team), member_count=stats.get(team.id, {}).get('members_count', 0))
+                for team in teams
+            ]
+            
+            total, total_is_approximate = self._list_total(
+                include_total, 'public_teams', {'search': search},
+                lambda: self.oper_team.count_public_teams(search)
+            )
+            return self._page_result(
+                'teams', teams_data, page, size, cursor, has_more,
+                CommonTools.encode_cursor(teams[-1].created_at, teams[-1].id) if has_more else None,
+                total, total_is_approximate
+            ), True
+            
+        except Exception as e:
+            logger.error(f"获取公开群组列表异常: {str(e)}")
+            return "获取公开群组列表失败", False
+    
+    def list_user_teams(self, user_id: str, page: int = 1, size: int = 20, visibility: str = None,
+                        cursor: str = None, include_total: str = 'approx') -> Tuple[Any, bool]:
+        """获取用户所在的群组列表，按加入时间游标分页，角色随列表一次查出"""
+        try:
+            page, size = _page_args(page, size)
+            after = None
+            if cursor:
+                after = CommonTools.decode_cursor(cursor)
+                if not after:
+                    return "无效的分页游标", False
+            
+            rows, has_more = self.oper_team.get_teams_by_user(
+                user_id, size, after=after, offset=(page - 1) * size, visibility=visibility
+            )
+            stats = team_stats.get_many([team.id for team, _, _, _ in rows], self._aggregate_team_statistics)
+            teams_data = [
+                dict(self._team_summary(team), member_count=stats.get(team.id, {}).get('members_count', 0),
+                     your_role=role)
+                for team, role, _, _ in rows
+            ]
+            
+            total, total_is_approximate = self._list_total(
+                include_total, 'user_teams', {'user_id': user_id, 'visibility': visibility},
+                lambda: self.oper_team.count_teams_by_user(user_id, visibility)
+            )
+            next_cursor = None
+            if has_more:
+                _, _, joined_at, member_id = rows[-1]
+                next_cursor = CommonTools.encode_cursor(joined_at, member_id)
+            return self._page_result(
+                'teams', teams_data, page, size, cursor, has_more, next_cursor, total, total_is_approximate
+            ), True
+            
+        except Exception as e:
+            logger.error(f"获取用户群组列表异常: {str(e)}")
+            return "获取群组列表失败", False
+    
+    @staticmethod
+    def _team_summary(team) -> Dict[str, Any]:
+        return {
+            'team_id': team.id,
+            'name': team.name,
+            'description': team.description,
+            'avatar_url': team.avatar_url,
+            'visibility': team.visibility,
+            'created_at': team.created_at.isoformat() if team.created_at else None
+        }
+    
+    # ==================== 分页 ====================
+    
+    @staticmethod
+    def _list_total(include_total: str, list_name: str, params: Dict[str, Any], counter) -> Tuple[Optional[int], bool]:
+        """
+        列表总数：exact 实时COUNT，approx 短TTL缓存的COUNT，none 不统计
+        :return: (总数, 是否为近似值)
+        """
+        if include_total == 'exact':
+            return counter(), False
+        if include_total == 'approx':
+            return token_cache.get_cached_list_count(list_name, params, counter), True
+        return None, False
+    
+    @staticmethod
+    def _page_result(key: str, items: List[Dict[str, Any]], page: int, size: int, cursor: Optional[str],
+                     has_more: bool, next_cursor: Optional[str], total: Optional[int],
+                     total_is_approximate: bool) -> Dict[str, Any]:
+        """构建分页结果"""
+        return {
+            key: items,
+            'total': total,
+            'total_is_approximate': total_is_approximate,
+            # 使用游标时页码无意义
+            'page': None if cursor else page,
+            'size': size,
+            'pages': (total + size - 1) // size if total is not None else None,
+            'next_cursor': next_cursor,
+            'has_more': has_more
+        }
+    
     # ==================== 成员管理 ====================
     
-    def get_team_members(self, team_id: str, user_id: str, page: int = 1, size: int = 20, role: str = None) -> Tuple[Any, bool]:
-        """获取群组成员列表"""
+    def get_team_members(self, team_id: str, user_id: str, page: int = 1, size: int = 20, role: str = None,
+                         cursor: str = None, include_total: str = 'approx') -> Tuple[Any, bool]:
+        """
+        获取群组成员列表
+        按 (joined_at, id) 游标分页；近似总数取自物化统计，不再逐页COUNT
+        """
         try:
+            page, size = _page_args(page, size)
+            after = None
+            if cursor:
+                after = CommonTools.decode_cursor(cursor)
+                if not after:
+                    return "无效的分页游标", False
+            
             # 检查用户是否有权限查看成员列表
             member = self.oper_member.get_by_team_and_user(team_id, user_id)
             team = self.oper_team.get_by_id(team_id)
             
             if not member and team and team.visibility == 'private':
                 return "没有权限查看成员列表", False
+            if member:
+                member_activity.touch(team_id, user_id)
             
             # 获取成员列表
-            paginated_members = self.oper_member.get_team_members(team_id, page, size, role)
+            members, has_more = self.oper_member.get_team_members(
+                team_id, size, after=after, offset=(page - 1) * size, role=role
+            )
+            # 合并缓冲中尚未落库的活跃时间
+            buffered_active = member_activity.get_many(team_id, [member_record.user_id for member_record in members])
             
             members_data = []
-            for member_record in paginated_members.items:
+            for member_record in members:
+                last_active_at = member_activity.merge(member_record.last_active_at,
+                                                       buffered_active.get(member_record.user_id))
                 members_data.append({
                     'member_id': member_record.id,
                     'user_id': member_record.user_id,
                     'role': member_record.role,
                     'invited_by': member_record.invited_by,
                     'joined_at': member_record.joined_at.isoformat() if member_record.joined_at else None,
-                    'last_active_at': member_record.last_active_at.isoformat() if member_record.last_active_at else None
+                    'last_active_at': last_active_at.isoformat() if last_active_at else None
                 })
             
-            return {
-                'members': members_data,
-                'total': paginated_members.total,
-                'page': page,
-                'size': size,
-                'pages': paginated_members.pages,
-                'your_role': member.role if member else None
-            }, True
+            total, total_is_approximate = None, False
+            if include_total == 'exact':
+                total = self.oper_member.count_team_members(team_id, role)
+            elif include_total == 'approx':
+                stats = team_stats.get(team_id, self._aggregate_team_statistics) or {}
+                total = stats.get('role_distribution', {}).get(role, 0) if role else stats.get('members_count', 0)
+                total_is_approximate = True
+            
+            result = self._page_result(
+                'members', members_data, page, size, cursor, has_more,
+                CommonTools.encode_cursor(members[-1].joined_at, members[-1].id) if has_more else None,
+                total, total_is_approximate
+            )
+            result['your_role'] = member.role if member else None
+            return result, True
             
         except Exception as e:
             logger.error(f"获取群组成员列表异常: {str(e)}")
@@ -347,6 +568,10 @@ class TeamController:
             if target_member.role != 'member':
                 return "只能提升普通成员为管理员", False
             
+            permission_changes = [
+                self._member_change(team_id, target_user_id, target_member.role, 'admin', operator_id)
+            ]
+            
             def _promote_member_transaction():
                 old_role = target_member.role
                 update_result, update_flag = self.oper_member.update_member_role(target_member, 'admin')
@@ -368,7 +593,7 @@ class TeamController:
                     'message': '成员提升为管理员成功'
                 }
             
-            return self._execute_with_transaction(_promote_member_transaction, "提升成员为管理员")
+            return self._execute_with_transaction(_promote_member_transaction, "提升成员为管理员", permission_changes)
             
         except Exception as e:
             logger.error(f"提升成员为管理员异常: {str(e)}")
@@ -388,6 +613,10 @@ class TeamController:
             if target_member.role != 'admin':
                 return "只能降级管理员为普通成员", False
             
+            permission_changes = [
+                self._member_change(team_id, target_user_id, target_member.role, 'member', operator_id)
+            ]
+            
             def _demote_member_transaction():
                 old_role = target_member.role
                 update_result, update_flag = self.oper_member.update_member_role(target_member, 'member')
@@ -409,7 +638,7 @@ class TeamController:
                     'message': '管理员降级为成员成功'
                 }
             
-            return self._execute_with_transaction(_demote_member_transaction, "降级管理员为成员")
+            return self._execute_with_transaction(_demote_member_transaction, "降级管理员为成员", permission_changes)
             
         except Exception as e:
             logger.error(f"降级管理员为成员异常: {str(e)}")
@@ -439,6 +668,10 @@ class TeamController:
             if target_member.role == 'owner':
                 return "不能移除群组所有者", False
             
+            permission_changes = [
+                self._member_change(team_id, target_user_id, target_member.role, None, operator_id)
+            ]
+            
             def _remove_member_transaction():
                 remove_result, remove_flag = self.oper_member.remove_member(target_member)
                 if not remove_flag:
@@ -457,12 +690,114 @@ class TeamController:
                     'message': '成员移除成功'
                 }
             
-            return self._execute_with_transaction(_remove_member_transaction, "移除群组成员")
+            return self._execute_with_transaction(_remove_member_transaction, "移除群组成员", permission_changes)
             
         except Exception as e:
             logger.error(f"移除群组成员异常: {str(e)}")
             return "移除群组成员失败", False
     
+    def bulk_update_members(self, team_id: str, operator_id: str, action: str,
+                            members: List[Dict[str, str]] = None, user_ids: List[str] = None) -> Tuple[Any, bool]:
+        """
+        批量成员操作
+        群组行加锁后一次读出相关用户的现有角色并校验权限和容量，成员行以单条语句写入，整批记录一条活动；
+        提交后每个变更用户一条缓存失效和权限变更事件，各经一个pipeline发出
+        :param action: upsert 添加成员或更新角色，remove 移除成员
+        """
+        try:
+            if action == 'upsert':
+                # 同一用户出现多次时以最后一条为准
+                targets = {item['user_id']: item.get('role', 'member') for item in members or []}
+            else:
+                targets = {user_id: None for user_id in dict.fromkeys(user_ids or [])}
+            if operator_id in targets:
+                return "不能批量变更自己的成员身份", False
+            
+            team = self.oper_team.get_by_id_for_update(team_id)
+            if not team:
+                DBFunction.db_rollback()
+                return "群组不存在", False
+            
+            roles = self.oper_member.get_roles_for_users(team_id, list(targets) + [operator_id])
+            operator_role = roles.get(operator_id)
+            if operator_role not in ('owner', 'admin'):
+                DBFunction.db_rollback()
+                return "没有权限批量管理成员", False
+            
+            result = {'team_id': team_id, 'action': action, 'added': [], 'updated': [], 'removed': [],
+                      'unchanged': [], 'not_members': []}
+            forbidden = []
+            for user_id, new_role in targets.items():
+                old_role = roles.get(user_id)
+                if action == 'remove' and old_role is None:
+                    result['not_members'].append(user_id)
+                elif action == 'upsert' and old_role == new_role:
+                    result['unchanged'].append(user_id)
+                elif old_role == 'owner' or (
+                        operator_role != 'owner' and 'admin' in (old_role, new_role)):
+                    # 所有者不可变更；设置、变更或移除管理员只能由所有者操作
+                    forbidden.append(user_id)
+                elif old_role is None:
+                    result['added'].append({'user_id': user_id, 'role': new_role})
+                elif new_role is None:
+                    result['removed'].append({'user_id': user_id, 'role': old_role})
+                else:
+                    result['updated'].append({'user_id': user_id, 'old_role': old_role, 'new_role': new_role})
+            
+            if forbidden:
+                DBFunction.db_rollback()
+                return f"没有权限变更以下用户: {', '.join(forbidden)}", False
+            
+            if result['added'] and team.max_members:
+                available = team.max_members - self.oper_member.count_team_members(team_id)
+                if len(result['added']) > available:
+                    DBFunction.db_rollback()
+                    return f"群组成员已达上限，最多还能添加 {max(available, 0)} 人", False
+            
+            if not (result['added'] or result['updated'] or result['removed']):
+                DBFunction.db_rollback()
+                return result, True
+            
+            permission_changes = [
+                self._member_change(team_id, item['user_id'], None, item['role'], operator_id)
+                for item in result['added']
+            ] + [
+                self._member_change(team_id, item['user_id'], item['old_role'], item['new_role'], operator_id)
+                for item in result['updated']
+            ] + [
+                self._member_change(team_id, item['user_id'], item['role'], None, operator_id)
+                for item in result['removed']
+            ]
+            
+            def _bulk_update_members_transaction():
+                upserts = [(item['user_id'], item['role']) for item in result['added']] + \
+                          [(item['user_id'], item['new_role']) for item in result['updated']]
+                upsert_result, upsert_flag = self.oper_member.bulk_upsert_members(team_id, upserts, operator_id)
+                if not upsert_flag:
+                    raise Exception(f"批量写入成员失败: {upsert_result}")
+                
+                remove_result, remove_flag = self.oper_member.bulk_remove_members(
+                    team_id, [item['user_id'] for item in result['removed']]
+                )
+                if not remove_flag:
+                    raise Exception(f"批量移除成员失败: {remove_result}")
+                
+                # 整批记录一条活动
+                activity_result, activity_flag = self.oper_activity.record_members_bulk_changed(
+                    team_id, operator_id, result['added'], result['updated'], result['removed']
+                )
+                if not activity_flag:
+                    logger.warning(f"记录批量成员变更活动失败: {activity_result}")
+                
+                return result
+            
+            return self._execute_with_transaction(_bulk_update_members_transaction, "批量成员操作", permission_changes)
+            
+        except Exception as e:
+            DBFunction.db_rollback()
+            logger.error(f"批量成员操作异常: {str(e)}")
+            return "批量成员操作失败", False
+    
     # ==================== 邀请管理 ====================
     
     def create_invitation(self, team_id: str, inviter_id: str, invitee_email: str, role: str = 'member', message: str = None) -> Tuple[Any, bool]:
@@ -522,6 +857,10 @@ class TeamController:
             if not invitation:
                 return "邀请不存在或已过期", False
             
+            permission_changes = [
+                self._member_change(invitation.team_id, user_id, None, invitation.invited_role, invitation.invited_by)
+            ]
+            
             def _accept_invitation_transaction():
                 # 接受邀请
                 accept_result, accept_flag = self.oper_invitation.accept_invitation(invitation, user_id)
@@ -554,12 +893,53 @@ class TeamController:
                     'message': '成功加入群组'
                 }
             
-            return self._execute_with_transaction(_accept_invitation_transaction, "接受群组邀请")
+            return self._execute_with_transaction(_accept_invitation_transaction, "接受群组邀请", permission_changes)
             
         except Exception as e:
             logger.error(f"接受群组邀请异常: {str(e)}")
             return "接受群组邀请失败", False
     
+    def list_team_invitations(self, team_id: str, page: int = 1, size: int = 20, status: str = None,
+                              cursor: str = None, include_total: str = 'approx') -> Tuple[Any, bool]:
+        """获取群组邀请列表，按 (created_at, id) 游标分页"""
+        try:
+            page, size = _page_args(page, size)
+            after = None
+            if cursor:
+                after = CommonTools.decode_cursor(cursor)
+                if not after:
+                    return "无效的分页游标", False
+            
+            invitations, has_more = self.oper_invitation.get_team_invitations(
+                team_id, size, after=after, offset=(page - 1) * size, status=status
+            )
+            invitations_data = []
+            for invitation in invitations:
+                invitations_data.append({
+                    'invitation_id': invitation.id,
+                    'invitee_email': invitation.invitee_email,
+                    'invited_role': invitation.invited_role,
+                    'invited_by': invitation.invited_by,
+                    'status': invitation.status,
+                    'message': invitation.message,
+                    'expires_at': invitation.expires_at.isoformat() if invitation.expires_at else None,
+                    'created_at': invitation.created_at.isoformat() if invitation.created_at else None
+                })
+            
+            total, total_is_approximate = self._list_total(
+                include_total, 'team_invitations', {'team_id': team_id, 'status': status},
+                lambda: self.oper_invitation.count_team_invitations(team_id, status)
+            )
+            return self._page_result(
+                'invitations', invitations_data, page, size, cursor, has_more,
+                CommonTools.encode_cursor(invitations[-1].created_at, invitations[-1].id) if has_more else None,
+                total, total_is_approximate
+            ), True
+            
+        except Exception as e:
+            logger.error(f"获取邀请列表异常: {str(e)}")
+            return "获取邀请列表失败", False
+    
     # ==================== 加入申请管理 ====================
     
     def create_join_request(self, team_id: str, user_id: str, email: str, message: str = None) -> Tuple[Any, bool]:
@@ -572,6 +952,8 @@ class TeamController:
             if team.visibility == 'private':
                 return "私有群组不接受加入申请", False
             
+            permission_changes = []
+            
             def _create_join_request_transaction():
                 expires_at = datetime.now() + timedelta(hours=self.default_join_request_expires_hours)
                 
@@ -607,6 +989,7 @@ class TeamController:
                     member_result, member_flag = self.oper_member.add_member(member)
                     if not member_flag:
                         raise Exception(f"添加群组成员失败: {member_result}")
+                    permission_changes.append(self._member_change(team_id, user_id, None, 'member', team.created_by))
                     
                     # 记录活动
                     activity_result, activity_flag = self.oper_activity.record_member_joined(
@@ -629,7 +1012,7 @@ class TeamController:
                     'message': '加入申请已提交，等待审批'
                 }
             
-            return self._execute_with_transaction(_create_join_request_transaction, "创建加入申请")
+            return self._execute_with_transaction(_create_join_request_transaction, "创建加入申请", permission_changes)
             
         except Exception as e:
             logger.error(f"创建加入申请异常: {str(e)}")
@@ -649,6 +1032,11 @@ class TeamController:
             if not self.oper_member.is_team_admin_or_owner(join_request.team_id, approver_id):
                 return "没有权限处理申请", False
             
+            permission_changes = [
+                self._member_change(join_request.team_id, join_request.user_id, None,
+                                    join_request.requested_role, approver_id)
+            ]
+            
             def _approve_join_request_transaction():
                 # 批准申请
                 approve_result, approve_flag = self.oper_join_request.approve_request(
@@ -683,12 +1071,283 @@ class TeamController:
                     'message': '申请已批准，用户成功加入群组'
                 }
             
-            return self._execute_with_transaction(_approve_join_request_transaction, "批准加入申请")
+            return self._execute_with_transaction(_approve_join_request_transaction, "批准加入申请", permission_changes)
             
         except Exception as e:
             logger.error(f"批准加入申请异常: {str(e)}")
             return "批准加入申请失败", False
     
+    def list_pending_join_requests(self, team_id: str, page: int = 1, size: int = 20,
+                                   cursor: str = None, include_total: str = 'approx') -> Tuple[Any, bool]:
+        """获取群组待处理的加入申请，按 (created_at, id) 游标分页"""
+        try:
+            page, size = _page_args(page, size)
+            after = None
+            if cursor:
+                after = CommonTools.decode_cursor(cursor)
+                if not after:
+                    return "无效的分页游标", False
+            
+            join_requests, has_more = self.oper_join_request.get_pending_requests_by_team(
+                team_id, size, after=after, offset=(page - 1) * size
+            )
+            requests_data = []
+            for join_request in join_requests:
+                requests_data.append({
+                    'request_id': join_request.id,
+                    'user_id': join_request.user_id,
+                    'email': join_request.email,
+                    'requested_role': join_request.requested_role,
+                    'message': join_request.message,
+                    'status': join_request.status,
+                    'expires_at': join_request.expires_at.isoformat() if join_request.expires_at else None,
+                    'created_at': join_request.created_at.isoformat() if join_request.created_at else None
+                })
+            
+            total, total_is_approximate = self._list_total(
+                include_total, 'pending_join_requests', {'team_id': team_id},
+                lambda: self.oper_join_request.count_pending_requests_by_team(team_id)
+            )
+            return self._page_result(
+                'join_requests', requests_data, page, size, cursor, has_more,
+                CommonTools.encode_cursor(join_requests[-1].created_at, join_requests[-1].id) if has_more else None,
+                total, total_is_approximate
+            ), True
+            
+        except Exception as e:
+            logger.error(f"获取加入申请列表异常: {str(e)}")
+            return "获取加入申请列表失败", False
+    
+    # ==================== 群组统计 ====================
+    
+    def _aggregate_team_statistics(self, team_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """物化统计的回源函数"""
+        return self.oper_team.aggregate_team_statistics(team_ids, activity_days=CacheConfig.TEAM_STATS_ACTIVITY_DAYS)
+    
+    def reconcile_team_statistics(self) -> Dict[str, Any]:
+        """周期对账：按数据库重新聚合已物化的群组统计，修正增量丢失或并发造成的偏差"""
+        return team_stats.reconcile(self._aggregate_team_statistics)
+    
+    # ==================== 活动记录 ====================
+    
+    def list_team_activities(self, team_id: str, user_id: str, page: int = 1, size: int = 20,
+                             activity_type: str = None, cursor: str = None,
+                             include_total: str = 'approx') -> Tuple[Any, bool]:
+        """
+        获取群组活动记录
+        近期活动从群组活动流按消息ID游标读取；流中读完后从数据库按 (created_at, id) 续读。
+        按类型过滤、页码翻页或使用数据库游标时查询数据库，并合并活动流中尚未归档的活动。
+        从活动流读取的近期页不重复读取活动流统计未归档数，其总数最多滞后一个归档周期
+        """
+        try:
+            page, size = _page_args(page, size)
+            if not self._get_membership(team_id, user_id):
+                return "只有群组成员可以查看活动记录", False
+            
+            recent = None
+            if not activity_type and page == 1 and (not cursor or activity_feed.is_cursor(cursor)):
+                recent = activity_feed.read(team_id, size, before=cursor)
+            
+            if recent is not None:
+                activities, has_more = recent
+                next_cursor = activities[-1]['stream_id'] if has_more else None
+                if not has_more and (activities or not cursor):
+                    activities, has_more, next_cursor = self._fill_activities_from_archive(team_id, size, activities)
+                elif not activities:
+                    # 游标所指的条目已被裁剪，从数据库中该消息时间之前续读
+                    activities, has_more, next_cursor = self._read_archived_activities(
+                        team_id, size, _through_second(datetime.fromtimestamp(int(cursor.split('-')[0]) / 1000))
+                    )
+            unarchived = []
+            if recent is None:
+                after = None
+                if cursor:
+                    after = CommonTools.decode_cursor(cursor)
+                    if not after:
+                        return "无效的分页游标", False
+                unarchived = self._unarchived_activities(team_id, activity_type)
+                activities, has_more, next_cursor = self._read_activities_merged(
+                    team_id, size, unarchived, after, offset=(page - 1) * size, activity_type=activity_type
+                )
+            
+            total, total_is_approximate = self._list_total(
+                include_total, 'team_activities', {'team_id': team_id, 'activity_type': activity_type},
+                lambda: self.oper_activity.count_team_activities(team_id, activity_type)
+            )
+            if total is not None:
+                total += len(unarchived)
+            return self._page_result(
+                'activities', [self._activity_item(activity) for activity in activities], page, size, cursor,
+                has_more, next_cursor, total, total_is_approximate
+            ), True
+            
+        except Exception as e:
+            logger.error(f"获取活动记录异常: {str(e)}")
+            return "获取活动记录失败", False
+    
+    def _fill_activities_from_archive(self, team_id: str, size: int, activities: List[Dict[str, Any]]):
+        """
+        活动流已读完时，用数据库中更早的活动补满本页
+        created_at 为秒精度，从最后一条的同一秒开始读并排除本页已有的活动，边界处宁可重复不遗漏
+        """
+        after = _through_second(activities[-1]['created_at']) if activities else None
+        seen = {activity['id'] for activity in activities}
+        rows, has_more = self.oper_activity.get_team_activities(team_id, size - len(activities) + len(seen),
+                                                                after=after)
+        older = [self._activity_entry(row) for row in rows if row.id not in seen]
+        has_more = has_more or len(older) > size - len(activities)
+        activities = activities + older[:size - len(activities)]
+        next_cursor = None
+        if has_more and activities:
+            last = activities[-1]
+            # 末条仍来自活动流时同样从该秒开始续读
+            next_cursor = CommonTools.encode_cursor(
+                *(_through_second(last['created_at']) if 'stream_id' in last else (last['created_at'], last['id']))
+            )
+        return activities, has_more, next_cursor
+    
+    def _unarchived_activities(self, team_id: str, activity_type: str = None) -> List[Dict[str, Any]]:
+        """
+        活动流中尚未归档入库的活动，按 (created_at, id) 倒序
+        只读取最新的 TEAM_ACTIVITY_UNARCHIVED_SCAN 条，归档按写入顺序进行，更早的条目均已落库
+        """
+        recent = activity_feed.read(team_id, CacheConfig.TEAM_ACTIVITY_UNARCHIVED_SCAN)
+        if not recent:
+            return []
+        entries = [
+            {field: value for field, value in activity.items() if field != 'stream_id'}
+            for activity in recent[0] if not activity_type or activity['activity_type'] == activity_type
+        ]
+        archived = self.oper_activity.get_archived_activity_ids([entry['id'] for entry in entries])
+        pending = [entry for entry in entries if entry['id'] not in archived]
+        pending.sort(key=lambda entry: (entry['created_at'], entry['id']), reverse=True)
+        return pending
+    
+    def _read_activities_merged(self, team_id: str, size: int, unarchived: List[Dict[str, Any]], after=None,
+                                offset: int = 0, activity_type: str = None):
+        """
+        数据库分页与未归档活动合并
+        未归档活动最多使本页之前多出 len(pending) 条，数据库偏移相应前移并多取这些行；
+        合并排序后第 k 条的全局位置为 数据库偏移 + k，据此截取本页
+        """
+        pending = [entry for entry in unarchived if not after or (entry['created_at'], entry['id']) < tuple(after)]
+        if not pending:
+            return self._read_archived_activities(team_id, size, after, offset=offset, activity_type=activity_type)
+        
+        db_offset = max(offset - len(pending), 0)
+        rows, db_has_more = self.oper_activity.get_team_activities(
+            team_id, size + offset - db_offset, after=after, offset=db_offset, activity_type=activity_type
+        )
+        archived = [self._activity_entry(row) for row in rows]
+        # 检查与读取之间刚被归档的活动以数据库记录为准
+        seen = {entry['id'] for entry in archived}
+        merged = sorted(archived + [entry for entry in pending if entry['id'] not in seen],
+                        key=lambda entry: (entry['created_at'], entry['id']), reverse=True)
+        
+        start = offset - db_offset
+        activities = merged[start:start + size]
+        has_more = db_has_more or len(merged) > start + size
+        next_cursor = None
+        if has_more and activities:
+            next_cursor = CommonTools.encode_cursor(activities[-1]['created_at'], activities[-1]['id'])
+        return activities, has_more, next_cursor
+    
+    def _read_archived_activities(self, team_id: str, size: int, after=None, offset: int = 0,
+                                  activity_type: str = None):
+        rows, has_more = self.oper_activity.get_team_activities(
+            team_id, size, after=after, offset=offset, activity_type=activity_type
+        )
+        return (
+            [self._activity_entry(row) for row in rows], has_more,
+            CommonTools.encode_cursor(rows[-1].created_at, rows[-1].id) if has_more else None
+        )
+    
+    @staticmethod
+    def _activity_entry(row) -> Dict[str, Any]:
+        return {
+            'id': row.id,
+            'user_id': row.user_id,
+            'activity_type': row.activity_type,
+            'description': row.description,
+            'metadata': row.activity_metadata,
+            'created_at': row.created_at
+        }
+    
+    @staticmethod
+    def _activity_item(activity: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            'activity_id': activity['id'],
+            'user_id': activity['user_id'],
+            'activity_type': activity['activity_type'],
+            'description': activity['description'],
+            'metadata': activity['metadata'],
+            'created_at': activity['created_at'].isoformat() if activity['created_at'] else None
+        }
+    
+    def record_role_change_notification(self, team_id: str, user_id: str, old_role: Optional[str],
+                                        new_role: str, changed_by: str) -> Tuple[Any, bool]:
+        """记录其他服务通知的角色变更活动"""
+        def _record_role_change_transaction():
+            activity_result, activity_flag = self.oper_activity.record_role_changed(
+                team_id, changed_by, user_id, old_role, new_role
+            )
+            if not activity_flag:
+                raise Exception(f"记录角色变更活动失败: {activity_result}")
+            return {'team_id': team_id, 'user_id': user_id}
+        
+        return self._execute_with_transaction(_record_role_change_transaction, "记录角色变更")
+    
+    def archive_team_activities(self) -> Dict[str, int]:
+        """周期任务：将归档流中的活动批量写入数据库，每批单独提交"""
+        def _write(activities):
+            result, flag = self.oper_activity.bulk_insert_activities(activities)
+            return DBFunction.do_commit(result, flag)
+        return activity_feed.archive(_write)
+    
+    # ==================== 成员活跃时间 ====================
+    
+    def flush_member_activity(self) -> Dict[str, int]:
+        """周期任务：将缓冲的成员活跃时间批量落库，每批单独提交"""
+        def _write(entries):
+            result, flag = self.oper_member.bulk_update_last_active(entries)
+            return DBFunction.do_commit(result, flag)
+        return member_activity.flush(_write)
+    
+    # ==================== 过期清理 ====================
+    
+    def cleanup_expired_records(self) -> Dict[str, Any]:
+        """
+        周期任务：将过期的待处理申请和邀请标记为过期
+        每批一条带LIMIT的UPDATE并单独提交，批次间停顿以免长时间占用行锁和复制带宽；
+        单轮达到批次上限时剩余记录留给下一轮
+        """
+        expired_before = datetime.now()
+        return {
+            'expired_requests': self._cleanup_in_batches(
+                self.oper_join_request.cleanup_expired_requests, expired_before, "過期申請"),
+            'expired_invitations': self._cleanup_in_batches(
+                self.oper_invitation.cleanup_expired_invitations, expired_before, "過期邀請")
+        }
+    
+    @staticmethod
+    def _cleanup_in_batches(cleanup, expired_before, label) -> int:
+        batch_size = Config.EXPIRED_CLEANUP_BATCH_SIZE
+        total = 0
+        for batch in range(Config.EXPIRED_CLEANUP_MAX_BATCHES):
+            if batch:
+                time.sleep(Config.EXPIRED_CLEANUP_PAUSE_MS / 1000)
+            result, flag = cleanup(expired_before, batch_size)
+            commit_result, commit_flag = DBFunction.do_commit(result, flag)
+            if not commit_flag:
+                logger.error(f"清理{label}失敗: {commit_result}")
+                break
+            total += result
+            if result < batch_size:
+                break
+        else:
+            logger.warning(f"清理{label}達到單輪批次上限，剩餘記錄留待下一輪: 已清理 {total}")
+        return total
+    
     # ==================== 权限检查 ====================
     
     def get_user_role_in_team(self, team_id: str, user_id: str) -> Tuple[Any, bool]:
@@ -741,6 +1400,37 @@ class TeamController:
             logger.error(f"获取用户群组角色异常: {str(e)}")
             return "获取用户群组角色失败", False
     
+    def get_users_teams_batch(self, user_ids: List[str]) -> Tuple[Any, bool]:
+        """
+        批量获取多个用户所在的群组
+        先批量读取缓存，未命中的用户一次联表查询后在内存中分组，再以单次pipeline回写缓存
+        :return: {user_id: [{'team_id', 'team_name', 'visibility', 'role', 'joined_at'}]}
+        """
+        try:
+            user_ids = list(dict.fromkeys(user_ids))
+            result = token_cache.batch_get_user_teams(user_ids)
+            misses = [user_id for user_id in user_ids if user_id not in result]
+            if not misses:
+                return result, True
+
+            loaded = {user_id: [] for user_id in misses}
+            for user_id, team_id, role, joined_at, team_name, visibility in self.oper_member.get_teams_for_users(misses):
+                loaded[user_id].append({
+                    'team_id': team_id,
+                    'team_name': team_name,
+                    'visibility': visibility,
+                    'role': role,
+                    'joined_at': joined_at.isoformat() if joined_at else None
+                })
+            # 没有群组的用户同样缓存空列表，避免反复回源
+            token_cache.batch_cache_user_teams(loaded)
+            result.update(loaded)
+            return result, True
+
+        except Exception as e:
+            logger.error(f"批量获取用户群组异常: {str(e)}")
+            return "批量获取用户群组失败", False
+    
     # 权限检查功能已移至permission-service
     # 如需检查权限，请调用permission-service的相关接口
 
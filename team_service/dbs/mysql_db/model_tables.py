@@ -53,9 +53,11 @@ class TeamModel(BaseModel):
     # 索引
     __table_args__ = (
         db.Index('idx_creator', 'created_by'),
-        db.Index('idx_visibility', 'visibility'),
+        # 公开群组列表按 (created_at, id) 游标分页
+        db.Index('idx_visibility_created', 'visibility', 'created_at', 'id'),
         db.Index('idx_name', 'name'),
-        db.Index('ft_name_desc', 'name', 'description', mysql_prefix='FULLTEXT'),
+        # ngram分词，中文名称和描述可按词检索
+        db.Index('ft_name_desc', 'name', 'description', mysql_prefix='FULLTEXT', mysql_with_parser='ngram'),
     )
 
 
@@ -83,8 +85,11 @@ class TeamMemberModel(BaseModel):
     # 唯一約束和索引
     __table_args__ = (
         db.UniqueConstraint('team_id', 'user_id', name='uk_team_user'),
-        db.Index('idx_team', 'team_id'),
-        db.Index('idx_user', 'user_id'),
+        # 成员列表按 (joined_at, id) 游标分页，可选按角色过滤
+        db.Index('idx_team_joined', 'team_id', 'joined_at', 'id'),
+        db.Index('idx_team_role_joined', 'team_id', 'role', 'joined_at', 'id'),
+        # 用户群组列表分页；同时覆盖批量查询用户群组所需的 team_id、role
+        db.Index('idx_user_joined', 'user_id', 'joined_at', 'id', 'team_id', 'role'),
         db.Index('idx_role', 'role'),
         db.Index('idx_last_active', 'last_active_at'),
     )
@@ -120,10 +125,11 @@ class TeamJoinRequestModel(BaseModel):
     # 唯一約束和索引
     __table_args__ = (
         db.UniqueConstraint('team_id', 'user_id', name='uk_team_user_request'),
-        db.Index('idx_team', 'team_id'),
-        db.Index('idx_user', 'user_id'),
+        db.Index('idx_team_status_created', 'team_id', 'status', 'created_at', 'id'),
+        db.Index('idx_user_created', 'user_id', 'created_at', 'id'),
         db.Index('idx_status', 'status'),
         db.Index('idx_expires', 'expires_at'),
+        db.Index('idx_status_expires', 'status', 'expires_at'),
     )
 
 
@@ -156,12 +162,14 @@ class TeamInvitationModel(BaseModel):
 
     # 索引
     __table_args__ = (
-        db.Index('idx_team', 'team_id'),
-        db.Index('idx_email', 'invitee_email'),
+        db.Index('idx_team_created', 'team_id', 'created_at', 'id'),
+        db.Index('idx_team_status_created', 'team_id', 'status', 'created_at', 'id'),
+        db.Index('idx_email_created', 'invitee_email', 'created_at', 'id'),
         db.Index('idx_user', 'invitee_user_id'),
         db.Index('idx_status', 'status'),
         db.Index('idx_token', 'invitation_token'),
         db.Index('idx_expires', 'expires_at'),
+        db.Index('idx_status_expires', 'status', 'expires_at'),
     )
 
 
@@ -174,7 +182,8 @@ class TeamActivityModel(BaseModel):
     user_id = db.Column(db.String(36), nullable=False, comment="用戶ID")
     activity_type = db.Column(db.String(100), nullable=False, comment="活動類型")
     description = db.Column(db.Text, nullable=False, comment="活動描述")
-    metadata = db.Column(db.JSON, comment="活動元數據")
+    # metadata 是声明式基类的保留属性名，列名保持不变
+    activity_metadata = db.Column('metadata', db.JSON, comment="活動元數據")
 
     # 關係
     team = db.relationship('TeamModel', backref='activities')
@@ -185,4 +194,7 @@ class TeamActivityModel(BaseModel):
         db.Index('idx_user', 'user_id'),
         db.Index('idx_type', 'activity_type'),
         db.Index('idx_created', 'created_at'),
+        # 活动流之外的历史记录按 (created_at, id) 游标分页，可选按类型过滤
+        db.Index('idx_team_created', 'team_id', 'created_at', 'id'),
+        db.Index('idx_team_type_created', 'team_id', 'activity_type', 'created_at', 'id'),
     )
\ No newline at end of file
@@ -6,10 +6,12 @@
 @作者: LiDong
 """
 
+import re
 import secrets
 import uuid
 from datetime import datetime, timedelta
-from sqlalchemy import and_, or_, func, desc
+from sqlalchemy import and_, or_, func, desc, text, update, bindparam
+from sqlalchemy.dialects.mysql import insert as mysql_insert
 from sqlalchemy.orm import load_only
 from typing import List, Dict, Any, Optional, Tuple
 
@@ -21,6 +23,36 @@ from dbs.mysql_db.model_tables import (
 )
 
 
+# 全文检索布尔模式的操作符，用户输入中的这些字符按分隔符处理
+_FULLTEXT_OPERATORS = re.compile(r'[+\-<>()~*"@]')
+# ngram分词的最小词长，更短的关键词无法走全文索引
+_FULLTEXT_MIN_TERM_LENGTH = 2
+# 会话中暂存待写入活动流的群组活动
+_PENDING_ACTIVITIES_KEY = 'pending_team_activities'
+
+
+def _keyset_page(query, sort_column, id_column, size, after=None, offset=0):
+    """
+    按 (排序列, 主键) 倒序游标分页，多取一条用于判断是否还有下一页
+    :param after: 上一页最后一条的 (排序值, 主键)
+    :param offset: 兼容页码分页的偏移量，仅在未提供after时使用
+    :return: (当前页记录, 是否还有下一页)
+    """
+    if after:
+        after_value, after_id = after
+        query = query.filter(
+            or_(
+                sort_column < after_value,
+                and_(sort_column == after_value, id_column < after_id)
+            )
+        )
+    query = query.order_by(sort_column.desc(), id_column.desc())
+    if offset and not after:
+        query = query.offset(offset)
+    rows = query.limit(size + 1).all()
+    return rows[:size], len(rows) > size
+
+
 class OperTeamModel:
     """群組模型操作類"""
     
@@ -64,42 +96,63 @@ class OperTeamModel:
             )
         ).first()
     
-    def get_teams_by_user(self, user_id, page=1, size=20, visibility=None):
-        """获取用户相关的群组列表"""
-        # 获取用户作为成员的群组
-        member_teams_query = db.session.query(self.model).join(
+    def get_teams_by_user(self, user_id, size=20, after=None, offset=0, visibility=None):
+        """
+        获取用户所在的群组列表，按加入时间 (joined_at, 成员ID) 游标分页
+        :return: ([(群组, 角色, 加入时间, 成员ID)], 是否还有下一页)
+        """
+        query = db.session.query(
+            self.model, TeamMemberModel.role, TeamMemberModel.joined_at, TeamMemberModel.id
+        ).join(
             TeamMemberModel,
             self.model.id == TeamMemberModel.team_id
         ).filter(TeamMemberModel.user_id == user_id)
         
         # 如果指定了可见性，添加过滤条件
         if visibility:
-            member_teams_query = member_teams_query.filter(self.model.visibility == visibility)
+            query = query.filter(self.model.visibility == visibility)
         
-        # 分页查询
-        paginated = member_teams_query.order_by(self.model.created_at.desc()).paginate(
-            page=page, per_page=size, error_out=False
-        )
-        
-        return paginated
+        return _keyset_page(query, TeamMemberModel.joined_at, TeamMemberModel.id, size, after, offset)
     
-    def get_public_teams(self, page=1, size=20, search=None):
-        """获取公开群组列表"""
+    def count_teams_by_user(self, user_id, visibility=None):
+        """统计用户所在的群组数量"""
+        query = db.session.query(func.count(TeamMemberModel.id)).filter(TeamMemberModel.user_id == user_id)
+        if visibility:
+            query = query.join(self.model, self.model.id == TeamMemberModel.team_id).filter(
+                self.model.visibility == visibility
+            )
+        return query.scalar() or 0
+    
+    def get_public_teams(self, size=20, after=None, offset=0, search=None):
+        """
+        获取公开群组列表，按 (created_at, id) 游标分页
+        :return: (群组列表, 是否还有下一页)
+        """
+        query = self._public_teams_query(search)
+        return _keyset_page(query, self.model.created_at, self.model.id, size, after, offset)
+    
+    def count_public_teams(self, search=None):
+        """统计公开群组数量"""
+        return self._public_teams_query(search).with_entities(func.count(self.model.id)).scalar() or 0
+    
+    def _public_teams_query(self, search=None):
         query = self.model.query.filter(self.model.visibility == 'public')
-        
-        # 搜索功能
-        if search:
-            search_term = f"%{search}%"
-            query = query.filter(
-                or_(
-                    self.model.name.like(search_term),
-                    self.model.description.like(search_term)
+        if not search:
+            return query
+        
+        # 关键词都够长时走名称+描述的全文索引，否则退化为名称前缀匹配 (可用名称索引)
+        terms = _FULLTEXT_OPERATORS.sub(' ', search).split()
+        if terms and all(len(term) >= _FULLTEXT_MIN_TERM_LENGTH for term in terms):
+            return query.filter(
+                text("MATCH (teams.name, teams.description) AGAINST (:search IN BOOLEAN MODE)").bindparams(
+                    search=' '.join(f'+"{term}"' for term in terms)
                 )
             )
-        
-        return query.order_by(self.model.created_at.desc()).paginate(
-            page=page, per_page=size, error_out=False
-        )
+        return query.filter(self.model.name.startswith(search.strip(), autoescape=True))
+    
+    def get_by_id_for_update(self, team_id):
+        """根据ID获取群组并加行锁，批量变更成员时串行化同一群组的容量校验"""
+        return self.model.query.filter(self.model.id == team_id).with_for_update().first()
     
     @TryExcept("更新群組失敗")
     def update_team(self, team, update_data):
@@ -154,6 +207,39 @@ class OperTeamModel:
             'created_at': team.created_at
         }
 
+    def aggregate_team_statistics(self, team_ids, activity_days=30):
+        """
+        批量聚合群组统计 (供物化统计回源和对账使用)，按群组分组各查询一次成员和近期活动
+        :return: {team_id: {'role_distribution': {角色: 数量}, 'recent_activities': 数量}}，不存在的群组不返回
+        """
+        if not team_ids:
+            return {}
+        stats = {
+            team_id: {'role_distribution': {}, 'recent_activities': 0}
+            for team_id, in db.session.query(self.model.id).filter(self.model.id.in_(team_ids)).all()
+        }
+        if not stats:
+            return {}
+
+        role_rows = db.session.query(
+            TeamMemberModel.team_id, TeamMemberModel.role, func.count(TeamMemberModel.id)
+        ).filter(TeamMemberModel.team_id.in_(list(stats))).group_by(
+            TeamMemberModel.team_id, TeamMemberModel.role
+        ).all()
+        for team_id, role, count in role_rows:
+            stats[team_id]['role_distribution'][role] = count
+
+        since = datetime.now() - timedelta(days=activity_days)
+        activity_rows = db.session.query(
+            TeamActivityModel.team_id, func.count(TeamActivityModel.id)
+        ).filter(
+            TeamActivityModel.team_id.in_(list(stats)),
+            TeamActivityModel.created_at >= since
+        ).group_by(TeamActivityModel.team_id).all()
+        for team_id, count in activity_rows:
+            stats[team_id]['recent_activities'] = count
+        return stats
+
 
 class OperTeamMemberModel:
     """群組成員模型操作類"""
@@ -194,16 +280,30 @@ class OperTeamMemberModel:
             )
         ).first()
     
-    def get_team_members(self, team_id, page=1, size=20, role=None):
-        """获取群组成员列表"""
+    def get_team_members(self, team_id, size=20, after=None, offset=0, role=None):
+        """
+        获取群组成员列表，按 (joined_at, id) 游标分页
+        :return: (成员列表, 是否还有下一页)
+        """
         query = self.model.query.filter(self.model.team_id == team_id)
         
         if role:
             query = query.filter(self.model.role == role)
         
-        return query.order_by(self.model.joined_at.desc()).paginate(
-            page=page, per_page=size, error_out=False
-        )
+        return _keyset_page(query, self.model.joined_at, self.model.id, size, after, offset)
+    
+    def count_team_members(self, team_id, role=None):
+        """统计群组成员数量"""
+        query = db.session.query(func.count(self.model.id)).filter(self.model.team_id == team_id)
+        if role:
+            query = query.filter(self.model.role == role)
+        return query.scalar() or 0
+    
+    def get_member_roles(self, team_id):
+        """获取群组全部成员的 (用户ID, 角色)，只查询这两列"""
+        return self.model.query.with_entities(self.model.user_id, self.model.role).filter(
+            self.model.team_id == team_id
+        ).all()
     
     def get_user_teams(self, user_id, role=None):
         """获取用户所在的群组列表"""
@@ -213,6 +313,68 @@ class OperTeamMemberModel:
             query = query.filter(self.model.role == role)
         
         return query.all()
+
+    def get_teams_for_users(self, user_ids):
+        """
+        批量获取多个用户所在的群组，成员表与群组表一次联表查询
+        :return: [(用户ID, 群组ID, 角色, 加入时间, 群组名称, 可见性), ...]
+        """
+        if not user_ids:
+            return []
+        return db.session.query(
+            self.model.user_id, self.model.team_id, self.model.role, self.model.joined_at,
+            TeamModel.name, TeamModel.visibility
+        ).join(TeamModel, TeamModel.id == self.model.team_id).filter(
+            self.model.user_id.in_(user_ids)
+        ).all()
+
+    def get_roles_for_users(self, team_id, user_ids):
+        """获取指定用户在群组中的角色 {用户ID: 角色}，非成员不返回"""
+        if not user_ids:
+            return {}
+        return dict(self.model.query.with_entities(self.model.user_id, self.model.role).filter(
+            self.model.team_id == team_id,
+            self.model.user_id.in_(user_ids)
+        ).all())
+    
+    @TryExcept("批量寫入群組成員失敗")
+    def bulk_upsert_members(self, team_id, members, invited_by):
+        """
+        批量添加成员或更新角色，单条多行 INSERT ... ON DUPLICATE KEY UPDATE
+        :param members: [(用户ID, 角色)]
+        """
+        if not members:
+            return 0
+        now = datetime.now()
+        statement = mysql_insert(self.model.__table__).values([
+            {
+                'id': str(uuid.uuid4()),
+                'team_id': team_id,
+                'user_id': user_id,
+                'role': role,
+                'invited_by': invited_by,
+                'joined_at': now,
+                'last_active_at': now,
+                'created_at': now,
+                'updated_at': now
+            }
+            for user_id, role in members
+        ])
+        # 已是成员的只更新角色，保留原加入时间和邀请人
+        statement = statement.on_duplicate_key_update(role=statement.inserted.role, updated_at=now)
+        db.session.execute(statement)
+        return len(members)
+    
+    @TryExcept("批量移除群組成員失敗")
+    def bulk_remove_members(self, team_id, user_ids):
+        """批量移除成员 (单条DELETE)，所有者不会被移除"""
+        if not user_ids:
+            return 0
+        return self.model.query.filter(
+            self.model.team_id == team_id,
+            self.model.user_id.in_(user_ids),
+            self.model.role != 'owner'
+        ).delete(synchronize_session=False)
     
     @TryExcept("更新成員角色失敗")
     def update_member_role(self, member, new_role):
@@ -220,11 +382,24 @@ class OperTeamMemberModel:
         member.role = new_role
         return True
     
-    @TryExcept("更新成員活躍時間失敗")
-    def update_last_active(self, member):
-        """更新成员最后活跃时间"""
-        member.last_active_at = datetime.now()
-        return True
+    @TryExcept("批量更新成員活躍時間失敗")
+    def bulk_update_last_active(self, entries):
+        """
+        批量更新成员最后活跃时间 (一条语句executemany)，只前移不回退
+        :param entries: [(team_id, user_id, last_active_at)]
+        """
+        if not entries:
+            return 0
+        table = self.model.__table__
+        stmt = update(table).where(
+            table.c.team_id == bindparam('b_team_id'),
+            table.c.user_id == bindparam('b_user_id'),
+            or_(table.c.last_active_at.is_(None), table.c.last_active_at < bindparam('b_last_active_at'))
+        ).values(last_active_at=bindparam('b_last_active_at'))
+        return db.session.execute(stmt, [
+            {'b_team_id': team_id, 'b_user_id': user_id, 'b_last_active_at': last_active_at}
+            for team_id, user_id, last_active_at in entries
+        ]).rowcount
     
     @TryExcept("移除群組成員失敗")
     def remove_member(self, member):
@@ -287,25 +462,35 @@ class OperTeamJoinRequestModel:
         """根据ID获取申请"""
         return self.model.query.filter(self.model.id == request_id).first()
     
-    def get_pending_requests_by_team(self, team_id, page=1, size=20):
-        """获取群组的待处理申请"""
+    def get_pending_requests_by_team(self, team_id, size=20, after=None, offset=0):
+        """
+        获取群组的待处理申请，按 (created_at, id) 游标分页
+        :return: (申请列表, 是否还有下一页)
+        """
+        return _keyset_page(
+            self._pending_requests_query(team_id), self.model.created_at, self.model.id, size, after, offset
+        )
+    
+    def count_pending_requests_by_team(self, team_id):
+        """统计群组的待处理申请数量"""
+        return self._pending_requests_query(team_id).with_entities(func.count(self.model.id)).scalar() or 0
+    
+    def _pending_requests_query(self, team_id):
         return self.model.query.filter(
             and_(
                 self.model.team_id == team_id,
                 self.model.status == 'pending',
                 self.model.expires_at > datetime.now()
             )
-        ).order_by(self.model.created_at.desc()).paginate(
-            page=page, per_page=size, error_out=False
         )
     
-    def get_user_requests(self, user_id, page=1, size=20):
-        """获取用户的申请记录"""
-        return self.model.query.filter(
-            self.model.user_id == user_id
-        ).order_by(self.model.created_at.desc()).paginate(
-            page=page, per_page=size, error_out=False
-        )
+    def get_user_requests(self, user_id, size=20, after=None, offset=0):
+        """
+        获取用户的申请记录，按 (created_at, id) 游标分页
+        :return: (申请列表, 是否还有下一页)
+        """
+        query = self.model.query.filter(self.model.user_id == user_id)
+        return _keyset_page(query, self.model.created_at, self.model.id, size, after, offset)
     
     @TryExcept("批准申請失敗")
     def approve_request(self, request, resolved_by):
@@ -326,20 +511,17 @@ class OperTeamJoinRequestModel:
         return True
     
     @TryExcept("清理過期申請失敗")
-    def cleanup_expired_requests(self):
-        """清理过期申请"""
-        current_time = datetime.now()
-        expired_requests = self.model.query.filter(
-            and_(
-                self.model.expires_at <= current_time,
-                self.model.status == 'pending'
-            )
-        ).all()
-        
-        for request in expired_requests:
-            request.status = 'expired'
-        
-        return len(expired_requests)
+    def cleanup_expired_requests(self, expired_before, limit):
+        """
+        将一批过期的待处理申请标记为过期 - 带LIMIT的单条UPDATE，不加载申请对象
+        :param expired_before: 过期时间截止点，同一轮清理使用同一截止点
+        :return: 本批更新的行数，小于limit表示已清理完
+        """
+        stmt = update(self.model).where(
+            self.model.status == 'pending',
+            self.model.expires_at <= expired_before
+        ).values(status='expired').with_dialect_options(mysql_limit=limit)
+        return db.session.execute(stmt).rowcount
 
 
 class OperTeamInvitationModel:
@@ -388,24 +570,32 @@ class OperTeamInvitationModel:
             )
         ).first()
     
-    def get_team_invitations(self, team_id, page=1, size=20, status=None):
-        """获取群组的邀请列表"""
+    def get_team_invitations(self, team_id, size=20, after=None, offset=0, status=None):
+        """
+        获取群组的邀请列表，按 (created_at, id) 游标分页
+        :return: (邀请列表, 是否还有下一页)
+        """
         query = self.model.query.filter(self.model.team_id == team_id)
         
         if status:
             query = query.filter(self.model.status == status)
         
-        return query.order_by(self.model.created_at.desc()).paginate(
-            page=page, per_page=size, error_out=False
-        )
+        return _keyset_page(query, self.model.created_at, self.model.id, size, after, offset)
     
-    def get_user_invitations(self, email, page=1, size=20):
-        """获取用户的邀请列表"""
-        return self.model.query.filter(
-            self.model.invitee_email == email
-        ).order_by(self.model.created_at.desc()).paginate(
-            page=page, per_page=size, error_out=False
-        )
+    def count_team_invitations(self, team_id, status=None):
+        """统计群组的邀请数量"""
+        query = db.session.query(func.count(self.model.id)).filter(self.model.team_id == team_id)
+        if status:
+            query = query.filter(self.model.status == status)
+        return query.scalar() or 0
+    
+    def get_user_invitations(self, email, size=20, after=None, offset=0):
+        """
+        获取用户的邀请列表，按 (created_at, id) 游标分页
+        :return: (邀请列表, 是否还有下一页)
+        """
+        query = self.model.query.filter(self.model.invitee_email == email)
+        return _keyset_page(query, self.model.created_at, self.model.id, size, after, offset)
     
     @TryExcept("接受邀請失敗")
     def accept_invitation(self, invitation, user_id=None):
@@ -423,20 +613,16 @@ class OperTeamInvitationModel:
         return True
     
     @TryExcept("清理過期邀請失敗")
-    def cleanup_expired_invitations(self):
-        """清理过期邀请"""
-        current_time = datetime.now()
-        expired_invitations = self.model.query.filter(
-            and_(
-                self.model.expires_at <= current_time,
-                self.model.status == 'pending'
-            )
-        ).all()
-        
-        for invitation in expired_invitations:
-            invitation.status = 'expired'
-        
-        return len(expired_invitations)
+    def cleanup_expired_invitations(self, expired_before, limit):
+        """
+        将一批过期的待处理邀请标记为过期 - 带LIMIT的单条UPDATE，不加载邀请对象
+        :return: 本批更新的行数，小于limit表示已清理完
+        """
+        stmt = update(self.model).where(
+            self.model.status == 'pending',
+            self.model.expires_at <= expired_before
+        ).values(status='expired').with_dialect_options(mysql_limit=limit)
+        return db.session.execute(stmt).rowcount
     
     @staticmethod
     def generate_invitation_token():
@@ -452,20 +638,61 @@ class OperTeamActivityModel:
     
     @TryExcept("記錄群組活動失敗")
     def create_activity(self, activity_data):
-        """创建群组活动记录"""
-        db.session.add(activity_data)
+        """
+        暂存群组活动 (不随业务事务写库)
+        事务提交后由控制器取出写入活动流，归档任务再批量落库；事务回滚时丢弃
+        """
+        db.session.info.setdefault(_PENDING_ACTIVITIES_KEY, []).append({
+            'id': str(uuid.uuid4()),
+            'team_id': activity_data.team_id,
+            'user_id': activity_data.user_id,
+            'activity_type': activity_data.activity_type,
+            'description': activity_data.description,
+            'metadata': activity_data.activity_metadata,
+            # 与数据库列同为秒精度，活动流与归档记录的时间一致
+            'created_at': datetime.now().replace(microsecond=0)
+        })
         return True
     
-    def get_team_activities(self, team_id, page=1, size=20, activity_type=None):
-        """获取群组活动记录"""
+    @staticmethod
+    def take_pending_activities():
+        """取出当前会话暂存的活动"""
+        return db.session.info.pop(_PENDING_ACTIVITIES_KEY, [])
+    
+    @TryExcept("批量歸檔群組活動失敗")
+    def bulk_insert_activities(self, entries):
+        """
+        批量写入活动 (一条多行INSERT IGNORE)，活动ID为主键，重复归档的记录被忽略
+        :param entries: [{'id', 'team_id', 'user_id', 'activity_type', 'description', 'metadata', 'created_at'}]
+        """
+        if not entries:
+            return 0
+        stmt = mysql_insert(self.model.__table__).prefix_with('IGNORE').values([
+            dict(entry, updated_at=entry['created_at']) for entry in entries
+        ])
+        return db.session.execute(stmt).rowcount
+    
+    def get_team_activities(self, team_id, size=20, after=None, offset=0, activity_type=None):
+        """获取群组活动记录，按 (created_at, id) 游标分页"""
         query = self.model.query.filter(self.model.team_id == team_id)
         
         if activity_type:
             query = query.filter(self.model.activity_type == activity_type)
         
-        return query.order_by(self.model.created_at.desc()).paginate(
-            page=page, per_page=size, error_out=False
-        )
+        return _keyset_page(query, self.model.created_at, self.model.id, size, after=after, offset=offset)
+    
+    def get_archived_activity_ids(self, activity_ids):
+        """返回已落库的活动ID集合"""
+        if not activity_ids:
+            return set()
+        return {row_id for row_id, in db.session.query(self.model.id).filter(self.model.id.in_(activity_ids))}
+    
+    def count_team_activities(self, team_id, activity_type=None):
+        """统计群组活动记录数"""
+        query = self.model.query.filter(self.model.team_id == team_id)
+        if activity_type:
+            query = query.filter(self.model.activity_type == activity_type)
+        return query.count()
     
     def get_user_activities_in_team(self, team_id, user_id, page=1, size=20):
         """获取用户在群组中的活动记录"""
@@ -485,7 +712,7 @@ class OperTeamActivityModel:
             user_id=user_id,
             activity_type='team_created',
             description=f'創建了群組 "{team_name}"',
-            metadata={'team_name': team_name}
+            activity_metadata={'team_name': team_name}
         )
         return self.create_activity(activity)
     
@@ -496,7 +723,23 @@ class OperTeamActivityModel:
             user_id=user_id,
             activity_type='member_joined',
             description=f'新成員加入群組，角色為 {role}',
-            metadata={'new_member_id': new_member_id, 'role': role}
+            activity_metadata={'new_member_id': new_member_id, 'role': role}
+        )
+        return self.create_activity(activity)
+    
+    def record_members_bulk_changed(self, team_id, user_id, added, updated, removed):
+        """
+        记录批量成员变更活动 (整批一条)
+        :param added: [{'user_id', 'role'}]
+        :param updated: [{'user_id', 'old_role', 'new_role'}]
+        :param removed: [{'user_id', 'role'}]
+        """
+        activity = TeamActivityModel(
+            team_id=team_id,
+            user_id=user_id,
+            activity_type='members_bulk_changed',
+            description=f'批量變更成員：加入 {len(added)} 人，角色變更 {len(updated)} 人，移除 {len(removed)} 人',
+            activity_metadata={'added': added, 'updated': updated, 'removed': removed}
         )
         return self.create_activity(activity)
     
@@ -507,7 +750,7 @@ class OperTeamActivityModel:
             user_id=user_id,
             activity_type='member_left',
             description='成員離開了群組',
-            metadata={'left_member_id': left_member_id}
+            activity_metadata={'left_member_id': left_member_id}
         )
         return self.create_activity(activity)
     
@@ -518,7 +761,7 @@ class OperTeamActivityModel:
             user_id=user_id,
             activity_type='role_changed',
             description=f'成員角色從 {old_role} 變更為 {new_role}',
-            metadata={
+            activity_metadata={
                 'target_member_id': target_member_id,
                 'old_role': old_role,
                 'new_role': new_role
@@ -533,7 +776,7 @@ class OperTeamActivityModel:
             user_id=user_id,
             activity_type='team_updated',
             description='群組信息已更新',
-            metadata={'changes': changes}
+            activity_metadata={'changes': changes}
         )
         return self.create_activity(activity)
     
@@ -13,6 +13,7 @@ from dbs.mysql_db.model_tables import (
     TeamInvitationModel, TeamActivityModel
 )
 from marshmallow import post_load
+from configs.constant import Config
 
 
 # ==================== 群組管理相關Schema ====================
@@ -151,6 +152,46 @@ class TeamMemberRemoveSchema(Schema):
     )
 
 
+class TeamMemberBulkItemSchema(Schema):
+    """批量成員操作的單個成員"""
+    user_id = fields.String(
+        required=True,
+        validate=validate.Length(min=1, max=36),
+        metadata={"description": "用戶ID"}
+    )
+    role = fields.String(
+        missing='member',
+        validate=validate.OneOf(['admin', 'member']),
+        metadata={"description": "群組角色"}
+    )
+
+
+class TeamMemberBulkSchema(Schema):
+    """批量成員操作請求參數"""
+    action = fields.String(
+        required=True,
+        validate=validate.OneOf(['upsert', 'remove']),
+        metadata={"description": "upsert: 添加成員或更新角色; remove: 移除成員"}
+    )
+    members = fields.List(
+        fields.Nested(TeamMemberBulkItemSchema),
+        validate=validate.Length(min=1, max=Config.BULK_MEMBER_MAX_USERS),
+        metadata={"description": "upsert時的成員列表"}
+    )
+    user_ids = fields.List(
+        fields.String(validate=validate.Length(min=1, max=36)),
+        validate=validate.Length(min=1, max=Config.BULK_MEMBER_MAX_USERS),
+        metadata={"description": "remove時的用戶ID列表"}
+    )
+
+    @validates_schema
+    def validate_payload(self, data, **kwargs):
+        if data['action'] == 'upsert' and not data.get('members'):
+            raise ValidationError("upsert操作需要提供members", field_name='members')
+        if data['action'] == 'remove' and not data.get('user_ids'):
+            raise ValidationError("remove操作需要提供user_ids", field_name='user_ids')
+
+
 # ==================== 邀請管理相關Schema ====================
 
 class TeamMemberInviteSchema(Schema):
@@ -229,6 +270,17 @@ class JoinRequestRejectSchema(Schema):
     )
 
 
+# ==================== 列表查詢相關Schema ====================
+
+class TeamListQuerySchema(Schema):
+    """列表查詢參數"""
+    include_total = fields.String(
+        missing='approx',
+        validate=validate.OneOf(['approx', 'exact', 'none']),
+        metadata={"description": "總數統計方式：approx 近似值，exact 精確值，none 不統計"}
+    )
+
+
 # ==================== 權限檢查相關Schema ====================
 
 class TeamPermissionCheckSchema(Schema):
@@ -17,7 +17,8 @@ from serializes.response_serialize import (RspMsgDictSchema, RspMsgSchema)
 from serializes.team_serialize import (
     TeamCreateSchema, TeamUpdateSchema, TeamMemberInviteSchema,
     TeamJoinRequestSchema, InvitationAcceptSchema, JoinRequestApproveSchema,
-    JoinRequestRejectSchema, TeamMemberPromoteSchema, TeamMemberRemoveSchema
+    JoinRequestRejectSchema, TeamMemberPromoteSchema, TeamMemberRemoveSchema,
+    TeamMemberBulkSchema, TeamListQuerySchema
 )
 from common.common_tools import CommonTools
 from loggers import logger
@@ -49,8 +50,9 @@ class TeamsListApi(BaseTeamView):
     """群組列表API"""
 
     @jwt_required()
+    @blp.arguments(TeamListQuerySchema, location="query")
     @blp.response(200, RspMsgDictSchema)
-    def get(self):
+    def get(self, query_args):
         """獲取群組列表"""
         try:
             current_user_id = get_jwt_identity()
@@ -62,54 +64,17 @@ class TeamsListApi(BaseTeamView):
             size = request.args.get('size', 20, type=int)
             visibility = request.args.get('visibility')
             search = request.args.get('search')
+            cursor = request.args.get('cursor')
+            include_total = query_args['include_total']
             
             if visibility == 'public':
                 # 獲取公開群組
-                result = self.tc.oper_team.get_public_teams(page, size, search)
-                teams_data = []
-                for team in result.items:
-                    teams_data.append({
-                        'team_id': team.id,
-                        'name': team.name,
-                        'description': team.description,
-                        'avatar_url': team.avatar_url,
-                        'visibility': team.visibility,
-                        'member_count': len(team.members) if team.members else 0,
-                        'created_at': team.created_at.isoformat() if team.created_at else None
-                    })
-                
-                return response_result(content={
-                    'teams': teams_data,
-                    'total': result.total,
-                    'page': page,
-                    'size': size,
-                    'pages': result.pages
-                }, msg="獲取公開群組列表成功")
-            else:
-                # 獲取用戶相關群組
-                result = self.tc.oper_team.get_teams_by_user(current_user_id, page, size, visibility)
-                teams_data = []
-                for team in result.items:
-                    # 獲取用戶在該群組的角色
-                    member = self.tc.oper_member.get_by_team_and_user(team.id, current_user_id)
-                    teams_data.append({
-                        'team_id': team.id,
-                        'name': team.name,
-                        'description': team.description,
-                        'avatar_url': team.avatar_url,
-                        'visibility': team.visibility,
-                        'member_count': len(team.members) if team.members else 0,
-                        'your_role': member.role if member else None,
-                        'created_at': team.created_at.isoformat() if team.created_at else None
-                    })
-                
-                return response_result(content={
-                    'teams': teams_data,
-                    'total': result.total,
-                    'page': page,
-                    'size': size,
-                    'pages': result.pages
-                }, msg="獲取群組列表成功")
+                result, flag = self.tc.list_public_teams(page, size, search, cursor, include_total)
+                return self._build_response(result, flag, "獲取公開群組列表成功")
+            
+            # 獲取用戶相關群組
+            result, flag = self.tc.list_user_teams(current_user_id, page, size, visibility, cursor, include_total)
+            return self._build_response(result, flag, "獲取群組列表成功")
                 
         except Exception as e:
             logger.error(f"獲取群組列表異常: {str(e)}")
@@ -226,8 +191,9 @@ class TeamMembersApi(BaseTeamView):
     """群組成員API"""
 
     @jwt_required()
+    @blp.arguments(TeamListQuerySchema, location="query")
     @blp.response(200, RspMsgDictSchema)
-    def get(self, team_id):
+    def get(self, query_args, team_id):
         """獲取成員列表"""
         try:
             current_user_id = get_jwt_identity()
@@ -238,7 +204,11 @@ class TeamMembersApi(BaseTeamView):
             size = request.args.get('size', 20, type=int)
             role = request.args.get('role')
             
-            result, flag = self.tc.get_team_members(team_id, current_user_id, page, size, role)
+            result, flag = self.tc.get_team_members(
+                team_id, current_user_id, page, size, role,
+                cursor=request.args.get('cursor'),
+                include_total=query_args['include_total']
+            )
             return self._build_response(result, flag, "獲取成員列表成功")
             
         except Exception as e:
@@ -246,6 +216,31 @@ class TeamMembersApi(BaseTeamView):
             return fail_response_result(msg="系統內部錯誤，請稍後重試")
 
 
+@blp.route("/teams/<team_id>/members/bulk")
+class TeamMembersBulkApi(BaseTeamView):
+    """批量成員操作API"""
+
+    @jwt_required()
+    @blp.arguments(TeamMemberBulkSchema)
+    @blp.response(200, RspMsgDictSchema)
+    def post(self, data, team_id):
+        """批量添加成員、更新角色或移除成員"""
+        try:
+            current_user_id = get_jwt_identity()
+            if not current_user_id:
+                return fail_response_result(msg="無效的用戶身份")
+            
+            result, flag = self.tc.bulk_update_members(
+                team_id, current_user_id, data['action'],
+                members=data.get('members'), user_ids=data.get('user_ids')
+            )
+            return self._build_response(result, flag, "批量成員操作成功")
+            
+        except Exception as e:
+            logger.error(f"批量成員操作異常: {str(e)}")
+            return fail_response_result(msg="系統內部錯誤，請稍後重試")
+
+
 @blp.route("/teams/<team_id>/members/<user_id>/promote")
 class TeamMemberPromoteApi(BaseTeamView):
     """提升成員API"""
@@ -316,8 +311,9 @@ class TeamInvitationsApi(BaseTeamView):
     """群組邀請API"""
 
     @jwt_required()
+    @blp.arguments(TeamListQuerySchema, location="query")
     @blp.response(200, RspMsgDictSchema)
-    def get(self, team_id):
+    def get(self, query_args, team_id):
         """獲取邀請列表"""
         try:
             current_user_id = get_jwt_identity()
@@ -332,28 +328,12 @@ class TeamInvitationsApi(BaseTeamView):
             size = request.args.get('size', 20, type=int)
             status = request.args.get('status')
             
-            paginated = self.tc.oper_invitation.get_team_invitations(team_id, page, size, status)
-            
-            invitations_data = []
-            for invitation in paginated.items:
-                invitations_data.append({
-                    'invitation_id': invitation.id,
-                    'invitee_email': invitation.invitee_email,
-                    'invited_role': invitation.invited_role,
-                    'invited_by': invitation.invited_by,
-                    'status': invitation.status,
-                    'message': invitation.message,
-                    'expires_at': invitation.expires_at.isoformat() if invitation.expires_at else None,
-                    'created_at': invitation.created_at.isoformat() if invitation.created_at else None
-                })
-            
-            return response_result(content={
-                'invitations': invitations_data,
-                'total': paginated.total,
-                'page': page,
-                'size': size,
-                'pages': paginated.pages
-            }, msg="獲取邀請列表成功")
+            result, flag = self.tc.list_team_invitations(
+                team_id, page, size, status,
+                cursor=request.args.get('cursor'),
+                include_total=query_args['include_total']
+            )
+            return self._build_response(result, flag, "獲取邀請列表成功")
             
         except Exception as e:
             logger.error(f"獲取邀請列表異常: {str(e)}")
@@ -482,8 +462,9 @@ class TeamJoinRequestsApi(BaseTeamView):
     """群組加入申請API"""
 
     @jwt_required()
+    @blp.arguments(TeamListQuerySchema, location="query")
     @blp.response(200, RspMsgDictSchema)
-    def get(self, team_id):
+    def get(self, query_args, team_id):
         """獲取加入申請列表"""
         try:
             current_user_id = get_jwt_identity()
@@ -497,28 +478,12 @@ class TeamJoinRequestsApi(BaseTeamView):
             page = request.args.get('page', 1, type=int)
             size = request.args.get('size', 20, type=int)
             
-            paginated = self.tc.oper_join_request.get_pending_requests_by_team(team_id, page, size)
-            
-            requests_data = []
-            for join_request in paginated.items:
-                requests_data.append({
-                    'request_id': join_request.id,
-                    'user_id': join_request.user_id,
-                    'email': join_request.email,
-                    'requested_role': join_request.requested_role,
-                    'message': join_request.message,
-                    'status': join_request.status,
-                    'expires_at': join_request.expires_at.isoformat() if join_request.expires_at else None,
-                    'created_at': join_request.created_at.isoformat() if join_request.created_at else None
-                })
-            
-            return response_result(content={
-                'join_requests': requests_data,
-                'total': paginated.total,
-                'page': page,
-                'size': size,
-                'pages': paginated.pages
-            }, msg="獲取加入申請列表成功")
+            result, flag = self.tc.list_pending_join_requests(
+                team_id, page, size,
+                cursor=request.args.get('cursor'),
+                include_total=query_args['include_total']
+            )
+            return self._build_response(result, flag, "獲取加入申請列表成功")
             
         except Exception as e:
             logger.error(f"獲取加入申請列表異常: {str(e)}")
@@ -647,43 +612,24 @@ class TeamActivitiesApi(BaseTeamView):
     """群組活動記錄API"""
 
     @jwt_required()
+    @blp.arguments(TeamListQuerySchema, location="query")
     @blp.response(200, RspMsgDictSchema)
-    def get(self, team_id):
+    def get(self, query_args, team_id):
         """獲取活動記錄"""
         try:
             current_user_id = get_jwt_identity()
             if not current_user_id:
                 return fail_response_result(msg="無效的用戶身份")
             
-            # 檢查是否為群組成員
-            member = self.tc.oper_member.get_by_team_and_user(team_id, current_user_id)
-            if not member:
-                return fail_response_result(msg="只有群組成員可以查看活動記錄")
-            
-            page = request.args.get('page', 1, type=int)
-            size = request.args.get('size', 20, type=int)
-            activity_type = request.args.get('activity_type')
-            
-            paginated = self.tc.oper_activity.get_team_activities(team_id, page, size, activity_type)
-            
-            activities_data = []
-            for activity in paginated.items:
-                activities_data.append({
-                    'activity_id': activity.id,
-                    'user_id': activity.user_id,
-                    'activity_type': activity.activity_type,
-                    'description': activity.description,
-                    'metadata': activity.metadata,
-                    'created_at': activity.created_at.isoformat() if activity.created_at else None
-                })
-            
-            return response_result(content={
-                'activities': activities_data,
-                'total': paginated.total,
-                'page': page,
-                'size': size,
-                'pages': paginated.pages
-            }, msg="獲取活動記錄成功")
+            result, flag = self.tc.list_team_activities(
+                team_id, current_user_id,
+                page=request.args.get('page', 1, type=int),
+                size=request.args.get('size', 20, type=int),
+                activity_type=request.args.get('activity_type'),
+                cursor=request.args.get('cursor'),
+                include_total=query_args['include_total']
+            )
+            return self._build_response(result, flag, "獲取活動記錄成功")
             
         except Exception as e:
             logger.error(f"獲取活動記錄異常: {str(e)}")
@@ -773,19 +719,13 @@ class InternalRoleChangeNotifyApi(BaseTeamView):
                 return fail_response_result(msg="缺少必要參數")
             
             # 記錄角色變更活動
-            activity_result, activity_flag = self.tc.oper_activity.record_role_changed(
-                team_id, changed_by, user_id, old_role, new_role
-            )
-            
-            if activity_flag:
-                from dbs.mysql_db import DBFunction
-                commit_result, commit_flag = DBFunction.do_commit("記錄角色變更", True)
-                if commit_flag:
-                    return response_result(content={
-                        'team_id': team_id,
-                        'user_id': user_id,
-                        'message': '角色變更通知處理成功'
-                    }, msg="角色變更通知處理成功")
+            result, flag = self.tc.record_role_change_notification(team_id, user_id, old_role, new_role, changed_by)
+            if flag:
+                return response_result(content={
+                    'team_id': team_id,
+                    'user_id': user_id,
+                    'message': '角色變更通知處理成功'
+                }, msg="角色變更通知處理成功")
             
             return fail_response_result(msg="角色變更通知處理失敗")
             